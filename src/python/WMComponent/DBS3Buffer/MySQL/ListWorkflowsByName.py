@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""
+_ListWorkflowsByName_
+
+MySQL implementation of DBS3Buffer.ListWorkflowsByName
+"""
+
+from WMCore.Database.DBFormatter import DBFormatter
+
+class ListWorkflowsByName(DBFormatter):
+    """
+    _ListWorkflowsByName_
+
+    Get the id and task path of all the workflows with the given names.
+    """
+    sql = """SELECT id, name, task FROM dbsbuffer_workflow
+               WHERE name = :name"""
+
+
+    def execute(self, names, conn = None, transaction = False):
+        """
+        _execute_
+
+        Retrieve the workflows, returns a list of dictionaries with the id,
+        name and task of each of them
+        """
+        if len(names) == 0:
+            return []
+
+        binds = [{"name": name} for name in set(names)]
+        result = self.dbi.processData(self.sql, binds, conn = conn,
+                                      transaction = transaction)
+
+        return self.formatDict(result)
@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+"""
+_ListWorkflowsByName_
+
+Oracle implementation of DBS3Buffer.ListWorkflowsByName
+"""
+
+from WMComponent.DBS3Buffer.MySQL.ListWorkflowsByName import ListWorkflowsByName as MySQLListWorkflowsByName
+
+class ListWorkflowsByName(MySQLListWorkflowsByName):
+    pass
@@ -111,7 +111,10 @@ class ErrorHandlerPoller(BaseWorkerThread):
         Do one pass, then commit suicide
         """
         logging.debug("terminating. doing one more pass before we die")
-        self.algorithm(params)
+        try:
+            self.algorithm(params)
+        finally:
+            self.changeState.close()
 
     def exhaustJobs(self, jobList):
         """
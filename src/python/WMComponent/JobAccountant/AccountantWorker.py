@@ -17,12 +17,13 @@ import shutil
 import threading
 import logging
 import gc
-import collections
+import time
 
 from WMCore.FwkJobReport.Report  import Report
 from WMCore.DAOFactory           import DAOFactory
 from WMCore.WMConnectionBase     import WMConnectionBase
 from WMCore.WMException          import WMException
+from WMCore.Cache.LRUCache       import LRUCache
 
 from WMCore.DataStructs.Run import Run
 from WMCore.WMBS.File       import File
@@ -45,6 +46,224 @@ class AccountantWorkerException(WMException):
     """
 
 
+def loadJobReport(jobReportPath):
+    """
+    _loadJobReport_
+
+    Load a framework job report from disk and check it can be used.  Return
+    the report and None, or None and the (exit code, description) of the
+    problem.
+    """
+    # The jobReportPath may be prefixed with "file://" which needs to be
+    # removed so it doesn't confuse the FwkJobReport() parser.
+    if not jobReportPath:
+        logging.error("Bad FwkJobReport Path: %s" % jobReportPath)
+        return (None, (99999, "FWJR path is empty"))
+
+    jobReportPath = jobReportPath.replace("file://","")
+    if not os.path.exists(jobReportPath):
+        logging.error("Bad FwkJobReport Path: %s" % jobReportPath)
+        return (None, (99999, 'Cannot find file in jobReport path: %s' % jobReportPath))
+
+    if os.path.getsize(jobReportPath) == 0:
+        logging.error("Empty FwkJobReport: %s" % jobReportPath)
+        return (None, (99998, 'jobReport of size 0: %s ' % jobReportPath))
+
+    jobReport = Report()
+
+    try:
+        jobReport.load(jobReportPath)
+    except Exception as ex:
+        msg =  "Error loading jobReport %s\n" % jobReportPath
+        msg += str(ex)
+        logging.error(msg)
+        return (None, (99997, 'Cannot load jobReport'))
+
+    if len(jobReport.listSteps()) == 0:
+        logging.error("FwkJobReport with no steps: %s" % jobReportPath)
+        return (None, (99997, 'jobReport with no steps: %s ' % jobReportPath))
+
+    return (jobReport, None)
+
+def parseJobReport(jobReport):
+    """
+    _parseJobReport_
+
+    Extract from a report what the accountant needs to handle the job: its
+    success, its output files, the log archive files and the skipped files.
+    """
+    jobSuccess = jobReport.taskSuccessful()
+    summary = {"jobSuccess": jobSuccess,
+               "files": [],
+               "logArchFiles": jobReport.getAllFilesFromStep(step = 'logArch1'),
+               "skippedFiles": []}
+    if jobSuccess:
+        summary["files"] = jobReport.getAllFiles()
+        summary["skippedFiles"] = jobReport.getAllSkippedFiles()
+
+    return summary
+
+class FileRef(object):
+    """
+    _FileRef_
+
+    Attribute access to a file of the couch document of a report, like to
+    the report section the file was made from.  The document keeps plain
+    dictionaries, the changes made through the reference go to it.
+    """
+    def __init__(self, jsonFile):
+        self.__dict__['jsonFile'] = jsonFile
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['jsonFile'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self.__dict__['jsonFile'][name] = value
+
+class JobReportSummary(object):
+    """
+    _JobReportSummary_
+
+    What the accountant and ChangeState use of a framework job report: the
+    summary of parseJobReport, the couch document of the report and the few
+    values ChangeState asks for.  It stands in for the Report without its
+    ConfigSection tree, the fileRef of the summary files are the files of
+    the document so that marking them merged or mapping their location
+    update what goes to couch.
+    """
+    def __init__(self, jobReport, reportPath = None):
+        self.reportPath = reportPath
+        self.jobID = jobReport.getJobID()
+        self.steps = jobReport.listSteps()
+        self.siteName = jobReport.getSiteName()
+        self.exitCode = jobReport.getExitCode()
+        self.inputFiles = [{"lfn": x["lfn"], "input_type": x["input_type"]}
+                           for x in jobReport.getAllInputFiles()]
+        self.document = jobReport.__to_json__(None)
+        self.summary = parseJobReport(jobReport)
+
+        # Swap the report sections of the files for the document files,
+        # they are jsonized in the same order
+        self.outputModules = {}
+        self.fileRefs = []
+        documentFiles = {}
+        for stepName in self.steps:
+            reportStep = jobReport.retrieveStep(stepName)
+            jsonOutput = self.document["steps"][stepName]["output"]
+            self.outputModules[stepName] = list(reportStep.outputModules)
+            sections = [(x, getattr(reportStep.output, x)) for x in reportStep.outputModules]
+            if getattr(reportStep, 'analysis', None):
+                sections.append(('analysis', reportStep.analysis))
+            for (name, section) in sections:
+                jsonFiles = jsonOutput[name]
+                for i in range(len(jsonFiles)):
+                    fileRef = FileRef(jsonFiles[i])
+                    documentFiles[id(getattr(section.files, "file%i" % i))] = fileRef
+                    self.fileRefs.append(fileRef)
+
+        for key in ["files", "logArchFiles"]:
+            for fwjrFile in self.summary[key]:
+                fwjrFile["fileRef"] = documentFiles.get(id(fwjrFile["fileRef"]))
+        return
+
+    # The Report methods used by the accountant and ChangeState
+
+    def setJobID(self, jobID):
+        self.jobID = jobID
+
+    def getJobID(self):
+        return self.jobID
+
+    def setTaskName(self, taskName):
+        self.document["task"] = taskName
+
+    def getTaskName(self):
+        return self.document["task"]
+
+    def listSteps(self):
+        return list(self.steps)
+
+    def getSiteName(self):
+        return self.siteName
+
+    def getExitCode(self):
+        return self.exitCode
+
+    def getAllInputFiles(self):
+        return list(self.inputFiles)
+
+    def getAllFileRefs(self):
+        return list(self.fileRefs)
+
+    def stripInputFiles(self):
+        """
+        _stripInputFiles_
+
+        Drop the input files, as Report.stripInputFiles
+        """
+        self.inputFiles = []
+        for step in self.document["steps"].values():
+            for inputSource in step["input"].keys():
+                step["input"][inputSource] = []
+        return
+
+    def getAllFilesFromStep(self, step):
+        """
+        _getAllFilesFromStep_
+
+        The output files of the step with the keys ChangeState uses
+        """
+        listOfFiles = []
+        for outputModule in self.outputModules.get(step, []):
+            for fileRef in self.document["steps"][step]["output"][outputModule]:
+                newFile = {"lfn": fileRef.get("lfn", None),
+                           "locations": set(),
+                           "module_label": fileRef.get("module_label", ""),
+                           "checksums": fileRef.get("checksums", {}),
+                           "size": int(fileRef.get("size", 0)),
+                           "dataset": fileRef.get("dataset", {}),
+                           "outputModule": outputModule}
+                if fileRef.get("location", None):
+                    newFile["locations"].add(fileRef["location"])
+                listOfFiles.append(newFile)
+        return listOfFiles
+
+    def save(self, filename):
+        """
+        _save_
+
+        Write the task name to the report on disk, the only change the
+        accountant saves
+        """
+        jobReport = Report()
+        jobReport.load(self.reportPath)
+        jobReport.setTaskName(self.getTaskName())
+        jobReport.save(filename)
+        return
+
+    def __to_json__(self, thunker):
+        return self.document
+
+def loadReportWorker(job):
+    """
+    _loadReportWorker_
+
+    Load and parse the report of a completed job, meant to run in a pool of
+    processes.  Returns the job ID, a JobReportSummary of the report and the
+    error of loadJobReport.  The report itself is not sent back, only what
+    the accountant writes from it.
+    """
+    (jobReport, error) = loadJobReport(job.get("fwjr_path", None))
+    if error:
+        return (job["id"], None, error)
+
+    jobReport.setJobID(job["id"])
+    reportPath = job["fwjr_path"].replace("file://", "")
+    return (job["id"], JobReportSummary(jobReport, reportPath), None)
+
 class AccountantWorker(WMConnectionBase):
     """
     Class that actually does the work of parsing FWJRs for the Accountant
@@ -88,7 +307,7 @@ class AccountantWorker(WMConnectionBase):
         self.dbsInsertLocation     = self.dbsDaoFactory(classname = "DBSBufferFiles.AddLocation")
         self.dbsSetChecksum        = self.dbsDaoFactory(classname = "DBSBufferFiles.AddChecksumByLFN")
         self.dbsSetRunLumi         = self.dbsDaoFactory(classname = "DBSBufferFiles.AddRunLumi")
-        self.dbsGetWorkflow        = self.dbsDaoFactory(classname = "ListWorkflow")
+        self.dbsGetWorkflows       = self.dbsDaoFactory(classname = "ListWorkflowsByName")
 
         self.dbsLFNHeritage      = self.dbsDaoFactory(classname = "DBSBufferFiles.BulkHeritageParent")
 
@@ -123,11 +342,17 @@ class AccountantWorker(WMConnectionBase):
         self.parentageBindsForMerge    = []
         self.jobsWithSkippedFiles = {}
         self.count = 0
-        self.datasetAlgoID     = collections.deque(maxlen = 1000)
-        self.datasetAlgoPaths  = collections.deque(maxlen = 1000)
         self.dbsLocations      = set()
-        self.workflowIDs       = collections.deque(maxlen = 1000)
-        self.workflowPaths     = collections.deque(maxlen = 1000)
+
+        # Dataset-algo path -> association ID and (workflow, task) -> workflow ID,
+        # kept between the calls
+        cacheSize = getattr(config.JobAccountant, 'dbsCacheSize', 1000)
+        self.datasetAlgoCache  = LRUCache(maxSize = cacheSize)
+        self.workflowCache     = LRUCache(maxSize = cacheSize)
+
+        # Seconds spent loading reports, handling the jobs and writing to the
+        # database, summed over the calls until the owner resets them
+        self.timing = {'load': 0.0, 'handle': 0.0, 'commit': 0.0}
 
         self.phedex = PhEDEx()
         self.locLists = self.phedex.getNodeMap()
@@ -161,40 +386,32 @@ class AccountantWorker(WMConnectionBase):
 
         Given a framework job report on disk, load it and return a
         FwkJobReport instance.  If there is any problem loading or parsing the
-        framework job report return None.
+        framework job report return a report with the failure.
         """
-        # The jobReportPath may be prefixed with "file://" which needs to be
-        # removed so it doesn't confuse the FwkJobReport() parser.
-        jobReportPath = parameters.get("fwjr_path", None)
-        if not jobReportPath:
-            logging.error("Bad FwkJobReport Path: %s" % jobReportPath)
-            return self.createMissingFWKJR(parameters, 99999, "FWJR path is empty")
+        jobReport, error = loadJobReport(parameters.get("fwjr_path", None))
+        if error:
+            logging.debug("Failing job: %s\n" % parameters)
+            return self.createMissingFWKJR(parameters, *error)
 
-        jobReportPath = jobReportPath.replace("file://","")
-        if not os.path.exists(jobReportPath):
-            logging.error("Bad FwkJobReport Path: %s" % jobReportPath)
-            return self.createMissingFWKJR(parameters, 99999, 'Cannot find file in jobReport path: %s' % jobReportPath)
+        return jobReport
 
-        if os.path.getsize(jobReportPath) == 0:
-            logging.error("Empty FwkJobReport: %s" % jobReportPath)
-            return self.createMissingFWKJR(parameters, 99998, 'jobReport of size 0: %s ' % jobReportPath)
+    def unpackJobReport(self, parameters, loadedReport):
+        """
+        _unpackJobReport_
 
-        jobReport = Report()
+        Return the report and its summary from what loadReportWorker returned
+        for the job, the report is the JobReportSummary of the worker.
+        """
+        (jobID, reportSummary, error) = loadedReport
+        if jobID != parameters["id"]:
+            msg = "Loaded report for job %s while handling job %s" % (jobID, parameters["id"])
+            raise AccountantWorkerException(msg)
 
-        try:
-            jobReport.load(jobReportPath)
-        except Exception as ex:
-            msg =  "Error loading jobReport %s\n" % jobReportPath
-            msg += str(ex)
-            logging.error(msg)
+        if error:
             logging.debug("Failing job: %s\n" % parameters)
-            return self.createMissingFWKJR(parameters, 99997, 'Cannot load jobReport')
+            return (self.createMissingFWKJR(parameters, *error), None)
 
-        if len(jobReport.listSteps()) == 0:
-            logging.error("FwkJobReport with no steps: %s" % jobReportPath)
-            return self.createMissingFWKJR(parameters, 99997, 'jobReport with no steps: %s ' % jobReportPath)
-
-        return jobReport
+        return (reportSummary, reportSummary.summary)
 
     def isTaskExistInFWJR(self, jobReport, jobStatus):
         """
@@ -220,25 +437,36 @@ class AccountantWorker(WMConnectionBase):
 
         return
 
-    def __call__(self, parameters):
+    def __call__(self, parameters, loadedReports = None):
         """
         __call__
 
         Handle a completed job.  The parameters dictionary will contain the job
-        ID and the path to the framework job report.
+        ID and the path to the framework job report.  The reports can be
+        loaded beforehand with loadReportWorker, loadedReports is then the
+        list of its results in the order of the jobs.
         """
         returnList = []
         self.reset()
 
-        for job in parameters:
+        for i, job in enumerate(parameters):
             logging.info("Handling %s" % job["fwjr_path"])
 
             # Load the job and set the ID
-            fwkJobReport = self.loadJobReport(job)
+            startTime = time.time()
+            if loadedReports is None:
+                fwkJobReport = self.loadJobReport(job)
+                summary = None
+            else:
+                (fwkJobReport, summary) = self.unpackJobReport(job, loadedReports[i])
             fwkJobReport.setJobID(job['id'])
-            
+            handleTime = time.time()
+            self.timing['load'] += handleTime - startTime
+
             jobSuccess = self.handleJob(jobID = job["id"],
-                                        fwkJobReport = fwkJobReport)
+                                        fwkJobReport = fwkJobReport,
+                                        summary = summary)
+            self.timing['handle'] += time.time() - handleTime
 
             if self.returnJobReport:
                 returnList.append({'id': job["id"], 'jobSuccess': jobSuccess,
@@ -248,6 +476,7 @@ class AccountantWorker(WMConnectionBase):
 
             self.count += 1
 
+        startTime = time.time()
         self.beginTransaction()
 
         # Now things done at the end of the job
@@ -307,6 +536,7 @@ class AccountantWorker(WMConnectionBase):
             self.handleSkippedFiles()
 
         self.commitTransaction(existingTransaction = False)
+        self.timing['commit'] += time.time() - startTime
 
         return returnList
 
@@ -443,15 +673,18 @@ class AccountantWorker(WMConnectionBase):
                 file.location = self.phedex.getBestNodeName(file.location, self.locLists)
 
 
-    def handleJob(self, jobID, fwkJobReport):
+    def handleJob(self, jobID, fwkJobReport, summary = None):
         """
         _handleJob_
 
         Figure out if a job was successful or not, handle it appropriately
-        (parse FWJR, update WMBS) and return the success status as a boolean
+        (parse FWJR, update WMBS) and return the success status as a boolean.
+        The summary of the report is made with parseJobReport if not given.
 
         """
-        jobSuccess = fwkJobReport.taskSuccessful()
+        if summary is None:
+            summary = parseJobReport(fwkJobReport)
+        jobSuccess = summary["jobSuccess"]
 
         outputMap = self.getOutputMapAction.execute(jobID = jobID,
                                                     conn = self.getDBConn(),
@@ -462,7 +695,7 @@ class AccountantWorker(WMConnectionBase):
                                                 transaction = self.existingTransaction())
 
         if jobSuccess:
-            fileList = fwkJobReport.getAllFiles()
+            fileList = summary["files"]
 
             # consistency check comparing outputMap to fileList
             # they should match except for some limited special cases
@@ -494,11 +727,11 @@ class AccountantWorker(WMConnectionBase):
                     logging.error("Job %d , list of expected outputModules does not match job report, failing job", jobID)
                     logging.debug("Job %d , expected outputModules %s", jobID, sorted(outputMap.keys()))
                     logging.debug("Job %d , fwjr outputModules %s", jobID, sorted(outputModules))
-                    fileList = fwkJobReport.getAllFilesFromStep(step = 'logArch1')
+                    fileList = summary["logArchFiles"]
                 else:
                     logging.debug("Job %d , list of expected outputModules does not match job report, accepted for multi-step CMSSW job", jobID)
         else:
-            fileList = fwkJobReport.getAllFilesFromStep(step = 'logArch1')
+            fileList = summary["logArchFiles"]
 
         if jobSuccess:
             logging.info("Job %d , handle successful job", jobID)
@@ -562,7 +795,7 @@ class AccountantWorker(WMConnectionBase):
             # Check if the job had any skipped files, put them in ACDC containers
             # We assume full file processing (no job masks)
             if jobSuccess:
-                skippedFiles = fwkJobReport.getAllSkippedFiles()
+                skippedFiles = summary["skippedFiles"]
                 if skippedFiles:
                     self.jobsWithSkippedFiles[jobID] = skippedFiles
 
@@ -625,50 +858,55 @@ class AccountantWorker(WMConnectionBase):
         report.data.cmsRun1.status = "Failed"
         return report
 
-    def createFilesInDBSBuffer(self):
+    def datasetAlgoPath(self, dbsFile):
         """
-        _createFilesInDBSBuffer_
-        It does the actual job of creating things in DBSBuffer
-        WARNING: This assumes all files in a job have the same final location
+        _datasetAlgoPath_
+
+        Key of the dataset-algo association of a DBSBuffer file
         """
-        if len(self.dbsFilesToCreate) == 0:
-            # Whoops, nothing to do!
-            return
+        return '%s:%s:%s:%s:%s:%s:%s:%s' % (dbsFile['datasetPath'],
+                                            dbsFile["appName"],
+                                            dbsFile["appVer"],
+                                            dbsFile["appFam"],
+                                            dbsFile["psetHash"],
+                                            dbsFile['processingVer'],
+                                            dbsFile['acquisitionEra'],
+                                            dbsFile['globalTag'])
+
+    def workflowPath(self, dbsFile):
+        """
+        _workflowPath_
 
-        dbsFileTuples = []
-        dbsFileLoc    = []
-        dbsCksumBinds = []
-        runLumiBinds  = []
-        selfChecksums = None
-        jobLocations  = set()
+        Workflow name and task path of a DBSBuffer file
+        """
+        # Associate the workflow to the file using the taskPath and the requestName
+        # TODO: debug why it happens and then drop/recover these cases automatically
+        taskPath = dbsFile.get('task')
+        if not taskPath:
+            msg = "Can't do workflow association, report this error to a developer.\n"
+            msg += "DbsFile : %s" % str(dbsFile)
+            raise AccountantWorkerException(msg)
+        return (taskPath.split('/')[1], taskPath)
 
-        for dbsFile in self.dbsFilesToCreate:
-            # Append a tuple in the format specified by DBSBufferFiles.Add
-            # Also run insertDatasetAlgo
-
-            assocID         = None
-            datasetAlgoPath = '%s:%s:%s:%s:%s:%s:%s:%s' % (dbsFile['datasetPath'],
-                                                           dbsFile["appName"],
-                                                           dbsFile["appVer"],
-                                                           dbsFile["appFam"],
-                                                           dbsFile["psetHash"],
-                                                           dbsFile['processingVer'],
-                                                           dbsFile['acquisitionEra'],
-                                                           dbsFile['globalTag'])
-            # First, check if this is in the cache
-            if datasetAlgoPath in self.datasetAlgoPaths:
-                for da in self.datasetAlgoID:
-                    if da['datasetAlgoPath'] == datasetAlgoPath:
-                        assocID = da['assocID']
-                        break
+    def findDatasetAlgos(self, dbsFiles):
+        """
+        _findDatasetAlgos_
+
+        Return a dictionary of dataset-algo path -> association ID for the
+        files, inserting the algos and datasets that are not in the cache.
+        Each of them is inserted once, by the first file that has it.
+        """
+        assocIDs = {}
+        for dbsFile in dbsFiles:
+            datasetAlgoPath = self.datasetAlgoPath(dbsFile)
+            if datasetAlgoPath in assocIDs:
+                continue
 
+            assocID = self.datasetAlgoCache.get(datasetAlgoPath)
             if not assocID:
                 # Then we have to get it ourselves
                 try:
                     assocID = dbsFile.insertDatasetAlgo()
-                    self.datasetAlgoPaths.append(datasetAlgoPath)
-                    self.datasetAlgoID.append({'datasetAlgoPath': datasetAlgoPath,
-                                               'assocID': assocID})
                 except WMException:
                     raise
                 except Exception as ex:
@@ -676,28 +914,75 @@ class AccountantWorker(WMConnectionBase):
                     msg += str(ex)
                     logging.error(msg)
                     raise AccountantWorkerException(msg)
+                if assocID:
+                    self.datasetAlgoCache[datasetAlgoPath] = assocID
+            assocIDs[datasetAlgoPath] = assocID
 
-            # Associate the workflow to the file using the taskPath and the requestName
-            # TODO: debug why it happens and then drop/recover these cases automatically
-            taskPath = dbsFile.get('task')
-            if not taskPath:
-                msg = "Can't do workflow association, report this error to a developer.\n"
-                msg += "DbsFile : %s" % str(dbsFile)
-                raise AccountantWorkerException(msg)
-            workflowName = taskPath.split('/')[1]
-            workflowPath = '%s:%s' % (workflowName, taskPath)
-            if workflowPath in self.workflowPaths:
-                for wf in self.workflowIDs:
-                    if wf['workflowPath'] == workflowPath:
-                        workflowID = wf['workflowID']
-                        break
+        return assocIDs
+
+    def findWorkflows(self, dbsFiles):
+        """
+        _findWorkflows_
+
+        Return a dictionary of (workflow name, task path) -> workflow ID for
+        the files, the ones that are not in the cache are loaded with a
+        single query.
+        """
+        workflowIDs = {}
+        missing     = set()
+        for workflowPath in set([self.workflowPath(x) for x in dbsFiles]):
+            workflowID = self.workflowCache.get(workflowPath)
+            if workflowID == None:
+                missing.add(workflowPath)
             else:
-                result = self.dbsGetWorkflow.execute(workflowName, taskPath, conn = self.getDBConn(),
-                                                         transaction = self.existingTransaction())
-                workflowID = result['id']
+                workflowIDs[workflowPath] = workflowID
+
+        if len(missing) == 0:
+            return workflowIDs
+
+        result = self.dbsGetWorkflows.execute(names = [x[0] for x in missing],
+                                              conn = self.getDBConn(),
+                                              transaction = self.existingTransaction())
+        for workflow in result:
+            workflowPath = (workflow['name'], workflow['task'])
+            self.workflowCache[workflowPath] = workflow['id']
+            if workflowPath in missing:
+                workflowIDs[workflowPath] = workflow['id']
+
+        for workflowPath in missing:
+            if workflowPath not in workflowIDs:
+                msg = "Workflow %s with task %s not found in DBSBuffer" % workflowPath
+                logging.error(msg)
+                raise AccountantWorkerException(msg)
 
-            self.workflowPaths.append(workflowPath)
-            self.workflowIDs.append({'workflowPath': workflowPath, 'workflowID': workflowID})
+        return workflowIDs
+
+    def createFilesInDBSBuffer(self):
+        """
+        _createFilesInDBSBuffer_
+        It does the actual job of creating things in DBSBuffer
+        WARNING: This assumes all files in a job have the same final location
+        """
+        if len(self.dbsFilesToCreate) == 0:
+            # Whoops, nothing to do!
+            return
+
+        dbsFileTuples = []
+        dbsFileLoc    = []
+        dbsCksumBinds = []
+        runLumiBinds  = []
+        selfChecksums = None
+        jobLocations  = set()
+
+        # Resolve the dataset-algo associations and workflows that are not
+        # cached yet, once for the whole batch
+        assocIDs    = self.findDatasetAlgos(self.dbsFilesToCreate)
+        workflowIDs = self.findWorkflows(self.dbsFilesToCreate)
+
+        for dbsFile in self.dbsFilesToCreate:
+            # Append a tuple in the format specified by DBSBufferFiles.Add
+            assocID    = assocIDs[self.datasetAlgoPath(dbsFile)]
+            workflowID = workflowIDs[self.workflowPath(dbsFile)]
 
             lfn           = dbsFile['lfn']
             selfChecksums = dbsFile['checksums']
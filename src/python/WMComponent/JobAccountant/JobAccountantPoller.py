@@ -8,11 +8,13 @@ Poll WMBS for complete jobs and process their framework job reports.
 import time
 import threading
 import logging
+import itertools
+import multiprocessing
 
 from WMCore.WorkerThreads.BaseWorkerThread import BaseWorkerThread
 from WMCore.Agent.Harness import Harness
 from WMCore.DAOFactory import DAOFactory
-from WMComponent.JobAccountant.AccountantWorker import AccountantWorker
+from WMComponent.JobAccountant.AccountantWorker import AccountantWorker, loadReportWorker
 from WMCore.WMException import WMException
 
 class JobAccountantPollerException(WMException):
@@ -29,6 +31,10 @@ class JobAccountantPoller(BaseWorkerThread):
         BaseWorkerThread.__init__(self)
         self.config = config
         self.accountantWorkSize = getattr(self.config.JobAccountant, 'accountantWorkSize', 100)
+        # Number of processes loading and parsing the job reports, with one
+        # the reports are loaded by the poller thread itself
+        self.accountantProcesses = getattr(self.config.JobAccountant, 'accountantProcesses', 1)
+        self.pool = None
         # initialize the alert framework (if available - config.Alert present)
         #    self.sendAlert will be then be available
         self.initAlerts(compName = "JobAccountant")
@@ -45,6 +51,8 @@ class JobAccountantPoller(BaseWorkerThread):
         #self.accountantWorker = AccountantWorker(couchURL = self.config.JobStateMachine.couchurl,
         #                                         couchDBName = self.config.JobStateMachine.couchDBName)
         self.accountantWorker = AccountantWorker(config = self.config)
+        if self.accountantProcesses > 1:
+            self.pool = multiprocessing.Pool(processes = self.accountantProcesses)
 
         myThread = threading.currentThread()
         daoFactory = DAOFactory(package = "WMCore.WMBS", logger = myThread.logger,
@@ -66,12 +74,27 @@ class JobAccountantPoller(BaseWorkerThread):
             logging.debug("No work to do; exiting")
             return
 
-        while len(completeJobs) > 0:
+        # With a pool the reports are loaded ahead of the slice being written
+        reports = None
+        if self.pool:
+            chunkSize = max(1, self.accountantWorkSize // (4 * self.accountantProcesses))
+            reports = self.pool.imap(loadReportWorker, completeJobs, chunkSize)
+
+        timing = self.accountantWorker.timing
+        for key in timing:
+            timing[key] = 0.0
+        startTime = time.time()
+
+        for start in range(0, len(completeJobs), self.accountantWorkSize):
+            jobsSlice = completeJobs[start:start + self.accountantWorkSize]
             try:
-                jobsSlice = completeJobs[:self.accountantWorkSize]
-                completeJobs = completeJobs[self.accountantWorkSize:]
-                self.accountantWorker(jobsSlice)
-                logging.info("Remaining completed jobs to process: %d" % len(completeJobs))
+                loadedReports = None
+                if reports is not None:
+                    loadTime = time.time()
+                    loadedReports = list(itertools.islice(reports, len(jobsSlice)))
+                    timing['load'] += time.time() - loadTime
+                self.accountantWorker(jobsSlice, loadedReports)
+                logging.info("Remaining completed jobs to process: %d" % (len(completeJobs) - start - len(jobsSlice)))
             except WMException:
                 myThread = threading.currentThread()
                 if getattr(myThread, 'transaction', None) != None:
@@ -87,4 +110,35 @@ class JobAccountantPoller(BaseWorkerThread):
                 self.sendAlert(6, msg = msg)
                 raise JobAccountantPollerException(msg)
 
+        self.logThroughput(len(completeJobs), time.time() - startTime)
+        return
+
+    def logThroughput(self, nJobs, totalTime):
+        """
+        _logThroughput_
+
+        Log how many jobs per second went through each stage of the accountant
+        """
+        stages = []
+        for stage in ['load', 'handle', 'commit']:
+            stageTime = self.accountantWorker.timing[stage]
+            if stageTime > 0:
+                stages.append("%s %.1f jobs/s" % (stage, nJobs / stageTime))
+            else:
+                stages.append("%s n/a" % stage)
+        logging.info("Processed %d jobs in %.1f s (%s)" % (nJobs, totalTime, ", ".join(stages)))
+        return
+
+    def terminate(self, parameters = None):
+        """
+        _terminate_
+
+        Stop the processes loading the job reports and the threads posting
+        the fwjr documents
+        """
+        self.accountantWorker.stateChanger.close()
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
         return
@@ -117,7 +117,10 @@ class JobArchiverPoller(BaseWorkerThread):
         This function terminates the job after a final pass
         """
         logging.debug("terminating. doing one more pass before we die")
-        self.algorithm(params)
+        try:
+            self.algorithm(params)
+        finally:
+            self.changeState.close()
         return
 
 
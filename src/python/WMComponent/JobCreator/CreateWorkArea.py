@@ -25,7 +25,7 @@ from subprocess import Popen, PIPE
 
 from WMCore.DAOFactory        import DAOFactory
 
-from WMCore.WMSpec.WMWorkload               import WMWorkload, WMWorkloadHelper
+from WMCore.Cache.WMSpecCache               import loadWorkload
 
 from WMCore.WMException import WMException
 
@@ -110,8 +110,12 @@ def getMasterName(startDir, wmWorkload = None, workflow = None):
         logging.error(msg)
         raise CreateWorkAreaException(msg)
     else:
-        wmWorkload = WMWorkloadHelper(WMWorkload("workload"))
-        wmWorkload.load(workflow.spec)
+        wmWorkload = loadWorkload(workflow.spec)
+        if wmWorkload == None:
+            msg =  "Could not load Workflow spec %s: " % (workflow.spec)
+            msg += "Cannot create work area without spec!"
+            logging.error(msg)
+            raise CreateWorkAreaException(msg)
 
         workload = wmWorkload.name()
 
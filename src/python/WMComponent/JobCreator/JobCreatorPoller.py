@@ -7,7 +7,6 @@ __all__ = []
 
 import os
 import os.path
-import cPickle
 import logging
 import traceback
 import threading
@@ -18,19 +17,22 @@ from WMCore.WMException                     import WMException
 
 from WMCore.JobSplitting.Generators.GeneratorManager import GeneratorManager
 from WMCore.JobStateMachine.ChangeState     import ChangeState
-from WMComponent.JobCreator.CreateWorkArea  import CreateWorkArea
+from WMComponent.JobCreator.CreateWorkArea  import CreateWorkArea, CreateWorkAreaException
 from WMCore.JobSplitting.SplitterFactory    import SplitterFactory
 from WMCore.WMBS.Subscription               import Subscription
 from WMCore.WMBS.Workflow                   import Workflow
-from WMCore.WMSpec.WMWorkload               import WMWorkload, WMWorkloadHelper
 from WMCore.FwkJobReport.Report             import Report
+from WMCore.DataStructs.JobStore            import JobStore, jobStoreDir
+from WMCore.Cache.WMSpecCache               import loadWorkload, getSpecCache
 
 
 def retrieveWMSpec(workflow = None, wmWorkloadURL = None):
     """
     _retrieveWMSpec_
 
-    Given a subscription, this function loads the WMSpec associated with that workload
+    Given a subscription, this function loads the WMSpec associated with that workload.
+    The spec is served from the process wide spec cache, the returned object
+    is shared and must not be modified.
     """
     if not wmWorkloadURL and workflow:
         wmWorkloadURL = workflow.spec
@@ -39,8 +41,11 @@ def retrieveWMSpec(workflow = None, wmWorkloadURL = None):
         logging.error("WMWorkloadURL %s is empty" % (wmWorkloadURL))
         return None
 
-    wmWorkload = WMWorkloadHelper(WMWorkload("workload"))
-    wmWorkload.load(wmWorkloadURL)
+    wmWorkload = loadWorkload(wmWorkloadURL)
+    if wmWorkload == None:
+        msg = "Could not load WMWorkload spec %s" % (wmWorkloadURL)
+        logging.error(msg)
+        raise CreateWorkAreaException(msg)
 
     return wmWorkload
 
@@ -120,11 +125,14 @@ def saveJob(job, workflow, sandbox, wmTask = None, jobNumber = 0,
             owner = None, ownerDN = None,
             ownerGroup = '', ownerRole = '',
             scramArch = None, swVersion = None, agentNumber = 0,
-            numberOfCores = 1):
+            numberOfCores = 1, jobStores = None):
     """
     _saveJob_
 
-    Actually do the mechanics of saving the job to a pickle file
+    Actually do the mechanics of saving the job to the job store of its
+    job collection directory.  If a dictionary of JobStores keyed by
+    directory is passed in the job is only queued in the right store and
+    the caller has to flush them, otherwise it is written right away.
     """
     if wmTask:
             # If we managed to load the task,
@@ -145,9 +153,14 @@ def saveJob(job, workflow, sandbox, wmTask = None, jobNumber = 0,
     job['scramArch'] = scramArch
     job['swVersion'] = swVersion
     job['numberOfCores'] = numberOfCores
-    output = open(os.path.join(cacheDir, 'job.pkl'), 'w')
-    cPickle.dump(job, output, cPickle.HIGHEST_PROTOCOL)
-    output.close()
+
+    storeDir = jobStoreDir(cacheDir)
+    if jobStores is None:
+        JobStore(storeDir).append([job])
+    else:
+        if storeDir not in jobStores:
+            jobStores[storeDir] = JobStore(storeDir)
+        jobStores[storeDir].add(job)
 
 
     return
@@ -200,6 +213,7 @@ def creatorProcess(work, jobCacheDir):
                                    wmWorkload = wmWorkload,
                                    cache = False)
 
+        jobStores = {}
         for job in wmbsJobGroup.jobs:
             jobNumber += 1
             saveJob(job = job, workflow = workflow,
@@ -213,7 +227,11 @@ def creatorProcess(work, jobCacheDir):
                     scramArch = scramArch,
                     swVersion = swVersion,
                     agentNumber = agentNumber,
-                    numberOfCores = numberOfCores)
+                    numberOfCores = numberOfCores,
+                    jobStores = jobStores)
+
+        for jobStore in jobStores.values():
+            jobStore.flush()
 
     except Exception as ex:
         # Register as failure; move on
@@ -369,6 +387,10 @@ class JobCreatorPoller(BaseWorkerThread):
         self.agentNumber    = int(getattr(config.Agent, 'agentNumber', 0))
         self.glideinLimits  = getattr(config.JobCreator, 'GlideInRestriction', None)
 
+        specCacheSize = getattr(config.JobCreator, 'specCacheSize', None)
+        if specCacheSize is not None:
+            getSpecCache().setMaxSize(specCacheSize)
+
         # initialize the alert framework (if available - config.Alert present)
         #    self.sendAlert will be then be available
         self.initAlerts(compName = "JobCreator")
@@ -441,7 +463,10 @@ class JobCreatorPoller(BaseWorkerThread):
         Kill the code after one final pass when called by the master thread.
         """
         logging.debug("terminating. doing one more pass before we die")
-        self.algorithm(params)
+        try:
+            self.algorithm(params)
+        finally:
+            self.changeState.close()
 
 
     def pollSubscriptions(self):
@@ -641,6 +666,8 @@ class JobCreatorPoller(BaseWorkerThread):
             # Close the jobFactory
             wmbsJobFactory.close()
 
+        logging.info("Spec cache statistics: %s" % getSpecCache().stats())
+
         return
 
 
@@ -45,12 +45,13 @@ import cPickle
 from WMCore.DAOFactory                      import DAOFactory
 from WMCore.JobSplitting.SplitterFactory    import SplitterFactory
 from WMCore.WMBS.Subscription               import Subscription
-from WMCore.WMSpec.WMWorkload               import WMWorkload, WMWorkloadHelper
+from WMCore.Cache.WMSpecCache               import loadWorkload
 
 
 from WMCore.WMSpec.Seeders.SeederManager                import SeederManager
 from WMCore.JobStateMachine.ChangeState                 import ChangeState
-from WMComponent.JobCreator.CreateWorkArea              import CreateWorkArea
+from WMComponent.JobCreator.CreateWorkArea              import CreateWorkArea, \
+                                                               CreateWorkAreaException
 
 from WMCore.Agent.Configuration import Configuration
 
@@ -91,6 +92,7 @@ def retrieveWMSpec(subscription):
     _retrieveWMSpec_
 
     Given a subscription, this function loads the WMSpec associated with that workload
+    from the process wide spec cache
     """
     workflow = subscription['workflow']
     wmWorkloadURL = workflow.spec
@@ -99,8 +101,11 @@ def retrieveWMSpec(subscription):
         logging.error("WMWorkloadURL %s is empty" % (wmWorkloadURL))
         return None
 
-    wmWorkload = WMWorkloadHelper(WMWorkload("workload"))
-    wmWorkload.load(wmWorkloadURL)
+    wmWorkload = loadWorkload(wmWorkloadURL)
+    if wmWorkload == None:
+        msg = "Could not load WMWorkload spec %s" % (wmWorkloadURL)
+        logging.error(msg)
+        raise CreateWorkAreaException(msg)
 
     return wmWorkload
 
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""
+_JobSubmitterCache_
+
+In memory cache of the jobs waiting to be submitted.
+
+Jobs are kept in buckets keyed by site, task type and workflow, a job
+that can run at several sites is in one bucket per site.  A reverse index
+from job ID to the buckets the job is in allows removing a job from the
+cache without walking all the buckets.
+
+Every site and task type also has a priority queue of the workflows that
+have jobs in it, ordered by workflow priority (highest first) and then by
+workflow timestamp (oldest first).  The queues are heaps with lazy
+deletion: entries of workflows that ran out of jobs or changed priority
+are only dropped when they reach the top of the heap.
+"""
+
+import heapq
+
+
+class JobSubmitterCache(object):
+    """
+    _JobSubmitterCache_
+
+    Job cache indexed by site/task type/workflow and by job ID.
+    """
+    def __init__(self):
+        # site -> task type -> workflow -> set of job IDs
+        self.buckets = {}
+        # job ID -> (workflow, task type, possible sites, job info tuple)
+        self.jobs = {}
+        # workflow -> number of cached jobs
+        self.workflowJobs = {}
+        # workflow -> [priority, timestamp]
+        self.workflowInfo = {}
+        # workflow -> set of (site, task type) it has jobs for
+        self.workflowBuckets = {}
+        # (site, task type) -> heap of (-priority, timestamp, workflow)
+        self.heaps = {}
+        return
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __contains__(self, jobID):
+        return jobID in self.jobs
+
+    def _sortKey(self, workflow):
+        """
+        _sortKey_
+
+        Heap key of a workflow, higher priorities and older timestamps first
+        """
+        priority, timestamp = self.workflowInfo[workflow]
+        return (-(priority or 0), timestamp, workflow)
+
+    def _pushWorkflow(self, site, taskType, workflow):
+        """
+        _pushWorkflow_
+
+        Add a workflow to the priority queue of a site and task type,
+        compacting the heap if it is mostly made of stale entries.
+        """
+        heap = self.heaps.setdefault((site, taskType), [])
+        heapq.heappush(heap, self._sortKey(workflow))
+
+        taskCache = self.buckets[site][taskType]
+        if len(heap) > 2 * len(taskCache) + 16:
+            heap[:] = [self._sortKey(x) for x in taskCache]
+            heapq.heapify(heap)
+        return
+
+    def addJob(self, jobID, workflow, taskType, sites, jobInfo,
+               priority = 0, timestamp = 0):
+        """
+        _addJob_
+
+        Add a job to the bucket of every site it can run at.  The priority
+        and timestamp are only used if the workflow has no jobs in the cache
+        yet, use setWorkflowPriority() to change the priority afterwards.
+        """
+        if jobID in self.jobs:
+            self.removeJob(jobID)
+
+        if workflow not in self.workflowInfo:
+            self.workflowInfo[workflow] = [priority, timestamp]
+            self.workflowBuckets[workflow] = set()
+
+        sites = frozenset(sites)
+        for site in sites:
+            taskCache = self.buckets.setdefault(site, {}).setdefault(taskType, {})
+            if workflow not in taskCache:
+                taskCache[workflow] = set()
+                self.workflowBuckets[workflow].add((site, taskType))
+                self._pushWorkflow(site, taskType, workflow)
+            taskCache[workflow].add(jobID)
+
+        self.jobs[jobID] = (workflow, taskType, sites, jobInfo)
+        self.workflowJobs[workflow] = self.workflowJobs.get(workflow, 0) + 1
+        return
+
+    def removeJob(self, jobID):
+        """
+        _removeJob_
+
+        Remove a job from all its buckets, dropping the buckets that become
+        empty.  Return the job info tuple or None if the job wasn't cached.
+        """
+        entry = self.jobs.pop(jobID, None)
+        if entry is None:
+            return None
+
+        workflow, taskType, sites, jobInfo = entry
+        for site in sites:
+            siteCache = self.buckets[site]
+            taskCache = siteCache[taskType]
+            taskCache[workflow].discard(jobID)
+            if not taskCache[workflow]:
+                del taskCache[workflow]
+                self.workflowBuckets[workflow].discard((site, taskType))
+                if not taskCache:
+                    del siteCache[taskType]
+                    del self.heaps[(site, taskType)]
+                    if not siteCache:
+                        del self.buckets[site]
+
+        self.workflowJobs[workflow] -= 1
+        if self.workflowJobs[workflow] == 0:
+            del self.workflowJobs[workflow]
+            del self.workflowInfo[workflow]
+            del self.workflowBuckets[workflow]
+        return jobInfo
+
+    def setWorkflowPriority(self, workflow, priority):
+        """
+        _setWorkflowPriority_
+
+        Change the priority of a cached workflow, requeueing it in the
+        priority queues of the sites and task types it has jobs for.
+        Workflows without jobs in the cache are ignored.
+        """
+        info = self.workflowInfo.get(workflow, None)
+        if info is None or info[0] == priority:
+            return
+
+        info[0] = priority
+        for site, taskType in self.workflowBuckets[workflow]:
+            self._pushWorkflow(site, taskType, workflow)
+        return
+
+    def getWorkflowPriority(self, workflow):
+        """
+        _getWorkflowPriority_
+
+        Return the priority of a cached workflow
+        """
+        return self.workflowInfo[workflow][0]
+
+    def topWorkflow(self, site, taskType):
+        """
+        _topWorkflow_
+
+        Return the highest priority workflow with jobs for a site and task
+        type, None if there are no jobs for them.
+        """
+        heap = self.heaps.get((site, taskType), None)
+        if not heap:
+            return None
+
+        taskCache = self.buckets[site][taskType]
+        while heap:
+            key = heap[0]
+            workflow = key[2]
+            if workflow in taskCache and key == self._sortKey(workflow):
+                return workflow
+            # Stale entry, the workflow ran out of jobs or was requeued
+            heapq.heappop(heap)
+        return None
+
+    def popJob(self, site, taskType):
+        """
+        _popJob_
+
+        Remove a job of the highest priority workflow for a site and task
+        type from the cache.  Return a (workflow, workflow priority, job info)
+        tuple or None if there are no jobs for them.
+        """
+        workflow = self.topWorkflow(site, taskType)
+        if workflow is None:
+            return None
+
+        priority = self.workflowInfo[workflow][0]
+        jobID = next(iter(self.buckets[site][taskType][workflow]))
+        return (workflow, priority, self.removeJob(jobID))
+
+    def getJobInfo(self, jobID):
+        """
+        _getJobInfo_
+
+        Return the job info tuple of a cached job, None if it is not cached
+        """
+        entry = self.jobs.get(jobID, None)
+        if entry is None:
+            return None
+        return entry[3]
+
+    def getTaskCache(self, site, taskType):
+        """
+        _getTaskCache_
+
+        Return the workflow -> job IDs dictionary for a site and task type,
+        None if there are no jobs for them.
+        """
+        return self.buckets.get(site, {}).get(taskType, None)
+
+    def hasSite(self, site):
+        """
+        _hasSite_
+
+        Check whether there are jobs that can run at a site
+        """
+        return site in self.buckets
+
+    def jobIDs(self):
+        """
+        _jobIDs_
+
+        Return the set of cached job IDs
+        """
+        return set(self.jobs)
+
+    def workflows(self):
+        """
+        _workflows_
+
+        Return the names of the workflows that have jobs in the cache
+        """
+        return self.workflowJobs.keys()
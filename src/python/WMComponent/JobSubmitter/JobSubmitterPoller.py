@@ -9,11 +9,15 @@ _JobSubmitterPoller_t_
 Submit jobs for execution.
 """
 
+import time
 import random
 import logging
+import itertools
 import threading
+import multiprocessing
 import os.path
-import cPickle
+
+from multiprocessing.pool import ThreadPool
 
 # WMBS objects
 from WMCore.DAOFactory        import DAOFactory
@@ -23,9 +27,11 @@ from WMCore.JobStateMachine.ChangeState       import ChangeState
 from WMCore.WorkerThreads.BaseWorkerThread    import BaseWorkerThread
 from WMCore.ResourceControl.ResourceControl   import ResourceControl
 from WMCore.DataStructs.JobPackage            import JobPackage
+from WMCore.DataStructs.JobStore              import JobStore, jobStoreDir, makeHeader, loadLegacyJob
 from WMCore.FwkJobReport.Report               import Report
 from WMCore.WMException                       import WMException
 from WMCore.BossAir.BossAirAPI                import BossAirAPI
+from WMComponent.JobSubmitter.JobSubmitterCache import JobSubmitterCache
 
 def siteListCompare(a, b):
     """
@@ -43,6 +49,177 @@ def siteListCompare(a, b):
     return -1
 
 
+def loadJobHeader(newJob, jobStores):
+    """
+    _loadJobHeader_
+
+    Find the submission header of a job in the job store of its job
+    collection directory.  The headers of a store are loaded in bulk the
+    first time one of its jobs is seen and kept in jobStores, keyed by
+    directory, as a (JobStore, headers) tuple.
+
+    Jobs created before the job store existed are read from their job.pkl
+    file instead, their header has no offset into a store.  Return None if
+    the job could not be found.
+    """
+    storeDir = jobStoreDir(newJob["cache_dir"])
+    if storeDir not in jobStores:
+        jobStore = JobStore(storeDir)
+        jobStores[storeDir] = (jobStore, jobStore.loadHeaders())
+
+    jobHeader = jobStores[storeDir][1].get(newJob["id"], None)
+    if jobHeader is not None:
+        return jobHeader
+
+    loadedJob = loadLegacyJob(newJob["cache_dir"])
+    if loadedJob is None:
+        return None
+    return makeHeader(loadedJob)
+
+
+def jobBodyRef(jobHeader):
+    """
+    _jobBodyRef_
+
+    Where the body of a job is in the job store of its collection directory,
+    as an (offset, length) tuple, or None if the job has a job.pkl file
+    instead.
+    """
+    if "offset" not in jobHeader:
+        return None
+    return (jobHeader["offset"], jobHeader["length"])
+
+
+def loadJobBody(cacheDir, bodyRef, jobStores):
+    """
+    _loadJobBody_
+
+    Unpickle the full job with the given cache directory, from the position
+    bodyRef in its job store or from its job.pkl file if bodyRef is None.
+    The stores opened are kept in jobStores, keyed by directory, until the
+    caller closes them.
+    """
+    if bodyRef is None:
+        return loadLegacyJob(cacheDir)
+
+    storeDir = jobStoreDir(cacheDir)
+    if storeDir not in jobStores:
+        jobStores[storeDir] = JobStore(storeDir)
+    return jobStores[storeDir].loadJob({"offset": bodyRef[0], "length": bodyRef[1]})
+
+
+def resolveJobLocations(newJob, jobHeader, siteInfo):
+    """
+    _resolveJobLocations_
+
+    Combine the site white and black lists of a job with the locations of
+    its input.  siteInfo is a (siteKeys, cmsNames, drainSites, abortSites)
+    tuple as built by JobSubmitterPoller.getThresholds().
+
+    Return a (errorCode, possibleLocations, potentialLocations) tuple, the
+    error code is None if the job can be submitted.
+    """
+    siteKeys, cmsNames, drainSites, abortSites = siteInfo
+
+    siteWhitelist = jobHeader["siteWhitelist"]
+    siteBlacklist = jobHeader["siteBlacklist"]
+    trustSitelists = jobHeader["trustSitelists"]
+
+    # convert site lists into correct format
+    if len(siteWhitelist) > 0:
+        whitelist = []
+        for cmsName in siteWhitelist:
+            whitelist.extend(cmsNames.get(cmsName, []))
+        siteWhitelist = whitelist
+    if len(siteBlacklist) > 0:
+        blacklist = []
+        for cmsName in siteBlacklist:
+            blacklist.extend(cmsNames.get(cmsName, []))
+        siteBlacklist = blacklist
+
+    # figure out possible locations for job
+    if trustSitelists:
+        possibleLocations = set(siteWhitelist) - set(siteBlacklist)
+    else:
+        possibleLocations = set()
+
+        # all files in job have same location (in se names)
+        rawLocations = jobHeader["locations"]
+
+        # transform se names into site names
+        for loc in rawLocations:
+            if not loc in siteKeys:
+                # Then we have a problem
+                logging.error('Encountered unknown location %s for job %i' % (loc, newJob['id']))
+                logging.error('Ignoring for now, but watch out for this')
+            else:
+                for siteName in siteKeys[loc]:
+                    possibleLocations.add(siteName)
+
+        # filter with site lists
+        if len(siteWhitelist) > 0:
+            possibleLocations = possibleLocations & set(siteWhitelist)
+        if len(siteBlacklist) > 0:
+            possibleLocations = possibleLocations - set(siteBlacklist)
+
+    # Create another set of locations that may change when a site goes white/black listed
+    # Does not care about the non_draining or aborted sites, they may change and that is the point
+    potentialLocations = set()
+    potentialLocations.update(possibleLocations)
+
+    # now check for sites in drain and adjust the possible locations
+    # also check if there is at least one site left to run the job
+    if len(possibleLocations) == 0:
+        return (61101, possibleLocations, potentialLocations)
+    else :
+        non_abort_sites = [x for x in possibleLocations if x not in abortSites]
+        if non_abort_sites: # if there is at least a non aborted/down site then run there, otherwise fail the job
+            possibleLocations = non_abort_sites
+        else:
+            return (61102, possibleLocations, potentialLocations)
+
+    # try to remove draining sites if possible, this is needed to stop
+    # jobs that could run anywhere blocking draining sites
+    # if the job type is Merge, LogCollect or Cleanup this is skipped
+    if newJob['type'] not in ('LogCollect','Merge','Cleanup','Harvesting'):
+        non_draining_sites = [x for x in possibleLocations if x not in drainSites]
+        if non_draining_sites: # if >1 viable non-draining site remove draining ones
+            possibleLocations = non_draining_sites
+        else:
+            return (61104, possibleLocations, potentialLocations)
+
+    return (None, possibleLocations, potentialLocations)
+
+
+def loadNewJobs(work):
+    """
+    _loadNewJobs_
+
+    Load the headers and find the possible locations of a batch of new
+    jobs.  This runs in the JobSubmitter load pool, work is a (list of new
+    jobs, siteInfo) tuple.  Return a list with one (newJob, jobHeader,
+    errorCode, possibleLocations, potentialLocations) tuple per job, in the
+    order the jobs were given.  The job bodies are not loaded here, they
+    are only loaded for the jobs picked for submission, see loadJobBody.
+    """
+    newJobs, siteInfo = work
+    results = []
+    jobStores = {}
+    for newJob in newJobs:
+        jobHeader = loadJobHeader(newJob, jobStores)
+        if jobHeader is None:
+            # Then we have a problem - there's no record for the job
+            logging.error("Could not find job object for job %i in %s" % (newJob['id'], newJob["cache_dir"]))
+            results.append((newJob, None, 61103, None, None))
+            continue
+
+        errorCode, possibleLocations, potentialLocations = resolveJobLocations(newJob, jobHeader, siteInfo)
+        results.append((newJob, jobHeader, errorCode,
+                        possibleLocations, potentialLocations))
+
+    return results
+
+
 class JobSubmitterPollerException(WMException):
     """
     _JobSubmitterPollerException_
@@ -81,11 +258,7 @@ class JobSubmitterPoller(BaseWorkerThread):
         self.bossAir = BossAirAPI(config = self.config)
 
         # Additions for caching-based JobSubmitter
-        self.workflowTimestamps = {}
-        self.workflowPrios      = {}
-        self.cachedJobIDs       = set()
-        self.cachedJobs         = {}
-        self.jobDataCache       = {}
+        self.jobCache           = JobSubmitterCache()
         self.jobsToPackage      = {}
         self.sandboxPackage     = {}
         self.siteKeys           = {}
@@ -98,6 +271,26 @@ class JobSubmitterPoller(BaseWorkerThread):
         self.collSize           = getattr(self.config.JobSubmitter, 'collectionSize',
                                           self.packageSize * 1000)
 
+        # Incremental cache refresh: only the jobs that entered or left the
+        # created state since the start of the previous poll, minus
+        # maxTransactionTime, are fetched from WMBS.  A state change is only
+        # missed if its transaction committed more than maxTransactionTime
+        # seconds after it stamped state_time; every fullRefreshCycles polls
+        # the whole created list is reloaded, which picks those up as well.
+        self.stateTimeMark      = None
+        self.refreshCount       = 0
+        self.maxTransactionTime = getattr(self.config.JobSubmitter, 'maxTransactionTime', 300)
+        self.fullRefreshCycles  = getattr(self.config.JobSubmitter, 'fullRefreshCycles', 20)
+
+        # The headers of the new jobs are loaded in batches, by a pool of
+        # loadWorkers processes or threads (loadMode) made in setup() if
+        # loadWorkers is not 0.  Header unpickling holds the GIL, threads
+        # only overlap the file reads but don't fork the component.
+        self.loadWorkers        = getattr(self.config.JobSubmitter, 'loadWorkers', 0)
+        self.loadMode           = getattr(self.config.JobSubmitter, 'loadMode', 'process')
+        self.loadBatchSize      = getattr(self.config.JobSubmitter, 'loadBatchSize', 1000)
+        self.loadPool           = None
+
         # initialize the alert framework (if available)
         self.initAlerts(compName = "JobSubmitter")
 
@@ -127,12 +320,27 @@ class JobSubmitterPoller(BaseWorkerThread):
         self.locationAction = self.daoFactory(classname = "Locations.GetSiteInfo")
         self.setFWJRPathAction = self.daoFactory(classname = "Jobs.SetFWJRPath")
         self.listWorkflows = self.daoFactory(classname = "Workflow.ListForSubmitter")
+        self.listRemovedJobsAction = self.daoFactory(classname = "Jobs.ListRemovedForSubmitter")
 
         # Keep a record of the thresholds in memory
         self.currentRcThresholds = {}
 
         return
 
+    def setup(self, parameters = None):
+        """
+        _setup_
+
+        Start the pool loading the job headers, once for the life of the
+        component
+        """
+        if self.loadWorkers > 0 and self.loadPool is None:
+            if self.loadMode == 'thread':
+                self.loadPool = ThreadPool(processes = self.loadWorkers)
+            else:
+                self.loadPool = multiprocessing.Pool(processes = self.loadWorkers)
+        return
+
     def getPackageCollection(self, sandboxDir):
         """
         _getPackageCollection_
@@ -231,195 +439,110 @@ class JobSubmitterPoller(BaseWorkerThread):
         """
         _refreshCache_
 
-        Query WMBS for all jobs in the 'created' state.  For all jobs returned
+        Query WMBS for the jobs in the 'created' state.  For all jobs returned
         from the query, check if they already exist in the cache.  If they
-        don't, unpickle them and combine their site white and black list with
-        the list of locations they can run at.  Add them to the cache.
-
-        Each entry in the cache is a tuple with five items:
+        don't, load their headers and combine their site white and black list
+        with the list of locations they can run at.  Add them to the cache.
+        The job bodies are only loaded when the jobs are picked for
+        submission, see packageJobs().
+
+        Only the jobs that changed state since the previous call are queried,
+        except every fullRefreshCycles calls or after the cache was dropped,
+        when all the jobs in the 'created' state are loaded and the ones that
+        are not there anymore are purged from the cache.
+
+        The incremental query asks for the jobs whose state_time is at least
+        the start of the previous call minus maxTransactionTime.  state_time
+        is stamped by the agent components when they build the update, not
+        when their transaction commits, so a change only shows up late if it
+        was still uncommitted when the previous call queried WMBS.  Such a
+        change is caught as long as its transaction committed within
+        maxTransactionTime seconds of stamping state_time; anything slower
+        is missed until the next full refresh, at most fullRefreshCycles
+        calls later.
+
+        Each entry in the cache is a tuple with, among others:
           - WMBS Job ID
           - Retry count
-          - Batch ID
+          - Position of the job body in its job store, see jobBodyRef()
           - Path to sanbox
           - Path to cache directory
         """
         badJobs = dict([(x, []) for x in range(61101,61105)])
-        dbJobs = set()
+        # Taken before any query, on the same clock the state_time stamps
+        # come from, so the next mark never starts after this snapshot
+        pollTime = int(time.time())
+        fullRefresh = self.stateTimeMark is None or \
+                      self.refreshCount % self.fullRefreshCycles == 0
+        self.refreshCount += 1
 
         logging.info("Refreshing priority cache...")
         workflows = self.listWorkflows.execute()
-        workflows = filter(lambda x: x['name'] in self.workflowPrios, workflows)
         for workflow in workflows:
-            self.workflowPrios[workflow['name']] = workflow['priority']
-
-        logging.info("Querying WMBS for jobs to be submitted...")
-        newJobs = self.listJobsAction.execute()
+            self.jobCache.setWorkflowPriority(workflow['name'], workflow['priority'])
+
+        if fullRefresh:
+            logging.info("Querying WMBS for all jobs to be submitted...")
+            newJobs = self.listJobsAction.execute()
+            jobIDsToPurge = self.jobCache.jobIDs() - set([x['id'] for x in newJobs])
+        else:
+            logging.info("Querying WMBS for jobs that changed state since %i..." % self.stateTimeMark)
+            newJobs = self.listJobsAction.execute(stateTime = self.stateTimeMark)
+            jobIDsToPurge = self.listRemovedJobsAction.execute(stateTime = self.stateTimeMark)
         logging.info("Found %s new jobs to be submitted." % len(newJobs))
 
-        logging.info("Determining possible sites for new jobs...")
-        jobCount = 0
-        for newJob in newJobs:
-            jobID = newJob['id']
-            dbJobs.add(jobID)
-            if jobID in self.cachedJobIDs:
-                continue
-
-            jobCount += 1
-            if jobCount % 5000 == 0:
-                logging.info("Processed %d/%d new jobs." % (jobCount, len(newJobs)))
-
-            pickledJobPath = os.path.join(newJob["cache_dir"], "job.pkl")
+        # We need to remove any jobs from the cache that left the created state
+        logging.info("Pruning killed jobs...")
+        for jobID in jobIDsToPurge:
+            self.jobCache.removeJob(jobID)
 
-            if not os.path.isfile(pickledJobPath):
-                # Then we have a problem - there's no file
-                logging.error("Could not find pickled jobObject %s" % pickledJobPath)
-                badJobs[61103].append(newJob)
-                continue
-            try:
-                jobHandle = open(pickledJobPath, "r")
-                loadedJob = cPickle.load(jobHandle)
-                jobHandle.close()
-            except Exception as ex:
-                msg =  "Error while loading pickled job object %s\n" % pickledJobPath
-                msg += str(ex)
-                logging.error(msg)
-                self.sendAlert(6, msg = msg)
-                raise JobSubmitterPollerException(msg)
-
-            loadedJob['retry_count'] = newJob['retry_count']
-
-            siteWhitelist = loadedJob.get("siteWhitelist", [])
-            siteBlacklist = loadedJob.get("siteBlacklist", [])
-            trustSitelists = loadedJob.get("trustSitelists", False)
-
-            # convert site lists into correct format
-            if len(siteWhitelist) > 0:
-                whitelist = []
-                for cmsName in siteWhitelist:
-                    whitelist.extend(self.cmsNames.get(cmsName, []))
-                siteWhitelist = whitelist
-            if len(siteBlacklist) > 0:
-                blacklist = []
-                for cmsName in siteBlacklist:
-                    blacklist.extend(self.cmsNames.get(cmsName, []))
-                siteBlacklist = blacklist
-
-            # figure out possible locations for job
-            if trustSitelists:
-                possibleLocations = set(siteWhitelist) - set(siteBlacklist)
-            else:
-                possibleLocations = set()
-
-                # all files in job have same location (in se names)
-                rawLocations = loadedJob["input_files"][0]["locations"]
-
-                # transform se names into site names
-                for loc in rawLocations:
-                    if not loc in self.siteKeys.keys():
-                        # Then we have a problem
-                        logging.error('Encountered unknown location %s for job %i' % (loc, jobID))
-                        logging.error('Ignoring for now, but watch out for this')
-                    else:
-                        for siteName in self.siteKeys[loc]:
-                            possibleLocations.add(siteName)
-
-                # filter with site lists
-                if len(siteWhitelist) > 0:
-                    possibleLocations = possibleLocations & set(siteWhitelist)
-                if len(siteBlacklist) > 0:
-                    possibleLocations = possibleLocations - set(siteBlacklist)
-
-            # Create another set of locations that may change when a site goes white/black listed
-            # Does not care about the non_draining or aborted sites, they may change and that is the point
-            potentialLocations = set()
-            potentialLocations.update(possibleLocations)
-
-            # now check for sites in drain and adjust the possible locations
-            # also check if there is at least one site left to run the job
-            if len(possibleLocations) == 0:
-                newJob['name'] = loadedJob['name']
-                badJobs[61101].append(newJob)
-                continue
-            else :
-                non_abort_sites = [x for x in possibleLocations if x not in self.abortSites]
-                if non_abort_sites: # if there is at least a non aborted/down site then run there, otherwise fail the job
-                    possibleLocations = non_abort_sites
-                else:
-                    newJob['name'] = loadedJob['name']
-                    newJob['possibleLocations'] = possibleLocations
-                    badJobs[61102].append(newJob)
-                    continue
-
-            # try to remove draining sites if possible, this is needed to stop
-            # jobs that could run anywhere blocking draining sites
-            # if the job type is Merge, LogCollect or Cleanup this is skipped
-            if newJob['type'] not in ('LogCollect','Merge','Cleanup','Harvesting'):
-                non_draining_sites = [x for x in possibleLocations if x not in self.drainSites]
-                if non_draining_sites: # if >1 viable non-draining site remove draining ones
-                    possibleLocations = non_draining_sites
-                else:
-                    newJob['name'] = loadedJob['name']
-                    newJob['possibleLocations'] = possibleLocations
-                    badJobs[61104].append(newJob)
+        # Only load the jobs that are not in the cache yet
+        jobsToLoad = []
+        for newJob in newJobs:
+            cachedJob = self.jobCache.getJobInfo(newJob['id'])
+            if cachedJob is not None:
+                if cachedJob[1] == newJob['retry_count']:
                     continue
-
-            batchDir = self.addJobsToPackage(loadedJob)
-            self.cachedJobIDs.add(jobID)
-
-            for possibleLocation in possibleLocations:
-                if possibleLocation not in self.cachedJobs:
-                    self.cachedJobs[possibleLocation] = {}
-                if newJob["type"] not in self.cachedJobs[possibleLocation]:
-                    self.cachedJobs[possibleLocation][newJob["type"]] = {}
-
-                locTypeCache = self.cachedJobs[possibleLocation][newJob["type"]]
-                workflowName = newJob['workflow']
-                timestamp    = newJob['timestamp']
-                prio         = newJob['task_priority']
-                if workflowName not in locTypeCache:
-                    locTypeCache[workflowName] = set()
-                if workflowName not in self.jobDataCache:
-                    self.jobDataCache[workflowName] = {}
-                if not workflowName in self.workflowTimestamps:
-                    self.workflowTimestamps[workflowName] = timestamp
-                if workflowName not in self.workflowPrios:
-                    self.workflowPrios[workflowName] = prio
-
-                locTypeCache[workflowName].add(jobID)
-
-            # allow job baggage to override numberOfCores
-            #       => used for repacking to get more slots/disk
-            numberOfCores = loadedJob.get('numberOfCores', 1)
-            if numberOfCores == 1:
-                baggage = loadedJob.getBaggage()
-                numberOfCores = getattr(baggage, "numberOfCores", 1)
-            loadedJob['numberOfCores'] = numberOfCores
-
-            # Now that we're out of that loop, put the job data in the cache
-            jobInfo = (jobID,
-                       newJob["retry_count"],
-                       batchDir,
-                       loadedJob["sandbox"],
-                       loadedJob["cache_dir"],
-                       loadedJob.get("ownerDN", None),
-                       loadedJob.get("ownerGroup", ''),
-                       loadedJob.get("ownerRole", ''),
-                       frozenset(possibleLocations),
-                       loadedJob.get("scramArch", None),
-                       loadedJob.get("swVersion", None),
-                       loadedJob["name"],
-                       loadedJob.get("proxyPath", None),
-                       newJob['request_name'],
-                       loadedJob.get("estimatedJobTime", None),
-                       loadedJob.get("estimatedDiskUsage", None),
-                       loadedJob.get("estimatedMemoryUsage", None),
-                       newJob['task_name'],
-                       frozenset(potentialLocations),
-                       loadedJob.get("numberOfCores", 1),
-                       newJob['task_id']
-                       )
-
-            self.jobDataCache[workflowName][jobID] = jobInfo
+                # The job was retried since it was cached, reload it
+                self.jobCache.removeJob(newJob['id'])
+            jobsToLoad.append(newJob)
+
+        logging.info("Determining possible sites for %d new jobs..." % len(jobsToLoad))
+        siteInfo = (self.siteKeys, self.cmsNames, self.drainSites, self.abortSites)
+        batches = [jobsToLoad[x:x + self.loadBatchSize]
+                   for x in range(0, len(jobsToLoad), self.loadBatchSize)]
+
+        if self.loadPool is not None and len(batches) > 1:
+            results = self.loadPool.imap(loadNewJobs, [(x, siteInfo) for x in batches])
+        else:
+            results = itertools.imap(loadNewJobs, [(x, siteInfo) for x in batches])
+
+        # Batches come back in the order they were sent, so the cache is
+        # filled exactly as if the jobs were loaded one after the other
+        startTime = time.time()
+        jobCount = 0
+        try:
+            for batch in results:
+                for newJob, jobHeader, errorCode, possibleLocations, potentialLocations in batch:
+                    if errorCode is not None:
+                        if jobHeader is not None:
+                            newJob['name'] = jobHeader['name']
+                            newJob['possibleLocations'] = possibleLocations
+                        badJobs[errorCode].append(newJob)
+                        continue
+                    self.cacheNewJob(newJob, jobHeader, possibleLocations, potentialLocations)
+                jobCount += len(batch)
+                elapsed = max(time.time() - startTime, 0.001)
+                logging.info("Processed %d/%d new jobs, %.1f jobs/s." % (jobCount, len(jobsToLoad),
+                                                                          jobCount / elapsed))
+        except WMException:
+            raise
+        except Exception as ex:
+            msg =  "Error while loading new job objects\n"
+            msg += str(ex)
+            logging.error(msg)
+            self.sendAlert(6, msg = msg)
+            raise JobSubmitterPollerException(msg)
 
         # Register failures in submission
         for errorCode in badJobs:
@@ -427,31 +550,45 @@ class JobSubmitterPoller(BaseWorkerThread):
                 logging.debug("The following jobs could not be submitted: %s, error code : %d" % (badJobs, errorCode))
                 self._handleSubmitFailedJobs(badJobs[errorCode], errorCode)
 
-        # If there are any leftover jobs, we want to get rid of them.
-        self.flushJobPackages()
-        logging.info("Done with refreshCache() loop, pruning killed jobs.")
-
-        # We need to remove any jobs from the cache that were not returned in
-        # the last call to the database.
-        jobIDsToPurge = self.cachedJobIDs - dbJobs
-        self.cachedJobIDs -= jobIDsToPurge
+        self.stateTimeMark = pollTime - self.maxTransactionTime
+        logging.info("Done with refreshCache() loop, %i jobs in the cache." % len(self.jobCache))
+        return
 
-        if len(jobIDsToPurge) == 0:
-            return
+    def cacheNewJob(self, newJob, jobHeader, possibleLocations, potentialLocations):
+        """
+        _cacheNewJob_
 
-        for siteName in self.cachedJobs.keys():
-            for taskType in self.cachedJobs[siteName].keys():
-                for workflow in self.cachedJobs[siteName][taskType].keys():
-                    for cachedJobID in list(self.cachedJobs[siteName][taskType][workflow]):
-                        if cachedJobID in jobIDsToPurge:
-                            self.cachedJobs[siteName][taskType][workflow].remove(cachedJobID)
-                            try:
-                                del self.jobDataCache[workflow][cachedJobID]
-                            except KeyError:
-                                # Already gone
-                                pass
-
-        logging.info("Done pruning killed jobs, moving on to submit.")
+        Add a job to the job cache from its header.
+        """
+        jobID = newJob['id']
+
+        jobInfo = (jobID,
+                   newJob["retry_count"],
+                   jobBodyRef(jobHeader),
+                   jobHeader["sandbox"],
+                   jobHeader["cache_dir"],
+                   jobHeader["ownerDN"],
+                   jobHeader["ownerGroup"],
+                   jobHeader["ownerRole"],
+                   frozenset(possibleLocations),
+                   jobHeader["scramArch"],
+                   jobHeader["swVersion"],
+                   jobHeader["name"],
+                   jobHeader["proxyPath"],
+                   newJob['request_name'],
+                   jobHeader["estimatedJobTime"],
+                   jobHeader["estimatedDiskUsage"],
+                   jobHeader["estimatedMemoryUsage"],
+                   newJob['task_name'],
+                   frozenset(potentialLocations),
+                   jobHeader["numberOfCores"],
+                   newJob['task_id']
+                   )
+
+        self.jobCache.addJob(jobID, newJob['workflow'], newJob["type"],
+                             possibleLocations, jobInfo,
+                             priority = newJob['task_priority'],
+                             timestamp = newJob['timestamp'])
         return
 
     def _handleSubmitFailedJobs(self, badJobs, exitCode):
@@ -520,9 +657,8 @@ class JobSubmitterPoller(BaseWorkerThread):
         # TODO: Make it more efficient, only reshuffle locations when this happens
         if newDrainSites != self.drainSites or  newAbortSites != self.abortSites:
             logging.info("Draining or Aborted sites have changed, the cache will be rebuilt.")
-            self.cachedJobIDs       = set()
-            self.cachedJobs         = {}
-            self.jobDataCache       = {}
+            self.jobCache           = JobSubmitterCache()
+            self.stateTimeMark      = None
 
         #Sort the sites using the following criteria:
         #T1 sites go first, then T2, then T3
@@ -546,17 +682,11 @@ class JobSubmitterPoller(BaseWorkerThread):
         _assignJobLocations_
 
         Loop through the submit thresholds and pull sites out of the job cache
-        as we discover open slots.  This will return a list of tuple where each
-        tuple will have six elements:
-          - WMBS Job ID
-          - Retry count
-          - Batch ID
-          - Path to sanbox
-          - Path to cache directory
-          - SE name of the site to run at
+        as we discover open slots.  This will return a dictionary of job
+        dictionaries keyed by workflow, they are put in job packages by
+        packageJobs().
         """
         jobsToSubmit = {}
-        jobsToPrune = {}
         jobsCount = 0
         exitLoop = False 
 
@@ -565,7 +695,7 @@ class JobSubmitterPoller(BaseWorkerThread):
                 break
 
             totalPending = None
-            if siteName not in self.cachedJobs:
+            if not self.jobCache.hasSite(siteName):
                 logging.debug("No jobs for site %s" % siteName)
                 continue
             logging.debug("Have site %s" % siteName)
@@ -610,17 +740,12 @@ class JobSubmitterPoller(BaseWorkerThread):
                 if maxSlots >= 0 and taskRunning >= maxSlots:
                     continue
 
-                # Ignore this threshold if we've cleaned out the site
-                if siteName not in self.cachedJobs:
-                    continue
-
                 # Ignore this threshold if we have no jobs
-                # for it
-                if taskType not in self.cachedJobs[siteName]:
+                # for it, or we've cleaned out the site
+                taskCache = self.jobCache.getTaskCache(siteName, taskType)
+                if not taskCache:
                     continue
 
-                taskCache = self.cachedJobs[siteName][taskType]
-
                 # Calculate number of jobs we need
                 nJobsRequired = min(totalPendingSlots - totalPending, taskPendingSlots - taskPending)
                 breakLoop = False
@@ -629,79 +754,19 @@ class JobSubmitterPoller(BaseWorkerThread):
                 while nJobsRequired > 0:
                     # Do this until we have all the jobs for this threshold
 
-                    # Pull a job out of the cache for the task/site.  Verify that we
-                    # haven't already used this job in this polling cycle.
-                    cachedJob = None
-                    cachedJobWorkflow = None
-
-                    workflows = taskCache.keys()
-                    # Sorting by prio and timestamp on the subscription
-                    def sortingCmp(x, y):
-                        if (x not in self.workflowTimestamps) or (y not in self.workflowTimestamps):
-                            return -1
-                        if (x not in self.workflowPrios) or (y not in self.workflowPrios):
-                            return -1
-                        if self.workflowPrios[x] > self.workflowPrios[y]:
-                            return -1
-                        elif self.workflowPrios[x] == self.workflowPrios[y]:
-                            return cmp(self.workflowTimestamps[x], self.workflowTimestamps[y])
-                        else:
-                            return 1
-                    workflows.sort(cmp = sortingCmp)
-
-                    for workflow in workflows:
-                        # Run a while loop until you get a job
-                        while len(taskCache[workflow]) > 0:
-                            cachedJobID = taskCache[workflow].pop()
-                            try:
-                                cachedJob   = self.jobDataCache[workflow].get(cachedJobID, None)
-                                del self.jobDataCache[workflow][cachedJobID]
-                            except:
-                                pass
-
-                            if cachedJobID not in jobsToPrune.get(workflow, set()):
-                                cachedJobWorkflow = workflow
-                                break
-                            else:
-                                cachedJob = None
-
-                        # Remove the entry in the cache for the workflow if it is empty.
-                        if len(self.cachedJobs[siteName][taskType][workflow]) == 0:
-                            del self.cachedJobs[siteName][taskType][workflow]
-                        if workflow in self.jobDataCache and len(self.jobDataCache[workflow].keys()) == 0:
-                            del self.jobDataCache[workflow]
-
-                        if cachedJob:
-                            # We found a job, bail out and handle it.
-                            break
-
-                    # Check to see if we need to delete this site from the cache
-                    if len(self.cachedJobs[siteName][taskType].keys()) == 0:
-                        del self.cachedJobs[siteName][taskType]
-                        breakLoop = True
-                    if len(self.cachedJobs[siteName].keys()) == 0:
-                        del self.cachedJobs[siteName]
-                        breakLoop = True
+                    # Pull a job of the highest priority workflow out of the
+                    # cache for the task/site.  Removing it from the cache takes
+                    # it out of the buckets of all the sites it could run at, so
+                    # it can't be used twice in this cycle.
+                    cachedJobWorkflow, cachedJobPriority, cachedJob = self.jobCache.popJob(siteName, taskType)
 
-                    if not cachedJob:
-                        # We didn't find a job, bail out.
-                        # This site and task type is done
-                        break
-
-                    self.cachedJobIDs.remove(cachedJob[0])
-
-                    if cachedJobWorkflow not in jobsToPrune:
-                        jobsToPrune[cachedJobWorkflow] = set()
-
-                    jobsToPrune[cachedJobWorkflow].add(cachedJob[0])
-
-                    # Sort jobs by jobPackage
-                    package = cachedJob[2]
-                    if not package in jobsToSubmit.keys():
-                        jobsToSubmit[package] = []
+                    # Check to see if we emptied the cache for this site and task type
+                    if not taskCache:
+                        breakLoop = True
 
-                    # Add the sandbox to a global list
-                    self.sandboxPackage[package] = cachedJob[3]
+                    # Sort jobs by workflow, they are packaged per workflow
+                    if not cachedJobWorkflow in jobsToSubmit:
+                        jobsToSubmit[cachedJobWorkflow] = []
 
                     possibleSites = cachedJob[8]
                     possibleSiteList = list(possibleSites)
@@ -713,7 +778,8 @@ class JobSubmitterPoller(BaseWorkerThread):
                                'retry_count': cachedJob[1],
                                'custom': {'location': fakeAssignedSiteName},
                                'cache_dir': cachedJob[4],
-                               'packageDir': package,
+                               'bodyRef': cachedJob[2],
+                               'sandbox': cachedJob[3],
                                'userdn': cachedJob[5],
                                'usergroup': cachedJob[6],
                                'userrole': cachedJob[7],
@@ -728,14 +794,14 @@ class JobSubmitterPoller(BaseWorkerThread):
                                'estimatedJobTime' : cachedJob[14],
                                'estimatedDiskUsage' : cachedJob[15],
                                'estimatedMemoryUsage' : cachedJob[16],
-                               'taskPriority' : self.workflowPrios[workflow],
+                               'taskPriority' : cachedJobPriority,
                                'taskName' : cachedJob[17],
                                'numberOfCores' : cachedJob[19],
                                'taskID' : cachedJob[20],
                                'potentialSites' : potentialSites}
 
                     # Add to jobsToSubmit
-                    jobsToSubmit[package].append(jobDict)
+                    jobsToSubmit[cachedJobWorkflow].append(jobDict)
                     jobsCount += 1
                     if jobsCount >= self.maxJobsPerPoll:
                         breakLoop, exitLoop = True, True
@@ -749,30 +815,65 @@ class JobSubmitterPoller(BaseWorkerThread):
                     if breakLoop:
                         break
 
-        # Remove the jobs that we're going to submit from the cache.
-        allWorkflows = set()
-        for siteName in self.cachedJobs.keys():
-            for taskType in self.cachedJobs[siteName].keys():
-                for workflow in self.cachedJobs[siteName][taskType].keys():
-                    allWorkflows.add(workflow)
-                    if workflow in jobsToPrune.keys():
-                        self.cachedJobs[siteName][taskType][workflow] -= jobsToPrune[workflow]
-
-        # Remove workflows from the timestamp dictionary which are not anymore in the cache
-        workflowsWithTimestamp = self.workflowTimestamps.keys()
-        for workflow in workflowsWithTimestamp:
-            if workflow not in allWorkflows:
-                del self.workflowTimestamps[workflow]
-
-        workflowsWithPrios = self.workflowPrios.keys()
-        for workflow in workflowsWithPrios:
-            if workflow not in allWorkflows:
-                del self.workflowPrios[workflow]
-
-        logging.info("Have %s packages to submit." % len(jobsToSubmit))
+        logging.info("Have %s jobs of %s workflows to submit." % (jobsCount, len(jobsToSubmit)))
         logging.info("Done assigning site locations.")
         return jobsToSubmit
 
+    def packageJobs(self, jobsToSubmit):
+        """
+        _packageJobs_
+
+        Load the bodies of the jobs picked for submission, the cache only
+        knows where they are stored, and write them to job packages.  This
+        takes the jobs by workflow, as returned by assignJobLocations(), and
+        returns them by package directory, as submitJobs() expects them.
+        Jobs that can't be loaded anymore fail submission.
+        """
+        jobsByPackage = {}
+        badJobs = []
+        jobStores = {}
+        startTime = time.time()
+        try:
+            for workflow in sorted(jobsToSubmit.keys()):
+                for job in jobsToSubmit[workflow]:
+                    loadedJob = loadJobBody(job['cache_dir'], job.pop('bodyRef'), jobStores)
+                    if loadedJob is None:
+                        logging.error("Could not load job object for job %i in %s" % (job['id'], job["cache_dir"]))
+                        badJobs.append(job)
+                        continue
+                    loadedJob['retry_count'] = job['retry_count']
+                    loadedJob['numberOfCores'] = job['numberOfCores']
+
+                    package = self.addJobsToPackage(loadedJob)
+                    job['packageDir'] = package
+                    if not package in jobsByPackage:
+                        jobsByPackage[package] = []
+                    jobsByPackage[package].append(job)
+
+                    # Add the sandbox to a global list
+                    self.sandboxPackage[package] = job['sandbox']
+        except WMException:
+            raise
+        except Exception as ex:
+            msg =  "Error while loading job objects to package\n"
+            msg += str(ex)
+            logging.error(msg)
+            self.sendAlert(6, msg = msg)
+            raise JobSubmitterPollerException(msg)
+        finally:
+            for jobStore in jobStores.values():
+                jobStore.close()
+
+        # If there are any leftover jobs, we want to get rid of them.
+        self.flushJobPackages()
+
+        if badJobs:
+            self._handleSubmitFailedJobs(badJobs, 61103)
+
+        logging.info("Packaged %d jobs in %d packages in %.1fs." % (sum([len(x) for x in jobsByPackage.values()]),
+                                                                    len(jobsByPackage), time.time() - startTime))
+        return jobsByPackage
+
 
     def submitJobs(self, jobsToSubmit):
         """
@@ -856,11 +957,14 @@ class JobSubmitterPoller(BaseWorkerThread):
             myThread = threading.currentThread()
             self.getThresholds()
             self.refreshCache()
-            jobsToSubmit = self.assignJobLocations()
+            jobsToSubmit = self.packageJobs(self.assignJobLocations())
             self.submitJobs(jobsToSubmit = jobsToSubmit)
 
 
         except WMException:
+            # Jobs taken out of the cache may not have been submitted,
+            # reload everything on the next cycle
+            self.stateTimeMark = None
             if getattr(myThread, 'transaction', None) != None:
                 myThread.transaction.rollback()
             raise
@@ -871,6 +975,7 @@ class JobSubmitterPoller(BaseWorkerThread):
             msg += '\n\n'
             logging.error(msg)
             self.sendAlert(7, msg = msg)
+            self.stateTimeMark = None
             if getattr(myThread, 'transaction', None) != None:
                 myThread.transaction.rollback()
             raise JobSubmitterPollerException(msg)
@@ -886,4 +991,11 @@ class JobSubmitterPoller(BaseWorkerThread):
         Kill the code after one final pass when called by the master thread.
         """
         logging.debug("terminating. doing one more pass before we die")
-        self.algorithm(params)
+        try:
+            self.algorithm(params)
+        finally:
+            self.changeState.close()
+            if self.loadPool is not None:
+                self.loadPool.terminate()
+                self.loadPool.join()
+                self.loadPool = None
@@ -80,7 +80,10 @@ class JobTrackerPoller(BaseWorkerThread):
         Terminate the function after one more run.
         """
         logging.debug("terminating. doing one more pass before we die")
-        self.algorithm(params)
+        try:
+            self.algorithm(params)
+        finally:
+            self.changeState.close()
         return
 
 
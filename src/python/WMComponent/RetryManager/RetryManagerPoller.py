@@ -146,7 +146,10 @@ class RetryManagerPoller(BaseWorkerThread):
 
         """
         logging.debug("Terminating. doing one more pass before we die")
-        self.algorithm(params)
+        try:
+            self.algorithm(params)
+        finally:
+            self.changeState.close()
 
 
     def algorithm(self, parameters = None):
@@ -53,6 +53,7 @@ from WMCore.BossAir.Plugins.gLitePlugin          import getDefaultDelegation
 from WMCore.Credential.Proxy                     import Proxy
 from WMComponent.JobCreator.CreateWorkArea       import getMasterName
 from WMComponent.JobCreator.JobCreatorPoller     import retrieveWMSpec
+from WMCore.Cache.WMSpecCache                    import getSpecCache
 from WMCore.Services.RequestManager.RequestManager import RequestManager
 from WMCore.Services.ReqMgr.ReqMgr               import ReqMgr
 from WMCore.Services.RequestDB.RequestDBWriter   import RequestDBWriter
@@ -491,7 +492,8 @@ class TaskArchiverPoller(BaseWorkerThread):
                 result = self.centralCouchDBWriter.getStatusAndTypeByRequest(workflow)
                 wfStatus = result[workflow][0]
                 if wfStatus in safeStatesToDelete:
-                    wfsToDelete[workflow] = {"spec" : spec, "workflows": deletablewfs[workflow]["workflows"]}
+                    wfsToDelete[workflow] = {"spec" : spec, "specPath" : deletablewfs[workflow]["spec"],
+                                             "workflows": deletablewfs[workflow]["workflows"]}
                 else:
                     logging.error("%s is in %s, will be deleted later" % (workflow, wfStatus))
             
@@ -583,6 +585,9 @@ class TaskArchiverPoller(BaseWorkerThread):
                     else:
                         logging.error("Attempted to delete sandbox dir but it was already gone: %s" % sandboxDir)
 
+                # The workflow is gone, no need to keep its spec around
+                getSpecCache().invalidate(workflows[workflow]["specPath"])
+
             except Exception as ex:
                 msg = "Critical error while deleting workflow %s\n" % workflow
                 msg += str(ex)
@@ -25,6 +25,7 @@ from WMCore.JobStateMachine.ChangeState import ChangeState
 from WMCore.DAOFactory          import DAOFactory
 from WMCore.WMFactory           import WMFactory
 from WMCore.BossAir.RunJob      import RunJob
+from WMCore.BossAir.RunJobRegistry import RunJobRegistry
 from WMCore.WMConnectionBase    import WMConnectionBase
 from WMCore.WMException         import WMException
 from WMCore.FwkJobReport.Report import Report
@@ -65,6 +66,9 @@ class BossAirAPI(WMConnectionBase):
 
         self.jobs    = []
 
+        # The active jobs tracked in the previous cycles
+        self.registry = RunJobRegistry()
+
         self.pluginDir  = config.BossAir.pluginDir
         # This is the default state jobs are created in
         self.newState   = getattr(config.BossAir, 'newState', 'New')
@@ -472,24 +476,28 @@ class BossAirAPI(WMConnectionBase):
 
         jobsToTrack = {}
 
-        runningJobs = self._listRunJobs(active = True)
+        existingTransaction = self.beginTransaction()
+        runJobRows = self.runningJobDAO.execute(conn = self.getDBConn(),
+                                                transaction = self.existingTransaction())
+        self.commitTransaction(existingTransaction)
 
-        if runJobIDs:
-            for job in runningJobs:
-                if not job['id'] in runJobIDs:
-                    runningJobs.remove(job)
-        if wmbsIDs:
-            for job in runningJobs:
-                if not job['jobid'] in wmbsIDs:
-                    runningJobs.remove(job)
+        changed = self.registry.sync(runJobRows)
+        selected = self.registry.select(runJobIDs = runJobIDs, wmbsIDs = wmbsIDs)
 
-        if len(runningJobs) < 1:
+        if len(selected) < 1:
             # Then we have no running jobs
             return returnList
 
         logging.info("About to start building running jobs")
 
-        loadedJobs = self._buildRunningJobsFromRunJobs(runJobs = runningJobs)
+        # Only the new jobs and the ones whose row changed are loaded again
+        toLoad = self.registry.unloaded(selected)
+        if toLoad:
+            self.registry.addLoaded(self._loadByID(jobs = toLoad))
+        loadedJobs = self.registry.getRunJobs(selected)
+        logging.info("Loaded %i of %i active jobs, %i new or changed since the last cycle" % (len(toLoad),
+                                                                                              len(self.registry),
+                                                                                              changed))
 
         logging.info("About to look for %i loadedJobs.\n" % len(loadedJobs))
 
@@ -804,12 +812,9 @@ class BossAirAPI(WMConnectionBase):
 
         loadedJobs = self._loadByID(jobs = runJobs)
 
+        runJobsByID = dict([(rj['id'], rj) for rj in runJobs])
         for loadJob in loadedJobs:
-            runJob = None
-            for rj in runJobs:
-                if rj['id'] == loadJob['id']:
-                    runJob = rj
-                    break
+            runJob = runJobsByID[loadJob['id']]
             # We should have two instances of the job
             for key in runJob.keys():
                 # Fill one from the other
@@ -10,7 +10,6 @@ For glide-in use.
 """
 
 import os
-import re
 import time
 import Queue
 import os.path
@@ -21,6 +20,7 @@ import subprocess
 import multiprocessing
 import glob
 import shlex
+import tempfile
 
 import WMCore.Algorithms.BasicAlgos as BasicAlgos
 
@@ -29,6 +29,9 @@ from WMCore.DAOFactory                 import DAOFactory
 from WMCore.WMException                import WMException
 from WMCore.WMInit                     import getWMBASE
 from WMCore.BossAir.Plugins.BasePlugin import BasePlugin, BossAirPluginException
+from WMCore.BossAir.Plugins.CondorUtils import jobIDConstraint, bulkJobAction, \
+                                               condorQArguments, parseJobIDs, \
+                                               CLASSAD_PARSERS, ClassAdSnapshot
 from WMCore.FwkJobReport.Report        import Report
 from WMCore.Algorithms                 import SubprocessAlgos
 
@@ -73,25 +76,33 @@ def submitWorker(input, results, timeout = None):
 
         command = work.get('command', None)
         idList  = work.get('idList', [])
+        # Handed back with the result
+        result  = {'idList': idList, 'schedd': work.get('schedd', None),
+                   'cycle': work.get('cycle', None)}
         if not command:
-            results.put({'stdout': '', 'stderr': '999100\n Got no command!', 'idList': idList})
+            result.update({'stdout': '', 'stderr': '999100\n Got no command!'})
+            results.put(result)
             continue
 
+        startTime = time.time()
         try:
-            stdout, stderr, returnCode = SubprocessAlgos.runCommand(cmd = command, shell = True, timeout = timeout)
+            # Commands given as a string need a shell (glexec)
+            shell = isinstance(command, basestring)
+            stdout, stderr, returnCode = SubprocessAlgos.runCommand(cmd = command, shell = shell, timeout = timeout)
             if returnCode == 0:
-                results.put({'stdout': stdout, 'stderr': stderr, 'idList': idList, 'exitCode': returnCode})
+                result.update({'stdout': stdout, 'stderr': stderr, 'exitCode': returnCode})
             else:
-                results.put({'stdout': stdout,
-                             'stderr': 'Non-zero exit code: %s\n stderr: %s' % (returnCode, stderr),
-                             'exitCode': returnCode,
-                             'idList': idList})
+                result.update({'stdout': stdout,
+                               'stderr': 'Non-zero exit code: %s\n stderr: %s' % (returnCode, stderr),
+                               'exitCode': returnCode})
         except Exception as ex:
             msg =  "Critical error in subprocess while submitting to condor"
             msg += str(ex)
             msg += str(traceback.format_exc())
             logging.error(msg)
-            results.put({'stdout': '', 'stderr': '999101\n %s' % msg, 'idList': idList, 'exitCode': 999101})
+            result.update({'stdout': '', 'stderr': '999101\n %s' % msg, 'exitCode': 999101})
+        result['time'] = time.time() - startTime
+        results.put(result)
 
     return 0
 
@@ -192,6 +203,17 @@ class CondorPlugin(BasePlugin):
         self.errorCount    = 0
         self.defaultTaskPriority = getattr(config.BossAir, 'defaultTaskPriority', 0)
         self.maxTaskPriority     = getattr(config.BossAir, 'maxTaskPriority', 1e7)
+        # Number of jobs acted on by a single condor_rm or condor_qedit
+        self.bulkSize            = getattr(config.BossAir, 'condorBulkSize', 500)
+        # Output format of condor_q, autoformat or json
+        self.condorQFormat       = getattr(config.BossAir, 'condorQFormat', 'autoformat')
+        if self.condorQFormat not in CLASSAD_PARSERS:
+            raise BossAirPluginException("Unknown condorQFormat %s" % self.condorQFormat)
+
+        # Shared by track and updateSiteInformation, see ClassAdSnapshot
+        self.snapshot = ClassAdSnapshot(self.queryClassAds, self.queryJobIDs,
+                                        ttl = getattr(config.BossAir, 'classAdTTL', 60),
+                                        fullRefresh = getattr(config.BossAir, 'classAdFullRefresh', 1800))
 
         # Required for global pool accounting
         self.acctGroup = getattr(config.BossAir, 'acctGroup', "production")
@@ -202,6 +224,17 @@ class CondorPlugin(BasePlugin):
         self.input    = None
         self.result   = None
         self.nProcess = getattr(self.config.BossAir, 'nCondorProcesses', 4)
+        # Keep the pool between submit cycles instead of purging it
+        self.persistentPool = getattr(self.config.BossAir, 'persistentSubmitPool', True)
+        self.submitCycle    = 0
+        # Schedd -> jobs, failed jobs, seconds in condor_submit and jobs/s
+        # for the last submit cycle
+        self.submitMetrics  = {}
+
+        # Schedds the jobs are spread over, the local one if there are none
+        self.schedds    = getattr(config.BossAir, 'condorSchedds', [])
+        # Job ID -> schedd, for the jobs submitted or seen in condor_q
+        self.jobSchedds = {}
 
         # Set up my proxy and glexec stuff
         self.setupScript = getattr(config.BossAir, 'UISetupScript', None)
@@ -324,12 +357,67 @@ class CondorPlugin(BasePlugin):
 
 
 
+    def startPool(self, timeout):
+        """
+        _startPool_
+
+        Start the submit workers, or replace the pool if a worker died
+        """
+        if self.pool and all([proc.is_alive() for proc in self.pool]):
+            return
+
+        if self.pool:
+            logging.error("A CondorPlugin worker died, restarting the worker pool")
+            self.close()
+
+        logging.info("Starting up CondorPlugin worker pool")
+        self.input    = multiprocessing.Queue()
+        self.result   = multiprocessing.Queue()
+        for x in range(self.nProcess):
+            p = multiprocessing.Process(target = submitWorker,
+                                        args = (self.input, self.result, timeout))
+            p.start()
+            self.pool.append(p)
+        return
+
+    def submitCommand(self, jdlFile, schedd = None):
+        """
+        _submitCommand_
+
+        The condor_submit command for a JDL file
+        """
+        if self.glexecPath:
+            command = 'CS=`which condor_submit`; '
+            if self.glexecWrapScript:
+                command += 'export GLEXEC_ENV=`%s 2>/dev/null`; ' % self.glexecWrapScript
+            command += 'export GLEXEC_CLIENT_CERT=%s; ' % self.glexecProxyFile
+            command += 'export GLEXEC_SOURCE_PROXY=%s; ' % self.glexecProxyFile
+            command += 'export X509_USER_PROXY=%s; ' % self.glexecProxyFile
+            command += 'export GLEXEC_TARGET_PROXY=%s; ' % self.jdlProxyFile
+            submit = '$CS %s' % jdlFile
+            if schedd:
+                submit = '$CS -name %s %s' % (schedd, jdlFile)
+            if self.glexecUnwrapScript:
+                command += '%s %s -- %s' % (self.glexecPath, self.glexecUnwrapScript, submit)
+            else:
+                command += '%s %s' % (self.glexecPath, submit)
+            return command
+
+        if schedd:
+            return ['condor_submit', '-name', schedd, jdlFile]
+        return ['condor_submit', jdlFile]
+
     def submit(self, jobs, info=None):
         """
         _submit_
 
 
         Submit jobs for one subscription
+
+        The JDL files are written in this process while the worker pool
+        runs condor_submit on the ones already written, the results are
+        handled as they come back.  The batches are spread over the
+        BossAir.condorSchedds.
         """
 
         # If we're here, then we have submitter components
@@ -345,34 +433,35 @@ class CondorPlugin(BasePlugin):
             # Then was have nothing to do
             return successfulJobs, failedJobs
 
-        if len(self.pool) == 0:
-            # Starting things up
-            # This is obviously a submit API
-            logging.info("Starting up CondorPlugin worker pool")
-            self.input    = multiprocessing.Queue()
-            self.result   = multiprocessing.Queue()
-            for x in range(self.nProcess):
-                p = multiprocessing.Process(target = submitWorker,
-                                            args = (self.input, self.result, timeout))
-                p.start()
-                self.pool.append(p)
+        # This is obviously a submit API
+        self.startPool(timeout)
 
         if not os.path.exists(self.submitDir):
             os.makedirs(self.submitDir)
 
+        # Results of a previous cycle that timed out are ignored
+        self.submitCycle += 1
+        startTime = time.time()
+        metrics = {}
+        for schedd in self.schedds or [None]:
+            metrics[schedd] = {'jobs': 0, 'failed': 0, 'time': 0.0}
 
         # Now assume that what we get is the following; a mostly
         # unordered list of jobs with random sandboxes.
         # We intend to sort them by sandbox.
 
         submitDict = {}
+        jobsByID   = {}
         nSubmits   = 0
         for job in jobs:
             sandbox = job['sandbox']
             if not sandbox in submitDict.keys():
                 submitDict[sandbox] = []
             submitDict[sandbox].append(job)
+            jobsByID[job.get('id', None)] = job
 
+        # Jobs handed to each schedd this cycle
+        scheddLoad = dict([(schedd, 0) for schedd in self.schedds])
 
         # Now submit the bastards
         queueError = False
@@ -398,25 +487,19 @@ class CondorPlugin(BasePlugin):
                 handle.close()
                 jdlFiles.append(jdlFile)
 
+                # The least loaded schedd gets the batch
+                schedd = None
+                if scheddLoad:
+                    schedd = min(self.schedds, key = scheddLoad.get)
+                    scheddLoad[schedd] += len(jobsReady)
+
                 # Now submit them
                 logging.info("About to submit %i jobs" %(len(jobsReady)))
-                if self.glexecPath:
-                    command = 'CS=`which condor_submit`; '
-                    if self.glexecWrapScript:
-                        command += 'export GLEXEC_ENV=`%s 2>/dev/null`; ' % self.glexecWrapScript
-                    command += 'export GLEXEC_CLIENT_CERT=%s; ' % self.glexecProxyFile
-                    command += 'export GLEXEC_SOURCE_PROXY=%s; ' % self.glexecProxyFile
-                    command += 'export X509_USER_PROXY=%s; ' % self.glexecProxyFile
-                    command += 'export GLEXEC_TARGET_PROXY=%s; ' % self.jdlProxyFile
-                    if self.glexecUnwrapScript:
-                        command += '%s %s -- $CS %s' % (self.glexecPath, self.glexecUnwrapScript, jdlFile)
-                    else:
-                        command += '%s $CS %s' % (self.glexecPath, jdlFile)
-                else:
-                    command = "condor_submit %s" % jdlFile
+                command = self.submitCommand(jdlFile, schedd)
 
                 try:
-                    self.input.put({'command': command, 'idList': idList})
+                    self.input.put({'command': command, 'idList': idList,
+                                    'schedd': schedd, 'cycle': self.submitCycle})
                 except AssertionError as ex:
                     msg =  "Critical error: input pipeline probably closed.\n"
                     msg += str(ex)
@@ -428,9 +511,20 @@ class CondorPlugin(BasePlugin):
                     break
                 nSubmits += 1
 
+                # Handle what came back while we were writing the JDL
+                while nSubmits > 0:
+                    try:
+                        res = self.result.get_nowait()
+                    except Queue.Empty:
+                        break
+                    except AssertionError:
+                        break
+                    if self.handleSubmitResult(res, jobsByID, successfulJobs, failedJobs, metrics):
+                        nSubmits -= 1
+
         # Now we should have sent all jobs to be submitted
         # Going to do the rest of it now
-        for n in range(nSubmits):
+        while nSubmits > 0:
             try:
                 res = self.result.get(block = True, timeout = timeout)
             except Queue.Empty:
@@ -441,6 +535,7 @@ class CondorPlugin(BasePlugin):
                 logging.error("However, no information of any use was obtained due to process failure.")
                 logging.error("Either process failed, or process timed out after %s seconds." % timeout)
                 queueError = True
+                nSubmits -= 1
                 continue
             except AssertionError as ex:
                 msg =  "Found Assertion error while retrieving output from worker process.\n"
@@ -450,84 +545,37 @@ class CondorPlugin(BasePlugin):
                 msg += "Refreshing worker pool at end of loop"
                 logging.error(msg)
                 queueError = True
+                nSubmits -= 1
                 continue
 
-            try:
-                output   = res['stdout']
-                error    = res['stderr']
-                idList   = res['idList']
-                exitCode = res['exitCode']
-            except KeyError as ex:
-                msg =  "Error in finding key from result pipe\n"
-                msg += "Something has gone critically wrong in the worker\n"
-                try:
-                    msg += "Result: %s\n" % str(res)
-                except:
-                    pass
-                msg += str(ex)
-                logging.error(msg)
-                queueError = True
-                continue
-
-            if not exitCode == 0:
-                logging.error("Condor returned non-zero.  Printing out command stderr")
-                logging.error(error)
-                errorCheck, errorMsg = parseError(error = error)
-                logging.error("Processing failed jobs and proceeding to the next jobs.")
-                logging.error("Do not restart component.")
-            else:
-                errorCheck = None
-
-            if errorCheck:
-                self.errorCount += 1
-                condorErrorReport = Report()
-                condorErrorReport.addError("JobSubmit", 61202, "CondorError", errorMsg)
-                for jobID in idList:
-                    for job in jobs:
-                        if job.get('id', None) == jobID:
-                            job['fwjr'] = condorErrorReport
-                            failedJobs.append(job)
-                            break
-            else:
-                if self.errorCount > 0:
-                    self.errorCount -= 1
-                for jobID in idList:
-                    for job in jobs:
-                        if job.get('id', None) == jobID:
-                            successfulJobs.append(job)
-                            break
-
-            # If we get a lot of errors in a row it's probably time to
-            # report this to the operators.
-            if self.errorCount > self.errorThreshold:
-                try:
-                    msg = "Exceeded errorThreshold while submitting to condor. Check condor status."
-                    logging.error(msg)
-                    logging.error("Reporting to Alert system and continuing to process jobs")
-                    from WMCore.Alerts import API as alertAPI
-                    preAlert, sender = alertAPI.setUpAlertsMessaging(self,
-                                                                     compName = "BossAirCondorPlugin")
-                    sendAlert = alertAPI.getSendAlert(sender = sender,
-                                                      preAlert = preAlert)
-                    sendAlert(6, msg = msg)
-                    sender.unregister()
-                    self.errorCount = 0
-                except:
-                    # There's nothing we can really do here
-                    pass
+            if self.handleSubmitResult(res, jobsByID, successfulJobs, failedJobs, metrics):
+                nSubmits -= 1
 
         # Remove JDL files unless commanded otherwise
         if getattr(self.config.JobSubmitter, 'deleteJDLFiles', True):
             for f in jdlFiles:
                 os.remove(f)
 
-        # When we're finished, clean up the queue workers in order
-        # to free up memory (in the midst of the process, the forked
-        # memory space shouldn't be touched, so it should still be
-        # shared, but after this point any action by the Submitter will
-        # result in memory duplication).
-        logging.info("Purging worker pool to clean up memory")
-        self.close()
+        elapsed = max(time.time() - startTime, 1e-6)
+        self.submitMetrics = {}
+        for schedd, values in metrics.items():
+            values['rate'] = values['jobs'] / elapsed
+            self.submitMetrics[schedd or 'local'] = values
+            logging.info("Submitted %i jobs to schedd %s in %.1f seconds, %.1f jobs/s, %i failed" % (values['jobs'],
+                                                                                                   schedd or 'local',
+                                                                                                   elapsed,
+                                                                                                   values['rate'],
+                                                                                                   values['failed']))
+
+        if queueError or not self.persistentPool:
+            # When we're finished, clean up the queue workers in order
+            # to free up memory (in the midst of the process, the forked
+            # memory space shouldn't be touched, so it should still be
+            # shared, but after this point any action by the Submitter will
+            # result in memory duplication).
+            # A pool that lost results is restarted in any case.
+            logging.info("Purging worker pool to clean up memory")
+            self.close()
 
 
         # We must return a list of jobs successfully submitted,
@@ -535,6 +583,96 @@ class CondorPlugin(BasePlugin):
         logging.info("Done submitting jobs for this cycle in CondorPlugin")
         return successfulJobs, failedJobs
 
+    def handleSubmitResult(self, res, jobsByID, successfulJobs, failedJobs, metrics):
+        """
+        _handleSubmitResult_
+
+        Sort the jobs of a condor_submit result into the successful and the
+        failed ones.  Returns False for the result of an earlier cycle.
+        """
+        if res.get('cycle', None) != self.submitCycle:
+            logging.error("Ignoring a result from a previous submit cycle: %s" % res.get('idList', None))
+            return False
+
+        try:
+            output   = res['stdout']
+            error    = res['stderr']
+            idList   = res['idList']
+            exitCode = res['exitCode']
+        except KeyError as ex:
+            msg =  "Error in finding key from result pipe\n"
+            msg += "Something has gone critically wrong in the worker\n"
+            try:
+                msg += "Result: %s\n" % str(res)
+            except:
+                pass
+            msg += str(ex)
+            logging.error(msg)
+            return True
+
+        schedd = res.get('schedd', None)
+        metrics[schedd]['time'] += res.get('time', 0)
+
+        if not exitCode == 0:
+            logging.error("Condor returned non-zero.  Printing out command stderr")
+            logging.error(error)
+            errorCheck, errorMsg = parseError(error = error)
+            logging.error("Processing failed jobs and proceeding to the next jobs.")
+            logging.error("Do not restart component.")
+        else:
+            errorCheck = None
+
+        if errorCheck:
+            self.errorCount += 1
+            condorErrorReport = Report()
+            condorErrorReport.addError("JobSubmit", 61202, "CondorError", errorMsg)
+            for jobID in idList:
+                job = jobsByID.get(jobID)
+                if job != None:
+                    job['fwjr'] = condorErrorReport
+                    failedJobs.append(job)
+            metrics[schedd]['failed'] += len(idList)
+        else:
+            if self.errorCount > 0:
+                self.errorCount -= 1
+            for jobID in idList:
+                job = jobsByID.get(jobID)
+                if job != None:
+                    successfulJobs.append(job)
+                    if schedd:
+                        self.jobSchedds[job.get('jobid', None)] = schedd
+            metrics[schedd]['jobs'] += len(idList)
+
+        # If we get a lot of errors in a row it's probably time to
+        # report this to the operators.
+        if self.errorCount > self.errorThreshold:
+            try:
+                msg = "Exceeded errorThreshold while submitting to condor. Check condor status."
+                logging.error(msg)
+                logging.error("Reporting to Alert system and continuing to process jobs")
+                from WMCore.Alerts import API as alertAPI
+                preAlert, sender = alertAPI.setUpAlertsMessaging(self,
+                                                                 compName = "BossAirCondorPlugin")
+                sendAlert = alertAPI.getSendAlert(sender = sender,
+                                                  preAlert = preAlert)
+                sendAlert(6, msg = msg)
+                sender.unregister()
+                self.errorCount = 0
+            except:
+                # There's nothing we can really do here
+                pass
+
+        return True
+
+    def getSubmitMetrics(self):
+        """
+        _getSubmitMetrics_
+
+        Jobs submitted, failed, seconds spent in condor_submit and jobs/s
+        per schedd in the last submit cycle
+        """
+        return self.submitMetrics
+
 
 
 
@@ -556,6 +694,12 @@ class CondorPlugin(BasePlugin):
 
         # Get the job
         jobInfo = self.getClassAds()
+        if jobInfo != None and self.snapshot.cached:
+            # Only conclude that jobs left condor on fresh information
+            for job in jobs:
+                if not job['jobid'] in jobInfo:
+                    jobInfo = self.getClassAds(maxAge = 0)
+                    break
         if jobInfo == None:
             return runningList, changeList, completeList
         if len(jobInfo.keys()) == 0:
@@ -563,7 +707,7 @@ class CondorPlugin(BasePlugin):
 
         for job in jobs:
             # Now go over the jobs from WMBS and see what we have
-            if not job['jobid'] in jobInfo.keys():
+            if not job['jobid'] in jobInfo:
                 # Two options here, either put in removed, or not
                 # Only cycle through Removed if condor_q is sending
                 # us no information
@@ -731,6 +875,8 @@ class CondorPlugin(BasePlugin):
         """
         jobInfo = self.getClassAds()
         jobtokill=[]
+        # New DESIRED_Sites -> IDs of the jobs to edit
+        siteEdits = {}
         for job in jobs:
             jobID = job['id']
             jobAd = jobInfo.get(jobID)
@@ -747,10 +893,7 @@ class CondorPlugin(BasePlugin):
                         if len(usi) > 1:
                             usi.remove(siteName)
                             usi = ','.join(map(str, usi))
-                            command = 'condor_qedit  -constraint \'WMAgent_JobID==%i\' DESIRED_Sites \'"%s"\'' %(jobID, usi)
-                            proc = subprocess.Popen(command, stderr = subprocess.PIPE,
-                                                    stdout = subprocess.PIPE, shell = True)
-                            out, err = proc.communicate()
+                            siteEdits.setdefault(usi, []).append(jobID)
                         else:
                             jobtokill.append(job)
                     else:
@@ -762,32 +905,104 @@ class CondorPlugin(BasePlugin):
                         usi = desiredSites
                         usi.append(siteName)
                         usi = ','.join(map(str, usi))
-                        command = 'condor_qedit  -constraint \'WMAgent_JobID==%i\' DESIRED_Sites \'"%s"\'' %(jobID, usi)
-                        proc = subprocess.Popen(command, stderr = subprocess.PIPE,
-                                                stdout = subprocess.PIPE, shell = True)
-                        out, err = proc.communicate()
+                        siteEdits.setdefault(usi, []).append(jobID)
                     else :
                         #If job doesn't have the siteName in the siteList, just ignore it
                         logging.debug("Cannot find siteName %s in the sitelist" % siteName)
 
+        # Edit all the jobs going to the same sites together
+        for usi, jobIDs in siteEdits.items():
+            results = {}
+            for schedd, scheddJobIDs in self.groupBySchedd(jobIDs).items():
+                editSites = lambda batch: self.runCondorCommand(['condor_qedit', '-constraint',
+                                                                 jobIDConstraint(batch),
+                                                                 'DESIRED_Sites', '"%s"' % usi],
+                                                                schedd)
+                queuedJobIDs = lambda batch: self.queryJobIDs(jobIDConstraint(batch), schedd)
+                results.update(bulkJobAction(editSites, scheddJobIDs, self.bulkSize, queuedJobIDs))
+            self.snapshot.updateJobs([jobID for jobID in jobIDs if results[jobID]], 'DESIRED_Sites', usi)
+            failed = [jobID for jobID in jobIDs if not results[jobID]]
+            if failed:
+                logging.error("Could not set DESIRED_Sites to %s for %i jobs: %s" % (usi, len(failed), failed))
+
         return jobtokill
 
 
-    def kill(self, jobs, info=None):
+    def scheddCommands(self, command, schedd = None):
         """
-        _kill_
+        _scheddCommands_
 
-        Kill a list of jobs based on the WMBS job names.
+        The command to run on the given schedd, or on every schedd in
+        BossAir.condorSchedds.  Returns a list of (schedd, command), the
+        schedd is None for the local one.
         """
-        for job in jobs:
-            jobID = job['jobid']
-            # This is a very long and painful command to run
-            command = 'condor_rm -constraint \"WMAgent_JobID =?= %i\"' % (jobID)
-            proc = subprocess.Popen(command, stderr = subprocess.PIPE,
-                                    stdout = subprocess.PIPE, shell = True)
+        if schedd:
+            return [(schedd, command[:1] + ['-name', schedd] + command[1:])]
+        if not self.schedds:
+            return [(None, command)]
+        return [(x, command[:1] + ['-name', x] + command[1:]) for x in self.schedds]
+
+    def groupBySchedd(self, jobIDs):
+        """
+        _groupBySchedd_
+
+        Group job IDs by the schedd they are known to be in, None for the
+        ones that could be in any of them.
+        """
+        if not self.schedds:
+            return {None: jobIDs}
+        groups = {}
+        for jobID in jobIDs:
+            groups.setdefault(self.jobSchedds.get(jobID), []).append(jobID)
+        return groups
+
+    def runCondorCommand(self, command, schedd = None):
+        """
+        _runCondorCommand_
+
+        Run a condor command on a schedd, on all of them if it isn't given.
+        Return True if it succeeded on at least one.
+        """
+        success = False
+        for schedd, scheddCommand in self.scheddCommands(command, schedd):
+            proc = subprocess.Popen(scheddCommand, stderr = subprocess.PIPE,
+                                    stdout = subprocess.PIPE)
             out, err = proc.communicate()
+            if proc.returncode != 0:
+                logging.debug("%s exited with code %i: %s" % (command[0], proc.returncode, err))
+            else:
+                success = True
+        return success
 
-        return
+    def kill(self, jobs, info=None):
+        """
+        _kill_
+
+        Kill a list of jobs based on the WMBS job names.  The jobs are
+        removed in batches of condorBulkSize jobs.  Jobs that already left
+        the queue count as removed.
+
+        Returns a dictionary of job ID -> True if the job is out of the queue
+        """
+        jobIDs = [job['jobid'] for job in jobs]
+        results = {}
+        for schedd, scheddJobIDs in self.groupBySchedd(jobIDs).items():
+            removeJobs = lambda batch: self.runCondorCommand(['condor_rm', '-constraint',
+                                                              jobIDConstraint(batch)],
+                                                             schedd)
+            queuedJobIDs = lambda batch: self.queryJobIDs("JobStatus =!= 3 && (%s)" % jobIDConstraint(batch),
+                                                          schedd)
+            results.update(bulkJobAction(removeJobs, scheddJobIDs, self.bulkSize, queuedJobIDs))
+        removed = [jobID for jobID in jobIDs if results[jobID]]
+        self.snapshot.removeJobs(removed)
+        for jobID in removed:
+            self.jobSchedds.pop(jobID, None)
+
+        failed = [jobID for jobID in jobIDs if not results[jobID]]
+        if failed:
+            logging.error("Could not remove %i of %i jobs: %s" % (len(failed), len(jobIDs), failed))
+
+        return results
 
     def killWorkflowJobs(self, workflow):
         """
@@ -795,10 +1010,9 @@ class CondorPlugin(BasePlugin):
 
         Kill all the jobs belonging to a specif workflow.
         """
-        command = 'condor_rm -constraint \'WMAgent_RequestName == "%s"\'' % workflow
-        proc = subprocess.Popen(command, stderr = subprocess.PIPE,
-                                stdout = subprocess.PIPE, shell = True)
-        out, err = proc.communicate()
+        self.runCondorCommand(['condor_rm', '-constraint',
+                               'WMAgent_RequestName == "%s"' % workflow])
+        self.snapshot.expire()
 
         return
 
@@ -815,25 +1029,24 @@ class CondorPlugin(BasePlugin):
         if 'taskPriority' in kwargs and 'requestPriority' in kwargs:
             # Do a priority update
             priority = (int(kwargs['requestPriority']) + int(kwargs['taskPriority'] * self.maxTaskPriority))
-            command = 'condor_qedit -constraint \'WMAgent_SubTaskName == "%s" && WMAgent_RequestName == "%s" ' %(task, workflow)
-            command += '&& (JobPrio != %d)\' JobPrio %d' % (priority, priority)
-            command = shlex.split(command)
-            proc = subprocess.Popen(command, stderr = subprocess.PIPE,
-                                    stdout = subprocess.PIPE)
-            _, stderr = proc.communicate()
-            if proc.returncode != 0:
-                # Check if there are actually jobs to update
-                command = 'condor_q -constraint \'WMAgent_SubTaskName == "%s" && WMAgent_RequestName == "%s"' %(task, workflow)
-                command += ' && (JobPrio != %d)\'' % priority
-                command += ' -format \'WMAgentID:\%d:::\' WMAgent_JobID'               
-                command = shlex.split(command)
-                proc = subprocess.Popen(command, stderr = subprocess.PIPE,
+            constraint = 'WMAgent_SubTaskName == "%s" && WMAgent_RequestName == "%s" ' % (task, workflow)
+            constraint += '&& (JobPrio != %d)' % priority
+            command = ['condor_qedit', '-constraint', constraint, 'JobPrio', str(priority)]
+            for schedd, scheddCommand in self.scheddCommands(command):
+                proc = subprocess.Popen(scheddCommand, stderr = subprocess.PIPE,
                                         stdout = subprocess.PIPE)
-                stdout, _ = proc.communicate()
-                if stdout != '':
-                    msg = 'HTCondor edit failed with exit code %d\n'% proc.returncode
-                    msg += 'Error was: %s' % stderr
-                    raise BossAirPluginException(msg)
+                _, stderr = proc.communicate()
+                if proc.returncode != 0:
+                    # Check if there are actually jobs to update
+                    command = ['condor_q', '-constraint', constraint,
+                               '-format', 'WMAgentID:%d:::', 'WMAgent_JobID']
+                    proc = subprocess.Popen(self.scheddCommands(command, schedd)[0][1],
+                                            stderr = subprocess.PIPE, stdout = subprocess.PIPE)
+                    stdout, _ = proc.communicate()
+                    if stdout != '':
+                        msg = 'HTCondor edit failed with exit code %d\n'% proc.returncode
+                        msg += 'Error was: %s' % stderr
+                        raise BossAirPluginException(msg)
 
         return
 
@@ -1064,64 +1277,97 @@ class CondorPlugin(BasePlugin):
             self.locationDict[jobSite] = siteInfo[0].get('ce_name', None)
         return self.locationDict[jobSite]
 
-    def getClassAds(self):
+    def getClassAds(self, maxAge = None):
         """
         _getClassAds_
 
-        Grab classAds from condor_q using xml parsing
+        Return the classAds of the jobs in condor from the snapshot, it is
+        refreshed if it is older than maxAge seconds, BossAir.classAdTTL by
+        default.
+
+        Returns a dictionary of job ID -> JobAd or None if condor_q failed
         """
+        return self.snapshot.getClassAds(maxAge = maxAge)
 
-        jobInfo = {}
+    def queryClassAds(self, constraint = None):
+        """
+        _queryClassAds_
 
-        command = ['condor_q', '-constraint', 'WMAgent_JobID =!= UNDEFINED',
-                   '-constraint', 'WMAgent_AgentName == \"%s\"' % (self.agent),
-                   '-format', '(JobStatus:\%s)  ', 'JobStatus',
-                   '-format', '(stateTime:\%s)  ', 'EnteredCurrentStatus',
-                   '-format', '(runningTime:\%s)  ', 'JobStartDate',
-                   '-format', '(submitTime:\%s)  ', 'QDate',
-                   '-format', '(DESIRED_Sites:\%s)  ', 'DESIRED_Sites',
-                   '-format', '(ExtDESIRED_Sites:\%s)  ', 'ExtDESIRED_Sites',
-                   '-format', '(runningCMSSite:\%s)  ', 'MATCH_EXP_JOBGLIDEIN_CMSSite',
-                   '-format', '(WMAgentID:\%d):::',  'WMAgent_JobID']
-
-        pipe = subprocess.Popen(command, stdout = subprocess.PIPE, stderr = subprocess.PIPE, shell = False)
-        stdout, _ = pipe.communicate()
-        classAdsRaw = stdout.split(':::')
-
-        if not pipe.returncode == 0:
-            # Then things have gotten bad - condor_q is not responding
-            logging.error("condor_q returned non-zero value %s" % str(pipe.returncode))
-            logging.error("Skipping classAd processing this round")
-            return None
+        Grab classAds from condor_q, the output is parsed as it comes in
+        the format set by BossAir.condorQFormat, autoformat or json.  Only
+        the jobs matching the extra constraint are returned if it is set.
 
-        if classAdsRaw == '':
-            # We have no jobs
-            return jobInfo
+        Returns a dictionary of job ID -> JobAd
+        """
 
-        for ad in classAdsRaw:
-            # There should be one for every job
-            if not re.search("\(", ad):
-                # There is no ad.
-                # Don't know what happened here
-                continue
-            statements = ad.split('(')
-            tmpDict = {}
-            for statement in statements:
-                # One for each value
-                if not re.search(':', statement):
-                    # Then we have an empty statement
+        jobInfo = {}
+        jobSchedds = {}
+
+        command = ['condor_q', '-constraint', 'WMAgent_JobID =!= UNDEFINED',
+                   '-constraint', 'WMAgent_AgentName == \"%s\"' % (self.agent)]
+        if constraint:
+            command.extend(['-constraint', constraint])
+        command.extend(condorQArguments(self.condorQFormat))
+
+        for schedd, scheddCommand in self.scheddCommands(command):
+            # Keep stderr out of the pipe so that it can't block condor_q
+            errors = tempfile.TemporaryFile()
+            pipe = subprocess.Popen(scheddCommand, stdout = subprocess.PIPE, stderr = errors, shell = False)
+
+            for jobAd in CLASSAD_PARSERS[self.condorQFormat](pipe.stdout):
+                # There should be one for every job
+                if jobAd.WMAgentID == None:
+                    # Then we have an invalid job somehow
+                    logging.error("Invalid job discovered in condor_q")
+                    logging.error(jobAd)
                     continue
-                key = str(statement.split(':')[0])
-                value = statement.split(':')[1].split(')')[0]
-                tmpDict[key] = value
-            if not 'WMAgentID' in tmpDict.keys():
-                # Then we have an invalid job somehow
-                logging.error("Invalid job discovered in condor_q")
-                logging.error(tmpDict)
-                continue
+                jobInfo[int(jobAd.WMAgentID)] = jobAd
+                jobSchedds[int(jobAd.WMAgentID)] = schedd
+            pipe.wait()
+
+            if not pipe.returncode == 0:
+                # Then things have gotten bad - condor_q is not responding
+                errors.seek(0)
+                logging.error("condor_q returned non-zero value %s" % str(pipe.returncode))
+                logging.error(errors.read(4096))
+                logging.error("Skipping classAd processing this round")
+                return None
+
+        if self.schedds:
+            if constraint == None:
+                self.jobSchedds = jobSchedds
             else:
-                jobInfo[int(tmpDict['WMAgentID'])] = tmpDict
+                self.jobSchedds.update(jobSchedds)
 
-        logging.info("Retrieved %i classAds" % len(jobInfo))
+        logging.debug("Retrieved %i classAds" % len(jobInfo))
 
         return jobInfo
+
+    def queryJobIDs(self, constraint = None, schedd = None):
+        """
+        _queryJobIDs_
+
+        Return the set of IDs of the jobs in condor, only the ones matching
+        the extra constraint if it is set, on the given schedd or on all of
+        them.  None if condor_q failed.
+        """
+        command = ['condor_q', '-constraint', 'WMAgent_JobID =!= UNDEFINED',
+                   '-constraint', 'WMAgent_AgentName == \"%s\"' % (self.agent)]
+        if constraint:
+            command.extend(['-constraint', constraint])
+        command.extend(['-af', 'WMAgent_JobID'])
+
+        jobIDs = set()
+        for schedd, scheddCommand in self.scheddCommands(command, schedd):
+            errors = tempfile.TemporaryFile()
+            pipe = subprocess.Popen(scheddCommand, stdout = subprocess.PIPE, stderr = errors, shell = False)
+            jobIDs.update(parseJobIDs(pipe.stdout))
+            pipe.wait()
+
+            if not pipe.returncode == 0:
+                errors.seek(0)
+                logging.error("condor_q returned non-zero value %s" % str(pipe.returncode))
+                logging.error(errors.read(4096))
+                return None
+
+        return jobIDs
@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+"""
+_CondorUtils_
+
+Helpers shared by the condor plugins to act on many jobs at once.  Jobs are
+selected with a single constraint OR-ing their WMAgent_JobIDs, one command
+or schedd call per batch instead of one per job.
+
+Also a streaming parser for the condor_q output, in autoformat (-af:t) or
+JSON (-json) mode.  The output is read in chunks and every job becomes a
+small JobAd record holding only the attributes that were asked for, and a
+snapshot of the queue shared by the plugin operations that is refreshed
+incrementally.
+"""
+
+import re
+import json
+import time
+import logging
+
+# condor_q attribute -> name of the value in a JobAd
+CLASSAD_ATTRIBUTES = [('JobStatus', 'JobStatus'),
+                      ('EnteredCurrentStatus', 'stateTime'),
+                      ('JobStartDate', 'runningTime'),
+                      ('QDate', 'submitTime'),
+                      ('DESIRED_Sites', 'DESIRED_Sites'),
+                      ('ExtDESIRED_Sites', 'ExtDESIRED_Sites'),
+                      ('MATCH_EXP_JOBGLIDEIN_CMSSite', 'runningCMSSite'),
+                      ('WMAgent_JobID', 'WMAgentID')]
+
+# Whitespace and separators between the ads of the JSON output
+JSON_SEPARATORS = re.compile(r'[\s\[\],]*')
+
+
+def jobIDConstraint(jobIDs, attribute = 'WMAgent_JobID'):
+    """
+    _jobIDConstraint_
+
+    ClassAd constraint matching the jobs with the given IDs
+    """
+    return " || ".join(["%s =?= %i" % (attribute, jobID) for jobID in jobIDs])
+
+
+def bulkJobAction(action, jobIDs, batchSize = 500, queuedJobIDs = None):
+    """
+    _bulkJobAction_
+
+    Call action with batches of at most batchSize job IDs, it returns True
+    if the command succeeded.  condor_rm and condor_qedit with a constraint
+    succeed as soon as one job matches and only fail if none does or if the
+    schedd refused, so a failure says nothing about single jobs and is not
+    bisected.  queuedJobIDs(batch) returns the jobs of a failed batch that
+    are still in the queue, or None if condor_q failed.  They are the ones
+    the action failed for, the others left the queue and need nothing done.
+
+    Returns a dictionary of job ID -> True/False
+    """
+    results = {}
+    for i in range(0, len(jobIDs), batchSize):
+        batch = jobIDs[i:i + batchSize]
+        try:
+            success = action(batch)
+        except Exception as ex:
+            logging.error("Error acting on %i jobs: %s" % (len(batch), str(ex)))
+            success = False
+
+        queued = None
+        if not success and queuedJobIDs != None:
+            queued = queuedJobIDs(batch)
+
+        for jobID in batch:
+            if queued != None:
+                results[jobID] = jobID not in queued
+            else:
+                results[jobID] = success
+
+    return results
+
+
+class JobAd(object):
+    """
+    _JobAd_
+
+    The attributes of a job in the condor queue.  Undefined attributes are
+    None, values are the strings printed by condor_q.  Reads like the
+    dictionaries the plugins used to build.
+    """
+    __slots__ = [name for attribute, name in CLASSAD_ATTRIBUTES]
+
+    def __init__(self, values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+        return
+
+    def get(self, key, default = None):
+        value = getattr(self, key, None)
+        if value == None:
+            return default
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value == None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) != None
+
+    def keys(self):
+        return [name for name in self.__slots__ if getattr(self, name) != None]
+
+    def __repr__(self):
+        return repr(dict([(name, getattr(self, name)) for name in self.keys()]))
+
+
+def readChunks(stream, chunkSize = 65536):
+    """
+    _readChunks_
+
+    Read a stream in chunks until the end
+    """
+    while True:
+        chunk = stream.read(chunkSize)
+        if not chunk:
+            break
+        yield chunk
+
+
+def parseAutoformat(stream, chunkSize = 65536):
+    """
+    _parseAutoformat_
+
+    Parse the output of condor_q -af:t with the CLASSAD_ATTRIBUTES, one
+    tab separated line per job.  Yields a JobAd for every job.
+    """
+    nAttributes = len(CLASSAD_ATTRIBUTES)
+    remainder = ''
+    for chunk in readChunks(stream, chunkSize):
+        lines = (remainder + chunk).split('\n')
+        remainder = lines.pop()
+        for line in lines:
+            if not line:
+                continue
+            values = line.split('\t')
+            if len(values) != nAttributes:
+                logging.error("Invalid job discovered in condor_q: %s" % line)
+                continue
+            yield JobAd([None if x == 'undefined' else x for x in values])
+
+    if remainder:
+        values = remainder.split('\t')
+        if len(values) == nAttributes:
+            yield JobAd([None if x == 'undefined' else x for x in values])
+        else:
+            logging.error("Invalid job discovered in condor_q: %s" % remainder)
+
+    return
+
+
+def parseJSON(stream, chunkSize = 65536):
+    """
+    _parseJSON_
+
+    Parse the output of condor_q -json, an array of ads, one ad at a time.
+    Yields a JobAd for every job.
+    """
+    attributes = [attribute for attribute, name in CLASSAD_ATTRIBUTES]
+    decoder = json.JSONDecoder()
+    buffer = ''
+    for chunk in readChunks(stream, chunkSize):
+        buffer += chunk
+        position = 0
+        while True:
+            position = JSON_SEPARATORS.match(buffer, position).end()
+            try:
+                ad, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # The ad isn't complete yet
+                break
+            position = end
+            yield JobAd([None if x is None else str(x) for x in map(ad.get, attributes)])
+        buffer = buffer[position:]
+
+    if buffer.strip(' \t\r\n[],'):
+        logging.error("Invalid output at the end of condor_q: %s" % buffer[:200])
+
+    return
+
+
+CLASSAD_PARSERS = {'autoformat': parseAutoformat,
+                   'json': parseJSON}
+
+
+def condorQArguments(outputFormat):
+    """
+    _condorQArguments_
+
+    condor_q arguments printing the CLASSAD_ATTRIBUTES in the given format
+    """
+    attributes = [attribute for attribute, name in CLASSAD_ATTRIBUTES]
+    if outputFormat == 'json':
+        return ['-json', '-attributes', ','.join(attributes)]
+    return ['-af:t'] + attributes
+
+
+def parseJobIDs(stream, chunkSize = 65536):
+    """
+    _parseJobIDs_
+
+    Parse the output of condor_q -af WMAgent_JobID into a set of job IDs
+    """
+    jobIDs = set()
+    remainder = ''
+    for chunk in readChunks(stream, chunkSize):
+        lines = (remainder + chunk).split('\n')
+        remainder = lines.pop()
+        for line in lines:
+            if line.strip():
+                jobIDs.add(int(line))
+    if remainder.strip():
+        jobIDs.add(int(remainder))
+
+    return jobIDs
+
+
+class ClassAdSnapshot(object):
+    """
+    _ClassAdSnapshot_
+
+    Copy of the ads of the jobs in the condor queue shared by the plugin
+    operations.  It is refreshed at most once every ttl seconds.  A refresh
+    only loads the ads of the jobs that were queued or changed status
+    (EnteredCurrentStatus) since the previous one and drops the jobs that
+    left the queue, the whole queue is loaded again every fullRefresh
+    seconds.  Changes made by the plugin itself are applied to the
+    snapshot directly.
+
+    queryAds(constraint) returns a dictionary of job ID -> JobAd for the
+    jobs matching the extra constraint, or all of them if it is None, and
+    queryJobIDs() the set of job IDs in the queue.  Both return None if
+    condor_q failed.
+    """
+
+    def __init__(self, queryAds, queryJobIDs, ttl = 60, fullRefresh = 1800, margin = 60):
+        self.queryAds    = queryAds
+        self.queryJobIDs = queryJobIDs
+        self.ttl         = ttl
+        self.fullRefresh = fullRefresh
+        # Seconds of overlap between refreshes, covers clock differences
+        self.margin      = margin
+
+        self.jobAds          = None
+        self.lastRefresh     = None
+        self.lastFullRefresh = None
+        self.refreshTime     = None
+        self.fullRefreshes   = 0
+        self.deltaRefreshes  = 0
+        self.cacheHits       = 0
+        # Whether the last getClassAds() call was served from the snapshot
+        self.cached          = False
+        self.expired         = False
+        return
+
+    def getClassAds(self, maxAge = None):
+        """
+        _getClassAds_
+
+        Return the job ads, refresh them if they are older than maxAge
+        seconds, ttl by default.  Returns None if the refresh failed.
+        """
+        if maxAge == None:
+            maxAge = self.ttl
+
+        startTime = time.time()
+        if self.jobAds != None and not self.expired and startTime - self.lastRefresh < maxAge:
+            self.cached = True
+            self.cacheHits += 1
+            return self.jobAds
+
+        self.cached = False
+        if self.jobAds == None or startTime - self.lastFullRefresh >= self.fullRefresh:
+            jobAds = self.queryAds(None)
+            if jobAds == None:
+                return None
+            self.jobAds = jobAds
+            self.lastFullRefresh = startTime
+            self.fullRefreshes += 1
+            mode = "full"
+        else:
+            since = int(self.lastRefresh - self.margin)
+            changedAds = self.queryAds("EnteredCurrentStatus >= %i || QDate >= %i" % (since, since))
+            if changedAds == None:
+                return None
+            jobIDs = self.queryJobIDs()
+            if jobIDs == None:
+                return None
+
+            for jobID in self.jobAds.keys():
+                if jobID not in jobIDs:
+                    del self.jobAds[jobID]
+            self.jobAds.update(changedAds)
+
+            # Jobs we never saw, like the ones that were queued while
+            # the previous refresh was running
+            unknownIDs = list(jobIDs.difference(self.jobAds))
+            for i in range(0, len(unknownIDs), 500):
+                unknownAds = self.queryAds(jobIDConstraint(unknownIDs[i:i + 500]))
+                if unknownAds == None:
+                    return None
+                self.jobAds.update(unknownAds)
+            self.deltaRefreshes += 1
+            mode = "incremental"
+
+        self.lastRefresh = startTime
+        self.expired     = False
+        self.refreshTime = time.time() - startTime
+        logging.info("%s classAd refresh: %i jobs in %.2f seconds" % (mode.capitalize(),
+                                                                       len(self.jobAds),
+                                                                       self.refreshTime))
+        return self.jobAds
+
+    def expire(self):
+        """
+        _expire_
+
+        Refresh on the next call, for changes that can't be applied to the
+        snapshot directly
+        """
+        self.expired = True
+        return
+
+    def removeJobs(self, jobIDs):
+        """
+        _removeJobs_
+
+        Drop jobs that were removed from the queue
+        """
+        if self.jobAds != None:
+            for jobID in jobIDs:
+                self.jobAds.pop(jobID, None)
+        return
+
+    def updateJobs(self, jobIDs, name, value):
+        """
+        _updateJobs_
+
+        Set a value in the ads of jobs that were edited
+        """
+        if self.jobAds != None:
+            for jobID in jobIDs:
+                if jobID in self.jobAds:
+                    setattr(self.jobAds[jobID], name, value)
+        return
+
+    def getMetrics(self):
+        """
+        _getMetrics_
+
+        Age of the snapshot, duration of the last refresh and refresh counts
+        """
+        staleness = None
+        if self.lastRefresh != None:
+            staleness = time.time() - self.lastRefresh
+        return {'jobs': len(self.jobAds or {}),
+                'staleness': staleness,
+                'refreshTime': self.refreshTime,
+                'fullRefreshes': self.fullRefreshes,
+                'deltaRefreshes': self.deltaRefreshes,
+                'cacheHits': self.cacheHits}
@@ -28,6 +28,7 @@ from WMCore.DAOFactory                 import DAOFactory
 from WMCore.WMException                import WMException
 from WMCore.WMInit                     import getWMBASE
 from WMCore.BossAir.Plugins.BasePlugin import BasePlugin, BossAirPluginException
+from WMCore.BossAir.Plugins.CondorUtils import jobIDConstraint, bulkJobAction
 from WMCore.FwkJobReport.Report        import Report
 from WMCore.Algorithms                 import SubprocessAlgos
 
@@ -213,6 +214,8 @@ class PyCondorPlugin(BasePlugin):
         self.errorCount    = 0
         self.defaultTaskPriority = getattr(config.BossAir, 'defaultTaskPriority', 0)
         self.maxTaskPriority     = getattr(config.BossAir, 'maxTaskPriority', 1e7)
+        # Number of jobs acted on by a single schedd call
+        self.bulkSize            = getattr(config.BossAir, 'condorBulkSize', 500)
 
         # Required for global pool accounting
         self.acctGroup = getattr(config.BossAir, 'acctGroup', "production")
@@ -697,6 +700,8 @@ class PyCondorPlugin(BasePlugin):
         """
         jobInfo, sd = self.getClassAds()
         jobtokill=[]
+        # New DESIRED_Sites -> IDs of the jobs to edit
+        siteEdits = {}
         for job in jobs:
             jobID = job['id']
             jobAd = jobInfo.get(jobID)
@@ -712,7 +717,7 @@ class PyCondorPlugin(BasePlugin):
                         if len(usi) > 1:
                             usi.remove(siteName)
                             usi = ','.join(map(str, usi))
-                            sd.edit('WMAgent_JobID == %i'%jobID, "DESIRED_Sites", classad.ExprTree('"%s"'% usi))
+                            siteEdits.setdefault(usi, []).append(jobID)
                         else:
                             jobtokill.append(job)
                     else:
@@ -724,11 +729,22 @@ class PyCondorPlugin(BasePlugin):
                         usi = desiredSites
                         usi.append(siteName)
                         usi = ','.join(map(str, usi))
-                        sd.edit('WMAgent_JobID == %i'%jobID, "DESIRED_Sites", classad.ExprTree('"%s"'% usi))
+                        siteEdits.setdefault(usi, []).append(jobID)
                     else:
                         #If job doesn't have the siteName in the siteList, just ignore it
                         logging.debug("Cannot find siteName %s in the sitelist" % siteName)
 
+        # Edit all the jobs going to the same sites together
+        for usi, jobIDs in siteEdits.items():
+            def editSites(batch):
+                sd.edit(jobIDConstraint(batch), "DESIRED_Sites", classad.ExprTree('"%s"' % usi))
+                return True
+            queuedJobIDs = lambda batch: self.queryJobIDs(sd, jobIDConstraint(batch))
+            results = bulkJobAction(editSites, jobIDs, self.bulkSize, queuedJobIDs)
+            failed = [jobID for jobID in jobIDs if not results[jobID]]
+            if failed:
+                logging.error("Could not set DESIRED_Sites to %s for %i jobs: %s" % (usi, len(failed), failed))
+
         return jobtokill
 
 
@@ -739,14 +755,42 @@ class PyCondorPlugin(BasePlugin):
 
         Kill a list of jobs based on the WMBS job names.
         Kill can happen for schedd running on localhost... TBC.
+        The jobs are removed in batches of condorBulkSize jobs.  Jobs that
+        already left the queue count as removed.
+
+        Returns a dictionary of job ID -> True if the job is out of the queue
         """
         sd = condor.Schedd()
-        for job in jobs:
-            logging.debug("Going to remove jobid=%i from the queue" % job['jobid'])
-            sd.act(condor.JobAction.Remove, 'WMAgent_JobID == %i' % job['jobid'])
-            logging.debug("Removed jobid=%i from the queue" % job['jobid'])
+        jobIDs = [job['jobid'] for job in jobs]
 
-        return
+        def removeJobs(batch):
+            logging.debug("Going to remove %i jobs from the queue" % len(batch))
+            result = sd.act(condor.JobAction.Remove, jobIDConstraint(batch))
+            # Jobs that were not found left the queue already
+            return result.get('TotalError', 0) == 0
+
+        queuedJobIDs = lambda batch: self.queryJobIDs(sd, "JobStatus =!= 3 && (%s)" % jobIDConstraint(batch))
+        results = bulkJobAction(removeJobs, jobIDs, self.bulkSize, queuedJobIDs)
+
+        failed = [jobID for jobID in jobIDs if not results[jobID]]
+        if failed:
+            logging.error("Could not remove %i of %i jobs: %s" % (len(failed), len(jobIDs), failed))
+
+        return results
+
+    def queryJobIDs(self, sd, constraint):
+        """
+        _queryJobIDs_
+
+        Return the set of IDs of the jobs in the schedd matching the
+        constraint, None if the query failed
+        """
+        try:
+            ads = sd.query(constraint, ['WMAgent_JobID'])
+        except Exception as ex:
+            logging.error("Query to condor schedd failed in PyCondorPlugin: %s" % str(ex))
+            return None
+        return set([int(ad['WMAgent_JobID']) for ad in ads if 'WMAgent_JobID' in ad])
 
     def killWorkflowJobs(self, workflow):
         """
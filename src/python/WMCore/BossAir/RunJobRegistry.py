@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+_RunJobRegistry_
+
+The active jobs tracked by BossAir, indexed by RunJob ID and WMBS ID.
+"""
+
+from WMCore.BossAir.RunJob import RunJob
+
+
+class RunJobRegistry(object):
+    """
+    _RunJobRegistry_
+
+    Keeps the RunJobs built for tracking between cycles.  Every cycle it is
+    given the bl_runjob rows of the active jobs, a job is only loaded in
+    full again if its row changed since the previous cycle.
+    """
+
+    def __init__(self):
+        # RunJob ID -> bl_runjob row
+        self.rows     = {}
+        # RunJob ID -> full information of the job, as loaded by ID
+        self.loaded   = {}
+        # RunJob ID -> RunJob handed to the plugins
+        self.jobs     = {}
+        # WMBS ID -> set of RunJob IDs
+        self.byWMBSID = {}
+        return
+
+    def __len__(self):
+        return len(self.rows)
+
+    def sync(self, rows):
+        """
+        _sync_
+
+        Replace the rows of the active jobs.  Jobs that are no longer
+        active are dropped and the ones whose row changed will be loaded
+        again.  Returns the number of new or changed jobs.
+        """
+        newRows = {}
+        changed = 0
+        kept    = 0
+        for row in rows:
+            runJobID = row['id']
+            newRows[runJobID] = row
+            oldRow = self.rows.get(runJobID)
+            if oldRow != None:
+                kept += 1
+            if oldRow == row:
+                continue
+            changed += 1
+            self.loaded.pop(runJobID, None)
+            self.jobs.pop(runJobID, None)
+            if oldRow == None:
+                self.byWMBSID.setdefault(row['jobid'], set()).add(runJobID)
+            elif oldRow['jobid'] != row['jobid']:
+                self._unindex(runJobID, oldRow['jobid'])
+                self.byWMBSID.setdefault(row['jobid'], set()).add(runJobID)
+
+        if kept < len(self.rows):
+            for runJobID in set(self.rows).difference(newRows):
+                self._unindex(runJobID, self.rows[runJobID]['jobid'])
+                self.loaded.pop(runJobID, None)
+                self.jobs.pop(runJobID, None)
+
+        self.rows = newRows
+        return changed
+
+    def _unindex(self, runJobID, wmbsID):
+        """
+        _unindex_
+
+        Remove a job from the WMBS ID index
+        """
+        runJobIDs = self.byWMBSID.get(wmbsID)
+        if runJobIDs != None:
+            runJobIDs.discard(runJobID)
+            if not runJobIDs:
+                del self.byWMBSID[wmbsID]
+        return
+
+    def select(self, runJobIDs = None, wmbsIDs = None):
+        """
+        _select_
+
+        IDs of the active jobs with one of the runJobIDs and one of the
+        wmbsIDs, all of them if neither is given.
+        """
+        if runJobIDs:
+            selected = set(self.rows).intersection(runJobIDs)
+        else:
+            selected = None
+
+        if wmbsIDs:
+            byWMBS = set()
+            for wmbsID in set(wmbsIDs):
+                byWMBS.update(self.byWMBSID.get(wmbsID, ()))
+            if selected == None:
+                selected = byWMBS
+            else:
+                selected &= byWMBS
+
+        if selected == None:
+            selected = set(self.rows)
+
+        return selected
+
+    def unloaded(self, runJobIDs):
+        """
+        _unloaded_
+
+        Rows of the jobs that have to be loaded in full
+        """
+        return [self.rows[x] for x in runJobIDs if x not in self.loaded]
+
+    def addLoaded(self, loadedJobs):
+        """
+        _addLoaded_
+
+        Store the full information of jobs loaded by ID
+        """
+        for loadJob in loadedJobs:
+            if loadJob['id'] in self.rows:
+                self.loaded[loadJob['id']] = loadJob
+        return
+
+    def getRunJobs(self, runJobIDs):
+        """
+        _getRunJobs_
+
+        RunJobs for the jobs that were loaded.  The values from the row are
+        on top, the ones it doesn't have are filled from the full
+        information, like a RunJob built from scratch.
+        """
+        runJobs = []
+        for runJobID in runJobIDs:
+            loadJob = self.loaded.get(runJobID)
+            if loadJob == None:
+                continue
+            runJob = self.jobs.get(runJobID)
+            if runJob == None:
+                runJob = RunJob()
+                self.jobs[runJobID] = runJob
+            runJob.update(self.rows[runJobID])
+            for key, value in loadJob.iteritems():
+                if runJob.get(key, 0) == None:
+                    runJob[key] = value
+            runJobs.append(runJob)
+
+        return runJobs
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+_LRUCache_
+
+Dictionary with a maximum size, the least recently used entries are evicted
+to make room for new ones.  The size is the number of entries, or the sum of
+the sizes of the values if a sizeOf function is given.
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    _LRUCache_
+
+    Bounded mapping of keys to values.  Reading or writing a key makes it the
+    most recently used one.  sizeOf(value) gives the size a value counts for,
+    every entry counts as one without it.  The most recently written entry
+    is kept even if it is bigger than maxSize on its own.  Not thread safe,
+    it is meant to be owned by a single worker or used under a lock.
+    """
+    def __init__(self, maxSize = 1000, sizeOf = None):
+        self.maxSize = maxSize
+        self.sizeOf = sizeOf
+        self.currentSize = 0
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        return
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def _size(self, value):
+        if self.sizeOf is None:
+            return 1
+        return self.sizeOf(value)
+
+    def get(self, key, default = None):
+        """
+        _get_
+
+        Return the value for the key, or default if it is not cached
+        """
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries[key] = value
+        return value
+
+    def __getitem__(self, key):
+        value = self.entries.pop(key)
+        self.entries[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.pop(key)
+        self.entries[key] = value
+        self.currentSize += self._size(value)
+        self._evict()
+        return
+
+    def pop(self, key, default = None):
+        """
+        _pop_
+
+        Remove the key and return its value, or default if it is not cached
+        """
+        if key not in self.entries:
+            return default
+        value = self.entries.pop(key)
+        self.currentSize -= self._size(value)
+        return value
+
+    def clear(self):
+        """
+        _clear_
+
+        Drop every cached entry
+        """
+        self.entries.clear()
+        self.currentSize = 0
+        return
+
+    def resize(self, maxSize):
+        """
+        _resize_
+
+        Change the maximum size, evicting entries as needed
+        """
+        self.maxSize = maxSize
+        self._evict()
+        return
+
+    def _evict(self):
+        """
+        _evict_
+
+        Remove the least recently used entries until the cache fits in
+        maxSize, but for the most recently used one
+        """
+        while self.currentSize > self.maxSize and len(self.entries) > 1:
+            key, value = self.entries.popitem(last = False)
+            self.currentSize -= self._size(value)
+            self.evictions += 1
+        return
+
+    def stats(self):
+        """
+        _stats_
+
+        Return the cache counters as a dictionary
+        """
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'maxSize': self.maxSize}
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+_TTLCache_
+
+Thread safe LRU cache whose entries expire after a time to live, the value of
+a missing or expired key is made by a refresh function given by the caller.
+Threads asking for the same key while it is being refreshed wait for that
+refresh instead of running their own.
+"""
+
+import time
+import threading
+
+from WMCore.Cache.LRUCache import LRUCache
+
+
+class TTLCache(object):
+    """
+    _TTLCache_
+
+    Bounded mapping of keys to (expiry time, value).  The values are shared
+    by every caller, they must be treated as read only.
+    """
+    def __init__(self, maxSize = 1000):
+        self.lock = threading.Lock()
+        self.entries = LRUCache(maxSize = maxSize)
+        # key -> Event set once the running refresh of the key is done
+        self.refreshing = {}
+
+        self.stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'coalesced': 0,
+                      'errors': 0, 'refreshTime': 0.0, 'maxRefreshTime': 0.0}
+        return
+
+    def get(self, key, ttl, refresh):
+        """
+        _get_
+
+        Return the value of the key if it hasn't expired, otherwise the value
+        returned by refresh(), which is kept for ttl seconds.  An error raised
+        by refresh is raised to the caller that ran it, the callers waiting
+        for it try again.
+        """
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] > time.time():
+                    self.stats['hits'] += 1
+                    return entry[1]
+
+                event = self.refreshing.get(key)
+                if event is None:
+                    event = self.refreshing[key] = threading.Event()
+                    self.stats['misses'] += 1
+                    break
+                self.stats['coalesced'] += 1
+
+            event.wait()
+
+        startTime = time.time()
+        try:
+            value = refresh()
+        except Exception:
+            with self.lock:
+                self.stats['errors'] += 1
+                del self.refreshing[key]
+            event.set()
+            raise
+
+        refreshTime = time.time() - startTime
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, value)
+            self.stats['refreshes'] += 1
+            self.stats['refreshTime'] += refreshTime
+            self.stats['maxRefreshTime'] = max(self.stats['maxRefreshTime'], refreshTime)
+            del self.refreshing[key]
+        event.set()
+        return value
+
+    def remove(self, key):
+        """
+        _remove_
+
+        Forget the value of the key
+        """
+        with self.lock:
+            self.entries.pop(key)
+        return
+
+    def clear(self):
+        """
+        _clear_
+
+        Forget every value
+        """
+        with self.lock:
+            self.entries.clear()
+        return
+
+    def statistics(self):
+        """
+        _statistics_
+
+        Return the cache counters, refreshTime is the total time spent in
+        the refresh functions
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+            stats['evictions'] = self.entries.evictions
+        return stats
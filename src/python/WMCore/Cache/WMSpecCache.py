@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+_WMSpecCache_
+
+Process wide cache of unpickled WMWorkload specs.
+
+Agent components reload the same spec pickle for every subscription,
+workflow or job they touch.  This cache keeps the loaded WMWorkloadHelper
+around, keyed by spec path, and only unpickles it again when the file on
+disk changes (mtime or size).  Entries are evicted in LRU order once the
+total footprint (approximated by the size of the pickle) goes over the
+configured limit.
+
+The cached helpers are shared between all the callers in the process, so
+they must be treated as read only.
+"""
+
+import os
+import threading
+
+from WMCore.Cache.LRUCache import LRUCache
+from WMCore.WMSpec.WMWorkload import WMWorkload, WMWorkloadHelper
+
+# Default maximum footprint of the cache, in bytes
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+class WMSpecCache(object):
+    """
+    _WMSpecCache_
+
+    LRU cache of WMWorkloadHelper objects validated against the mtime and
+    size of the spec file they were loaded from.
+    """
+    def __init__(self, maxSize = DEFAULT_MAX_SIZE):
+        self.lock = threading.RLock()
+        # specPath -> (mtime, size, workloadHelper), sized by the pickle
+        self.entries = LRUCache(maxSize = maxSize, sizeOf = lambda entry: entry[1])
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        return
+
+    def get(self, specPath):
+        """
+        _get_
+
+        Return the WMWorkloadHelper for the spec at specPath, loading it
+        from disk only if it is not cached or the file changed since it was
+        cached.  Return None if the spec file does not exist.
+        """
+        try:
+            fileStat = os.stat(specPath)
+        except (OSError, TypeError):
+            self.invalidate(specPath)
+            return None
+
+        with self.lock:
+            entry = self.entries.pop(specPath, None)
+            if entry is not None:
+                if entry[0] == fileStat.st_mtime and entry[1] == fileStat.st_size:
+                    self.hits += 1
+                    self.entries[specPath] = entry
+                    return entry[2]
+                self.reloads += 1
+            self.misses += 1
+
+        # Unpickle outside the lock, other specs can be served meanwhile
+        wmWorkload = WMWorkloadHelper(WMWorkload("workload"))
+        wmWorkload.load(specPath)
+
+        with self.lock:
+            self.entries[specPath] = (fileStat.st_mtime, fileStat.st_size, wmWorkload)
+
+        return wmWorkload
+
+    def invalidate(self, specPath):
+        """
+        _invalidate_
+
+        Drop a single spec from the cache
+        """
+        with self.lock:
+            self.entries.pop(specPath)
+        return
+
+    def clear(self):
+        """
+        _clear_
+
+        Drop every cached spec
+        """
+        with self.lock:
+            self.entries.clear()
+        return
+
+    def setMaxSize(self, maxSize):
+        """
+        _setMaxSize_
+
+        Change the maximum footprint of the cache, evicting as needed
+        """
+        with self.lock:
+            self.entries.resize(maxSize)
+        return
+
+    def stats(self):
+        """
+        _stats_
+
+        Return the cache counters as a dictionary
+        """
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'reloads': self.reloads,
+                    'evictions': self.entries.evictions,
+                    'entries': len(self.entries),
+                    'size': self.entries.currentSize,
+                    'maxSize': self.entries.maxSize}
+
+
+_specCache = WMSpecCache()
+
+
+def getSpecCache():
+    """
+    _getSpecCache_
+
+    Return the process wide spec cache
+    """
+    return _specCache
+
+
+def loadWorkload(specPath):
+    """
+    _loadWorkload_
+
+    Load a WMWorkloadHelper through the process wide spec cache
+    """
+    return _specCache.get(specPath)
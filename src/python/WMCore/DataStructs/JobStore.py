@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""
+_JobStore_
+
+Append only record store for job objects.
+
+The JobCreator used to pickle each job into its own job.pkl file, which the
+JobSubmitter then had to open and unpickle one by one just to read a handful
+of fields.  The JobStore keeps all the jobs of a job collection directory in
+two files:
+
+  JobStore.headers: stream of pickled header dictionaries, one per job,
+                    holding the fields needed to decide where a job can be
+                    submitted plus the position of the job body.
+  JobStore.bodies:  concatenated pickled job objects.
+
+Headers can be streamed in bulk with a single file open and the full job is
+only unpickled when it is actually needed.  Records are only ever appended,
+the last header written for a given job ID wins.  Bodies are written and
+flushed before their header so a reader never sees a header pointing to
+incomplete data.
+
+Old job caches with one job.pkl per job can still be read through
+loadLegacyJob().
+"""
+
+import os
+import cPickle
+import logging
+
+HEADER_FILE = "JobStore.headers"
+BODY_FILE = "JobStore.bodies"
+LEGACY_FILE = "job.pkl"
+
+
+def jobStoreDir(cacheDir):
+    """
+    _jobStoreDir_
+
+    Return the directory of the store holding the job with the given cache
+    directory, that is the job collection directory.
+    """
+    return os.path.dirname(os.path.normpath(cacheDir))
+
+
+def makeHeader(job):
+    """
+    _makeHeader_
+
+    Extract the submission relevant fields from a job object
+    """
+    locations = []
+    if job.get("input_files"):
+        locations = list(job["input_files"][0]["locations"])
+
+    # allow job baggage to override numberOfCores
+    #       => used for repacking to get more slots/disk
+    numberOfCores = job.get("numberOfCores", 1)
+    if numberOfCores == 1:
+        numberOfCores = getattr(job.getBaggage(), "numberOfCores", 1)
+
+    return {"id": job["id"],
+            "name": job["name"],
+            "workflow": job.get("workflow", None),
+            "sandbox": job.get("sandbox", None),
+            "cache_dir": job.get("cache_dir", None),
+            "siteWhitelist": job.get("siteWhitelist", []),
+            "siteBlacklist": job.get("siteBlacklist", []),
+            "trustSitelists": job.get("trustSitelists", False),
+            "locations": locations,
+            "ownerDN": job.get("ownerDN", None),
+            "ownerGroup": job.get("ownerGroup", ''),
+            "ownerRole": job.get("ownerRole", ''),
+            "scramArch": job.get("scramArch", None),
+            "swVersion": job.get("swVersion", None),
+            "proxyPath": job.get("proxyPath", None),
+            "estimatedJobTime": job.get("estimatedJobTime", None),
+            "estimatedDiskUsage": job.get("estimatedDiskUsage", None),
+            "estimatedMemoryUsage": job.get("estimatedMemoryUsage", None),
+            "numberOfCores": numberOfCores}
+
+
+def loadLegacyJob(cacheDir):
+    """
+    _loadLegacyJob_
+
+    Load a job pickled in the old one job.pkl per job layout.  Return None
+    if there is no such file.
+    """
+    pickledJobPath = os.path.join(cacheDir, LEGACY_FILE)
+    if not os.path.isfile(pickledJobPath):
+        return None
+
+    jobHandle = open(pickledJobPath, "rb")
+    try:
+        return cPickle.load(jobHandle)
+    finally:
+        jobHandle.close()
+
+
+class JobStore(object):
+    """
+    _JobStore_
+
+    Reader and writer for the job records of a job collection directory.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.headerPath = os.path.join(directory, HEADER_FILE)
+        self.bodyPath = os.path.join(directory, BODY_FILE)
+        self.pending = []
+        self.bodyHandle = None
+        return
+
+    def exists(self):
+        """
+        _exists_
+
+        Check whether any record was written to this store
+        """
+        return os.path.isfile(self.headerPath)
+
+    def add(self, job):
+        """
+        _add_
+
+        Queue a job to be written by the next flush()
+        """
+        self.pending.append(job)
+        return
+
+    def flush(self):
+        """
+        _flush_
+
+        Append all the queued jobs to the store
+        """
+        if not self.pending:
+            return
+
+        headers = []
+        bodyHandle = open(self.bodyPath, "ab")
+        try:
+            bodyHandle.seek(0, os.SEEK_END)
+            for job in self.pending:
+                body = cPickle.dumps(job, cPickle.HIGHEST_PROTOCOL)
+                header = makeHeader(job)
+                header["offset"] = bodyHandle.tell()
+                header["length"] = len(body)
+                bodyHandle.write(body)
+                headers.append(header)
+            bodyHandle.flush()
+            os.fsync(bodyHandle.fileno())
+        finally:
+            bodyHandle.close()
+
+        headerHandle = open(self.headerPath, "ab")
+        try:
+            for header in headers:
+                cPickle.dump(header, headerHandle, cPickle.HIGHEST_PROTOCOL)
+            headerHandle.flush()
+            os.fsync(headerHandle.fileno())
+        finally:
+            headerHandle.close()
+
+        self.pending = []
+        return
+
+    def append(self, jobs):
+        """
+        _append_
+
+        Write a list of jobs to the store
+        """
+        self.pending.extend(jobs)
+        self.flush()
+        return
+
+    def iterHeaders(self):
+        """
+        _iterHeaders_
+
+        Stream all the headers in the store in the order they were written.
+        A truncated record at the end of the file, left by a writer that is
+        still running or died, is ignored.
+        """
+        if not self.exists():
+            return
+
+        headerHandle = open(self.headerPath, "rb")
+        try:
+            unpickler = cPickle.Unpickler(headerHandle)
+            while True:
+                try:
+                    yield unpickler.load()
+                except EOFError:
+                    break
+                except (cPickle.UnpicklingError, ValueError, AttributeError) as ex:
+                    logging.error("Truncated record in job store %s: %s" % (self.headerPath, str(ex)))
+                    break
+        finally:
+            headerHandle.close()
+        return
+
+    def loadHeaders(self):
+        """
+        _loadHeaders_
+
+        Return a dictionary of the latest header for every job ID in the store
+        """
+        headers = {}
+        for header in self.iterHeaders():
+            headers[header["id"]] = header
+        return headers
+
+    def loadJob(self, header):
+        """
+        _loadJob_
+
+        Unpickle the full job object a header points to.  The body file is
+        kept open until close() is called so that many jobs can be loaded
+        from the same store cheaply.
+        """
+        if self.bodyHandle is None:
+            self.bodyHandle = open(self.bodyPath, "rb")
+        self.bodyHandle.seek(header["offset"])
+        return cPickle.loads(self.bodyHandle.read(header["length"]))
+
+    def close(self):
+        """
+        _close_
+
+        Close the body file if it was opened by loadJob()
+        """
+        if self.bodyHandle is not None:
+            self.bodyHandle.close()
+            self.bodyHandle = None
+        return
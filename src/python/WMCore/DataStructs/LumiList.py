@@ -10,14 +10,20 @@ This class can also handle ranges of events as the structure is identical
 or could be subclassed renaming a function or two.
 
 This code began life in COMP/CRAB/python/LumiList.py
+
+The set operations work on the sorted lumi ranges in a single pass (see
+WMCore.DataStructs.LumiRanges) and never expand ranges into lumis.
 """
 
 
-import copy
+import bisect
 import json
 import re
 import urllib2
 
+from WMCore.DataStructs.LumiRanges import compactLumis, mergeRanges, unionRanges, \
+                                         intersectRanges, subtractRanges, rangesContain
+
 class LumiList(object):
     """
     Deal with lists of lumis in several different forms:
@@ -79,20 +85,11 @@ class LumiList(object):
         if runsAndLumis:
             for run in runsAndLumis.keys():
                 runString = str(run)
-                lastLumi = -1000
                 lumiList = runsAndLumis[run]
                 if lumiList:
-                    self.compactList[runString] = []
-                    self.duplicates[runString] = []
-                    for lumi in sorted(lumiList):
-                        if lumi == lastLumi:
-                            self.duplicates[runString].append(lumi)
-                        elif lumi != lastLumi + 1: # Break in lumi sequence
-                            self.compactList[runString].append([lumi, lumi])
-                        else:
-                            nRange =  len(self.compactList[runString])
-                            self.compactList[runString][nRange-1][1] = lumi
-                        lastLumi = lumi
+                    ranges, duplicates = compactLumis(lumiList)
+                    self.compactList[runString] = ranges
+                    self.duplicates[runString] = duplicates
         if runs:
             for run in runs:
                 runString = str(run)
@@ -107,39 +104,13 @@ class LumiList(object):
         # Compact each run and make it unique
 
         for run in self.compactList.keys():
-            newLumis = []
-            for lumi in sorted(self.compactList[run]):
-                # If the next lumi starts inside or just after the last just change the endpoint of the first
-                if newLumis and newLumis[-1][0] <= lumi[0] <= newLumis[-1][1] + 1:
-                    newLumis[-1][1] = max(newLumis[-1][1], lumi[1])
-                else:
-                    newLumis.append(lumi)
-            self.compactList[run] = newLumis
+            self.compactList[run] = mergeRanges(self.compactList[run])
 
     def __sub__(self, other): # Things from self not in other
         result = {}
-        for run in sorted(self.compactList.keys()):
-            alumis = sorted(self.compactList[run])
-            blumis = sorted(other.compactList.get(run, []))
-            alist = []                    # verified part
-            for alumi in alumis:
-                tmplist = [alumi[0], alumi[1]] # may be part
-                for blumi in blumis:
-                    if blumi[0] <= tmplist[0] and blumi[1] >= tmplist[1]: # blumi has all of alumi
-                        tmplist = []
-                        break # blumi is has all of alumi
-                    if blumi[0] > tmplist[0] and blumi[1] < tmplist[1]: # blumi is part of alumi
-                        alist.append([tmplist[0], blumi[0]-1])
-                        tmplist = [blumi[1]+1, tmplist[1]]
-                    elif blumi[0] <= tmplist[0] and blumi[1] < tmplist[1] and blumi[1]>=tmplist[0]: # overlaps start
-                        tmplist = [blumi[1]+1, tmplist[1]]
-                    elif blumi[0] > tmplist[0] and blumi[1] >= tmplist[1] and blumi[0]<=tmplist[1]: # overlaps end
-                        alist.append([tmplist[0], blumi[0]-1])
-                        tmplist = []
-                        break
-                if tmplist:
-                    alist.append(tmplist)
-            result[run] = alist
+        for run in self.compactList.keys():
+            result[run] = subtractRanges(self.compactList[run],
+                                         other.compactList.get(run, []))
 
         return LumiList(compactList = result)
 
@@ -149,46 +120,16 @@ class LumiList(object):
         aruns = set(self.compactList.keys())
         bruns = set(other.compactList.keys())
         for run in aruns & bruns:
-            lumiList = []                    # List for this run
-            unique = []                    # List for this run
-            for alumi in self.compactList[run]:
-                for blumi in other.compactList[run]:
-                    if blumi[0] <= alumi[0] and blumi[1] >= alumi[1]: # blumi has all of alumi
-                        lumiList.append(alumi)
-                    if blumi[0] > alumi[0] and blumi[1] < alumi[1]: # blumi is part of alumi
-                        lumiList.append(blumi)
-                    elif blumi[0] <= alumi[0] and blumi[1] < alumi[1] and blumi[1] >= alumi[0]: # overlaps start
-                        lumiList.append([alumi[0], blumi[1]])
-                    elif blumi[0] > alumi[0] and blumi[1] >= alumi[1] and blumi[0] <= alumi[1]: # overlaps end
-                        lumiList.append([blumi[0], alumi[1]])
-
-
-            if lumiList:
-                unique = [lumiList[0]]
-            for pair in lumiList[1:]:
-                if pair[0] == unique[-1][1]+1:
-                    unique[-1][1] = copy.deepcopy(pair[1])
-                else:
-                    unique.append(copy.deepcopy(pair))
-
-            result[run] = unique
+            result[run] = intersectRanges(self.compactList[run], other.compactList[run])
         return LumiList(compactList = result)
 
 
     def __or__(self, other):
         result = {}
-        aruns = self.compactList.keys()
-        bruns = other.compactList.keys()
-        runs = set(aruns + bruns)
+        runs = set(self.compactList.keys()) | set(other.compactList.keys())
         for run in runs:
-            overlap = sorted(self.compactList.get(run, []) + other.compactList.get(run, []))
-            unique = [overlap[0]]
-            for pair in overlap[1:]:
-                if pair[0] >= unique[-1][0] and pair[0] <= unique[-1][1]+1 and pair[1] > unique[-1][1]:
-                    unique[-1][1] = copy.deepcopy(pair[1])
-                elif pair[0] > unique[-1][1]:
-                    unique.append(copy.deepcopy(pair))
-            result[run] = unique
+            result[run] = unionRanges(self.compactList.get(run, []),
+                                      other.compactList.get(run, []))
         return LumiList(compactList = result)
 
 
@@ -207,12 +148,16 @@ class LumiList(object):
         [(run1,lumi1),(run1,lumi2),(run2,lumi1)]
         """
         filteredList = []
+        # run -> (first lumi of each range, ranges)
+        runRanges = {}
         for (run, lumi) in lumiList:
-            runsInLumi = self.compactList.get(str(run), [[0, -1]])
-            for (first, last) in runsInLumi:
-                if lumi >= first and lumi <= last:
-                    filteredList.append((run, lumi))
-                    break
+            if run not in runRanges:
+                ranges = self.compactList.get(str(run), [])
+                runRanges[run] = ([x[0] for x in ranges], ranges)
+            firstLumis, ranges = runRanges[run]
+            index = bisect.bisect_right(firstLumis, lumi) - 1
+            if index >= 0 and lumi <= ranges[index][1]:
+                filteredList.append((run, lumi))
         return filteredList
 
 
@@ -360,17 +305,14 @@ class LumiList(object):
         if not lumiRangeList:
             # the run isn't there, so no need to look any further
             return False
-        for lumiRange in lumiRangeList:
-            # we want to make this as found if either the lumiSection
-            # is inside the range OR if the lumi section is greater
-            # than or equal to the lower bound of the lumi range and
-            # the upper bound is 0 (which means extends to the end of
-            # the run)
-            if lumiRange[0] <= lumiSection and \
-               (0 == lumiRange[1] or lumiSection <= lumiRange[1]):
-                # got it
-                return True
-        return False
+        if rangesContain(lumiRangeList, lumiSection):
+            return True
+        # we also want to make this as found if the lumi section is
+        # greater than or equal to the lower bound of any lumi range whose
+        # upper bound is 0 (which means extends to the end of the run),
+        # that range doesn't have to be the last one starting before it
+        openStarts = [x[0] for x in lumiRangeList if 0 == x[1]]
+        return bool(openStarts) and min(openStarts) <= lumiSection
 
 
     def __contains__ (self, runTuple):
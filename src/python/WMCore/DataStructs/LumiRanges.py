@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+_LumiRanges_
+
+Set algebra on lists of inclusive lumi ranges, [[first, last], ...], the
+representation used by the compact lists in LumiList and the runAndLumis in
+Mask.  Every function takes and returns lists sorted by the first lumi
+without overlapping or adjacent ranges, as made by mergeRanges(), so that
+two lists are combined in a single pass and membership is a binary search.
+No lumi range is ever expanded into its lumis.
+"""
+
+import bisect
+import sys
+
+
+def compactLumis(lumis):
+    """
+    _compactLumis_
+
+    Turn a list of individual lumis into a list of ranges and the list of
+    lumis that appeared more than once.
+    """
+    ranges = []
+    duplicates = []
+    lastLumi = None
+    for lumi in sorted(lumis):
+        if lumi == lastLumi:
+            duplicates.append(lumi)
+        elif lastLumi == None or lumi != lastLumi + 1:
+            ranges.append([lumi, lumi])
+        else:
+            ranges[-1][1] = lumi
+        lastLumi = lumi
+
+    return ranges, duplicates
+
+
+def mergeRanges(ranges):
+    """
+    _mergeRanges_
+
+    Sort a list of ranges and merge the ones that overlap or touch
+    """
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1][1] = last
+        else:
+            merged.append([first, last])
+
+    return merged
+
+
+def unionRanges(aRanges, bRanges):
+    """
+    _unionRanges_
+
+    Ranges in either of the lists
+    """
+    return mergeRanges(aRanges + bRanges)
+
+
+def intersectRanges(aRanges, bRanges):
+    """
+    _intersectRanges_
+
+    Ranges in both lists
+    """
+    result = []
+    i = j = 0
+    while i < len(aRanges) and j < len(bRanges):
+        first = max(aRanges[i][0], bRanges[j][0])
+        last  = min(aRanges[i][1], bRanges[j][1])
+        if first <= last:
+            result.append([first, last])
+        # Move on from the range that ends first
+        if aRanges[i][1] < bRanges[j][1]:
+            i += 1
+        else:
+            j += 1
+
+    return result
+
+
+def subtractRanges(aRanges, bRanges):
+    """
+    _subtractRanges_
+
+    Ranges in the first list that are not in the second one
+    """
+    result = []
+    j = 0
+    for first, last in aRanges:
+        # Skip the ranges that end before this one starts
+        while j < len(bRanges) and bRanges[j][1] < first:
+            j += 1
+
+        k = j
+        while k < len(bRanges) and bRanges[k][0] <= last:
+            if bRanges[k][0] > first:
+                result.append([first, bRanges[k][0] - 1])
+            first = max(first, bRanges[k][1] + 1)
+            if first > last:
+                break
+            k += 1
+
+        if first <= last:
+            result.append([first, last])
+
+    return result
+
+
+def rangesContain(ranges, lumi):
+    """
+    _rangesContain_
+
+    Check whether a lumi is in one of the ranges
+    """
+    index = bisect.bisect_right(ranges, [lumi, sys.maxint]) - 1
+    return index >= 0 and lumi <= ranges[index][1]
+
+
+def filterLumis(ranges, lumis):
+    """
+    _filterLumis_
+
+    Return the sorted lumis that are in one of the ranges
+    """
+    result = []
+    i = 0
+    for lumi in sorted(lumis):
+        while i < len(ranges) and ranges[i][1] < lumi:
+            i += 1
+        if i == len(ranges):
+            break
+        if ranges[i][0] <= lumi:
+            result.append(lumi)
+
+    return result
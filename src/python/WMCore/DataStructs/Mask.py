@@ -13,6 +13,7 @@ job in two ways:
 import logging
 
 from WMCore.DataStructs.Run import Run
+from WMCore.DataStructs.LumiRanges import mergeRanges, filterLumis
 
 class Mask(dict):
     """
@@ -201,27 +202,18 @@ class Mask(dict):
 
         runDict = {}
         for r in runs:
-            if r.run in runDict:
-                runDict[r.run].lumis.extend(r.lumis)
-            else:
-                runDict[r.run] = r
+            runDict.setdefault(r.run, []).extend(r.lumis)
 
         maskRuns = set(self["runAndLumis"].keys())
-        passedRuns = set([r.run for r in runs])
+        passedRuns = set(runDict.keys())
         filteredRuns = maskRuns.intersection(passedRuns)
 
         newRuns = set()
         for runNumber in filteredRuns:
-            maskLumis = set()
-            for pair in self["runAndLumis"][runNumber]:
-                if pair[0] == pair[1]:
-                    maskLumis.add(pair[0])
-                else:
-                    maskLumis = maskLumis.union(range(pair[0], pair[1] + 1, 1))
-
-            filteredLumis = set(runDict[runNumber].lumis).intersection(maskLumis)
+            maskRanges = mergeRanges(self["runAndLumis"][runNumber])
+            filteredLumis = filterLumis(maskRanges, set(runDict[runNumber]))
             if len(filteredLumis) > 0:
-                newRuns.add(Run(runNumber, *list(filteredLumis)))
+                newRuns.add(Run(runNumber, *filteredLumis))
 
         return newRuns
 
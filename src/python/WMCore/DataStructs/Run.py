@@ -63,9 +63,11 @@ class Run(WMObject):
             msg += "Run %s does not equal Run %s" % (self.run, rhs.run)
             raise RuntimeError(msg)
 
-        #newRun = Run(self.run, *self)
-        #[ newRun.append(x) for x in rhs if x not in newRun ]
-        [ self.lumis.append(x) for x in rhs.lumis if x not in self.lumis ]
+        knownLumis = set(self.lumis)
+        for lumi in rhs.lumis:
+            if lumi not in knownLumis:
+                self.lumis.append(lumi)
+                knownLumis.add(lumi)
 
         return self
     def __iter__(self):
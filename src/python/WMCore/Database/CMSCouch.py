@@ -6,7 +6,8 @@ A simple API to CouchDB that sends HTTP requests to the REST interface.
 
 http://wiki.apache.org/couchdb/API_Cheatsheet
 
-NOT A THREAD SAFE CLASS.
+NOT A THREAD SAFE CLASS. Databases can hand their bulk commits to writer
+threads with their own connections, see Database.startAsyncCommit.
 """
 
 
@@ -17,6 +18,8 @@ import re
 import hashlib
 import base64
 import logging
+import threading
+import Queue
 from httplib import HTTPException
 from datetime import timedelta, datetime
 
@@ -169,6 +172,7 @@ class Database(CouchDBRequests):
         self._queue_size = size
         self.threads = []
         self.last_seq = 0
+        self._writer = None
 
     def _reset_queue(self):
         """
@@ -202,7 +206,6 @@ class Database(CouchDBRequests):
         """
         if timestamp:
             self.timestamp(doc, timestamp)
-        #TODO: Thread this off so that it's non blocking...
         if len(self._queue) >= self._queue_size:
             print 'queue larger than %s records, committing' % self._queue_size
             self.commit(viewlist=viewlist, callback = callback)
@@ -261,12 +264,22 @@ class Database(CouchDBRequests):
         if (doc):
             self.queue(doc, timestamp, viewlist)
 
+        if self._writer:
+            self._writer.runCallbacks()
+
         if len(self._queue) == 0:
             return
 
         if timestamp:
             self.timestamp(self._queue, timestamp)
-        # TODO: commit in thread to avoid blocking others
+
+        if self._writer:
+            # Posted by the writer threads, conflicts are handed to the
+            # callback by a later commit or flush
+            self._writer.put(self._queue, viewlist, callback, data)
+            self._reset_queue()
+            return
+
         uri  = '/%s/_bulk_docs/' % self.name
 
         data['docs'] = list(self._queue)
@@ -282,6 +295,52 @@ class Database(CouchDBRequests):
 
         return retval
 
+    def startAsyncCommit(self, writers = 2, maxPending = 10):
+        """
+        Post the queued documents from writer threads from now on, commit
+        returns as soon as the documents are handed over. At most maxPending
+        bulk commits wait for a writer, more block the caller. Use flush to
+        wait for the documents to be in the database.
+        """
+        if not self._writer:
+            self._writer = AsyncBulkWriter(self, writers, maxPending)
+        return
+
+    def stopAsyncCommit(self):
+        """
+        Flush the documents handed to the writer threads, stop them and go
+        back to posting in commit.
+        """
+        if self._writer:
+            try:
+                self.flush()
+            finally:
+                self._writer.stop()
+                self._writer = None
+        return
+
+    def flush(self, callback = None):
+        """
+        Commit the queue and wait for the writer threads to post everything
+        handed to them. Conflict callbacks are run and the first error raised
+        by a post is raised here.
+        """
+        self.commit(callback = callback)
+        if self._writer:
+            self._writer.wait()
+            self._writer.runCallbacks()
+        return
+
+    def asyncCommitStats(self):
+        """
+        Counters of the writer threads: the bulk commits waiting for or being
+        posted, the documents and commits posted, the conflicts and errors and
+        how often and how long callers were blocked on a full writer queue.
+        """
+        if not self._writer:
+            return None
+        return self._writer.statistics()
+
     def document(self, id, rev = None):
         """
         Load a document identified by id. You can specify a rev to see an older revision
@@ -842,6 +901,139 @@ class RotatingDatabase(Database):
         self._archive()
         self._expire()
 
+class AsyncBulkWriter(object):
+    """
+    Threads posting the bulk commits of a Database. Each thread has its own
+    connection to the database, the conflicting rows are kept until the
+    owner of the Database runs the callbacks with runCallbacks.
+    """
+    def __init__(self, database, writers = 2, maxPending = 10):
+        self.database = database
+        self.commits = Queue.Queue(maxPending)
+
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0
+        self.conflicts = []
+        self.errors = []
+        self.stats = {'commits': 0, 'docs': 0, 'conflicts': 0, 'errors': 0,
+                      'blocked': 0, 'blockedTime': 0.0}
+
+        self.threads = []
+        for i in range(writers):
+            conn = Database(dbname = urllib.unquote_plus(database.name),
+                            url = database['host'], ckey = database['key'],
+                            cert = database['cert'])
+            conn.additionalHeaders = dict(database.additionalHeaders)
+            thread = threading.Thread(target = self.write, args = (conn,),
+                                      name = "AsyncBulkWriter-%s-%i" % (database.name, i))
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, docs, viewlist, callback, data):
+        """
+        Hand a bulk commit to the threads, block while maxPending commits are
+        waiting for them.
+        """
+        with self.lock:
+            self.pending += 1
+        item = (list(docs), viewlist, callback, data)
+        try:
+            self.commits.put_nowait(item)
+        except Queue.Full:
+            startTime = time.time()
+            self.commits.put(item)
+            with self.lock:
+                self.stats['blocked'] += 1
+                self.stats['blockedTime'] += time.time() - startTime
+        return
+
+    def write(self, conn):
+        """
+        Post the bulk commits until stopped
+        """
+        while True:
+            item = self.commits.get()
+            if item is None:
+                return
+            (docs, viewlist, callback, data) = item
+            data = dict(data)
+            conflicts = []
+            error = None
+            try:
+                conn._queue = docs
+                retval = conn.commit(viewlist = viewlist, **data)
+                if callback:
+                    postedData = dict(data, docs = docs)
+                    for result in retval:
+                        if result.get('error', None) == 'conflict':
+                            conflicts.append((callback, postedData, result))
+            except Exception as ex:
+                logging.error("Error posting %d documents to %s: %s" % (len(docs), conn.name, str(ex)))
+                conn._reset_queue()
+                error = ex
+
+            with self.lock:
+                self.stats['commits'] += 1
+                self.stats['docs'] += len(docs)
+                self.stats['conflicts'] += len(conflicts)
+                self.conflicts.extend(conflicts)
+                if error:
+                    self.stats['errors'] += 1
+                    self.errors.append(error)
+                self.pending -= 1
+                if self.pending == 0:
+                    self.idle.notifyAll()
+
+    def wait(self):
+        """
+        Wait until every bulk commit handed over is posted
+        """
+        with self.lock:
+            while self.pending > 0:
+                self.idle.wait()
+        return
+
+    def runCallbacks(self):
+        """
+        Call the callbacks of the conflicts reported by the threads with the
+        Database, raise the first error reported since the last call.
+        """
+        with self.lock:
+            conflicts = self.conflicts
+            errors = self.errors
+            self.conflicts = []
+            self.errors = []
+
+        for (callback, data, result) in conflicts:
+            callback(self.database, data, result)
+        if errors:
+            raise errors[0]
+        return
+
+    def statistics(self):
+        """
+        Return the counters and how many bulk commits are waiting for or
+        being posted by the threads
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['inFlight'] = self.pending
+        stats['queued'] = self.commits.qsize()
+        return stats
+
+    def stop(self):
+        """
+        Stop the threads once they posted what they have been handed
+        """
+        for thread in self.threads:
+            self.commits.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        return
+
 class CouchServer(CouchDBRequests):
     """
     An object representing the CouchDB server, use it to list, create, delete
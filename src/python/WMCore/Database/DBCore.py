@@ -9,11 +9,30 @@ Core Database APIs
 
 
 
+import re
+import itertools
+
 from WMCore.DataStructs.WMObject import WMObject
 from WMCore.Database.ResultSet import ResultSet
 from copy import copy
 import WMCore.WMLogging
 
+# Constructs that make a select return something different when it is run
+# once with a list of keys instead of once per key
+INLIST_UNSAFE = re.compile(r"\b(count|sum|min|max|avg)\s*\(|\bgroup\s+by\b|\border\s+by\b|"
+                           r"\bdistinct\b|\bhaving\b|\blimit\b|\brownum\b|\bunion\b|"
+                           r"\bfor\s+update\b", re.IGNORECASE)
+
+def isBindStream(binds):
+    """
+    _isBindStream_
+
+    Check whether binds is an iterator or generator of bind dictionaries
+    rather than a single dictionary or a list of them.
+    """
+    return hasattr(binds, "__iter__") and \
+           not isinstance(binds, (dict, list, set, tuple))
+
 class DBInterface(WMObject):
     """
     Base class for doing SQL operations using a SQLAlchemy engine, or
@@ -32,11 +51,103 @@ class DBInterface(WMObject):
     logger = None
     engine = None
 
-    def __init__(self, logger, engine):
+    def __init__(self, logger, engine, maxBindsPerQuery = None):
         self.logger = logger
         self.logger.info ("Instantiating base WM DBInterface")
         self.engine = engine
-        self.maxBindsPerQuery = 500
+        self.maxBindsPerQuery = maxBindsPerQuery or 500
+        # Oracle doesn't accept more than 1000 expressions in an IN list
+        self.maxInListSize = min(self.maxBindsPerQuery, 1000)
+
+    def batchBinds(self, binds):
+        """
+        _batchBinds_
+
+        Split a list or a stream of binds into lists of at most
+        maxBindsPerQuery binds, without copying what is left over.
+        """
+        binds = iter(binds)
+        while True:
+            batch = list(itertools.islice(binds, self.maxBindsPerQuery))
+            if not batch:
+                return
+            yield batch
+
+    def inListSelects(self, s, b):
+        """
+        _inListSelects_
+
+        Rewrite a select run for many values of a single key, e.g.:
+
+        SELECT id FROM wmbs_file_details WHERE lfn = :lfn
+
+        into selects that fetch up to maxInListSize keys at once:
+
+        SELECT id FROM wmbs_file_details WHERE lfn IN (:lfn_0, :lfn_1, ...)
+
+        Only a WHERE clause made of the key comparison alone is rewritten,
+        with other predicates (OR terms in particular) a row could come back
+        a different number of times.  The rows come back in the order the
+        database returns them for each IN list, not grouped by bind.
+
+        Return a list of (sql, bind) tuples or None if the select can't be
+        rewritten without changing the rows it returns.
+        """
+        if len(b) < 2 or not isinstance(b[0], dict) or len(b[0]) != 1:
+            return None
+
+        bindName = b[0].keys()[0]
+        values = []
+        for bind in b:
+            if len(bind) != 1 or bindName not in bind:
+                return None
+            values.append(bind[bindName])
+
+        try:
+            if len(set(values)) != len(values):
+                return None
+        except TypeError:
+            return None
+
+        if INLIST_UNSAFE.search(s) or len(re.findall(r"\bselect\b", s, re.IGNORECASE)) != 1:
+            return None
+
+        bindRef = r":%s\b" % re.escape(bindName)
+        if len(re.findall(bindRef, s, re.IGNORECASE)) != 1:
+            return None
+        match = re.search(r"\bwhere\s+[\w.]+\s*(=\s*%s)\s*$" % bindRef, s, re.IGNORECASE)
+        if match is None:
+            return None
+
+        queries = []
+        for start in range(0, len(values), self.maxInListSize):
+            chunk = values[start:start + self.maxInListSize]
+            names = ["%s_%d" % (bindName, i) for i in range(len(chunk))]
+            sql = "%sIN (%s)%s" % (s[:match.start(1)],
+                                   ", ".join([":%s" % x for x in names]),
+                                   s[match.end(1):])
+            queries.append((sql, dict(zip(names, chunk))))
+        return queries
+
+    def executeselects(self, queries, connection = None, returnCursor = False):
+        """
+        _executeselects_
+
+        Run a list of (sql, bind) select queries, return a list with one
+        ResultSet holding all the rows or a list of cursors.
+        """
+        if returnCursor:
+            result = []
+            for sql, bind in queries:
+                result.append(connection.execute(sql, bind))
+        else:
+            result = ResultSet()
+            for sql, bind in queries:
+                resultproxy = connection.execute(sql, bind)
+                result.add(resultproxy)
+                resultproxy.close()
+
+        return self.makelist(result)
 
     def buildbinds(self, sequence, thename, therest=[{}]):
         """
@@ -83,9 +194,12 @@ class DBInterface(WMObject):
 
         see: http://www.gingerandjohn.com/archives/2004/02/26/cx_oracle-executemany-example/
 
-        Can't executemany() selects - so do each combination of binds here instead.
-        This will return a list of sqlalchemy.engine.base.ResultProxy object's
-        one for each set of binds.
+        Can't executemany() selects - so selects on a single key are turned
+        into IN list selects and the others are run for each combination of
+        binds instead.  This will return a list of
+        sqlalchemy.engine.base.ResultProxy object's one for each query.
+        With returnCursor every set of binds is still run on its own, so
+        that there is one cursor for each of them.
 
         returns a list of sqlalchemy.engine.base.ResultProxy objects
         """
@@ -95,18 +209,14 @@ class DBInterface(WMObject):
             """
             Trying to select many
             """
-            if returnCursor:
-                result = []
-                for bind in b:
-                    result.append(connection.execute(s, bind))
-            else:
-                result = ResultSet()
-                for bind in b:
-                    resultproxy = connection.execute(s, bind)
-                    result.add(resultproxy)
-                    resultproxy.close()
+            queries = None
+            if not returnCursor:
+                queries = self.inListSelects(s, b)
+            if queries is None:
+                queries = [(s, bind) for bind in b]
 
-            return self.makelist(result)
+            return self.executeselects(queries, connection = connection,
+                                       returnCursor = returnCursor)
 
         """
         Now inserting or updating many
@@ -127,6 +237,10 @@ class DBInterface(WMObject):
         set conn if you already have an active connection to reuse
         set transaction = True if you already have an active transaction
 
+        binds can also be a generator of bind dictionaries for a single
+        statement, they are then executed in batches of maxBindsPerQuery
+        without ever being held in memory all at once.  Nothing is executed
+        if the generator is empty.
         """
         connection = None
         try:
@@ -138,8 +252,33 @@ class DBInterface(WMObject):
             result = []
             # Can take either a single statement or a list of statements and binds
             sqlstmt = self.makelist(sqlstmt)
-            binds = self.makelist(binds)
-            if len(sqlstmt) > 0 and (len(binds) == 0 or (binds[0] == {} or binds[0] == None)):
+
+            bindStream = False
+            if isBindStream(binds):
+                if len(sqlstmt) == 1:
+                    binds = iter(binds)
+                    try:
+                        firstBind = binds.next()
+                    except StopIteration:
+                        return result
+                    binds = itertools.chain([firstBind], binds)
+                    bindStream = True
+                else:
+                    binds = list(binds)
+
+            if not bindStream:
+                binds = self.makelist(binds)
+
+            if bindStream:
+                # Run single SQL statement for a stream of binds
+                if not transaction:
+                    trans = connection.begin()
+                for batch in self.batchBinds(binds):
+                    result.extend(self.executemanybinds(sqlstmt[0], batch, connection=connection,
+                                                        returnCursor=returnCursor))
+                if not transaction:
+                    trans.commit()
+            elif len(sqlstmt) > 0 and (len(binds) == 0 or (binds[0] == {} or binds[0] == None)):
                 # Should only be run by create statements
                 if not transaction:
                     #WMCore.WMLogging.sqldebug("transaction created in DBInterface")
@@ -156,14 +295,8 @@ class DBInterface(WMObject):
                 #Run single SQL statement for a list of binds - use execute_many()
                 if not transaction:
                     trans = connection.begin()
-                while(len(binds) > self.maxBindsPerQuery):
-                    result.extend(self.processData(sqlstmt, binds[:self.maxBindsPerQuery],
-                                                   conn=connection, transaction=True,
-                                                   returnCursor=returnCursor))
-                    binds = binds[self.maxBindsPerQuery:]
-
-                for i in sqlstmt:
-                    result.extend(self.executemanybinds(i, binds, connection=connection,
+                for batch in self.batchBinds(binds):
+                    result.extend(self.executemanybinds(sqlstmt[0], batch, connection=connection,
                                                         returnCursor=returnCursor))
                 if not transaction:
                     trans.commit()
@@ -21,6 +21,12 @@ class DBFactory(object):
         if 'engine_parameters' in options.keys():
             self._defaultEngineParams.update(options['engine_parameters'])
             del options['engine_parameters']
+        # number of binds sent to the database in one go, the DBInterface
+        # default is used if it isn't set
+        self.bindBatchSize = None
+        if 'bind_batch_size' in options.keys():
+            self.bindBatchSize = options['bind_batch_size']
+            del options['bind_batch_size']
 
         if dburl:
             self.dburl = dburl
@@ -114,7 +120,8 @@ class DBFactory(object):
             else:
                 from WMCore.Database.DBCore import DBInterface
             # we instantiate within the lock so we can safely return the local instance.
-            dbInterface =  DBInterface(self.logger, self.engine)
+            dbInterface =  DBInterface(self.logger, self.engine,
+                                       maxBindsPerQuery = self.bindBatchSize)
 
         else:
             dbInterface =  None
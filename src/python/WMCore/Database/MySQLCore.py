@@ -133,7 +133,19 @@ class MySQLInterface(DBInterface):
 
         Execute a SQL statement that has multiple sets of bind variables.
         Transform the bind variables into the format that MySQL expects.
+        Selects on a single key are turned into IN list selects first,
+        unless a cursor is wanted for each set of binds.
         """
+        if not returnCursor and s.strip().lower().startswith("select"):
+            queries = self.inListSelects(s.strip(), b)
+            if queries is not None:
+                mySQLQueries = []
+                for sql, bind in queries:
+                    newsql, binds = self.substitute(sql, bind)
+                    mySQLQueries.append((newsql, binds[0]))
+                return self.executeselects(mySQLQueries, connection = connection,
+                                           returnCursor = returnCursor)
+
         newsql, binds = self.substitute(s, b)
 
         return DBInterface.executemanybinds(self, newsql, binds, connection,
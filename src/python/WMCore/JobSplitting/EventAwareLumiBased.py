@@ -19,7 +19,7 @@ import math
 
 from WMCore.DataStructs.Run         import Run
 from WMCore.JobSplitting.JobFactory import JobFactory
-from WMCore.JobSplitting.LumiBased  import isGoodLumi, isGoodRun, LumiChecker
+from WMCore.JobSplitting.LumiBased  import GoodRunList, RunLumis, LumiChecker
 from WMCore.WMBS.File               import File
 from WMCore.WMSpec.WMTask           import buildLumiMask
 
@@ -137,14 +137,17 @@ class EventAwareLumiBased(JobFactory):
             locationDict[key] = sorted(newlist, key=operator.itemgetter('lowestRun'))
 
         totalJobs      = 0
-        lastLumi       = None
-        firstLumi      = None
         lastRun        = None
         lumisInJob     = 0
         totalAvgEventCount = 0
         currentJobAvgEventCount = 0
         stopTask = False
+        goodLumis = GoodRunList(goodRunList)
         self.lumiChecker = LumiChecker(applyLumiCorrection)
+        if getParents:
+            # Load the parentage of all the files at once
+            self.findParents([f['lfn'] for files in locationDict.values() for f in files])
+
         for location in locationDict:
 
             # For each location, we need a new jobGroup
@@ -191,62 +194,32 @@ class EventAwareLumiBased(JobFactory):
                     lumisPerJob = max(lumisInJob + lumisAllowed, 1)
 
                 for run in f['runs']:
-                    if not isGoodRun(goodRunList = goodRunList, run = run.run):
+                    if not goodLumis.isGoodRun(run.run):
                         # Then skip this one
                         continue
                     if len(runWhitelist) > 0 and not run.run in runWhitelist:
                         # Skip due to run whitelist
                         continue
-                    firstLumi = None
 
                     if splitOnRun and run.run != lastRun:
                         # Then we need to kill this job and get a new one
                         stopJob = True
 
-                    # Now loop over the lumis
-                    for lumi in run:
-                        if (not isGoodLumi(goodRunList, run = run.run, lumi = lumi) or
-                            self.lumiChecker.isSplitLumi(run.run, lumi, f)):
-                            # Kill the chain of good lumis
-                            # Skip this lumi
-                            if firstLumi != None and firstLumi != lumi:
-                                self.currentJob['mask'].addRunAndLumis(run = run.run,
-                                                                       lumis = [firstLumi, lastLumi])
-                                eventsAdded = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
-                                runAddedTime = eventsAdded * timePerEvent
-                                runAddedSize = eventsAdded * sizePerEvent
-                                self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
-                                firstLumi = None
-                                lastLumi = None
-                            continue
-
-                        # You have to kill the lumi chain if they're not continuous
-                        if lastLumi and not lumi == lastLumi + 1:
-                            self.currentJob['mask'].addRunAndLumis(run = run.run,
-                                                                   lumis = [firstLumi, lastLumi])
-                            eventsAdded = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
-                            runAddedTime = eventsAdded * timePerEvent
-                            runAddedSize = eventsAdded * sizePerEvent
-                            self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
-                            firstLumi = None
-                            lastLumi = None
-
-                        if firstLumi == None:
-                            # Set the first lumi in the run
-                            firstLumi = lumi
+                    # We stop at the lumi that brings the events over the requested total
+                    maxLumis = None
+                    if totalEvents > 0 and f['avgEvtsPerLumi']:
+                        eventsRemaining = int(totalEvents - totalAvgEventCount)
+                        maxLumis = max(-(-eventsRemaining // int(f['avgEvtsPerLumi'])), 1)
+                    runLumis = RunLumis(run, goodLumis, self.lumiChecker, f, maxLumis)
 
+                    # Fill jobs with the lumis of the run, a job at a time
+                    start = 0
+                    while runLumis.load(start + 1) > start:
                         # If we're full, end the job
                         if lumisInJob == lumisPerJob:
                             stopJob = True
                         # Actually do the new job creation
                         if stopJob:
-                            if firstLumi != None and lastLumi != None and lastRun != None:
-                                self.currentJob['mask'].addRunAndLumis(run = lastRun,
-                                                                       lumis = [firstLumi, lastLumi])
-                                eventsAdded = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
-                                runAddedTime = eventsAdded * timePerEvent
-                                runAddedSize = eventsAdded * sizePerEvent
-                                self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
                             msg = None
                             if failNextJob:
                                 msg = "File %s has too many events (%d) in %d lumi(s)" % (f['lfn'],
@@ -259,7 +232,6 @@ class EventAwareLumiBased(JobFactory):
                                 self.currentJob.addBaggageParameter("skipPileupEvents", (self.nJobs - 1) * lumisPerJob * eventsPerLumiInDataset)
                             self.currentJob.addResourceEstimates(memory = memoryRequirement)
                             failNextJob = False
-                            firstLumi = lumi
                             lumisInJob = 0
                             lumisInJobInFile = 0
                             currentJobAvgEventCount = 0
@@ -277,34 +249,27 @@ class EventAwareLumiBased(JobFactory):
                                     lumisPerJob = max(int(math.floor(ratio)), 1)
                                 else:
                                     lumisPerJob = f['lumiCount']
+                        elif not f in self.currentJob['input_files']:
+                            self.currentJob.addFile(f)
 
-                        lumisInJob += 1
-                        lumisInJobInFile += 1
-                        lastLumi = lumi
+                        end = None
+                        if lumisInJob < lumisPerJob:
+                            end = start + lumisPerJob - lumisInJob
+                        end = runLumis.load(end)
+                        runLumis.addToJob(self.currentJob, start, end, f['avgEvtsPerLumi'],
+                                          timePerEvent, sizePerEvent)
+
+                        lumisInJob += end - start
+                        lumisInJobInFile += end - start
                         stopJob = False
                         lastRun = run.run
-                        totalAvgEventCount += f['avgEvtsPerLumi']
+                        start = end
 
-                        if self.currentJob and not f in self.currentJob['input_files']:
-                            self.currentJob.addFile(f)
+                    totalAvgEventCount += f['avgEvtsPerLumi'] * len(runLumis.lumis)
 
-                        # We stop here if there are more total events than requested.
-                        if totalEvents > 0 and totalAvgEventCount >= totalEvents:
-                            stopTask = True
-                            break
-
-                    if firstLumi != None and lastLumi != None:
-                        # Add this run to the mask
-                        self.currentJob['mask'].addRunAndLumis(run = run.run,
-                                                               lumis = [firstLumi, lastLumi])
-                        eventsAdded = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
-                        runAddedTime = eventsAdded * timePerEvent
-                        runAddedSize = eventsAdded * sizePerEvent
-                        self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
-                        firstLumi = None
-                        lastLumi = None
-
-                    if stopTask:
+                    # We stop here if there are more total events than requested.
+                    if maxLumis and len(runLumis.lumis) == maxLumis:
+                        stopTask = True
                         break
 
                 if not splitOnFile:
@@ -54,6 +54,10 @@ class FileBased(JobFactory):
                     if file in locationDict[locSet]:
                         locationDict[locSet].remove(file)
 
+        if getParents:
+            # Load the parentage of all the files at once
+            self.findParents([f['lfn'] for files in locationDict.values() for f in files])
+
         for locSet in locationDict.keys():
             #Now we have all the files in a certain location set
             fileList    = locationDict[locSet]
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+_FileBatch_
+
+A batch of available files loaded for job splitting, kept by column.
+"""
+
+from array import array
+
+from WMCore.WMBS.File import File as WMBSFile
+
+
+class FileBatch(object):
+    """
+    _FileBatch_
+
+    Columns of IDs, sizes and events and the lists of LFNs, run numbers and
+    location sets of a batch of files.  Location sets are interned, every
+    file at the same locations shares the same frozenset, so the files can
+    be grouped by location without building them.
+
+    Files are added from the rows of Subscriptions.GetAvailableFilesForSplitting,
+    one row per file and location with the rows of a file following each
+    other:  (fileid, lfn, filesize, events, first_event, merged, minrun, se_name)
+    """
+
+    def __init__(self):
+        self.ids         = array('l')
+        self.sizes       = array('l')
+        self.events      = array('l')
+        self.firstEvents = array('l')
+        self.lfns        = []
+        self.minRuns     = []
+        self.locations   = []
+        self.locationSets = {}
+        self.lastID      = None
+        return
+
+    def __len__(self):
+        return len(self.ids)
+
+    def internLocations(self, locations):
+        """
+        _internLocations_
+
+        The shared frozenset for these locations
+        """
+        locations = frozenset(locations)
+        return self.locationSets.setdefault(locations, locations)
+
+    def addRow(self, row):
+        """
+        _addRow_
+
+        Add a file, or a location to the last file
+        """
+        fileID = int(row[0])
+        if fileID == self.lastID:
+            if row[7] != None:
+                self.locations[-1] = self.internLocations(self.locations[-1].union([row[7]]))
+            return
+
+        self.ids.append(fileID)
+        self.lfns.append(row[1])
+        self.sizes.append(int(row[2] or 0))
+        self.events.append(int(row[3] or 0))
+        self.firstEvents.append(int(row[4] or 0))
+        self.minRuns.append(row[6])
+        if row[7] != None:
+            self.locations.append(self.internLocations([row[7]]))
+        else:
+            self.locations.append(self.internLocations([]))
+        self.lastID = fileID
+        return
+
+    def makeFile(self, index):
+        """
+        _makeFile_
+
+        The WMBS file at the given position, as the splitting algorithms use it
+        """
+        fl = WMBSFile(id = self.ids[index], lfn = self.lfns[index],
+                      size = self.sizes[index], events = self.events[index],
+                      first_event = self.firstEvents[index])
+        fl['minrun'] = self.minRuns[index]
+        fl['locations'] = set(self.locations[index])
+        fl['newlocations'] = set(self.locations[index])
+        return fl
+
+    def files(self):
+        """
+        _files_
+
+        All the WMBS files of the batch
+        """
+        return [self.makeFile(i) for i in range(len(self.ids))]
+
+    def sortByLocation(self):
+        """
+        _sortByLocation_
+
+        Dictionary of location set -> list of WMBS files, in the order they
+        were loaded
+        """
+        indices = {}
+        for i, locations in enumerate(self.locations):
+            indices.setdefault(locations, []).append(i)
+
+        fileDict = {}
+        for locations, fileIndices in indices.items():
+            fileDict[locations] = [self.makeFile(i) for i in fileIndices]
+        return fileDict
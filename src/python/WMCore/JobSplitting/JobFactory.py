@@ -13,6 +13,8 @@ from WMCore.DataStructs.Fileset  import Fileset
 from WMCore.DataStructs.File     import File
 from WMCore.Services.UUID        import makeUUID
 from WMCore.WMBS.File            import File as WMBSFile
+from WMCore.WMBS.ParentResolver  import ParentResolver
+from WMCore.JobSplitting.FileBatch import FileBatch
 from WMCore.DAOFactory           import DAOFactory
 
 
@@ -42,8 +44,11 @@ class JobFactory(WMObject):
         self.limit         = limit
         self.transaction   = None
         self.proxies       = []
+        # Rows fetched from the proxies that belong to the next batch
+        self.pendingRows   = []
         self.grabByProxy   = False
         self.daoFactory    = None
+        self.parentResolver = None
         self.timing = {'jobInstance': 0, 'sortByLocation': 0, 'acquireFiles': 0, 'jobGroup': 0}
 
         if package == 'WMCore.WMBS':
@@ -52,6 +57,7 @@ class JobFactory(WMObject):
                                          logger = myThread.logger,
                                          dbinterface = myThread.dbi)
             self.getParentInfoAction  = self.daoFactory(classname = "Files.GetParentInfo")
+            self.parentResolver = ParentResolver(self.getParentInfoAction.execute)
 
     def __call__(self, jobtype = "Job", grouptype = "JobGroup", *args, **kwargs):
         """
@@ -72,6 +78,10 @@ class JobFactory(WMObject):
         # Every time we restart, re-zero the jobs
         self.nJobs = 0
 
+        # Parentage is only cached for one splitting
+        if self.parentResolver:
+            self.parentResolver.clear()
+
         # Create a new name
         self.baseUUID = makeUUID()
 
@@ -202,8 +212,13 @@ class JobFactory(WMObject):
 
         if self.grabByProxy:
             logging.debug("About to load files by proxy")
-            fileset = self.loadFiles(size = self.limit)
-            logging.debug("Loaded %i files" % (len(fileset)))
+            fileBatch = self.loadFileBatch(size = self.limit)
+            logging.debug("Loaded %i files" % (len(fileBatch)))
+            if frozenset() in fileBatch.locationSets:
+                for i, locations in enumerate(fileBatch.locations):
+                    if not locations:
+                        logging.error('File %s has no locations!' % (fileBatch.lfns[i]))
+            return fileBatch.sortByLocation()
         else:
             logging.debug("About to load files by DAO")
             fileset = self.subscription.availableFiles(limit = self.limit, doingJobSplitting = True)
@@ -258,7 +273,8 @@ class JobFactory(WMObject):
                                      logger = myThread.logger,
                                      dbinterface = myThread.dbi)
 
-        subAction = self.daoFactory(classname = "Subscriptions.GetAvailableFilesNoLocations")
+        # Files come with their details and locations, see FileBatch
+        subAction = self.daoFactory(classname = "Subscriptions.GetAvailableFilesForSplitting")
         results   = subAction.execute(subscription = self.subscription['id'],
                                       returnCursor = True,
                                       conn = myThread.transaction.conn,
@@ -279,6 +295,7 @@ class JobFactory(WMObject):
         Close any leftover connections
         """
         self.proxies     = []
+        self.pendingRows = []
         self.grabByProxy = False
         return
 
@@ -289,62 +306,44 @@ class JobFactory(WMObject):
         Grab some files from the resultProxy
         Should handle multiple proxies.  Not really sure about that
         """
+        return set(self.loadFileBatch(size = size).files())
+
+    def loadFileBatch(self, size = 10):
+        """
+        _loadFileBatch_
+
+        Grab the next size files from the resultProxy as a FileBatch.  A
+        file comes in one row per location, the rows that are fetched past
+        the last file of the batch are kept for the next one.
+        """
+        fileBatch = FileBatch()
 
-        if len(self.proxies) < 1:
+        if len(self.proxies) < 1 and not self.pendingRows:
             # Well, you don't have any proxies.
             # This is what happens when you ran out of files last time
             logging.info("No additional files found; Ending.")
-            return set()
-
-
-        resultProxy = self.proxies[0]
-        rawResults  = []
-        if type(resultProxy.keys) == list:
-            keys  = resultProxy.keys
-        else:
-            keys  = resultProxy.keys()
-            if type(keys) == set:
-                # If it's a set, handle it
-                keys = list(keys)
-        files       = set()
-
-
-        while len(rawResults) < size and len(self.proxies) > 0:
-            length = size - len(rawResults)
-            newResults = resultProxy.fetchmany(size = length)
-            if len(newResults) < length:
+            return fileBatch
+
+        rows = self.pendingRows
+        self.pendingRows = []
+        while True:
+            for i, row in enumerate(rows):
+                if len(fileBatch) >= size and int(row[0]) != fileBatch.lastID:
+                    self.pendingRows = rows[i:]
+                    return fileBatch
+                fileBatch.addRow(row)
+
+            if len(self.proxies) < 1:
+                break
+            resultProxy = self.proxies[0]
+            length = max(size - len(fileBatch), 1)
+            rows = resultProxy.fetchmany(size = length)
+            if len(rows) < length:
                 # Assume we're all out
                 # Eliminate this proxy
                 self.proxies.remove(resultProxy)
-            rawResults.extend(newResults)
 
-        if rawResults == []:
-            # Nothing to do
-            return set()
-
-        fileList = self.formatDict(results = rawResults, keys = keys)
-        fileIDs = list(set([x['fileid'] for x in fileList]))
-
-        myThread = threading.currentThread()
-        fileInfoAct  = self.daoFactory(classname = "Files.GetForJobSplittingByID")
-        fileInfoDict = fileInfoAct.execute(file = fileIDs,
-                                           conn = myThread.transaction.conn,
-                                           transaction = True)
-
-        getLocAction = self.daoFactory(classname = "Files.GetLocationBulk")
-        getLocDict   = getLocAction.execute(files = fileIDs,
-                                            conn = myThread.transaction.conn,
-                                            transaction = True)
-
-        for fID in fileIDs:
-            fl = WMBSFile(id = fID)
-            fl.update(fileInfoDict[fID])
-            locations = getLocDict.get((fID), [])
-            for loc in locations:
-                fl.setLocation(loc, immediateSave = False)
-            files.add(fl)
-
-        return files
+        return fileBatch
 
     def formatDict(self, results, keys):
         """
@@ -374,35 +373,19 @@ class JobFactory(WMObject):
 
         Find the parents for a file based on its lfn
         """
+        return self.findParents([lfn])[lfn]
 
-        parentsInfo = self.getParentInfoAction.execute([lfn])
-        newParents  = set()
-        for parentInfo in parentsInfo:
-
-            # This will catch straight to merge files that do not have redneck
-            # parents.  We will mark the straight to merge file from the job
-            # as a child of the merged parent.
-            if int(parentInfo["merged"]) == 1:
-                newParents.add(parentInfo["lfn"])
-
-            elif parentInfo['gpmerged'] == None:
-                continue
-
-            # Handle the files that result from merge jobs that aren't redneck
-            # children.  We have to setup parentage and then check on whether or
-            # not this file has any redneck children and update their parentage
-            # information.
-            elif int(parentInfo["gpmerged"]) == 1:
-                newParents.add(parentInfo["gplfn"])
+    def findParents(self, lfns):
+        """
+        _findParents_
 
-            # If that didn't work, we've reached the great-grandparents
-            # And we have to work via recursion
-            else:
-                parentSet = self.findParent(lfn = parentInfo['gplfn'])
-                for parent in parentSet:
-                    newParents.add(parent)
+        Find the merged parents of many files at once, with one query per
+        level of parentage.  Splitting algorithms call it with all their
+        files first, findParent() then uses what was loaded.
 
-        return newParents
+        Returns a dictionary of lfn -> set of parent lfns
+        """
+        return self.parentResolver.findParents(lfns)
 
     def getPerformanceParameters(self, defaultParams):
         """
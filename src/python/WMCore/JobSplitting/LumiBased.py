@@ -14,6 +14,7 @@ import operator
 import logging
 import threading
 import traceback
+from bisect import bisect_left, bisect_right
 
 from WMCore.DataStructs.Run import Run
 
@@ -130,6 +131,228 @@ class LumiChecker:
                 self.lumiJobs[(run, lumi)].addFile(file_)
 
 
+class GoodRunList(object):
+    """
+    _GoodRunList_
+
+    A good run list compiled for lookups.  The lumi ranges of every run are
+    sorted and merged, so a lumi is checked with a bisection instead of a
+    scan of the ranges.  Answers like isGoodRun and isGoodLumi.
+    """
+
+    def __init__(self, goodRunList):
+        self.runs = None
+        if goodRunList == None or goodRunList == {}:
+            return
+
+        self.runs = {}
+        for run, runRanges in goodRunList.items():
+            ranges = []
+            for runRange in runRanges:
+                if not len(runRange) == 2:
+                    logging.error("Invalid run range %s for run %s!  Failing its lumis!" % (runRange, run))
+                elif runRange[0] <= runRange[1]:
+                    ranges.append(list(runRange))
+            ranges.sort()
+
+            starts = []
+            ends   = []
+            for firstLumi, lastLumi in ranges:
+                if ends and firstLumi <= ends[-1]:
+                    ends[-1] = max(ends[-1], lastLumi)
+                else:
+                    starts.append(firstLumi)
+                    ends.append(lastLumi)
+            self.runs[run] = (starts, ends)
+        return
+
+    def isGoodRun(self, run):
+        """
+        _isGoodRun_
+
+        Tell if this is a good run
+        """
+        return self.runs == None or str(run) in self.runs
+
+    def lumiRanges(self, run):
+        """
+        _lumiRanges_
+
+        The sorted starts and ends of the good lumi ranges of a good run,
+        None if every lumi is good
+        """
+        if self.runs == None:
+            return None
+        return self.runs[str(run)]
+
+    def isGoodLumi(self, run, lumi):
+        """
+        _isGoodLumi_
+
+        Checks to see if a run-lumi combination is in the good run list
+        """
+        if not self.isGoodRun(run):
+            return False
+        if self.runs == None:
+            return True
+        starts, ends = self.runs[str(run)]
+        i = bisect_right(starts, lumi) - 1
+        return i >= 0 and lumi <= ends[i]
+
+class RunLumis(object):
+    """
+    _RunLumis_
+
+    The lumis of a run of a file that the splitting algorithms put in jobs:
+    the sorted lumis that pass the good run list and the lumi checker, and
+    the positions where a chain of lumis breaks and a new mask range starts.
+
+    The chains break where the splitting algorithms always broke them: on a
+    gap after a lumi other than 0 and on a skipped lumi.  A lumi skipped
+    because it is a duplicate of the lumi before only breaks the chain when
+    that lumi doesn't start a chain itself, those positions are conditional.
+    Jobs start a new chain too, see chains().
+
+    The good lumis are cut from the sorted lumis of the run by bisection,
+    only the lumi checker needs to look at them one by one.
+    """
+
+    def __init__(self, run, goodRunList, lumiChecker, inputFile, maxLumis = None):
+        self.run         = run.run
+        self.lumis       = []
+        self.breaks      = []
+        self.conditional = set()
+        self.pending     = None
+
+        # The slices of the sorted lumis that are in the good run list
+        lumis  = run.lumis
+        ranges = goodRunList.lumiRanges(run.run)
+        if ranges == None:
+            slices = [(0, len(lumis))]
+        else:
+            slices = []
+            for firstLumi, lastLumi in zip(*ranges):
+                start = bisect_left(lumis, firstLumi)
+                end   = bisect_right(lumis, lastLumi)
+                if start < end:
+                    slices.append((start, end))
+
+        if lumiChecker.applyLumiCorrection:
+            # Jobs add lumis to the checker, so lumis are checked as they are needed
+            self.pending = self.checkLumis(lumis, slices, lumiChecker, inputFile, maxLumis)
+            return
+
+        lastEnd = 0
+        for start, end in slices:
+            if maxLumis:
+                end = min(end, start + maxLumis - len(self.lumis))
+            if self.lumis:
+                lastLumi = self.lumis[-1]
+                if start > lastEnd or (lastLumi and lumis[start] != lastLumi + 1):
+                    self.breaks.append(len(self.lumis))
+            self.findBreaks(lumis, start, end)
+            self.lumis.extend(lumis[start:end])
+            lastEnd = end
+            if maxLumis and len(self.lumis) == maxLumis:
+                break
+        return
+
+    def findBreaks(self, lumis, start, end):
+        """
+        _findBreaks_
+
+        Add the gaps in lumis[start:end], which are appended to the lumis
+        """
+        offset = len(self.lumis) - start
+        steps  = map(operator.sub, lumis[start + 1:end], lumis[start:end - 1])
+        if steps.count(1) == len(steps):
+            return
+        for i, step in enumerate(steps):
+            if step != 1 and lumis[start + i]:
+                self.breaks.append(offset + start + i + 1)
+        return
+
+    def checkLumis(self, lumis, slices, lumiChecker, inputFile, maxLumis):
+        """
+        _checkLumis_
+
+        Go through the lumis in the good run list one by one, skipping the
+        ones the lumi checker has seen already.  Yields after every lumi
+        that is added, see load().
+        """
+        skipped = []
+        lastEnd = 0
+        for start, end in slices:
+            if self.lumis:
+                skipped.extend(lumis[lastEnd:start])
+            lastEnd = end
+            for lumi in lumis[start:end]:
+                if maxLumis and len(self.lumis) == maxLumis:
+                    return
+                if lumiChecker.isSplitLumi(self.run, lumi, inputFile):
+                    if self.lumis:
+                        skipped.append(lumi)
+                    continue
+
+                if self.lumis:
+                    lastLumi = self.lumis[-1]
+                    if (lastLumi and lumi != lastLumi + 1) or [x for x in skipped if x != lastLumi]:
+                        self.breaks.append(len(self.lumis))
+                    elif skipped:
+                        self.breaks.append(len(self.lumis))
+                        self.conditional.add(len(self.lumis))
+                    skipped = []
+                self.lumis.append(lumi)
+                yield lumi
+        return
+
+    def load(self, end = None):
+        """
+        _load_
+
+        Check the lumis until there are end lumis, or all of them if end is
+        None.  Returns the number of lumis up to end.
+        """
+        while self.pending != None and (end == None or len(self.lumis) < end):
+            try:
+                next(self.pending)
+            except StopIteration:
+                self.pending = None
+        if end == None:
+            return len(self.lumis)
+        return min(end, len(self.lumis))
+
+    def chains(self, start, end):
+        """
+        _chains_
+
+        The (first, last) lumi of the chains of lumis[start:end], which go
+        in the same job and start a chain
+        """
+        chains     = []
+        chainStart = start
+        for i in self.breaks[bisect_right(self.breaks, start):bisect_left(self.breaks, end)]:
+            if i in self.conditional and chainStart == i - 1:
+                continue
+            chains.append((self.lumis[chainStart], self.lumis[i - 1]))
+            chainStart = i
+        chains.append((self.lumis[chainStart], self.lumis[end - 1]))
+        return chains
+
+    def addToJob(self, job, start, end, avgEvtsPerLumi, timePerEvent, sizePerEvent):
+        """
+        _addToJob_
+
+        Add lumis[start:end] to the mask and the resource estimates of the job
+        """
+        for firstLumi, lastLumi in self.chains(start, end):
+            job['mask'].addRunAndLumis(run = self.run, lumis = [firstLumi, lastLumi])
+            addedEvents = ((lastLumi - firstLumi + 1) * avgEvtsPerLumi)
+            runAddedTime = addedEvents * timePerEvent
+            runAddedSize = addedEvents * sizePerEvent
+            job.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
+        return
+
 
 class LumiBased(JobFactory):
     """
@@ -247,14 +470,17 @@ class LumiBased(JobFactory):
         # EXACTLY lumisPerJob number of lumis (except for maybe the last one)
 
         totalJobs = 0
-        lastLumi = None
-        firstLumi = None
         stopJob = True
         stopTask = False
         lastRun = None
         lumisInJob = 0
         lumisInTask = 0
+        goodLumis = GoodRunList(goodRunList)
         self.lumiChecker = LumiChecker(applyLumiCorrection)
+        if getParents:
+            # Load the parentage of all the files at once
+            self.findParents([f['lfn'] for files in locationDict.values() for f in files])
+
         for location in locationDict.keys():
 
             # For each location, we need a new jobGroup
@@ -272,102 +498,58 @@ class LumiBased(JobFactory):
                     stopJob = True
 
                 for run in f['runs']:
-                    if not isGoodRun(goodRunList = goodRunList, run = run.run):
+                    if not goodLumis.isGoodRun(run.run):
                         # Then skip this one
                         continue
                     if len(runWhitelist) > 0 and not run.run in runWhitelist:
                         # Skip due to run whitelist
                         continue
-                    firstLumi = None
 
                     if splitOnRun and run.run != lastRun:
                         # Then we need to kill this job and get a new one
                         stopJob = True
 
-                    # Now loop over the lumis
-                    for lumi in run:
-                        if (not isGoodLumi(goodRunList, run = run.run, lumi = lumi)
-                                or self.lumiChecker.isSplitLumi(run.run, lumi, f)): # splitLumi checks if the lumi is split across jobs
-                            # Kill the chain of good lumis
-                            # Skip this lumi
-                            if firstLumi != None and firstLumi != lumi:
-                                self.currentJob['mask'].addRunAndLumis(run = run.run,
-                                                                       lumis = [firstLumi, lastLumi])
-                                addedEvents = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
-                                runAddedTime = addedEvents * timePerEvent
-                                runAddedSize = addedEvents * sizePerEvent
-                                self.currentJob.addResourceEstimates(jobTime = runAddedTime,
-                                                                     disk = runAddedSize)
-                                firstLumi = None
-                                lastLumi = None
-                            continue
-
-                        # You have to kill the lumi chain if they're not continuous
-                        if lastLumi and not lumi == lastLumi + 1:
-                            self.currentJob['mask'].addRunAndLumis(run = run.run,
-                                                                   lumis = [firstLumi, lastLumi])
-                            addedEvents = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
-                            runAddedTime = addedEvents * timePerEvent
-                            runAddedSize = addedEvents * sizePerEvent
-                            self.currentJob.addResourceEstimates(jobTime = runAddedTime,
-                                                                 disk = runAddedSize)
-                            firstLumi = None
-                            lastLumi = None
-
-                        if firstLumi == None:
-                            # Set the first lumi in the run
-                            firstLumi = lumi
+                    maxLumis = None
+                    if totalLumis > 0:
+                        maxLumis = totalLumis - lumisInTask
+                    runLumis = RunLumis(run, goodLumis, self.lumiChecker, f, maxLumis)
 
+                    # Fill jobs with the lumis of the run, a job at a time
+                    start = 0
+                    while runLumis.load(start + 1) > start:
                         # If we're full, end the job
                         if lumisInJob == lumisPerJob:
                             stopJob = True
                         # Actually do the new job creation
                         if stopJob:
-                            if firstLumi != None and lastLumi != None and lastRun != None:
-                                self.currentJob['mask'].addRunAndLumis(run = lastRun,
-                                                                       lumis = [firstLumi, lastLumi])
-                                addedEvents = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
-                                runAddedTime = addedEvents * timePerEvent
-                                runAddedSize = addedEvents * sizePerEvent
-                                self.currentJob.addResourceEstimates(jobTime = runAddedTime,
-                                                                     disk = runAddedSize)
                             self.lumiChecker.closeJob(self.currentJob) # before creating a new job add the lumis of the current one to the checker
                             self.newJob(name = self.getJobName())
                             self.currentJob.addResourceEstimates(memory = memoryRequirement)
                             if deterministicPileup:
                                 self.currentJob.addBaggageParameter("skipPileupEvents", (self.nJobs - 1) * lumisPerJob * eventsPerLumiInDataset)
-                            firstLumi = lumi
                             lumisInJob = 0
                             totalJobs += 1
 
                             # Add the file to new jobs
                             self.currentJob.addFile(f)
+                        elif not f in self.currentJob['input_files']:
+                            self.currentJob.addFile(f)
+
+                        end = None
+                        if lumisInJob < lumisPerJob:
+                            end = start + lumisPerJob - lumisInJob
+                        end = runLumis.load(end)
+                        runLumis.addToJob(self.currentJob, start, end, f['avgEvtsPerLumi'],
+                                          timePerEvent, sizePerEvent)
 
-                        lumisInJob += 1
-                        lumisInTask += 1
-                        lastLumi = lumi
+                        lumisInJob += end - start
+                        lumisInTask += end - start
                         stopJob = False
                         lastRun = run.run
+                        start = end
 
-                        if self.currentJob and not f in self.currentJob['input_files']:
-                            self.currentJob.addFile(f)
-
-                        if totalLumis > 0 and lumisInTask >= totalLumis:
-                            stopTask = True
-                            break
-
-                    if firstLumi != None and lastLumi != None:
-                        # Add this run to the mask
-                        self.currentJob['mask'].addRunAndLumis(run = run.run,
-                                                               lumis = [firstLumi, lastLumi])
-                        addedEvents = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
-                        runAddedTime = addedEvents * timePerEvent
-                        runAddedSize = addedEvents * sizePerEvent
-                        self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
-                        firstLumi = None
-                        lastLumi = None
-
-                    if stopTask:
+                    if maxLumis and len(runLumis.lumis) == maxLumis:
+                        stopTask = True
                         break
 
                 if stopTask:
@@ -39,6 +39,10 @@ class MinFileBased(JobFactory):
         #Get a dictionary of sites, files
         locationDict = self.sortByLocation()
 
+        if getParents:
+            # Load the parentage of all the files at once
+            self.findParents([f['lfn'] for files in locationDict.values() for f in files])
+
         for location in locationDict.keys():
             #Now we have all the files in a certain location
             fileList    = locationDict[location]
@@ -9,6 +9,7 @@ import time
 import logging
 import traceback
 import re
+from functools import partial
 
 from WMCore.Database.CMSCouch import CouchServer
 from WMCore.Database.CMSCouch import CouchNotFoundError, CouchError
@@ -58,6 +59,143 @@ def discardConflictingDocument(couchDbInstance, data, result):
         return result
 
 
+def stateTransition(doc, docID, oldstate, newstate, location, timestamp):
+    """
+    _stateTransition_
+
+    Client side version of the JobDump stateTransition update handler, add
+    a state transition to a job document.  Arguments are converted the same
+    way the handler gets them from the query string.
+    """
+    if doc is None:
+        doc = {"_id": docID, "states": {}}
+
+    maxKey = 0
+    for key in doc.get("states", {}).keys():
+        maxKey = max(maxKey, int(key))
+
+    doc.setdefault("states", {})[str(maxKey + 1)] = {"oldstate": str(oldstate),
+                                                     "newstate": str(newstate),
+                                                     "location": str(location),
+                                                     "timestamp": int(timestamp)}
+    return doc
+
+def jobSummaryState(doc, docID, newstate, timestamp):
+    """
+    _jobSummaryState_
+
+    Client side version of the WMStatsAgent jobSummaryState update handler,
+    set the state of an existing job summary.
+    """
+    if doc is None:
+        # The update handler fails on missing documents
+        return None
+
+    doc["state"] = str(newstate)
+    doc["timestamp"] = int(timestamp)
+    return doc
+
+def jobSummaryTransition(doc, docID, oldstate, newstate, location, timestamp):
+    """
+    _jobSummaryTransition_
+
+    Client side version of the WMStatsAgent jobStateTransition update
+    handler, add a state transition to the history of a job summary.
+    """
+    if doc is None:
+        doc = {"_id": docID}
+
+    doc.setdefault("state_history", []).append({"oldstate": str(oldstate),
+                                                "newstate": str(newstate),
+                                                "location": str(location),
+                                                "timestamp": int(timestamp)})
+    return doc
+
+def replaceJobSummary(doc, docID, jobSummary, finalState):
+    """
+    _replaceJobSummary_
+
+    Replace a job summary with a new one built from the job report,
+    keeping the state history and the input information of the old one.
+    finalState is a transition to add to the history, or None.
+    """
+    newDoc = dict(jobSummary)
+    newDoc["timestamp"] = int(time.time())
+    if doc is None:
+        return newDoc
+
+    if "_rev" in doc:
+        newDoc["_rev"] = doc["_rev"]
+    newDoc["state_history"] = list(doc.get("state_history", []))
+    if finalState is not None:
+        newDoc["state_history"].append(finalState)
+
+    noEmptyList = ["inputfiles", "lumis"]
+    for prop in noEmptyList:
+        newDoc[prop] = newDoc[prop] if newDoc[prop] else doc.get(prop, [])
+    return newDoc
+
+def bulkUpdateDocuments(couchDbInstance, updates, maxRetries = 3):
+    """
+    _bulkUpdateDocuments_
+
+    Apply a list of client side updates to documents with one _all_docs and
+    one _bulk_docs request.  updates is a list of (document id, function)
+    tuples, the functions take the current document (None if it doesn't
+    exist) and the document id and return the updated document or None to
+    leave it untouched.  Updates to the same document are applied in order.
+
+    Documents that were changed by someone else in the meantime are read and
+    updated again, up to maxRetries times.  Return the list of ids of the
+    documents that could not be updated.
+    """
+    docUpdates = {}
+    docIDs = []
+    for docID, update in updates:
+        if docID not in docUpdates:
+            docUpdates[docID] = []
+            docIDs.append(docID)
+        docUpdates[docID].append(update)
+
+    failedIDs = []
+    attempt = 0
+    while docIDs:
+        currentDocs = {}
+        result = couchDbInstance.allDocs(options = {"include_docs": True}, keys = docIDs)
+        for row in result["rows"]:
+            if row.get("doc", None) is not None:
+                currentDocs[row["id"]] = row["doc"]
+
+        newDocs = []
+        for docID in docIDs:
+            doc = currentDocs.get(docID, None)
+            for update in docUpdates[docID]:
+                doc = update(doc, docID)
+            if doc is not None:
+                newDocs.append(doc)
+
+        if not newDocs:
+            break
+
+        retval = couchDbInstance.post("/%s/_bulk_docs/" % couchDbInstance.name,
+                                      {"docs": newDocs})
+        conflicts = []
+        for row in retval:
+            error = row.get("error", None)
+            if error is None:
+                continue
+            if error == "conflict" and attempt < maxRetries:
+                conflicts.append(row["id"])
+                continue
+            logging.error("Couldn't update document %s in %s: %s" % (row["id"], couchDbInstance.name,
+                                                                     row.get("reason", error)))
+            failedIDs.append(row["id"])
+
+        attempt += 1
+        docIDs = conflicts
+
+    return failedIDs
+
 class ChangeState(WMObject, WMConnectionBase):
     """
     Propagate the state of a job through the JSM.
@@ -71,6 +209,10 @@ class ChangeState(WMObject, WMConnectionBase):
         else:
             self.dbname = couchDbName
 
+        # The fwjr documents are only ever written, they can be posted by
+        # writer threads while the jobs move on
+        self.fwjrWriters = getattr(self.config.JobStateMachine, 'asyncFWJRWriters', 0)
+
         self.couchdb = CouchServer(self.config.JobStateMachine.couchurl)
         self._connectDatabases()
 
@@ -89,6 +231,11 @@ class ChangeState(WMObject, WMConnectionBase):
         self.updateLocationDAO = self.daofactory("Jobs.UpdateLocation")
 
         self.maxUploadedInputFiles = getattr(self.config.JobStateMachine, 'maxFWJRInputFiles', 1000)
+
+        # Apply the state transitions of existing documents client side and
+        # write them in bulk instead of calling the update handlers per job
+        self.bulkTransitions = getattr(self.config.JobStateMachine, 'bulkTransitions', False)
+        self.bulkConflictRetries = getattr(self.config.JobStateMachine, 'bulkConflictRetries', 3)
         return
 
     def _connectDatabases(self):
@@ -106,6 +253,8 @@ class ChangeState(WMObject, WMConnectionBase):
         if not hasattr(self, 'fwjrdatabase') or self.fwjrdatabase is None:
             try:
                 self.fwjrdatabase = self.couchdb.connectDatabase("%s/fwjrs" % self.dbname, size = 250)
+                if self.fwjrWriters > 0:
+                    self.fwjrdatabase.startAsyncCommit(writers = self.fwjrWriters)
             except Exception as ex:
                 logging.error("Error connecting to couch db '%s/fwjrs': %s" % (self.dbname, str(ex)))
                 self.fwjrdatabase = None
@@ -190,6 +339,10 @@ class ChangeState(WMObject, WMConnectionBase):
         Record relevant job information in couch. If the job does not yet exist
         in couch it will be saved as a seperate document.  If the job has a FWJR
         attached that will be saved as a seperate document.
+
+        In bulk transitions mode the updates of existing job and job summary
+        documents are collected, applied client side and written back with
+        a single _bulk_docs request per database.
         """
         if not self._connectDatabases():
             logging.error('Databases not connected properly')
@@ -197,6 +350,8 @@ class ChangeState(WMObject, WMConnectionBase):
 
         timestamp = int(time.time())
         couchRecordsToUpdate = []
+        jobUpdates = []
+        summaryUpdates = []
 
         for job in jobs:
             couchDocID = job.get("couch_record", None)
@@ -260,6 +415,10 @@ class ChangeState(WMObject, WMConnectionBase):
                 couchRecordsToUpdate.append({"jobid": job["id"],
                                              "couchid": jobDocument["_id"]})
                 self.jobsdatabase.queue(jobDocument, callback = discardConflictingDocument)
+            elif self.bulkTransitions:
+                jobUpdates.append((couchDocID, partial(stateTransition, oldstate = oldstate,
+                                                       newstate = newstate, location = jobLocation,
+                                                       timestamp = timestamp)))
             else:
                 # We send a PUT request to the stateTransition update handler.
                 # Couch expects the parameters to be passed as arguments to in
@@ -284,17 +443,25 @@ class ChangeState(WMObject, WMConnectionBase):
                     monitorState = "jobfailed"
                 else:
                     monitorState = newstate
-                updateUri += "?newstate=%s&timestamp=%s" % (monitorState, timestamp)
-                self.jsumdatabase.makeRequest(uri = updateUri, type = "PUT", decode = False)
-                logging.debug("Updated job summary status for job %s" % jobSummaryId)
-                
-                updateUri = "/" + self.jsumdatabase.name + "/_design/WMStatsAgent/_update/jobStateTransition/" + jobSummaryId
-                updateUri += "?oldstate=%s&newstate=%s&location=%s&timestamp=%s" % (oldstate,
-                                                                                    monitorState,
-                                                                                    job["location"],
-                                                                                    timestamp)
-                self.jsumdatabase.makeRequest(uri = updateUri, type = "PUT", decode = False)
-                logging.debug("Updated job summary state history for job %s" % jobSummaryId)
+
+                if self.bulkTransitions:
+                    summaryUpdates.append((jobSummaryId, partial(jobSummaryState, newstate = monitorState,
+                                                                 timestamp = timestamp)))
+                    summaryUpdates.append((jobSummaryId, partial(jobSummaryTransition, oldstate = oldstate,
+                                                                 newstate = monitorState, location = job["location"],
+                                                                 timestamp = timestamp)))
+                else:
+                    updateUri += "?newstate=%s&timestamp=%s" % (monitorState, timestamp)
+                    self.jsumdatabase.makeRequest(uri = updateUri, type = "PUT", decode = False)
+                    logging.debug("Updated job summary status for job %s" % jobSummaryId)
+
+                    updateUri = "/" + self.jsumdatabase.name + "/_design/WMStatsAgent/_update/jobStateTransition/" + jobSummaryId
+                    updateUri += "?oldstate=%s&newstate=%s&location=%s&timestamp=%s" % (oldstate,
+                                                                                        monitorState,
+                                                                                        job["location"],
+                                                                                        timestamp)
+                    self.jsumdatabase.makeRequest(uri = updateUri, type = "PUT", decode = False)
+                    logging.debug("Updated job summary state history for job %s" % jobSummaryId)
 
             if job.get("fwjr", None):
 
@@ -380,36 +547,67 @@ class ChangeState(WMObject, WMConnectionBase):
                                   "acdc_url": "%s/%s" % (sanitizeURL(self.config.ACDC.couchurl)['url'], self.config.ACDC.database),
                                   "agent_name": self.config.Agent.hostName,
                                   "output": outputs }
-                    if couchDocID is not None:
-                        try:
-                            currentJobDoc = self.jsumdatabase.document(id = jobSummaryId)
-                            jobSummary['_rev'] = currentJobDoc['_rev']
-                            jobSummary['state_history'] = currentJobDoc.get('state_history', [])
-                            # record final status transition
-                            if newstate == 'success':
-                                finalStateDict = {'oldstate': oldstate,
-                                                  'newstate': newstate,
-                                                  'location': job["location"],
-                                                  'timestamp': timestamp}
-                                jobSummary['state_history'].append(finalStateDict)
-                                
-                            noEmptyList = ["inputfiles", "lumis"]
-                            for prop in noEmptyList:
-                                jobSummary[prop] = jobSummary[prop] if jobSummary[prop] else currentJobDoc.get(prop, [])
-                        except CouchNotFoundError:
-                            pass
-                    self.jsumdatabase.queue(jobSummary, timestamp = True)
+                    if couchDocID is not None and self.bulkTransitions:
+                        # record final status transition
+                        finalStateDict = None
+                        if newstate == 'success':
+                            finalStateDict = {'oldstate': oldstate,
+                                              'newstate': newstate,
+                                              'location': job["location"],
+                                              'timestamp': timestamp}
+                        summaryUpdates.append((jobSummaryId, partial(replaceJobSummary, jobSummary = jobSummary,
+                                                                     finalState = finalStateDict)))
+                    else:
+                        if couchDocID is not None:
+                            try:
+                                currentJobDoc = self.jsumdatabase.document(id = jobSummaryId)
+                                jobSummary['_rev'] = currentJobDoc['_rev']
+                                jobSummary['state_history'] = currentJobDoc.get('state_history', [])
+                                # record final status transition
+                                if newstate == 'success':
+                                    finalStateDict = {'oldstate': oldstate,
+                                                      'newstate': newstate,
+                                                      'location': job["location"],
+                                                      'timestamp': timestamp}
+                                    jobSummary['state_history'].append(finalStateDict)
+
+                                noEmptyList = ["inputfiles", "lumis"]
+                                for prop in noEmptyList:
+                                    jobSummary[prop] = jobSummary[prop] if jobSummary[prop] else currentJobDoc.get(prop, [])
+                            except CouchNotFoundError:
+                                pass
+                        self.jsumdatabase.queue(jobSummary, timestamp = True)
 
         if len(couchRecordsToUpdate) > 0:
             self.setCouchDAO.execute(bulkList = couchRecordsToUpdate,
                                      conn = self.getDBConn(),
                                      transaction = self.existingTransaction())
 
+        if len(jobUpdates) > 0:
+            bulkUpdateDocuments(self.jobsdatabase, jobUpdates,
+                                maxRetries = self.bulkConflictRetries)
+        if len(summaryUpdates) > 0:
+            bulkUpdateDocuments(self.jsumdatabase, summaryUpdates,
+                                maxRetries = self.bulkConflictRetries)
+
         self.jobsdatabase.commit(callback = discardConflictingDocument)
-        self.fwjrdatabase.commit(callback = discardConflictingDocument)
+        # Wait for the writer threads, the documents must be in couch before
+        # the caller commits the state change
+        self.fwjrdatabase.flush(callback = discardConflictingDocument)
         self.jsumdatabase.commit()
         return
 
+    def close(self):
+        """
+        _close_
+
+        Stop the threads posting the fwjr documents, once they posted
+        everything they were handed
+        """
+        if getattr(self, 'fwjrdatabase', None) is not None:
+            self.fwjrdatabase.stopAsyncCommit()
+        return
+
     def persist(self, jobs, newstate, oldstate):
         """
         _persist_
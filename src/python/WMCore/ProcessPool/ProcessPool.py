@@ -3,6 +3,17 @@
 """
 _ProcessPool_
 
+Pool of slave processes running a worker class on pieces of work.
+
+The master holds a single ZMQ ROUTER socket and every slave connects to it
+with a DEALER socket.  Work is dispatched with credits: a slave announces how
+many items it accepts at once and gets a new item every time it reports one
+as done, so a slow slave never sits on more than its share of the work while
+the others are idle.  Work that can't be dispatched yet waits in the master.
+
+Slaves that die are restarted and the work they had in flight is requeued.
+Queue depth, per slave latencies and throughput are available from
+getMetrics() and are reported through the heartbeat API.
 """
 
 
@@ -10,19 +21,21 @@ _ProcessPool_
 import zmq
 import subprocess
 import sys
+import time
 import logging
 import os
 import threading
 import traceback
 import cPickle
 
+from collections import deque
 from logging.handlers import RotatingFileHandler
 
 from WMCore.WMFactory import WMFactory
 from WMCore.WMInit    import WMInit
 from WMCore           import WMLogging
 
-from WMCore.Services.Requests import JSONRequests
+from WMCore.ProcessPool.Serializers import getSerializer
 
 from WMCore.Agent.HeartbeatAPI import HeartbeatAPI
 
@@ -36,6 +49,17 @@ class ProcessPoolException(WMException):
     Raise some exceptions
     """
 
+def percentile(values, fraction):
+    """
+    _percentile_
+
+    Return the value below which the given fraction of the values fall
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[int(round(fraction * (len(values) - 1)))]
+
 class ProcessPoolWorker:
     """
     _ProcessPoolWorker_
@@ -60,10 +84,36 @@ class ProcessPoolWorker:
         return
 
 
+class SlaveInfo:
+    """
+    _SlaveInfo_
+
+    Bookkeeping for a single slave process
+    """
+
+    def __init__(self, index, identity, process):
+        self.index     = index
+        self.identity  = identity
+        self.process   = process
+        self.ready     = False
+        self.credits   = 0
+        # item ID -> time it was sent to the slave
+        self.inFlight  = {}
+        # item ID -> results received for work that isn't done yet
+        self.partial   = {}
+        self.latencies = deque(maxlen = 1000)
+        self.completed = 0
+        self.restarts  = 0
+
+        return
+
+
 class ProcessPool:
     def __init__(self, slaveClassName, totalSlaves, componentDir,
                  config, namespace = 'WMComponent', inPort = '5555',
-                 outPort = '5558'):
+                 serializer = 'json', transport = 'tcp',
+                 slaveCredits = 2, maxQueueSize = None, maxItemRetries = 2,
+                 maxSlaveRestarts = 5, metricsInterval = 60):
         """
         __init__
 
@@ -77,15 +127,28 @@ class ProcessPool:
         parameters.  It is not passed to the slave class.  The slaveInit
         parameter will be serialized and passed to the slave class's
         constructor.
+
+        Work is encoded with the given serializer, one of json, pickle or
+        msgpack (see WMCore.ProcessPool.Serializers).  The transport is
+        either tcp, on inPort, or ipc, through a unix socket in the
+        component directory.
+
+        Every slave holds at most slaveCredits pieces of work at a time and
+        enqueue() blocks while maxQueueSize pieces of work are waiting for a
+        slave, if it is set.  Work that was in flight on a slave that died
+        is requeued at most maxItemRetries times and a slave is restarted at
+        most maxSlaveRestarts times.  Metrics are sent to the heartbeat
+        every metricsInterval seconds.
         """
         self.enqueueIndex = 0
         self.dequeueIndex = 0
         self.runningWork  = 0
 
-        #Use the Services.Requests JSONizer, which handles __to_json__ calls
-        self.jsonHandler = JSONRequests()
+        self.serializerName = serializer
+        self.serializer     = getSerializer(serializer)
 
         # heartbeat should be registered at this point
+        self.heartbeatAPI = None
         if getattr(config.Agent, "useHeartbeat", True):
             self.heartbeatAPI = HeartbeatAPI(getattr(config.Agent, "componentName", "ProcPoolSlave"))
 
@@ -106,8 +169,34 @@ class ProcessPool:
         self.nSlaves   = totalSlaves
         self.namespace = namespace
         self.inPort    = inPort
-        self.outPort   = outPort
 
+        self.slaveCredits     = slaveCredits
+        self.maxQueueSize     = maxQueueSize
+        self.maxItemRetries   = maxItemRetries
+        self.maxSlaveRestarts = maxSlaveRestarts
+        self.metricsInterval  = metricsInterval
+
+        # IDs of the work waiting for a slave, in order
+        self.pendingWork = deque()
+        # item ID -> (encoded work, number of times it was requeued)
+        self.workItems   = {}
+        self.results     = deque()
+        self.nextItemID  = 0
+        self.slaveCount  = 0
+        self.completed   = deque(maxlen = 10000)
+        self.lastMetrics = time.time()
+        self.router      = None
+
+        if transport == 'tcp':
+            bindAddress  = "tcp://*:%s" % inPort
+            self.address = "tcp://localhost:%s" % inPort
+        elif transport == 'ipc':
+            self.address = "ipc://%s" % os.path.join(componentDir, '%s.ipc' % slaveClassName)
+            bindAddress  = self.address
+        else:
+            msg = "Unknown ProcessPool transport: %s" % transport
+            logging.error(msg)
+            raise ProcessPoolException(msg)
 
         # Pickle the config
         self.configPath = os.path.join(componentDir, '%s_config.pkl' % slaveClassName)
@@ -122,27 +211,21 @@ class ProcessPool:
         # Set up ZMQ
         try:
             context = zmq.Context()
-            self.sender = context.socket(zmq.PUSH)
-            self.sender.bind("tcp://*:%s" % inPort)
-            self.sink = context.socket(zmq.PULL)
-            self.sink.bind("tcp://*:%s" % outPort)
+            self.router = context.socket(zmq.ROUTER)
+            self.router.bind(bindAddress)
         except zmq.ZMQError:
             # Try this again in a moment to see
             # if it's just being held by something pre-existing
-            import time
             time.sleep(1)
             logging.error("Blocked socket on startup: Attempting sleep to give it time to clear.")
             try:
                 context = zmq.Context()
-                self.sender = context.socket(zmq.PUSH)
-                self.sender.bind("tcp://*:%s" % inPort)
-                self.sink = context.socket(zmq.PULL)
-                self.sink.bind("tcp://*:%s" % outPort)
+                self.router = context.socket(zmq.ROUTER)
+                self.router.bind(bindAddress)
             except Exception as ex:
-                msg =  "Error attempting to open TCP sockets\n"
+                msg =  "Error attempting to open %s socket\n" % transport
                 msg += str(ex)
                 logging.error(msg)
-                import traceback
                 print traceback.format_exc()
                 raise ProcessPoolException(msg)
 
@@ -153,6 +236,25 @@ class ProcessPool:
         return
 
 
+    def _startSlave(self, index):
+        """
+        _startSlave_
+
+        Start a slave process and return its bookkeeping
+        """
+        self.slaveCount += 1
+        identity = "%s-%i-%i" % (os.getpid(), index, self.slaveCount)
+        slaveArgs = [self.versionString, __file__, self.slaveClassName, self.address,
+                     identity, self.configPath, self.componentDir, self.namespace,
+                     self.serializerName, str(self.slaveCredits)]
+
+        #For each worker you want create a slave process
+        #That process calls this code (WMCore.ProcessPool) and opens
+        #A process pool that loads the designated class
+        slaveProcess = subprocess.Popen(slaveArgs, stdin = subprocess.PIPE,
+                                        stdout = subprocess.PIPE)
+        return SlaveInfo(index, identity, slaveProcess)
+
     def createSlaves(self):
         """
         _createSlaves_
@@ -161,28 +263,8 @@ class ProcessPool:
         Moving it into a separate function allows us to restart
         all of them.
         """
-
-        totalSlaves    = self.nSlaves
-        slaveClassName = self.slaveClassName
-        config         = self.config
-        namespace      = self.namespace
-        inPort         = self.inPort
-        outPort        = self.outPort
-
-        slaveArgs = [self.versionString, __file__, self.slaveClassName, inPort,
-                     outPort, self.configPath, self.componentDir, self.namespace]
-
-        count = 0
-        while totalSlaves > 0:
-            #For each worker you want create a slave process
-            #That process calls this code (WMCore.ProcessPool) and opens
-            #A process pool that loads the designated class
-            slaveProcess = subprocess.Popen(slaveArgs, stdin = subprocess.PIPE,
-                                            stdout = subprocess.PIPE)
-            self.workers.append(slaveProcess)
-            totalSlaves -= 1
-            count += 1
-
+        for index in range(self.nSlaves):
+            self.workers.append(self._startSlave(index))
 
         return
 
@@ -196,56 +278,227 @@ class ProcessPool:
         """
         __del__
 
-        Kill all the workers processes by sending them an invalid JSON object.
+        Kill all the workers processes by sending them a STOP message.
         This will cause them to shut down.
         """
         self.close()
         return
 
-    def close(self):
+    def _stopSlaves(self, timeout = 10):
         """
-        _close_
-
-        Close shuts down all the active systems by:
+        _stopSlaves_
 
-        a) Sending STOP commands for all workers
-        b) Closing the pipes
-        c) Shutting down the workers themselves
+        Send STOP commands to all the slaves, wait for them to exit and
+        kill the ones that don't.  The work they had in flight goes back
+        to the head of the queue.
         """
-        for i in range(self.nSlaves):
+        for worker in self.workers:
             try:
-                encodedWork = self.jsonHandler.encode('STOP')
-                self.sender.send(encodedWork)
+                self.router.send_multipart([worker.identity, "STOP"])
             except Exception as ex:
                 # Might be already failed.  Nothing you can
                 # really do about that.
                 logging.error("Failure killing running process: %s" % str(ex))
-                pass
 
+        deadline = time.time() + timeout
+        for worker in self.workers:
+            try:
+                while worker.process.poll() == None and time.time() < deadline:
+                    time.sleep(0.1)
+                if worker.process.poll() == None:
+                    worker.process.terminate()
+                    worker.process.wait()
+            except Exception as ex:
+                logging.error("Failure to stop or terminate process")
+                logging.error(str(ex))
+            self._requeue(worker, retry = False)
+
+        self.workers = []
+        return
+
+    def close(self):
+        """
+        _close_
+
+        Close shuts down all the active systems by:
+
+        a) Sending STOP commands for all workers
+        b) Waiting for the workers to exit, terminating them if they don't
+        c) Closing the socket
+        """
+        if getattr(self, 'router', None) == None:
+            return
+
+        self._stopSlaves()
         try:
-            self.sender.close()
+            self.router.close(linger = 0)
         except:
             # We can't really do anything if we fail
             pass
+        self.router = None
+        return
+
+    def _requeue(self, worker, retry = True):
+        """
+        _requeue_
+
+        Put the work a slave had in flight back at the head of the queue,
+        keeping the order it was sent in.  With retry the work is counted
+        as failed once, work that failed too often is given up on.
+        """
+        inFlight = sorted(worker.inFlight.items(), key = lambda x: x[1], reverse = True)
+        for itemID, dispatchTime in inFlight:
+            frames, retries = self.workItems[itemID]
+            if retry:
+                if retries >= self.maxItemRetries:
+                    msg = "Work was in flight on %i slaves that died, giving up on it" % (retries + 1)
+                    logging.error(msg)
+                    self.close()
+                    raise ProcessPoolException(msg)
+                self.workItems[itemID] = (frames, retries + 1)
+            self.pendingWork.appendleft(itemID)
+
+        worker.inFlight = {}
+        worker.partial  = {}
+        worker.credits  = 0
+        return
+
+    def _checkSlaves(self):
+        """
+        _checkSlaves_
+
+        Restart the slaves that died and requeue their work
+        """
+        for position, worker in enumerate(self.workers):
+            exitCode = worker.process.poll()
+            if exitCode == None:
+                continue
+
+            logging.error("ProcessPool slave %s exited with code %s" % (worker.identity, exitCode))
+            if worker.restarts >= self.maxSlaveRestarts:
+                msg = "ProcessPool slave %i died after %i restarts, giving up" % (worker.index,
+                                                                                   worker.restarts)
+                logging.error(msg)
+                self.close()
+                raise ProcessPoolException(msg)
+
+            self._requeue(worker)
+            newWorker = self._startSlave(worker.index)
+            newWorker.restarts  = worker.restarts + 1
+            newWorker.latencies = worker.latencies
+            newWorker.completed = worker.completed
+            self.workers[position] = newWorker
+            logging.info("Restarted ProcessPool slave %i as %s" % (worker.index, newWorker.identity))
+
+        return
+
+    def _dispatch(self):
+        """
+        _dispatch_
+
+        Send waiting work to the slaves that have credits left, the least
+        busy slave first.
+        """
+        while self.pendingWork:
+            worker = None
+            for candidate in self.workers:
+                if candidate.ready and candidate.credits > 0:
+                    if worker == None or candidate.credits > worker.credits:
+                        worker = candidate
+            if worker == None:
+                break
+
+            itemID = self.pendingWork.popleft()
+            self.router.send_multipart([worker.identity, "WORK", str(itemID)] + self.workItems[itemID][0],
+                                       copy = False)
+            worker.credits -= 1
+            worker.inFlight[itemID] = time.time()
+
+        return
+
+    def _handleMessage(self, message):
+        """
+        _handleMessage_
+
+        Process a message from a slave
+        """
+        identity, command = message[0], message[1]
+        worker = None
+        for candidate in self.workers:
+            if candidate.identity == identity:
+                worker = candidate
+                break
+        if worker == None:
+            # Left over from a slave that was restarted
+            logging.debug("Ignoring message from unknown slave %s" % identity)
+            return
+
+        if command == "READY":
+            worker.ready   = True
+            worker.credits = int(message[2])
+        elif command == "RESULT":
+            # Only handed out once the whole piece of work is done, a slave
+            # dying halfway through must not leave duplicates behind.
+            worker.partial.setdefault(int(message[2]), []).append(self.serializer.loads(message[3:]))
+        elif command == "DONE":
+            itemID = int(message[2])
+            self.results.extend(worker.partial.pop(itemID, []))
+            dispatchTime = worker.inFlight.pop(itemID, None)
+            self.workItems.pop(itemID, None)
+            self.runningWork -= 1
+            worker.credits   += 1
+            worker.completed += 1
+            now = time.time()
+            if dispatchTime != None:
+                worker.latencies.append(now - dispatchTime)
+            self.completed.append(now)
+        elif command == "ERROR":
+            output = self.serializer.loads(message[3:])
+            # Then we had some kind of error
+            msg = output.get('msg', 'Unknown Error in ProcessPool')
+            logging.error("Received Error Message from ProcessPool Slave")
+            logging.error(msg)
+            self.close()
+            raise ProcessPoolException(msg)
+
+        return
+
+    def _processMessages(self, timeout = 0):
+        """
+        _processMessages_
+
+        Wait at most timeout milliseconds for messages from the slaves and
+        handle all of them, then restart the slaves that died and dispatch
+        the waiting work.
+        """
+        if self.router == None:
+            msg = "Attempting to use the ProcessPool after it was shut down!\n"
+            logging.error(msg)
+            raise ProcessPoolException(msg)
+
         try:
-            self.sink.close()
-        except:
-            # We can't do anything if we fail
-            pass
+            if self.router.poll(timeout):
+                while True:
+                    try:
+                        message = self.router.recv_multipart(zmq.NOBLOCK)
+                    except zmq.ZMQError as ex:
+                        if ex.errno == zmq.EAGAIN:
+                            break
+                        raise
+                    self._handleMessage(message)
+        except ProcessPoolException:
+            raise
+        except Exception as ex:
+            msg =  "Exception while getting slave output in ProcessPool.\n"
+            msg += str(ex)
+            logging.error(msg)
+            raise ProcessPoolException(msg)
 
-        # Now close the workers by hand
-        for worker in self.workers:
-            try:
-                worker.join()
-            except Exception as ex:
-                try:
-                    worker.terminate()
-                except Exception as ex2:
-                    logging.error("Failure to join or terminate process")
-                    logging.error(str(ex))
-                    logging.error(str(ex2))
-                    continue
-        self.workers = []
+        self._checkSlaves()
+        self._dispatch()
+
+        if self.heartbeatAPI != None and time.time() - self.lastMetrics > self.metricsInterval:
+            self.reportMetrics()
         return
 
     def enqueue(self, work, list = False):
@@ -253,9 +506,10 @@ class ProcessPool:
         __enqeue__
 
         Assign work to the workers processes.  The work parameters must be a
-        list where each item in the list can be serialized into JSON.
+        list where each item in the list can be serialized by the serializer.
 
-        If list is True, the entire list is sent as one piece of work
+        If list is True, the entire list is sent as one piece of work.  Blocks
+        while more than maxQueueSize pieces of work wait for a slave.
         """
         if len(self.workers) < 1:
             # Someone's shut down the system
@@ -263,70 +517,166 @@ class ProcessPool:
             logging.error(msg)
             raise ProcessPoolException(msg)
 
-        if not list:
-            for w in work:
-                encodedWork = self.jsonHandler.encode(w)
-                self.sender.send(encodedWork)
-                self.runningWork += 1
-        else:
-            encodedWork = self.jsonHandler.encode(work)
-            self.sender.send(encodedWork)
-            self.runningWork += 1
+        if list:
+            work = [work]
 
-        return
+        for w in work:
+            while self.maxQueueSize and len(self.pendingWork) >= self.maxQueueSize:
+                self._processMessages(timeout = 1000)
 
+            itemID = self.nextItemID
+            self.nextItemID += 1
+            self.workItems[itemID] = (self.serializer.dumps(w), 0)
+            self.pendingWork.append(itemID)
+            self.runningWork += 1
+            self._dispatch()
 
+        self._processMessages()
+        return
 
-    def dequeue(self, totalItems = 1):
+    def dequeue(self, totalItems = 1, timeout = None):
         """
         __dequeue__
 
         Retrieve completed work from the slave workers.  This method will block
-        until enough work has been completed.
+        until enough work has been completed and raises a ProcessPoolException
+        if that takes more than timeout seconds.
         """
-        completedWork = []
-
-        if totalItems > self.runningWork:
+        if totalItems > self.runningWork + len(self.results):
             msg = "Asked to dequeue more work then is running!\n"
             msg += "Failing"
             logging.error(msg)
             raise ProcessPoolException(msg)
 
-        while totalItems > 0:
-            try:
-                output = self.sink.recv()
-                decode = self.jsonHandler.decode(output)
-                if type(decode) == type({}) and decode.get('type', None) == 'ERROR':
-                    # Then we had some kind of error
-                    msg = decode.get('msg', 'Unknown Error in ProcessPool')
-                    logging.error("Received Error Message from ProcessPool Slave")
+        deadline = None
+        if timeout != None:
+            deadline = time.time() + timeout
+
+        while len(self.results) < totalItems:
+            if self.runningWork < 1:
+                msg = "All work is done but only %i of %i items came back" % (len(self.results),
+                                                                             totalItems)
+                logging.error(msg)
+                raise ProcessPoolException(msg)
+            # Wake up regularly to look after dead slaves
+            pollTimeout = 1000
+            if deadline != None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    msg = "Timed out waiting for %i items from the ProcessPool, %i done" % (totalItems,
+                                                                                           len(self.results))
                     logging.error(msg)
-                    self.close()
                     raise ProcessPoolException(msg)
-                completedWork.append(decode)
-                self.runningWork -= 1
-                totalItems -= 1
-            except Exception as ex:
-                msg =  "Exception while getting slave outputin ProcessPool.\n"
-                msg += str(ex)
-                logging.error(msg)
+                pollTimeout = min(pollTimeout, int(remaining * 1000) + 1)
+            self._processMessages(timeout = pollTimeout)
+
+        return [self.results.popleft() for i in range(totalItems)]
+
+    def dequeueReady(self, maxItems = None, timeout = 0):
+        """
+        _dequeueReady_
+
+        Retrieve the completed work that is already available, at most
+        maxItems items.  Wait at most timeout milliseconds if nothing is
+        available yet, never block after that.
+        """
+        deadline = time.time() + timeout / 1000.0
+        self._processMessages()
+        while not self.results and self.runningWork > 0:
+            # Credits and partial results wake us up too, keep waiting
+            # until a whole piece of work is done or the time is up.
+            remaining = int((deadline - time.time()) * 1000)
+            if remaining <= 0:
                 break
+            self._processMessages(timeout = remaining)
 
+        if maxItems == None:
+            maxItems = len(self.results)
+
+        completedWork = []
+        while self.results and len(completedWork) < maxItems:
+            completedWork.append(self.results.popleft())
         return completedWork
 
+    def getMetrics(self):
+        """
+        _getMetrics_
+
+        Return the queue depth, the work in flight, the throughput over the
+        last minute and the latency percentiles of every slave.
+        """
+        now = time.time()
+        recent = [x for x in self.completed if x > now - 60]
+        window = 60.0
+        if recent:
+            window = min(60.0, max(now - recent[0], 1.0))
+
+        slaves = []
+        for worker in self.workers:
+            latencies = list(worker.latencies)
+            slaves.append({'index': worker.index,
+                           'pid': worker.process.pid,
+                           'inFlight': len(worker.inFlight),
+                           'completed': worker.completed,
+                           'restarts': worker.restarts,
+                           'latencyP50': percentile(latencies, 0.50),
+                           'latencyP90': percentile(latencies, 0.90),
+                           'latencyP99': percentile(latencies, 0.99)})
+
+        return {'queueDepth': len(self.pendingWork),
+                'inFlight': sum([len(x.inFlight) for x in self.workers]),
+                'resultsWaiting': len(self.results),
+                'itemsPerSecond': len(recent) / window,
+                'slaves': slaves}
+
+    def reportMetrics(self):
+        """
+        _reportMetrics_
+
+        Report the metrics as the heartbeat state of the pool and of every
+        slave.
+        """
+        self.lastMetrics = time.time()
+        metrics = self.getMetrics()
+        try:
+            state = "queued %i, in flight %i, %.1f items/s" % (metrics['queueDepth'],
+                                                               metrics['inFlight'],
+                                                               metrics['itemsPerSecond'])
+            self.heartbeatAPI.updateWorkerHeartbeat("%s_Pool" % self.slaveClassName,
+                                                    state = state, pid = os.getpid())
+            for slave in metrics['slaves']:
+                latencies = []
+                for key in ['latencyP50', 'latencyP90', 'latencyP99']:
+                    if slave[key] == None:
+                        latencies.append("-")
+                    else:
+                        latencies.append("%.3f" % slave[key])
+                state = "in flight %i, done %i, restarts %i, latency p50/p90/p99 %s s" % \
+                        (slave['inFlight'], slave['completed'], slave['restarts'], "/".join(latencies))
+                self.heartbeatAPI.updateWorkerHeartbeat(self._subProcessName(self.slaveClassName,
+                                                                             slave['index']),
+                                                        state = state, pid = slave['pid'])
+        except Exception as ex:
+            logging.error("Failed to report ProcessPool metrics: %s" % str(ex))
+        return
 
     def restart(self):
         """
         _restart_
 
-        Delete everything and restart all pools
-        """
+        Restart all the slaves, the work they had in flight is sent again.
 
-        self.close()
+        The pool does not know how far a slave got with that work, so work
+        a slave finished but did not report as DONE is processed twice.
+        Delivery is at least once, the slave class has to make its work
+        idempotent.  The same holds for the work of slaves that died.
+        """
+        self._stopSlaves()
         self.createSlaves()
         return
 
 
+
 def setupLogging(componentDir):
     """
     _setupLogging_
@@ -375,27 +725,28 @@ if __name__ == "__main__":
     in through stdin as a JSON object.
 
     Input variables:
-    className, input port, output port, path to pickled config, component dir, namespace
+    className, master address, slave identity, path to pickled config,
+    component dir, namespace, serializer, credits
     """
 
     # Get variables passed in
     slaveClassName = sys.argv[1]
-    inPort         = sys.argv[2]
-    outPort        = sys.argv[3]
+    address        = sys.argv[2]
+    identity       = sys.argv[3]
     configPath     = sys.argv[4]
     componentDir   = sys.argv[5]
     namespace      = sys.argv[6]
+    serializerName = sys.argv[7]
+    credits        = sys.argv[8]
 
     # Set up logging
     setupLogging(componentDir)
 
     # Build ZMQ link
     context = zmq.Context()
-    receiver = context.socket(zmq.PULL)
-    receiver.connect("tcp://localhost:%s" % inPort)
-
-    sender = context.socket(zmq.PUSH)
-    sender.connect("tcp://localhost:%s" % outPort)
+    receiver = context.socket(zmq.DEALER)
+    receiver.setsockopt(zmq.IDENTITY, identity)
+    receiver.connect(address)
 
     # Build config
     if not os.path.exists(configPath):
@@ -412,28 +763,30 @@ if __name__ == "__main__":
     wmInit = WMInit()
     setupDB(config, wmInit)
 
-    # Create JSON handler
-    jsonHandler = JSONRequests()
+    # Create the serializer
+    serializer = getSerializer(serializerName)
 
     wmFactory = WMFactory(name = "slaveFactory", namespace = namespace)
     slaveClass = wmFactory.loadObject(classname = slaveClassName, args = config)
 
     logging.info("Have slave class")
 
+    # Tell the master how much work we take at once
+    receiver.send_multipart(["READY", credits])
+
     while(True):
-        encodedInput = receiver.recv()
+        message = receiver.recv_multipart()
+        if message[0] == "STOP":
+            break
 
+        itemID = message[1]
         try:
-            input = jsonHandler.decode(encodedInput)
+            input = serializer.loads(message[2:])
         except Exception as ex:
             logging.error("Error decoding: %s" % str(ex))
             break
 
-        if input == "STOP":
-            break
-
         try:
-            logging.error(input)
             output = slaveClass(input)
         except Exception as ex:
             crashMessage = "Slave process crashed with exception: " + str(ex)
@@ -446,26 +799,22 @@ if __name__ == "__main__":
             logging.error(crashMessage)
             try:
                 output        = {'type': 'ERROR', 'msg': crashMessage}
-                encodedOutput = jsonHandler.encode(output)
-                sender.send(encodedOutput)
+                receiver.send_multipart(["ERROR", itemID] + serializer.dumps(output))
                 logging.error("Sent error message and now breaking")
                 break
             except Exception as ex:
                 logging.error("Failed to send error message")
                 logging.error(str(ex))
-                del jsonHandler
                 sys.exit(1)
 
         if output != None:
-            if type(output) == list:
-                for item in output:
-                    encodedOutput = jsonHandler.encode(item)
-                    sender.send(encodedOutput)
-            else:
-                encodedOutput = jsonHandler.encode(output)
-                sender.send(encodedOutput)
+            if type(output) != list:
+                output = [output]
+            for item in output:
+                receiver.send_multipart(["RESULT", itemID] + serializer.dumps(item), copy = False)
+        receiver.send_multipart(["DONE", itemID])
 
 
     logging.info("Process with PID %s finished" %(os.getpid()))
-    del jsonHandler
+    receiver.close(linger = 1000)
     sys.exit(0)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+_Serializers_
+
+Serializers for the work items exchanged between the ProcessPool and its
+slaves.  Every serializer turns an object into a list of frames, the first
+one holding the encoded object, and back.  The frames are sent as a single
+ZMQ multipart message.
+
+  json:    the historical format, JSON through the Services.Requests
+           JSONizer, which handles __to_json__ calls.  Everything is in the
+           first frame.
+  pickle:  pickle protocol 2.  Strings larger than blobThreshold bytes are
+           not copied into the pickle but sent as separate frames.
+  msgpack: msgpack, objects are converted with their __to_json__ method.
+           Large strings are sent as separate frames as well.  Needs the
+           msgpack module.
+"""
+
+import cPickle
+
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from WMCore.WMException import WMException
+
+# Strings at least this big are sent in their own frame
+BLOB_THRESHOLD = 64 * 1024
+
+# msgpack extension type of a reference to a blob frame
+BLOB_EXT_TYPE = 42
+
+
+class SerializerException(WMException):
+    """
+    _SerializerException_
+
+    Raised for unknown or unusable serializers
+    """
+
+
+class JSONSerializer(object):
+    """
+    _JSONSerializer_
+
+    JSON encoding through the Services.Requests JSONizer
+    """
+    name = "json"
+
+    def __init__(self, blobThreshold = BLOB_THRESHOLD):
+        # Imported here so that the other serializers don't depend on it
+        from WMCore.Services.Requests import JSONRequests
+        self.jsonHandler = JSONRequests()
+        return
+
+    def dumps(self, data):
+        """
+        _dumps_
+
+        Encode an object into a list of frames
+        """
+        return [self.jsonHandler.encode(data)]
+
+    def loads(self, frames):
+        """
+        _loads_
+
+        Decode a list of frames into an object
+        """
+        return self.jsonHandler.decode(frames[0])
+
+
+class PickleSerializer(object):
+    """
+    _PickleSerializer_
+
+    Pickle protocol 2 with large strings sent out of band
+    """
+    name = "pickle"
+
+    def __init__(self, blobThreshold = BLOB_THRESHOLD):
+        self.blobThreshold = blobThreshold
+        return
+
+    def dumps(self, data):
+        """
+        _dumps_
+
+        Encode an object into a list of frames
+        """
+        frames = [None]
+
+        def persistentID(obj):
+            if type(obj) == str and len(obj) >= self.blobThreshold:
+                frames.append(obj)
+                return len(frames) - 1
+            return None
+
+        output = StringIO.StringIO()
+        pickler = cPickle.Pickler(output, 2)
+        pickler.persistent_id = persistentID
+        pickler.dump(data)
+        frames[0] = output.getvalue()
+        return frames
+
+    def loads(self, frames):
+        """
+        _loads_
+
+        Decode a list of frames into an object
+        """
+        unpickler = cPickle.Unpickler(StringIO.StringIO(frames[0]))
+        unpickler.persistent_load = lambda index: frames[index]
+        return unpickler.load()
+
+
+class MsgpackSerializer(object):
+    """
+    _MsgpackSerializer_
+
+    msgpack with large strings sent out of band
+    """
+    name = "msgpack"
+
+    def __init__(self, blobThreshold = BLOB_THRESHOLD):
+        if msgpack is None:
+            raise SerializerException("The msgpack serializer needs the msgpack module")
+        self.blobThreshold = blobThreshold
+        return
+
+    def _extractBlobs(self, data, frames):
+        """
+        _extractBlobs_
+
+        Replace the large strings in a structure by references to frames
+        """
+        if type(data) == str:
+            if len(data) >= self.blobThreshold:
+                frames.append(data)
+                return msgpack.ExtType(BLOB_EXT_TYPE, str(len(frames) - 1))
+            return data
+        elif isinstance(data, dict):
+            return dict([(key, self._extractBlobs(value, frames)) for key, value in data.iteritems()])
+        elif isinstance(data, (list, tuple)):
+            return [self._extractBlobs(value, frames) for value in data]
+        elif hasattr(data, "__to_json__"):
+            return self._extractBlobs(data.__to_json__(None), frames)
+        return data
+
+    def dumps(self, data):
+        """
+        _dumps_
+
+        Encode an object into a list of frames
+        """
+        frames = [None]
+        frames[0] = msgpack.packb(self._extractBlobs(data, frames))
+        return frames
+
+    def loads(self, frames):
+        """
+        _loads_
+
+        Decode a list of frames into an object
+        """
+        def extHook(code, data):
+            if code == BLOB_EXT_TYPE:
+                return frames[int(data)]
+            return msgpack.ExtType(code, data)
+
+        return msgpack.unpackb(frames[0], ext_hook = extHook)
+
+
+SERIALIZERS = {"json": JSONSerializer,
+               "pickle": PickleSerializer,
+               "msgpack": MsgpackSerializer}
+
+
+def getSerializer(name, blobThreshold = BLOB_THRESHOLD):
+    """
+    _getSerializer_
+
+    Return an instance of the serializer with the given name
+    """
+    if name not in SERIALIZERS:
+        raise SerializerException("Unknown ProcessPool serializer: %s" % name)
+    return SERIALIZERS[name](blobThreshold = blobThreshold)
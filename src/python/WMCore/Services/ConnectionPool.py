@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+_ConnectionPool_
+
+Keep the connections of the HTTP clients alive between requests, so that
+requests to the same host reuse the sockets and TLS sessions instead of
+connecting again.  One pool is shared by every Requests instance and
+pycurl_manager.RequestHandler in the process, see getConnectionPool.
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+
+# Upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0]
+
+def closeConnection(conn):
+    """
+    _closeConnection_
+
+    Close a httplib2.Http opener or a pycurl.Curl handle
+    """
+    try:
+        if hasattr(conn, 'connections'):
+            for httpConn in conn.connections.values():
+                httpConn.close()
+            conn.connections = {}
+        else:
+            conn.close()
+    except Exception as ex:
+        logging.debug("Error closing connection: %s" % str(ex))
+    return
+
+class LatencyHistogram(object):
+    """
+    _LatencyHistogram_
+
+    Count the requests to a host by duration
+    """
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.requests = 0
+        self.errors = 0
+        self.totalTime = 0.0
+
+    def add(self, seconds, error = False):
+        """
+        _add_
+
+        Count a request that took the given number of seconds
+        """
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.requests += 1
+        self.totalTime += seconds
+        if error:
+            self.errors += 1
+        return
+
+    def dictionary(self):
+        """
+        _dictionary_
+
+        Return the counters, the histogram maps the upper bound of every
+        bucket to its count, the last one being "inf"
+        """
+        bounds = [str(x) for x in LATENCY_BUCKETS] + ["inf"]
+        return {'requests': self.requests,
+                'errors': self.errors,
+                'totalTime': self.totalTime,
+                'histogram': dict(zip(bounds, self.counts))}
+
+class ConnectionPool(object):
+    """
+    _ConnectionPool_
+
+    Thread safe pool of idle connections by key.  The key says what the
+    connection can be used for (client, host, credentials...), a connection
+    acquired is used by one thread only until it is released.  At most
+    maxIdle connections are kept per key, the ones idle for more than
+    idleTimeout seconds are closed.  A forked process starts with no idle
+    connections, it must not share the sockets of its parent.
+    """
+    def __init__(self, maxIdle = 4, idleTimeout = 30):
+        self.maxIdle = maxIdle
+        self.idleTimeout = idleTimeout
+
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.latency = {}
+        self.stats = {'created': 0, 'reused': 0, 'closed': 0, 'evicted': 0}
+        self.lastEviction = time.time()
+        self.pid = os.getpid()
+
+    def acquire(self, key, factory):
+        """
+        _acquire_
+
+        Return the most recently released connection for the key, or a new
+        one made by factory
+        """
+        expired = []
+        conn = None
+        with self.lock:
+            if self.pid != os.getpid():
+                self.idle = {}
+                self.pid = os.getpid()
+            expired = self._expire()
+            connections = self.idle.get(key)
+            if connections:
+                conn = connections.pop()[1]
+                self.stats['reused'] += 1
+            else:
+                self.stats['created'] += 1
+
+        for oldConn in expired:
+            closeConnection(oldConn)
+        if conn is None:
+            conn = factory()
+        return conn
+
+    def release(self, key, conn):
+        """
+        _release_
+
+        Give back a connection that can be used again
+        """
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.maxIdle and self.pid == os.getpid():
+                connections.append((time.time(), conn))
+                return
+            self.stats['closed'] += 1
+
+        closeConnection(conn)
+        return
+
+    def discard(self, key, conn):
+        """
+        _discard_
+
+        Close a connection that failed instead of giving it back
+        """
+        with self.lock:
+            self.stats['closed'] += 1
+        closeConnection(conn)
+        return
+
+    def record(self, host, seconds, error = False):
+        """
+        _record_
+
+        Add the duration of a request to the latency histogram of the host
+        """
+        with self.lock:
+            histogram = self.latency.get(host)
+            if histogram is None:
+                histogram = self.latency[host] = LatencyHistogram()
+            histogram.add(seconds, error)
+        return
+
+    def _expire(self):
+        """
+        _expire_
+
+        Take out the connections idle for too long, at most once a second.
+        Must be called with the lock held, the connections returned are
+        closed by the caller.
+        """
+        now = time.time()
+        if now - self.lastEviction < 1:
+            return []
+        self.lastEviction = now
+
+        expired = []
+        for key in self.idle.keys():
+            connections = self.idle[key]
+            while connections and now - connections[0][0] > self.idleTimeout:
+                expired.append(connections.pop(0)[1])
+            if not connections:
+                del self.idle[key]
+        self.stats['evicted'] += len(expired)
+        return expired
+
+    def clear(self):
+        """
+        _clear_
+
+        Close every idle connection
+        """
+        with self.lock:
+            idle = self.idle
+            self.idle = {}
+        for connections in idle.values():
+            for (lastUsed, conn) in connections:
+                closeConnection(conn)
+        return
+
+    def statistics(self):
+        """
+        _statistics_
+
+        Return the pool counters, the number of idle connections by key and
+        the latency histograms by host
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['idle'] = dict([(key, len(x)) for key, x in self.idle.items()])
+            stats['latency'] = dict([(host, x.dictionary()) for host, x in self.latency.items()])
+        return stats
+
+_connectionPool = ConnectionPool()
+
+def getConnectionPool():
+    """
+    _getConnectionPool_
+
+    Return the pool shared in the process
+    """
+    return _connectionPool
@@ -31,6 +31,8 @@ class PhEDEx(Service):
             dict['endpoint'] = "https://cmsweb.cern.ch/phedex/datasvc/%s/prod/" % self.responseType
 
         dict.setdefault('cacheduration', 0)
+        # the node map hardly ever changes, keep it an hour in memory
+        dict.setdefault('memcachedurations', {'nodes': 1.0})
         Service.__init__(self, dict)
 
     def _getResult(self, callname, clearCache = False,
@@ -43,20 +45,16 @@ class PhEDEx(Service):
 
         TODO: Probably want to move this up into Service
         """
-        result = ''
         # make base file name from call name.
         file = callname.replace("/", "_")
         if clearCache:
-            self.clearCache(file, args, verb = verb)
-
-        f = self.refreshCache(file, callname, args, verb = verb)
-        result = f.read()
-        f.close()
+            self.clearCache(file, args, verb = verb, url = callname)
 
+        parse = None
         if self.responseType == "json":
-            return JsonWrapper.loads(result)
+            parse = JsonWrapper.loads
 
-        return result
+        return self.getCachedResult(file, callname, args, parse = parse, verb = verb)
 
     def injectBlocks(self, node, xmlData, strict = 1):
 
@@ -15,6 +15,7 @@ import base64
 import httplib2
 import socket
 import logging
+import time
 import urlparse
 from httplib import HTTPException
 import tempfile
@@ -32,6 +33,7 @@ from WMCore.Algorithms import Permissions
 from WMCore.WMException import WMException
 from WMCore.Wrappers.JsonWrapper import JSONEncoder, JSONDecoder
 from WMCore.Wrappers.JsonWrapper.JSONThunker import JSONThunker
+from WMCore.Services.ConnectionPool import getConnectionPool
 try:
     from WMCore.Services.pycurl_manager import RequestHandler, ResponseHeader
 except ImportError:
@@ -96,8 +98,13 @@ class Requests(dict):
         self.setdefault("logger", logging)
 
         check_server_url(self['host'])
-        # and then get the URL opener
-        self.setdefault("conn", self._getURLOpener())
+        # and then get the URL opener, by default the openers are taken from
+        # the connection pool shared with the other instances
+        self.connectionPool = None
+        if 'conn' not in self and idict.get('pool', True):
+            self.connectionPool = getConnectionPool()
+        else:
+            self.setdefault("conn", self._getURLOpener())
 
 
     def get(self, uri=None, data={}, incoming_headers={},
@@ -167,6 +174,26 @@ class Requests(dict):
                     verb=verb, ckey=ckey, cert=cert, capath=capath, decode=decoder)
         return data, response.status, response.reason, response.fromcache
 
+    def makeMultiRequest(self, requests, incoming_headers={}, num_conn=10,
+                         decoder=True):
+        """
+        Make the GET requests of the (uri, data) pairs concurrently via the
+        pycurl library, for bulk lookups. Returns the (result, error) pair of
+        every request in the order of the list, error is None or the
+        exception of the failed request.
+        """
+        ckey, cert = self.getKeyCert()
+        capath = self.getCAPath()
+        headers = {"User-agent": "WMCore.Services.Requests/v001",
+                   "Accept": self['accept_type']}
+        for key in self.additionalHeaders.keys():
+            headers[key] = self.additionalHeaders[key]
+        headers.update(incoming_headers)
+        reqmgr = self.reqmgr if self.pycurl else RequestHandler()
+        urls = [(self['host'] + uri, data) for uri, data in requests]
+        return reqmgr.getdata_multi(urls, headers, ckey, cert, capath,
+                                    num_conn, decode=decoder)
+
     def makeRequest_httplib(self, uri=None, data={}, verb='GET',
             incoming_headers={}, encoder=True, decoder=True, contentType=None):
         """
@@ -239,30 +266,7 @@ class Requests(dict):
             "Data in makeRequest is %s and not encoded to a string" \
                 % type(encoded_data)
 
-        # httplib2 will allow sockets to close on remote end without retrying
-        # try to send request - if this fails try again - should then succeed
-        try:
-            response, result = self['conn'].request(uri, method = verb,
-                                    body = encoded_data, headers = headers)
-            if response.status == 408: # timeout can indicate a socket error
-                response, result = self['conn'].request(uri, method = verb,
-                                    body = encoded_data, headers = headers)
-        except (socket.error, AttributeError):
-            # AttributeError implies initial connection error - need to close
-            # & retry. httplib2 doesn't clear httplib state before next request
-            # if this is threaded this may spoil things
-            # only have one endpoint so don't need to determine which to shut
-            [conn.close() for conn in self['conn'].connections.values()]
-            self['conn'] = self._getURLOpener()
-            # ... try again... if this fails propagate error to client
-            try:
-                response, result = self['conn'].request(uri, method = verb,
-                                    body = encoded_data, headers = headers)
-            except AttributeError:
-                # socket/httplib really screwed up - nuclear option
-                self['conn'].connections = {}
-                raise socket.error('Error contacting: %s' \
-                        % self.getDomainName())
+        response, result = self._sendRequest(uri, verb, encoded_data, headers)
         if response.status >= 400:
             e = HTTPException()
             setattr(e, 'req_data', encoded_data)
@@ -281,6 +285,81 @@ class Requests(dict):
         #TODO: maybe just return result and response...
         return result, response.status, response.reason, response.fromcache
 
+    def _sendRequest(self, uri, verb, encoded_data, headers):
+        """
+        Send the request with an opener from the connection pool, or the one
+        of this instance, and return the response and its content.
+        """
+        connKey = None
+        if self.connectionPool:
+            connKey = self._connectionKey()
+            conn = self.connectionPool.acquire(connKey, self._getURLOpener)
+        else:
+            conn = self['conn']
+        startTime = time.time()
+
+        # httplib2 will allow sockets to close on remote end without retrying
+        # try to send request - if this fails try again - should then succeed
+        try:
+            response, result = conn.request(uri, method = verb,
+                                    body = encoded_data, headers = headers)
+            if response.status == 408: # timeout can indicate a socket error
+                response, result = conn.request(uri, method = verb,
+                                    body = encoded_data, headers = headers)
+        except (socket.error, AttributeError):
+            # AttributeError implies initial connection error - need to close
+            # & retry. httplib2 doesn't clear httplib state before next request
+            # only the connections of the opener that failed are closed
+            if self.connectionPool:
+                self.connectionPool.discard(connKey, conn)
+            else:
+                [httpConn.close() for httpConn in conn.connections.values()]
+            conn = self._getURLOpener()
+            if not self.connectionPool:
+                self['conn'] = conn
+            # ... try again... if this fails propagate error to client
+            try:
+                response, result = conn.request(uri, method = verb,
+                                    body = encoded_data, headers = headers)
+            except (socket.error, AttributeError) as ex:
+                self._recordRequest(startTime, error = True)
+                if isinstance(ex, socket.error):
+                    raise
+                # socket/httplib really screwed up - nuclear option
+                conn.connections = {}
+                raise socket.error('Error contacting: %s' \
+                        % self.getDomainName())
+
+        if self.connectionPool:
+            self.connectionPool.release(connKey, conn)
+        self._recordRequest(startTime, error = response.status >= 400)
+        return response, result
+
+    def _recordRequest(self, startTime, error = False):
+        """
+        Add a request started at startTime to the latency histogram of the
+        host in the connection pool
+        """
+        if self.connectionPool:
+            self.connectionPool.record(self['endpoint_components'].netloc,
+                                       time.time() - startTime, error)
+        return
+
+    def _connectionKey(self):
+        """
+        Key of the pooled openers this instance can use: the host, the cache,
+        the timeout and the credentials of the openers must match.
+        """
+        key, cert = None, None
+        if self['endpoint_components'].scheme == 'https':
+            try:
+                key, cert = self.getKeyCert()
+            except Exception:
+                pass
+        return ('httplib2', self['endpoint_components'].scheme,
+                self['endpoint_components'].netloc, self['req_cache_path'],
+                self['timeout'], key, cert)
+
     def encode(self, data):
         """
         encode data into some appropriate format, for now make it a string...
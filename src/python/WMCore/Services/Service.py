@@ -24,6 +24,11 @@ forceCache, clearCache calls. By default the cache lasts 30 minutes.
 Calling refreshCache/forceRefresh will return an open file object, the cache
 file. Once done with it you should close the object.
 
+getCachedResult returns the parsed result instead and keeps it in a process
+wide memory cache for memcacheduration hours (0 by default, i.e. not kept),
+memcachedurations can set a duration per url. On a miss the result is fetched
+with refreshCache, so the cache file is still there to fall back on.
+
 The service has a default timeout to receive a response from the remote service
 of 30 seconds. Over ride this by passing in a timeout via the configuration
 dict, set to None if you want to turn off the timeout.
@@ -93,6 +98,19 @@ from urlparse import urlparse
 from WMCore.Services.Requests import Requests, JSONRequests
 from WMCore.WMException import WMException
 from WMCore.Wrappers import JsonWrapper as json
+from WMCore.Cache.TTLCache import TTLCache
+
+# Parsed results of getCachedResult, shared by the services of the process
+_resultCache = TTLCache(maxSize = 1000)
+
+def getResultCache():
+    """
+    _getResultCache_
+
+    Return the memory cache of the service results, see TTLCache.statistics
+    for its counters
+    """
+    return _resultCache
 
 
 class Service(dict):
@@ -119,6 +137,8 @@ class Service(dict):
         self.setdefault("inputdata", {})
         self.setdefault("cacheduration", 0.5)
         self.setdefault("maxcachereuse", 24.0)
+        self.setdefault("memcacheduration", 0)
+        self.setdefault("memcachedurations", {})
         self.supportVerbList = ('GET', 'POST', 'PUT', 'DELETE')
         # this value should be only set when whole service class uses
         # the same verb ('GET', 'POST', 'PUT', 'DELETE')
@@ -238,10 +258,53 @@ class Service(dict):
         else:
             return cachefile
 
-    def clearCache(self, cachefile, inputdata = {}, verb = 'GET'):
+    def _resultKey(self, cachefile, url, inputdata, verb):
+        """
+        Key of a result in the memory cache
         """
-        Delete the cache file and the httplib2 cache.
+        if not inputdata:
+            inputdata = self['inputdata']
+        return (self['service_name'], self['endpoint'], url, verb, cachefile,
+                json.dumps(inputdata))
+
+    def getCachedResult(self, cachefile, url='', inputdata = {}, parse = None,
+                        encoder = True, decoder = True, verb = 'GET',
+                        contentType = None, incoming_headers={}):
         """
+        Return the result of the request, parsed by parse (or as read from the
+        cache file). It is kept in memory for the duration of the url, all
+        the callers get the same object and must not modify it. Concurrent
+        calls for the same result wait for the one fetching it.
+        """
+        verb = self._verbCheck(verb)
+
+        def refresh():
+            f = self.refreshCache(cachefile, url, inputdata, encoder = encoder,
+                                  decoder = decoder, verb = verb,
+                                  contentType = contentType,
+                                  incoming_headers = incoming_headers)
+            result = f.read()
+            f.close()
+            if parse:
+                result = parse(result)
+            return result
+
+        duration = self['memcachedurations'].get(url, self['memcacheduration'])
+        if not duration:
+            return refresh()
+
+        key = self._resultKey(cachefile, url, inputdata, verb)
+        return _resultCache.get(key, duration * 3600, refresh)
+
+    def clearCache(self, cachefile, inputdata = {}, verb = 'GET', url = None):
+        """
+        Delete the cache file and the httplib2 cache. The result of url is
+        also removed from the memory cache.
+        """
+        if url is not None:
+            _resultCache.remove(self._resultKey(cachefile, url, inputdata,
+                                                self._verbCheck(verb)))
+
         if not self['cachepath'] or not cachefile:
             # nothing to clear
             return
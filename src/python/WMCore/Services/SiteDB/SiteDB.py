@@ -10,6 +10,8 @@ from WMCore.Services.EmulatorSwitch import emulatorHook
 
 import json
 import re
+import time
+import threading
 
 def row2dict(columns, row):
     """Convert rows to dictionaries with column keys from description"""
@@ -23,6 +25,95 @@ def unflattenJSON(data):
     columns = data['desc']['columns']
     return [row2dict(columns, row) for row in data['result']]
 
+class PeopleIndex(object):
+    """
+    _PeopleIndex_
+
+    Lookup tables of the SiteDB people list.  Like the other indexes it is
+    built in one go and not modified afterwards, so it can be shared by
+    threads and replaced with a single assignment.
+    """
+    def __init__(self, people):
+        self.created = time.time()
+
+        # the first match wins, as with the scans of the list
+        self.dnToUser = {}
+        self.userToDn = {}
+        for person in people:
+            self.dnToUser.setdefault(person['dn'], person['username'])
+            self.userToDn.setdefault(person['username'], person['dn'])
+        return
+
+class SiteIndex(object):
+    """
+    _SiteIndex_
+
+    Lookup tables of the SiteDB site names and site resources.  The results
+    of hostsForPattern are memoized by pattern.
+    """
+    def __init__(self, sitenames, siteresources):
+        self.created = time.time()
+
+        cmsBySite = {}
+        self.psnNames = []
+        for sitename in sitenames:
+            if sitename['type'] == 'cms':
+                cmsBySite.setdefault(sitename['site_name'], []).append(sitename['alias'])
+            elif sitename['type'] == 'psn':
+                self.psnNames.append((sitename['alias'], sitename['site_name']))
+
+        # the positions keep the hosts of several sites in SiteDB order
+        self.fqdnToCMS = {}
+        self.resourcesBySite = {}
+        for position, resource in enumerate(siteresources):
+            cmsNames = self.fqdnToCMS.setdefault(resource['fqdn'], [])
+            cmsNames.extend(cmsBySite.get(resource['site_name'], []))
+            self.resourcesBySite.setdefault(resource['site_name'], []).append(
+                (position, resource['type'], resource['fqdn']))
+
+        self.patterns = {}
+        return
+
+    def hostsForPattern(self, cmsname_pattern, kind):
+        """
+        _hostsForPattern_
+
+        Return the hosts of the kind at the sites whose psn name matches the
+        pattern, where * and % match anything
+        """
+        hosts = self.patterns.get((cmsname_pattern, kind))
+        if hosts is None:
+            regexp = cmsname_pattern.replace('*', '.*').replace('%', '.*')
+            regexp = re.compile(regexp)
+            sites = set([site for alias, site in self.psnNames if regexp.match(alias)])
+            resources = []
+            for site in sites:
+                resources.extend(self.resourcesBySite.get(site, []))
+            resources.sort()
+            hosts = [fqdn for position, type, fqdn in resources if type == kind]
+            self.patterns[(cmsname_pattern, kind)] = hosts
+        return list(hosts)
+
+class ProcessingIndex(object):
+    """
+    _ProcessingIndex_
+
+    Lookup table of the SiteDB data processing list
+    """
+    def __init__(self, dataprocessing):
+        self.created = time.time()
+
+        self.pnnToPSN = {}
+        for row in dataprocessing:
+            self.pnnToPSN.setdefault(row['phedex_name'], []).append(row['psn_name'])
+        return
+
+# Indexes shared by the SiteDBJSON instances of the process, by endpoint
+# and kind of index
+_indexes = {}
+_indexLock = threading.Lock()
+_indexRefreshes = set()
+
 # emulator hook is used to swap the class instance
 # when emulator values are set.
 # Look WMCore.Services.EmulatorSwitch module for the values
@@ -35,6 +126,11 @@ class SiteDBJSON(Service):
     def __init__(self, config={}):
         config = dict(config)
         config['endpoint'] = "https://cmsweb.cern.ch/sitedb/data/prod/"
+        # the site and people information changes rarely, keep the parsed
+        # results as long as the cache files
+        config.setdefault('memcacheduration', config.get('cacheduration', 0.5))
+        # the indexes are refreshed with an instance of their own
+        self.indexConfig = dict(config)
         Service.__init__(self, config)
 
     def getJSON(self, callname, file = 'result.json', clearCache = False, verb = 'GET', data={}):
@@ -46,29 +142,25 @@ class SiteDBJSON(Service):
 
         TODO: Probably want to move this up into Service
         """
-        result = ''
         if clearCache:
-            self.clearCache(cachefile=file, inputdata=data, verb = verb)
+            self.clearCache(cachefile=file, inputdata=data, verb = verb, url = callname)
         try:
             #Set content_type and accept_type to application/json to get json returned from siteDB.
             #Default is text/html which will return xml instead
             #Add accept-encoding to gzip,identity to overwrite httplib default gzip,deflate,
             #which is not working properly with cmsweb
-            f = self.refreshCache(cachefile=file, url=callname, inputdata=data,
-                                  verb = verb, contentType='application/json',
-                                  incoming_headers={'Accept' : 'application/json',
-                                                    'accept-encoding' : 'gzip,identity'})
-            result = f.read()
-            f.close()
+            results = self.getCachedResult(cachefile=file, url=callname, inputdata=data,
+                                           parse = json.loads, verb = verb,
+                                           contentType='application/json',
+                                           incoming_headers={'Accept' : 'application/json',
+                                                             'accept-encoding' : 'gzip,identity'})
         except IOError:
             raise RuntimeError("URL not available: %s" % callname )
-        try:
-            results = json.loads(result)
-            results = unflattenJSON(results)
-            return results
         except SyntaxError:
-            self.clearCache(file, args, verb = verb)
+            self.clearCache(file, data, verb = verb, url = callname)
             raise SyntaxError("Problem parsing data. Cachefile cleared. Retrying may work")
+        # the rows are made again for every call, the callers can modify them
+        return unflattenJSON(results)
 
     def _people(self, username=None, clearCache=False):
         if username:
@@ -97,31 +189,90 @@ class SiteDBJSON(Service):
             psnMap = filter(lambda x: x['phedex_name'] == pnn, psnMap)
         return psnMap
 
+    def _getIndex(self, kind):
+        """
+        _getIndex_
+
+        Return the lookup tables of the people, sites or processing kind,
+        each is built from the lists it needs only when it is first used.
+        They are shared for memcacheduration hours, after that they are
+        rebuilt in a background thread and the callers keep the old ones
+        until the new ones are in.  With a memcacheduration of 0 they are
+        built for every call.
+        """
+        duration = self['memcacheduration'] * 3600
+        key = (self['endpoint'], kind)
+        index = _indexes.get(key)
+        if not duration or index is None:
+            return self._buildIndex(kind)
+
+        if time.time() - index.created > duration:
+            with _indexLock:
+                refresh = key not in _indexRefreshes
+                _indexRefreshes.add(key)
+            if refresh:
+                thread = threading.Thread(target = self._refreshIndex, args = (kind,))
+                thread.setDaemon(True)
+                thread.start()
+        return index
+
+    def _buildIndex(self, kind, clearCache = False):
+        """
+        _buildIndex_
+
+        Build the lookup tables of the kind and share them, clearCache
+        fetches the lists again
+        """
+        if kind == 'people':
+            index = PeopleIndex(self._people(clearCache = clearCache))
+        elif kind == 'sites':
+            index = SiteIndex(self._sitenames(clearCache = clearCache),
+                              self._siteresources(clearCache = clearCache))
+        else:
+            index = ProcessingIndex(self._dataProcessing(clearCache = clearCache))
+        if self['memcacheduration']:
+            _indexes[(self['endpoint'], kind)] = index
+        return index
+
+    def _refreshIndex(self, kind):
+        """
+        _refreshIndex_
+
+        Rebuild the shared lookup tables of the kind with a new instance,
+        this one is not thread safe.  The old tables stay in use if that
+        fails.
+        """
+        try:
+            self.__class__(self.indexConfig)._buildIndex(kind)
+        except Exception as ex:
+            self['logger'].error("Failed to refresh the SiteDB %s index: %s" % (kind, str(ex)))
+        with _indexLock:
+            _indexRefreshes.discard((self['endpoint'], kind))
+        return
+
     def dnUserName(self, dn):
         """
         Convert DN to Hypernews name. Clear cache between trys
         in case user just registered or fixed an issue with SiteDB
         """
-        try:
-            userinfo = filter(lambda x: x['dn']==dn, self._people())[0]
-            username = userinfo['username']
-        except (KeyError, IndexError):
-            userinfo = filter(lambda x: x['dn']==dn, self._people(clearCache=True))[0]
-            username = userinfo['username']
-        return username
+        index = self._getIndex('people')
+        if dn not in index.dnToUser:
+            index = self._buildIndex('people', clearCache = True)
+        if dn not in index.dnToUser:
+            raise IndexError("DN not found in SiteDB: %s" % dn)
+        return index.dnToUser[dn]
 
     def userNameDn(self, username):
         """
         Convert Hypernews name to DN. Clear cache between trys
         in case user just registered or fixed an issue with SiteDB
         """
-        try:
-            userinfo = filter(lambda x: x['username']==username, self._people())[0]
-            userdn = userinfo['dn']
-        except (KeyError, IndexError):
-            userinfo = filter(lambda x: x['username']==username, self._people(clearCache=True))[0]
-            userdn = userinfo['dn']
-        return userdn
+        index = self._getIndex('people')
+        if username not in index.userToDn:
+            index = self._buildIndex('people', clearCache = True)
+        if username not in index.userToDn:
+            raise IndexError("User not found in SiteDB: %s" % username)
+        return index.userToDn[username]
 
     def cmsNametoCE(self, cmsName):
         """
@@ -191,48 +342,21 @@ class SiteDBJSON(Service):
         Convert CMS name pattern T1*, T2* to a list of CEs or SEs. The file is
         for backward compatibility with SiteDBv1
         """
-        cmsname_pattern = cmsname_pattern.replace('*','.*')
-        cmsname_pattern = cmsname_pattern.replace('%','.*')
-        cmsname_pattern = re.compile(cmsname_pattern)
-
-        sitenames = filter(lambda x: x[u'type']=='psn' and cmsname_pattern.match(x[u'alias']),
-                           self._sitenames())
-        sitenames = set(map(lambda x: x['site_name'], sitenames))
-        siteresources = filter(lambda x: x['site_name'] in sitenames, self._siteresources())
-        hostlist = filter(lambda x: x['type']==kind, siteresources)
-        hostlist = map(lambda x: x['fqdn'], hostlist)
-
-        return hostlist
+        return self._getIndex('sites').hostsForPattern(cmsname_pattern, kind)
 
     def ceToCMSName(self, ce):
         """
         Convert SE name to the CMS Site they belong to,
         this is not a 1-to-1 relation but 1-to-many, return a list of cms site alias
         """
-        try:
-            siteresources = filter(lambda x: x['fqdn']==ce, self._siteresources())
-        except IndexError:
-            return None
-        siteNames = []
-        for resource in siteresources:
-            siteNames.extend(self._sitenames(sitename=resource['site_name']))
-        cmsname = filter(lambda x: x['type']=='cms', siteNames)
-        return [x['alias'] for x in cmsname]
+        return list(self._getIndex('sites').fqdnToCMS.get(ce, []))
 
     def seToCMSName(self, se):
         """
         Convert SE name to the CMS Site they belong to,
         this is not a 1-to-1 relation but 1-to-many, return a list of cms site alias
         """
-        try:
-            siteresources = filter(lambda x: x['fqdn']==se, self._siteresources())
-        except IndexError:
-            return None
-        siteNames = []
-        for resource in siteresources:
-            siteNames.extend(self._sitenames(sitename=resource['site_name']))
-        cmsname = filter(lambda x: x['type']=='cms', siteNames)
-        return [x['alias'] for x in cmsname]
+        return list(self._getIndex('sites').fqdnToCMS.get(se, []))
 
 
     def cmsNametoPhEDExNode(self, cmsName):
@@ -277,10 +401,4 @@ class SiteDBJSON(Service):
         Convert PhEDEx node name to Processing Site Name(s)
         """
 
-        psnMap = self._dataProcessing()
-        try:
-            reducedMap = filter(lambda x: x[u'phedex_name']==pnn, psnMap)
-            psns = [x[u'psn_name'] for x in reducedMap]
-        except IndexError:
-            return None
-        return psns
+        return list(self._getIndex('processing').pnnToPSN.get(pnn, []))
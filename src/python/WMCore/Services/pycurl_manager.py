@@ -15,7 +15,9 @@ import pycurl
 import urllib
 import httplib
 import logging
+import urlparse
 from WMCore.Wrappers import JsonWrapper as json
+from WMCore.Services.ConnectionPool import getConnectionPool
 try:
     import cStringIO as StringIO
 except:
@@ -36,7 +38,7 @@ class ResponseHeader(object):
             row = row.replace('\n', '')
             if  not row:
                 continue
-            if  row.find('HTTP') != -1 and \
+            if  row.startswith('HTTP/') and \
                 row.find('100') == -1: #HTTP/1.1 100 found: real header is later
                 res = row.replace('HTTP/1.1', '')
                 res = res.replace('HTTP/1.0', '')
@@ -66,6 +68,9 @@ class RequestHandler(object):
         self.followlocation = config.get('followlocation', 1)
         self.maxredirs = config.get('maxredirs', 5)
         self.logger = logger if logger else logging.getLogger()
+        # Curl handles are kept alive in the shared connection pool, they
+        # keep their connections and TLS sessions between the requests
+        self.pool = getConnectionPool() if config.get('pool', True) else None
 
     def set_opts(self, curl, url, params, headers,
                  ckey=None, cert=None, capath=None, verbose=None, verb='GET', doseq=True, cainfo=None):
@@ -153,13 +158,31 @@ class RequestHandler(object):
     def request(self, url, params, headers=None, verb='GET',
                 verbose=0, ckey=None, cert=None, capath=None, doseq=True, decode=False, cainfo=None):
         """Fetch data for given set of parameters"""
-        curl = pycurl.Curl()
+        if  self.pool:
+            urlComponents = urlparse.urlparse(url)
+            host = urlComponents.netloc
+            connKey = ('pycurl', urlComponents.scheme, host, ckey, cert, capath, cainfo)
+            curl = self.pool.acquire(connKey, pycurl.Curl)
+        else:
+            curl = pycurl.Curl()
         bbuf, hbuf = self.set_opts(curl, url, params, headers,
                 ckey, cert, capath, verbose, verb, doseq, cainfo)
-        curl.perform()
+        startTime = time.time()
+        try:
+            curl.perform()
+        except pycurl.error:
+            if  self.pool:
+                self.pool.discard(connKey, curl)
+                self.pool.record(host, time.time() - startTime, error=True)
+            raise
         if  verbose:
             print(verb, url, params, headers)
         header = self.parse_header(hbuf.getvalue())
+        if  self.pool:
+            self.pool.record(host, time.time() - startTime,
+                             error=header.status >= 400)
+            curl.reset()
+            self.pool.release(connKey, curl)
         if  header.status < 300:
             if  verb == 'HEAD':
                 data = ''
@@ -167,16 +190,7 @@ class RequestHandler(object):
                 data = self.parse_body(bbuf.getvalue(), decode)
         else:
             data = bbuf.getvalue()
-            msg = 'url=%s, code=%s, reason=%s, headers=%s' \
-                    % (url, header.status, header.reason, header.header)
-            exc = httplib.HTTPException(msg)
-            setattr(exc, 'req_data', params)
-            setattr(exc, 'req_headers', headers)
-            setattr(exc, 'url', url)
-            setattr(exc, 'result', data)
-            setattr(exc, 'status', header.status)
-            setattr(exc, 'reason', header.reason)
-            setattr(exc, 'headers', header.header)
+            exc = self.http_error(url, params, headers, header, data)
             bbuf.flush()
             hbuf.flush()
             raise exc
@@ -185,6 +199,20 @@ class RequestHandler(object):
         hbuf.flush()
         return header, data
 
+    def http_error(self, url, params, headers, header, data):
+        """Return the HTTPException of a request which failed with given header"""
+        msg = 'url=%s, code=%s, reason=%s, headers=%s' \
+                % (url, header.status, header.reason, header.header)
+        exc = httplib.HTTPException(msg)
+        setattr(exc, 'req_data', params)
+        setattr(exc, 'req_headers', headers)
+        setattr(exc, 'url', url)
+        setattr(exc, 'result', data)
+        setattr(exc, 'status', header.status)
+        setattr(exc, 'reason', header.reason)
+        setattr(exc, 'headers', header.header)
+        return exc
+
     def getdata(self, url, params, headers=None, verb='GET',
                 verbose=0, ckey=None, cert=None, doseq=True):
         """Fetch data for given set of parameters"""
@@ -199,41 +227,126 @@ class RequestHandler(object):
                     verbose, ckey, cert, doseq)
         return header
 
-    def multirequest(self, url, parray, headers=None,
-                ckey=None, cert=None, verbose=None):
-        """Fetch data for given set of parameters"""
+    def multifetch(self, requests, headers=None, verb='GET', ckey=None,
+                cert=None, capath=None, num_conn=10, decode=False,
+                verbose=None, doseq=True, cainfo=None):
+        """
+        Fetch the (url, params) pairs of given iterable concurrently, at most
+        num_conn transfers are in flight. Yield (url, params, header, data,
+        error) tuples in the order the transfers complete. A failed request
+        does not stop the others, its error is the pycurl.error or the
+        HTTPException (for an HTTP status >= 400) of the request.
+        """
+        requests = iter(requests)
         multi = pycurl.CurlMulti()
-        for params in parray:
-            curl = pycurl.Curl()
-            bbuf, hbuf = \
-                self.set_opts(curl, url, params, headers, ckey, cert, verbose)
-            multi.add_handle(curl)
+        active = {}
+        free = []
+        pending = True
+        try:
             while True:
-                ret, num_handles = multi.perform()
-                if  ret != pycurl.E_CALL_MULTI_PERFORM:
+                while pending and len(active) < num_conn:
+                    try:
+                        url, params = next(requests)
+                    except StopIteration:
+                        pending = False
+                        break
+                    curl = free.pop() if free else pycurl.Curl()
+                    bbuf, hbuf = self.set_opts(curl, url, params, headers,
+                            ckey, cert, capath, verbose, verb, doseq, cainfo)
+                    multi.add_handle(curl)
+                    active[curl] = (url, params, bbuf, hbuf)
+                if  not active:
                     break
-            while num_handles:
-                ret = multi.select(1.0)
-                if  ret == -1:
-                    continue
+
                 while True:
-                    ret, num_handles = multi.perform()
+                    ret, _num_handles = multi.perform()
                     if  ret != pycurl.E_CALL_MULTI_PERFORM:
                         break
-            _numq, response, _err = multi.info_read()
-            for _cobj in response:
-                data = json.loads(bbuf.getvalue())
-                if  isinstance(data, dict):
-                    data.update(params)
-                    yield data
-                if  isinstance(data, list):
-                    for item in data:
-                        if  isinstance(item, dict):
-                            item.update(params)
-                            yield item
-                        else:
-                            err = 'Unsupported data format: data=%s, type=%s'\
-                                % (item, type(item))
-                            raise Exception(err)
-                bbuf.flush()
-                hbuf.flush()
+
+                results = []
+                while True:
+                    num_q, ok_list, err_list = multi.info_read()
+                    for curl in ok_list:
+                        results.append(self.multifetch_result(\
+                                active.pop(curl), headers, verb, decode))
+                        multi.remove_handle(curl)
+                        curl.reset()
+                        free.append(curl)
+                    for curl, errno, errmsg in err_list:
+                        url, params, _bbuf, _hbuf = active.pop(curl)
+                        error = pycurl.error(errno, errmsg)
+                        results.append((url, params, None, None, error))
+                        multi.remove_handle(curl)
+                        curl.close()
+                    if  not num_q:
+                        break
+
+                for result in results:
+                    yield result
+                if  not results and active:
+                    multi.select(1.0)
+        finally:
+            for curl in active.keys():
+                multi.remove_handle(curl)
+                curl.close()
+            for curl in free:
+                curl.close()
+            multi.close()
+
+    def multifetch_result(self, transfer, headers, verb, decode):
+        """Make the multifetch result of a completed transfer"""
+        url, params, bbuf, hbuf = transfer
+        header = self.parse_header(hbuf.getvalue())
+        data = bbuf.getvalue()
+        error = None
+        if  header.status >= 400:
+            error = self.http_error(url, params, headers, header, data)
+        elif verb == 'HEAD':
+            data = ''
+        else:
+            data = self.parse_body(data, decode)
+        return url, params, header, data, error
+
+    def getdata_multi(self, requests, headers=None, ckey=None, cert=None,
+                      capath=None, num_conn=10, decode=True):
+        """
+        Fetch the (url, params) pairs of given list concurrently and return
+        the (data, error) pair of every request, in the order of the list.
+        The data of a failed request is None, its body is the result of the
+        error. Meant for bulk lookups, e.g. of many blocks or datasets.
+        """
+        # every request gets its own copy of the parameters to find it back
+        requests = [(url, dict(params or {})) for url, params in requests]
+        positions = dict([(id(params), idx) for idx, (_url, params) \
+                                in enumerate(requests)])
+        results = [None] * len(requests)
+        for _url, params, _header, data, error in \
+                self.multifetch(requests, headers, 'GET', ckey, cert, capath,
+                                num_conn, decode):
+            if  error:
+                data = None
+            results[positions[id(params)]] = (data, error)
+        return results
+
+    def multirequest(self, url, parray, headers=None,
+                ckey=None, cert=None, verbose=None):
+        """Fetch data for given set of parameters"""
+        requests = [(url, params) for params in parray]
+        for _url, params, _header, data, error in \
+                self.multifetch(requests, headers, ckey=ckey, cert=cert,
+                                verbose=verbose):
+            if  error:
+                raise error
+            data = json.loads(data)
+            if  isinstance(data, dict):
+                data.update(params)
+                yield data
+            if  isinstance(data, list):
+                for item in data:
+                    if  isinstance(item, dict):
+                        item.update(params)
+                        yield item
+                    else:
+                        err = 'Unsupported data format: data=%s, type=%s'\
+                            % (item, type(item))
+                        raise Exception(err)
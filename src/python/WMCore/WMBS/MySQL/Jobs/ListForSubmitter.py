@@ -33,7 +33,20 @@ class ListForSubmitter(DBFormatter):
                  wmbs_subscription.workflow = wmbs_workflow.id
              WHERE wmbs_job_state.name = 'created'"""
 
-    def execute(self, conn = None, transaction = False):
-        result = self.dbi.processData(self.sql, conn = conn,
-                                      transaction = transaction)
+    stateTimeSQL = " AND wmbs_job.state_time >= :state_time"
+
+    def execute(self, stateTime = None, conn = None, transaction = False):
+        """
+        _execute_
+
+        List all the jobs in the created state, or only the ones that
+        entered it at or after stateTime if it is given.
+        """
+        if stateTime is None:
+            result = self.dbi.processData(self.sql, conn = conn,
+                                          transaction = transaction)
+        else:
+            result = self.dbi.processData(self.sql + self.stateTimeSQL,
+                                          {"state_time": stateTime},
+                                          conn = conn, transaction = transaction)
         return self.formatDict(result)
@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+"""
+_ListRemovedForSubmitter_
+
+MySQL function to list the jobs that left the created state at or after a
+given time, either because they were submitted or killed.  The state_time
+range is read from idx_wmbs_job_state_time.
+"""
+
+from WMCore.Database.DBFormatter import DBFormatter
+
+class ListRemovedForSubmitter(DBFormatter):
+    sql = """SELECT wmbs_job.id AS id FROM wmbs_job
+               INNER JOIN wmbs_job_state ON
+                 wmbs_job.state = wmbs_job_state.id
+             WHERE wmbs_job_state.name != 'created' AND
+                   wmbs_job.state_time >= :state_time"""
+
+    def execute(self, stateTime, conn = None, transaction = False):
+        result = self.dbi.processData(self.sql, {"state_time": stateTime},
+                                      conn = conn, transaction = transaction)
+        return [x["id"] for x in self.formatDict(result)]
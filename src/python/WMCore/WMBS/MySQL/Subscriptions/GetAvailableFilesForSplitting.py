@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""
+_GetAvailableFilesForSplitting_
+
+MySQL implementation of Subscriptions.GetAvailableFilesForSplitting
+
+Retrieve the available files of a subscription with everything the job
+splitting needs to know about them, one row per file and location.  The
+rows are ordered by file so that the rows of a file follow each other.
+"""
+
+from WMCore.WMBS.MySQL.Subscriptions.GetAvailableFiles import GetAvailableFiles
+
+class GetAvailableFilesForSplitting(GetAvailableFiles):
+    sql = """SELECT wfd.id AS fileid, wfd.lfn AS lfn, wfd.filesize AS filesize,
+                    wfd.events AS events, wfd.first_event AS first_event,
+                    wfd.merged AS merged,
+                    (SELECT MIN(wfr.run) FROM wmbs_file_runlumi_map wfr
+                       WHERE wfr.fileid = wfd.id) AS minrun,
+                    wls.se_name AS se_name
+             FROM wmbs_sub_files_available wsfa
+               INNER JOIN wmbs_file_details wfd ON wfd.id = wsfa.fileid
+               LEFT OUTER JOIN wmbs_file_location wfl ON wfl.fileid = wfd.id
+               LEFT OUTER JOIN wmbs_location_senames wls ON wls.location = wfl.location
+             WHERE wsfa.subscription = :subscription
+             ORDER BY wfd.id"""
@@ -0,0 +1,11 @@
+#!/usr/bin/env python
+"""
+_ListRemovedForSubmitter_
+
+Oracle implementation of Jobs.ListRemovedForSubmitter
+"""
+
+from WMCore.WMBS.MySQL.Jobs.ListRemovedForSubmitter import ListRemovedForSubmitter as MySQLListRemovedForSubmitter
+
+class ListRemovedForSubmitter(MySQLListRemovedForSubmitter):
+    pass
@@ -0,0 +1,12 @@
+#!/usr/bin/env python
+"""
+_GetAvailableFilesForSplitting_
+
+Oracle implementation of Subscriptions.GetAvailableFilesForSplitting
+"""
+
+from WMCore.WMBS.MySQL.Subscriptions.GetAvailableFilesForSplitting \
+     import GetAvailableFilesForSplitting as GetAvailableFilesForSplittingMySQL
+
+class GetAvailableFilesForSplitting(GetAvailableFilesForSplittingMySQL):
+    pass
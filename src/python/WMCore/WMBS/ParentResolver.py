@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+_ParentResolver_
+
+Find the merged ancestors of many files at once.  The parentage is walked
+one level at a time for all the files, with a single Files.GetParentInfo
+call per level instead of one per file and ancestor.
+"""
+
+
+class ParentResolver(object):
+    """
+    _ParentResolver_
+
+    The merged ancestors of a file are its merged parents, the merged
+    grandparents reached through its unmerged parents and, when those are
+    unmerged too, the merged ancestors of the grandparents.
+
+    getParentInfo(lfns) returns the Files.GetParentInfo rows for the given
+    child LFNs.  Rows and results are kept until clear() is called.
+    """
+
+    def __init__(self, getParentInfo):
+        self.getParentInfo = getParentInfo
+        # LFN -> GetParentInfo rows of the file
+        self.parentInfo = {}
+        # LFN -> merged ancestors of the file
+        self.parents    = {}
+        self.queries    = 0
+        return
+
+    def clear(self):
+        """
+        _clear_
+
+        Forget the parentage that was loaded
+        """
+        self.parentInfo = {}
+        self.parents    = {}
+        return
+
+    def load(self, lfns):
+        """
+        _load_
+
+        Load the parentage of the files, and of the grandparents that have
+        to be followed, one level at a time.
+        """
+        toLoad = set(lfns).difference(self.parentInfo)
+        while toLoad:
+            for lfn in toLoad:
+                self.parentInfo[lfn] = []
+
+            nextLevel = set()
+            self.queries += 1
+            for parentInfo in self.getParentInfo(list(toLoad)):
+                self.parentInfo[parentInfo['child_lfn']].append(parentInfo)
+                if int(parentInfo['merged']) != 1 and parentInfo['gpmerged'] != None \
+                       and int(parentInfo['gpmerged']) != 1:
+                    nextLevel.add(parentInfo['gplfn'])
+
+            toLoad = nextLevel.difference(self.parentInfo)
+
+        return
+
+    def resolve(self, lfn):
+        """
+        _resolve_
+
+        Merged ancestors of a file whose parentage was loaded
+        """
+        if lfn in self.parents:
+            return self.parents[lfn]
+
+        # Guards against loops in the parentage
+        self.parents[lfn] = set()
+
+        newParents = set()
+        for parentInfo in self.parentInfo[lfn]:
+            if int(parentInfo['merged']) == 1:
+                newParents.add(parentInfo['lfn'])
+            elif parentInfo['gpmerged'] == None:
+                continue
+            elif int(parentInfo['gpmerged']) == 1:
+                newParents.add(parentInfo['gplfn'])
+            else:
+                newParents.update(self.resolve(parentInfo['gplfn']))
+
+        self.parents[lfn] = newParents
+        return newParents
+
+    def findParents(self, lfns):
+        """
+        _findParents_
+
+        Returns a dictionary of LFN -> set of merged ancestor LFNs
+        """
+        self.load(lfns)
+        return dict([(lfn, self.resolve(lfn)) for lfn in lfns])
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""
+_ReportLoading_t_
+
+Test loading and parsing the job reports for the JobAccountant, in the
+accountant process and in a pool of processes.
+"""
+
+import os
+import glob
+import time
+import cPickle
+import logging
+import unittest
+import multiprocessing
+
+import WMCore.WMBase
+from nose.plugins.attrib import attr
+
+from WMCore.FwkJobReport.Report import Report
+from WMCore.Wrappers.JsonWrapper.JSONThunker import JSONThunker
+
+from WMComponent.JobAccountant.AccountantWorker import loadJobReport, parseJobReport, loadReportWorker
+
+class ReportLoadingTest(unittest.TestCase):
+    """
+    _ReportLoadingTest_
+
+    """
+    def setUp(self):
+        self.fwjrPath = os.path.join(WMCore.WMBase.getTestBase(),
+                                     "WMComponent_t/JobAccountant_t/fwjrs")
+        return
+
+    def makeJobs(self, pattern):
+        """
+        _makeJobs_
+
+        Completed jobs for the reports matching the pattern
+        """
+        jobs = []
+        for i, fwjrPath in enumerate(sorted(glob.glob(os.path.join(self.fwjrPath, pattern)))):
+            jobs.append({"id": i + 1, "fwjr_path": "file://%s" % fwjrPath})
+        return jobs
+
+    def testA_BadReports(self):
+        """
+        _testA_BadReports_
+
+        Reports that can't be used give the exit code and the reason
+        """
+        self.assertEqual(loadJobReport(None), (None, (99999, "FWJR path is empty")))
+        self.assertEqual(loadJobReport("/this/does/not/exist")[1][0], 99999)
+        self.assertEqual(loadJobReport(os.path.join(self.fwjrPath, "EmptyJobReport.pkl"))[1][0], 99998)
+        self.assertEqual(loadJobReport(os.path.join(self.fwjrPath, "MergeSuccessBadPKL.pkl"))[1],
+                         (99997, "Cannot load jobReport"))
+
+        job = {"id": 5, "fwjr_path": os.path.join(self.fwjrPath, "EmptyJobReport.pkl")}
+        self.assertEqual(loadReportWorker(job)[:2], (5, None))
+        return
+
+    def testB_LoadReportWorker(self):
+        """
+        _testB_LoadReportWorker_
+
+        The pool returns the same reports as loading them in the accountant
+        """
+        jobs = self.makeJobs("*Success*.pkl") + self.makeJobs("SkimFailure.pkl")
+
+        pool = multiprocessing.Pool(processes = 2)
+        loadedReports = pool.map(loadReportWorker, jobs)
+        pool.close()
+        pool.join()
+
+        for job, loadedReport in zip(jobs, loadedReports):
+            (jobID, reportSummary, error) = loadedReport
+            self.assertEqual(jobID, job["id"])
+            (jobReport, error) = loadJobReport(job["fwjr_path"])
+            if error:
+                self.assertEqual(reportSummary, None)
+                self.assertEqual(loadedReport[2], error)
+                continue
+
+            # Only the summary comes back, not the report
+            self.assertFalse(isinstance(reportSummary, Report))
+            self.assertFalse(hasattr(reportSummary, "data"))
+
+            summary = parseJobReport(jobReport)
+            loadedSummary = reportSummary.summary
+            self.assertEqual(loadedSummary["jobSuccess"], summary["jobSuccess"])
+            for key in ["files", "logArchFiles"]:
+                self.assertEqual([x["lfn"] for x in loadedSummary[key]],
+                                 [x["lfn"] for x in summary[key]])
+                self.assertEqual([x.json() for x in loadedSummary[key]],
+                                 [x.json() for x in summary[key]])
+            self.assertEqual(loadedSummary["skippedFiles"], summary["skippedFiles"])
+
+            self.assertEqual(reportSummary.getJobID(), job["id"])
+            self.assertEqual(reportSummary.listSteps(), jobReport.listSteps())
+            self.assertEqual(reportSummary.getExitCode(), jobReport.getExitCode())
+            self.assertEqual(reportSummary.getSiteName(), jobReport.getSiteName())
+            self.assertEqual([x["lfn"] for x in reportSummary.getAllInputFiles()],
+                             [x["lfn"] for x in jobReport.getAllInputFiles()])
+            for step in jobReport.listSteps():
+                for (loadedFile, reportFile) in zip(reportSummary.getAllFilesFromStep(step),
+                                                    jobReport.getAllFilesFromStep(step)):
+                    for key in ["lfn", "locations", "module_label", "checksums", "size", "dataset"]:
+                        self.assertEqual(loadedFile[key], reportFile[key])
+
+            # Changes to the files go to the couch document as they do with
+            # the report
+            for (loadedFile, reportFile) in zip(loadedSummary["files"], summary["files"]):
+                loadedFile["fileRef"].merged = True
+                reportFile["fileRef"].merged = True
+            for fileRef in reportSummary.getAllFileRefs() + jobReport.getAllFileRefs():
+                if hasattr(fileRef, 'location'):
+                    fileRef.location = "T1_US_FNAL_Disk"
+            reportSummary.setTaskName("/Test/Task")
+            jobReport.setTaskName("/Test/Task")
+            reportSummary.stripInputFiles()
+            jobReport.stripInputFiles()
+            self.assertEqual(reportSummary.getAllInputFiles(), [])
+            thunker = JSONThunker()
+            self.assertEqual(thunker.thunk(reportSummary.__to_json__(None)),
+                             thunker.thunk(jobReport.__to_json__(None)))
+        return
+
+    @attr('performance')
+    def testC_LoadPerformance(self):
+        """
+        _testC_LoadPerformance_
+
+        Compare loading the reports in the accountant and in a pool, and
+        what receiving the summaries of the pool costs the accountant
+        """
+        jobs = self.makeJobs("LoadTest*.pkl") * 10
+
+        startTime = time.time()
+        for job in jobs:
+            (jobReport, error) = loadJobReport(job["fwjr_path"])
+            parseJobReport(jobReport)
+        serialTime = time.time() - startTime
+
+        # The accountant starts its pool once in setup(), so the workers are
+        # started and warmed up before the timing like they would be there
+        poolRates = []
+        for processes in sorted(set([2, max(2, multiprocessing.cpu_count())])):
+            pool = multiprocessing.Pool(processes = processes)
+            pool.map(loadReportWorker, jobs[:processes], 1)
+            startTime = time.time()
+            loadedReports = list(pool.imap(loadReportWorker, jobs, 25))
+            poolRates.append("%d processes: %.1f jobs/s" %
+                             (processes, len(jobs) / (time.time() - startTime)))
+            pool.close()
+            pool.join()
+
+        summaries = [cPickle.dumps(x, cPickle.HIGHEST_PROTOCOL) for x in loadedReports]
+        startTime = time.time()
+        for summary in summaries:
+            cPickle.loads(summary)
+        receiveTime = time.time() - startTime
+
+        logging.info("Serial: %.1f jobs/s, %s, receiving the summaries: %.1f jobs/s" %
+                     (len(jobs) / serialTime, ", ".join(poolRates), len(jobs) / receiveTime))
+        return
+
+if __name__ == '__main__':
+    unittest.main()
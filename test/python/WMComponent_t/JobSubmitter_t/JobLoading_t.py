@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+_JobLoading_t_
+
+Test loading the new jobs of the JobSubmitter from their job stores, in the
+poller and in a pool, and how long it takes to fill the cache on restart.
+"""
+
+import os
+import time
+import logging
+import unittest
+import itertools
+import multiprocessing
+
+from multiprocessing.pool import ThreadPool
+
+from nose.plugins.attrib import attr
+
+from WMQuality.TestInit import TestInit
+
+from WMCore.DataStructs.File import File
+from WMCore.DataStructs.Job import Job
+from WMCore.DataStructs.Run import Run
+from WMCore.DataStructs.JobStore import JobStore
+
+from WMComponent.JobSubmitter.JobSubmitterPoller import loadNewJobs, loadJobHeader, \
+                                                        loadJobBody, jobBodyRef, \
+                                                        resolveJobLocations
+
+class JobLoadingTest(unittest.TestCase):
+    """
+    _JobLoadingTest_
+
+    """
+    def setUp(self):
+        """
+        _setUp_
+
+        Create a work directory for the job stores
+        """
+        self.testInit = TestInit(__file__)
+        self.testDir = self.testInit.generateWorkDir()
+        self.siteInfo = ({"se1.cern.ch": ["T1_US_FNAL"], "se2.cern.ch": ["T2_CH_CERN"]},
+                         {"T1_US_FNAL": ["T1_US_FNAL"], "T2_CH_CERN": ["T2_CH_CERN"]},
+                         set(), set())
+        return
+
+    def tearDown(self):
+        """
+        _tearDown_
+
+        Remove the work directory
+        """
+        self.testInit.delWorkDir()
+        return
+
+    def makeStores(self, nStores, nJobs, nLumis = 1):
+        """
+        _makeStores_
+
+        Write nStores job collections of nJobs jobs, each with one input file
+        of nLumis lumis.  Return the new jobs as listed by the submitter.
+        """
+        newJobs = []
+        for storeIndex in range(nStores):
+            storeDir = os.path.join(self.testDir, "JobCollection_%d" % storeIndex)
+            os.makedirs(storeDir)
+            jobs = []
+            for jobIndex in range(nJobs):
+                jobID = storeIndex * nJobs + jobIndex + 1
+                testFile = File(lfn = "/this/is/file%d" % jobID,
+                                locations = set(["se%d.cern.ch" % (1 + jobID % 2)]))
+                testFile.addRun(Run(1, *range(1, nLumis + 1)))
+                newJob = Job("Job%d" % jobID, files = [testFile])
+                newJob["id"] = jobID
+                newJob["sandbox"] = "/path/to/sandbox.tar.bz2"
+                newJob["cache_dir"] = os.path.join(storeDir, "job_%d" % jobID)
+                jobs.append(newJob)
+                newJobs.append({"id": jobID, "cache_dir": newJob["cache_dir"],
+                                "type": "Processing", "retry_count": 0})
+            JobStore(storeDir).append(jobs)
+        return newJobs
+
+    def testA_LoadNewJobs(self):
+        """
+        _testA_LoadNewJobs_
+
+        Verify that the headers and locations come back in order, that the
+        bodies can be found again from the cache entry and that jobs without
+        a record fail.
+        """
+        newJobs = self.makeStores(2, 10)
+        newJobs.append({"id": 999, "cache_dir": os.path.join(self.testDir, "JobCollection_0", "job_999"),
+                        "type": "Processing", "retry_count": 0})
+
+        results = loadNewJobs((newJobs, self.siteInfo))
+        self.assertEqual([x[0]["id"] for x in results], [x["id"] for x in newJobs])
+        for newJob, jobHeader, errorCode, possibleLocations, potentialLocations in results[:-1]:
+            self.assertEqual(errorCode, None)
+            self.assertEqual(jobHeader["name"], "Job%d" % newJob["id"])
+            self.assertEqual(list(possibleLocations),
+                             ["T2_CH_CERN" if newJob["id"] % 2 else "T1_US_FNAL"])
+        self.assertEqual(results[-1][1:], (None, 61103, None, None))
+
+        jobStores = {}
+        for newJob, jobHeader, errorCode, possibleLocations, potentialLocations in results[:-1]:
+            loadedJob = loadJobBody(newJob["cache_dir"], jobBodyRef(jobHeader), jobStores)
+            self.assertEqual(loadedJob["id"], newJob["id"])
+            self.assertEqual(loadedJob["input_files"][0]["lfn"], "/this/is/file%d" % newJob["id"])
+        self.assertEqual(len(jobStores), 2)
+        for jobStore in jobStores.values():
+            jobStore.close()
+        return
+
+    @attr('performance')
+    def testB_RestartPerformance(self):
+        """
+        _testB_RestartPerformance_
+
+        Compare filling the cache with 50k new jobs after a restart the way
+        refreshCache() used to, loading every body, with loading only the
+        headers in the poller and in pools of threads and processes.  The
+        bodies of one submission cycle are loaded on top of that.
+        """
+        nLoadWorkers = max(2, multiprocessing.cpu_count())
+        newJobs = self.makeStores(50, 1000, nLumis = 50)
+        batches = [(newJobs[x:x + 1000], self.siteInfo) for x in range(0, len(newJobs), 1000)]
+
+        startTime = time.time()
+        headerStores = {}
+        bodyStores = {}
+        for newJob in newJobs:
+            jobHeader = loadJobHeader(newJob, headerStores)
+            resolveJobLocations(newJob, jobHeader, self.siteInfo)
+            loadJobBody(newJob["cache_dir"], jobBodyRef(jobHeader), bodyStores)
+        bodyTime = time.time() - startTime
+        for jobStore in bodyStores.values():
+            jobStore.close()
+
+        startTime = time.time()
+        results = list(itertools.imap(loadNewJobs, batches))
+        headerTime = time.time() - startTime
+
+        poolTimes = []
+        for loadMode, poolClass in [("thread", ThreadPool), ("process", multiprocessing.Pool)]:
+            # The poller starts its pool once in setup(), keep that out of the timing
+            pool = poolClass(processes = nLoadWorkers)
+            pool.map(abs, range(nLoadWorkers))
+            startTime = time.time()
+            for batch in pool.imap(loadNewJobs, batches):
+                pass
+            poolTimes.append((loadMode, time.time() - startTime))
+            pool.close()
+            pool.join()
+
+        startTime = time.time()
+        bodyStores = {}
+        for result in itertools.islice(itertools.chain(*results), 1000):
+            loadJobBody(result[0]["cache_dir"], jobBodyRef(result[1]), bodyStores)
+        cycleTime = time.time() - startTime
+        for jobStore in bodyStores.values():
+            jobStore.close()
+
+        logging.info("Cache filled in %.2fs loading the bodies, %.2fs loading the headers" % (bodyTime, headerTime))
+        for loadMode, poolTime in poolTimes:
+            logging.info("%d %s workers: %.2fs, %.1fx faster than loading the bodies" %
+                         (nLoadWorkers, loadMode, poolTime, bodyTime / poolTime))
+        logging.info("Loading the bodies of 1000 jobs to submit: %.2fs" % cycleTime)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+_JobSubmitterCache_t_
+
+Unit tests for the JobSubmitter job cache.
+"""
+
+import time
+import random
+import logging
+import unittest
+
+from nose.plugins.attrib import attr
+
+from WMComponent.JobSubmitter.JobSubmitterCache import JobSubmitterCache
+
+class JobSubmitterCacheTest(unittest.TestCase):
+    """
+    _JobSubmitterCacheTest_
+
+    """
+    def testA_AddRemove(self):
+        """
+        _testA_AddRemove_
+
+        Verify that jobs are indexed by all their sites and removed from all
+        of them at once.
+        """
+        jobCache = JobSubmitterCache()
+        jobCache.addJob(1, "wf001", "Processing", ["T1_US_FNAL", "T1_UK_RAL"], (1, 0))
+        jobCache.addJob(2, "wf001", "Processing", ["T1_US_FNAL"], (2, 0))
+        jobCache.addJob(3, "wf002", "Merge", ["T1_UK_RAL"], (3, 0))
+
+        self.assertEqual(len(jobCache), 3)
+        self.assertTrue(2 in jobCache)
+        self.assertEqual(jobCache.getTaskCache("T1_US_FNAL", "Processing"),
+                         {"wf001": set([1, 2])})
+        self.assertEqual(jobCache.getTaskCache("T1_UK_RAL", "Processing"),
+                         {"wf001": set([1])})
+        self.assertEqual(jobCache.getTaskCache("T1_UK_RAL", "Merge"),
+                         {"wf002": set([3])})
+        self.assertEqual(jobCache.getTaskCache("T2_CH_CERN", "Merge"), None)
+        self.assertEqual(sorted(jobCache.workflows()), ["wf001", "wf002"])
+
+        self.assertEqual(jobCache.removeJob(1), (1, 0))
+        self.assertEqual(jobCache.getTaskCache("T1_US_FNAL", "Processing"),
+                         {"wf001": set([2])})
+        self.assertEqual(jobCache.getTaskCache("T1_UK_RAL", "Processing"), None)
+        self.assertEqual(jobCache.removeJob(1), None)
+
+        jobCache.removeJob(3)
+        self.assertFalse(jobCache.hasSite("T1_UK_RAL"))
+        self.assertEqual(jobCache.workflows(), ["wf001"])
+        self.assertEqual(jobCache.jobIDs(), set([2]))
+        return
+
+    def testB_Replace(self):
+        """
+        _testB_Replace_
+
+        Verify that adding a job that is already cached replaces it.
+        """
+        jobCache = JobSubmitterCache()
+        jobCache.addJob(1, "wf001", "Processing", ["T1_US_FNAL"], (1, 0))
+        jobCache.addJob(1, "wf001", "Processing", ["T1_UK_RAL"], (1, 1))
+
+        self.assertEqual(len(jobCache), 1)
+        self.assertEqual(jobCache.getJobInfo(1), (1, 1))
+        self.assertFalse(jobCache.hasSite("T1_US_FNAL"))
+        self.assertTrue(jobCache.hasSite("T1_UK_RAL"))
+        return
+
+    def testC_Priorities(self):
+        """
+        _testC_Priorities_
+
+        Verify that jobs come out of the cache by workflow priority and then
+        by workflow timestamp, and that priority changes are honored.
+        """
+        jobCache = JobSubmitterCache()
+        jobCache.addJob(1, "wfLow", "Processing", ["T1_US_FNAL"], (1, 0),
+                        priority = 1, timestamp = 10)
+        jobCache.addJob(2, "wfHighNew", "Processing", ["T1_US_FNAL"], (2, 0),
+                        priority = 5, timestamp = 20)
+        jobCache.addJob(3, "wfHighOld", "Processing", ["T1_US_FNAL"], (3, 0),
+                        priority = 5, timestamp = 15)
+        jobCache.addJob(4, "wfHighOld", "Processing", ["T1_US_FNAL", "T1_UK_RAL"], (4, 0),
+                        priority = 0, timestamp = 0)
+
+        self.assertEqual(jobCache.topWorkflow("T1_US_FNAL", "Processing"), "wfHighOld")
+        self.assertEqual(jobCache.topWorkflow("T1_US_FNAL", "Merge"), None)
+
+        jobCache.setWorkflowPriority("wfLow", 10)
+        jobCache.setWorkflowPriority("NotCached", 100)
+        self.assertEqual(jobCache.getWorkflowPriority("wfLow"), 10)
+
+        order = []
+        while True:
+            result = jobCache.popJob("T1_US_FNAL", "Processing")
+            if result is None:
+                break
+            order.append((result[0], result[1], result[2][0]))
+
+        self.assertEqual([x[0] for x in order],
+                         ["wfLow", "wfHighOld", "wfHighOld", "wfHighNew"])
+        self.assertEqual(order[0][1], 10)
+        self.assertEqual(len(jobCache), 0)
+        self.assertFalse(jobCache.hasSite("T1_UK_RAL"))
+        self.assertEqual(jobCache.heaps, {})
+        return
+
+    @attr('performance')
+    def testD_AssignBenchmark(self):
+        """
+        _testD_AssignBenchmark_
+
+        Measure how many jobs per second can be pulled out of the cache in
+        priority order for 10k workflows and 500k jobs spread over 50 sites.
+        """
+        nWorkflows = 10000
+        nJobs = 500000
+        sites = ["T2_XX_Site%d" % i for i in range(50)]
+        random.seed(1)
+
+        jobCache = JobSubmitterCache()
+        startTime = time.time()
+        for jobID in range(nJobs):
+            workflow = "Workflow%d" % (jobID % nWorkflows)
+            jobSites = random.sample(sites, 3)
+            jobCache.addJob(jobID, workflow, "Processing", jobSites, (jobID, 0),
+                            priority = jobID % 7, timestamp = jobID % 1000)
+        fillTime = time.time() - startTime
+
+        for i in range(0, nWorkflows, 10):
+            jobCache.setWorkflowPriority("Workflow%d" % i, 100)
+
+        startTime = time.time()
+        assigned = 0
+        for site in sites:
+            for _ in range(nJobs / len(sites)):
+                if jobCache.popJob(site, "Processing") is None:
+                    break
+                assigned += 1
+        assignTime = time.time() - startTime
+
+        logging.info("Filled cache with %d jobs in %.2f seconds" % (nJobs, fillTime))
+        logging.info("Assigned %d jobs in %.2f seconds: %.0f jobs/s" % \
+                     (assigned, assignTime, assigned / max(assignTime, 1e-6)))
+        self.assertEqual(assigned + len(jobCache), nJobs)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
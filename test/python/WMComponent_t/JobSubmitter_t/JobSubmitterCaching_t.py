@@ -171,29 +171,29 @@ class JobSubmitterCachingTest(unittest.TestCase):
         mySubmitterPoller.getThresholds()
         mySubmitterPoller.refreshCache()
 
-        self.assertEqual(len(mySubmitterPoller.cachedJobIDs), 0,
+        self.assertEqual(len(mySubmitterPoller.jobCache), 0,
                          "Error: The job cache should be empty.")
 
         self.injectJobs()
         mySubmitterPoller.refreshCache()
 
         # Verify the cache is full
-        self.assertEqual(len(mySubmitterPoller.cachedJobIDs), 20,
-                         "Error: The job cache should contain 20 jobs.  Contains: %i" % len(mySubmitterPoller.cachedJobIDs))
+        self.assertEqual(len(mySubmitterPoller.jobCache), 20,
+                         "Error: The job cache should contain 20 jobs.  Contains: %i" % len(mySubmitterPoller.jobCache))
 
         killWorkflow("wf001", jobCouchConfig = config)
         mySubmitterPoller.refreshCache()
 
         # Verify that the workflow is gone from the cache
-        self.assertEqual(len(mySubmitterPoller.cachedJobIDs), 10,
-                         "Error: The job cache should contain 10 jobs. Contains: %i" % len(mySubmitterPoller.cachedJobIDs))
+        self.assertEqual(len(mySubmitterPoller.jobCache), 10,
+                         "Error: The job cache should contain 10 jobs. Contains: %i" % len(mySubmitterPoller.jobCache))
 
         killWorkflow("wf002", jobCouchConfig = config)
         mySubmitterPoller.refreshCache()
 
         # Verify that the workflow is gone from the cache
-        self.assertEqual(len(mySubmitterPoller.cachedJobIDs), 0,
-                         "Error: The job cache should be empty.  Contains: %i" % len(mySubmitterPoller.cachedJobIDs))
+        self.assertEqual(len(mySubmitterPoller.jobCache), 0,
+                         "Error: The job cache should be empty.  Contains: %i" % len(mySubmitterPoller.jobCache))
         return
 
 if __name__ == "__main__":
@@ -893,5 +893,61 @@ class JobSubmitterTest(unittest.TestCase):
 
         return
 
+    def testG_ParallelLoad(self):
+        """
+        _testG_ParallelLoad_
+
+        Load the new jobs in small batches with a pool of threads and then
+        of processes, check that all of them are cached and submitted and
+        that each poller keeps its pool over the refreshes.
+        """
+        workloadName = "basicWorkload"
+        workload = self.createTestWorkload()
+        config = self.getConfig()
+        config.JobSubmitter.loadWorkers = 2
+        config.JobSubmitter.loadBatchSize = 7
+        changeState = ChangeState(config)
+
+        nSubs = 2
+        nJobs = 20
+        site = 'T2_US_UCSD'
+
+        self.setResourceThresholds(site, pendingSlots = 100, runningSlots = 200, tasks = ['Processing', 'Merge'],
+                                   Processing = {'pendingSlots' : 100, 'runningSlots' : 200},
+                                   Merge = {'pendingSlots' : 100, 'runningSlots' : 200})
+
+        getJobsAction = self.daoFactory(classname = "Jobs.GetAllJobs")
+        for loadMode, taskType in [('thread', 'Processing'), ('process', 'Merge')]:
+            config.JobSubmitter.loadMode = loadMode
+            jobSubmitter = JobSubmitterPoller(config = config)
+            jobSubmitter.setup()
+            loadPool = jobSubmitter.loadPool
+            self.assertNotEqual(loadPool, None)
+
+            jobGroupList = self.createJobGroups(nSubs = nSubs, nJobs = nJobs,
+                                                task = workload.getTask("ReReco"),
+                                                workloadSpec = os.path.join(self.testDir, 'workloadTest',
+                                                                            workloadName),
+                                                site = 'se.%s' % site,
+                                                taskType = taskType)
+            for group in jobGroupList:
+                changeState.propagate(group.jobs, 'created', 'new')
+
+            jobSubmitter.getThresholds()
+            jobSubmitter.refreshCache()
+            self.assertEqual(len(jobSubmitter.jobCache), nSubs * nJobs)
+
+            jobSubmitter.algorithm()
+            result = getJobsAction.execute(state = 'Created', jobType = taskType)
+            self.assertEqual(len(result), 0)
+            result = getJobsAction.execute(state = 'Executing', jobType = taskType)
+            self.assertEqual(len(result), nSubs * nJobs)
+
+            # The same pool served both refreshes
+            self.assertTrue(jobSubmitter.loadPool is loadPool)
+            jobSubmitter.terminate(None)
+            self.assertEqual(jobSubmitter.loadPool, None)
+        return
+
 if __name__ == "__main__":
     unittest.main()
@@ -5,6 +5,8 @@ _CondorPlugin_t_
 
 CondorPlugin unittests
 """
+import os
+import re
 import time
 import os.path
 import threading
@@ -15,12 +17,68 @@ from subprocess import Popen, PIPE, STDOUT
 
 from WMCore.BossAir.BossAirAPI   import BossAirAPI, BossAirException
 from WMCore.BossAir.StatusPoller import StatusPoller
+from WMCore.BossAir.Plugins.CondorPlugin import CondorPlugin
 from WMCore.JobStateMachine.ChangeState          import ChangeState
 from WMComponent.JobSubmitter.JobSubmitterPoller import JobSubmitterPoller
 from WMComponent.JobTracker.JobTrackerPoller     import JobTrackerPoller
 
 from WMCore_t.BossAir_t.BossAir_t import BossAirTest, getNArcJobs, getCondorRunningJobs
 
+# Stand-in for condor_q, condor_rm, condor_qedit and condor_submit, with one
+# queue per schedd given with -name.  It records every invocation.  The queue
+# is condor_q.<schedd>.out (condor_q.out for the local schedd) in condor_q
+# -af:t format, condor_q prints the jobs selected by their WMAgent_JobIDs.
+# Like the real ones condor_rm and condor_qedit succeed if any job matches
+# their constraint and fail if none does, they also fail if one of the jobs
+# is listed in the missing file and the schedd refused to act on it.
+# condor_rm takes the jobs it removed out of the queue.  condor_submit fails
+# for the jobs in the missing file and records the jobs in its JDL file in
+# the submitted file.
+FAKE_CONDOR = """#!/usr/bin/env python
+import os, re, sys, time
+binDir = os.path.dirname(os.path.abspath(sys.argv[0]))
+name = os.path.basename(sys.argv[0])
+log = open(os.path.join(binDir, 'invocations'), 'a')
+log.write('%s\\t%s\\n' % (name, '\\t'.join(sys.argv[1:])))
+log.close()
+arguments = sys.argv[1:]
+schedd = 'local'
+if '-name' in arguments:
+    schedd = arguments[arguments.index('-name') + 1]
+missing = set([int(x) for x in open(os.path.join(binDir, 'missing')).read().split()])
+if name == 'condor_submit':
+    jobIDs = [int(x) for x in re.findall('WMAgent_JobID = (\\d+)', open(arguments[-1]).read())]
+    # The time it takes a schedd to queue the jobs
+    time.sleep(0.05)
+    if set(jobIDs) & missing:
+        sys.exit(1)
+    log = open(os.path.join(binDir, 'submitted'), 'a')
+    log.write(''.join(['%s %i\\n' % (schedd, x) for x in jobIDs]))
+    log.close()
+    print '%i job(s) submitted to cluster 1.' % len(jobIDs)
+    sys.exit(0)
+queue = os.path.join(binDir, 'condor_q.%s.out' % schedd)
+if not os.path.exists(queue):
+    queue = os.path.join(binDir, 'condor_q.out')
+lines = [x for x in open(queue).read().split('\\n') if x]
+jobID = lambda line: int(line.split('\\t')[-1])
+constraints = [arguments[i + 1] for i in range(len(arguments)) if arguments[i] == '-constraint']
+selected = set([int(x) for x in re.findall('WMAgent_JobID =\\?= (\\d+)', ' '.join(constraints))])
+matching = [x for x in lines if not selected or jobID(x) in selected]
+if name == 'condor_q':
+    if arguments[-2:] == ['-af', 'WMAgent_JobID']:
+        sys.stdout.write(''.join(['%i\\n' % jobID(x) for x in matching]))
+    else:
+        sys.stdout.write(''.join(['%s\\n' % x for x in matching]))
+    sys.exit(0)
+refused = [x for x in matching if jobID(x) in missing]
+if name == 'condor_rm':
+    kept = [x for x in lines if x not in matching or x in refused]
+    open(queue, 'w').write(''.join(['%s\\n' % x for x in kept]))
+if not matching or refused:
+    sys.exit(1)
+sys.exit(0)
+"""
 class CondorPluginTest(BossAirTest):
     """
     _CondorPluginTest_
@@ -465,6 +523,197 @@ class CondorPluginTest(BossAirTest):
 
         return
 
+    def setupFakeCondor(self, missing = [], condorQ = ''):
+        """
+        _setupFakeCondor_
+
+        Put the fake condor commands first in the PATH
+        """
+        binDir = os.path.join(self.testDir, 'fakeCondor')
+        os.makedirs(binDir)
+        for name in ['condor_q', 'condor_rm', 'condor_qedit', 'condor_submit']:
+            path = os.path.join(binDir, name)
+            f = open(path, 'w')
+            f.write(FAKE_CONDOR)
+            f.close()
+            os.chmod(path, 0755)
+        f = open(os.path.join(binDir, 'missing'), 'w')
+        f.write(' '.join([str(x) for x in missing]))
+        f.close()
+        f = open(os.path.join(binDir, 'condor_q.out'), 'w')
+        f.write(condorQ)
+        f.close()
+
+        self.originalPath = os.environ['PATH']
+        os.environ['PATH'] = "%s:%s" % (binDir, self.originalPath)
+        return binDir
+
+    def getInvocations(self, binDir, name):
+        """
+        _getInvocations_
+
+        Arguments of every call to the given fake condor command
+        """
+        invocations = []
+        if os.path.exists(os.path.join(binDir, 'invocations')):
+            for line in open(os.path.join(binDir, 'invocations')):
+                arguments = line.rstrip('\n').split('\t')
+                if arguments[0] == name:
+                    invocations.append(arguments[1:])
+        return invocations
+
+    def getSubmitted(self, binDir):
+        """
+        _getSubmitted_
+
+        Schedd -> IDs of the jobs submitted to the fake schedds
+        """
+        submitted = {}
+        if os.path.exists(os.path.join(binDir, 'submitted')):
+            for line in open(os.path.join(binDir, 'submitted')):
+                schedd, jobID = line.split()
+                submitted.setdefault(schedd, []).append(int(jobID))
+        return submitted
+
+    def testG_BulkKillAndEdit(self):
+        """
+        _testG_BulkKillAndEdit_
+
+        Check that kill and updateSiteInformation act on batches of jobs,
+        that jobs which left the queue don't count as failures and that the
+        jobs the schedd refused to act on are still reported.
+        """
+        config = self.getConfig()
+        config.BossAir.condorBulkSize = 500
+
+        # condor_q -af:t output
+        condorQ = ''
+        for jobID in range(1, 101):
+            condorQ += '1\t0\tundefined\t0\tT1_A, T2_B\tT1_A, T2_B\tundefined\t%i\n' % jobID
+        condorQ += '1\t0\tundefined\t0\tT1_A\tT1_A\tundefined\t101\n'
+        condorQ += '1\t0\tundefined\t0\tT2_B\tT1_A, T2_B\tundefined\t102\n'
+
+        binDir = self.setupFakeCondor(missing = [7, 900], condorQ = condorQ)
+        try:
+            plugin = CondorPlugin(config)
+
+            # Job 7 is refused, job 900 and most of the others are not queued
+            jobs = [{'jobid': x} for x in range(1, 1201)]
+            results = plugin.kill(jobs = jobs)
+            self.assertEqual(len(results), 1200)
+            self.assertEqual([x for x in results if not results[x]], [7])
+
+            # One condor_rm per batch, the failed ones are checked with condor_q
+            removes = self.getInvocations(binDir, 'condor_rm')
+            self.assertEqual(len(removes), 3)
+            removed = set()
+            for arguments in removes:
+                removed.update([int(x) for x in re.findall('=\?= (\d+)', arguments[1])])
+            self.assertEqual(removed, set(range(1, 1201)))
+            self.assertEqual(len(self.getInvocations(binDir, 'condor_q')), 3)
+            self.assertEqual(plugin.queryJobIDs(), set([7]))
+
+            # All the jobs are there again
+            open(os.path.join(binDir, 'missing'), 'w').close()
+            f = open(os.path.join(binDir, 'condor_q.out'), 'w')
+            f.write(condorQ)
+            f.close()
+            self.assertEqual(len(plugin.getClassAds()), 102)
+
+            # Job 50 leaves the queue before the edit
+            f = open(os.path.join(binDir, 'condor_q.out'), 'w')
+            f.write(''.join([x + '\n' for x in condorQ.splitlines() if not x.endswith('\t50')]))
+            f.close()
+            jobs = [{'id': x} for x in range(1, 103)]
+            jobsToKill = plugin.updateSiteInformation(jobs, 'T1_A', True)
+            self.assertEqual(jobsToKill, [{'id': 101}])
+
+            edits = self.getInvocations(binDir, 'condor_qedit')
+            self.assertEqual(len(edits), 1)
+            self.assertEqual(edits[0][2:], ['DESIRED_Sites', '"T2_B"'])
+            self.assertEqual(sorted([int(x) for x in re.findall('=\?= (\d+)', edits[0][1])]),
+                             range(1, 101))
+
+            # None of the jobs is queued anymore, nothing to edit
+            open(os.path.join(binDir, 'condor_q.out'), 'w').close()
+            jobsToKill = plugin.updateSiteInformation(jobs, 'T1_A', False)
+            self.assertEqual(jobsToKill, [])
+            self.assertEqual(len(self.getInvocations(binDir, 'condor_qedit')), 2)
+        finally:
+            os.environ['PATH'] = self.originalPath
+
+        return
+
+    def testH_ShardedSubmit(self):
+        """
+        _testH_ShardedSubmit_
+
+        Check that the jobs are spread over the schedds by the same worker
+        pool every cycle and that later commands go to the schedd that
+        has the job.
+        """
+        config = self.getConfig()
+        config.BossAir.condorSchedds = ['schedd1', 'schedd2']
+        config.BossAir.nCondorProcesses = 2
+        config.JobSubmitter.jobsPerWorker = 10
+        config.JobSubmitter.submitScript = os.path.join(self.testDir, 'submit.sh')
+
+        jobs = []
+        for jobID in range(1, 101):
+            jobs.append({'id': jobID, 'jobid': jobID, 'retry_count': 0, 'taskID': 1,
+                         'sandbox': os.path.join(self.testDir, 'sandbox%i.box' % (jobID % 2)),
+                         'packageDir': self.testDir, 'cache_dir': self.testDir,
+                         'location': 'T2_US_UCSD'})
+
+        binDir = self.setupFakeCondor(missing = [55])
+        plugin = CondorPlugin(config)
+        try:
+            successful, failed = plugin.submit(jobs = jobs)
+            self.assertEqual(len(successful), 90)
+            self.assertEqual(len(failed), 10)
+            self.assertTrue(55 in [x['id'] for x in failed])
+            self.assertTrue('fwjr' in failed[0])
+
+            submitted = self.getSubmitted(binDir)
+            self.assertEqual(sorted(submitted.keys()), ['schedd1', 'schedd2'])
+            self.assertEqual(sorted(submitted['schedd1'] + submitted['schedd2']),
+                             sorted([x['id'] for x in successful]))
+            for schedd in ['schedd1', 'schedd2']:
+                self.assertTrue(len(submitted[schedd]) >= 40)
+
+            metrics = plugin.getSubmitMetrics()
+            self.assertEqual(metrics['schedd1']['jobs'] + metrics['schedd2']['jobs'], 90)
+            self.assertEqual(metrics['schedd1']['failed'] + metrics['schedd2']['failed'], 10)
+            self.assertTrue(metrics['schedd1']['rate'] > 0)
+
+            # The pool is still there for the next cycle
+            pids = [x.pid for x in plugin.pool]
+            self.assertEqual(len(pids), 2)
+            successful, failed = plugin.submit(jobs = jobs[:20])
+            self.assertEqual(len(successful), 20)
+            self.assertEqual([x.pid for x in plugin.pool], pids)
+
+            # The jobs are removed from the schedd they were submitted to
+            jobID = submitted['schedd2'][0]
+            plugin.kill(jobs = [{'jobid': jobID}])
+            removes = self.getInvocations(binDir, 'condor_rm')
+            self.assertEqual(len(removes), 1)
+            self.assertEqual(removes[0][:2], ['-name', 'schedd2'])
+
+            # condor_q is run on every schedd
+            f = open(os.path.join(binDir, 'condor_q.schedd2.out'), 'w')
+            f.write('1\t0\tundefined\t0\tT1_A\tT1_A\tundefined\t7\n')
+            f.close()
+            nQueries = len(self.getInvocations(binDir, 'condor_q'))
+            jobInfo = plugin.getClassAds()
+            self.assertEqual(jobInfo.keys(), [7])
+            self.assertEqual(len(self.getInvocations(binDir, 'condor_q')), nQueries + 2)
+        finally:
+            plugin.close()
+            os.environ['PATH'] = self.originalPath
+
+        return
+
 
 if __name__ == '__main__':
     unittest.main()
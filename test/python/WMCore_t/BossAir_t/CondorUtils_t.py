@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""
+_CondorUtils_t_
+
+Unit tests for the condor plugin helpers
+"""
+
+import re
+import json
+import time
+import logging
+import unittest
+import StringIO
+
+from nose.plugins.attrib import attr
+
+from WMCore.BossAir.Plugins.CondorUtils import bulkJobAction, jobIDConstraint, \
+                                               parseAutoformat, parseJSON, JobAd, \
+                                               parseJobIDs, ClassAdSnapshot, \
+                                               CLASSAD_ATTRIBUTES
+
+def makeDumps(nJobs):
+    """
+    _makeDumps_
+
+    condor_q output for nJobs jobs in autoformat and JSON, and in the old
+    -format layout
+    """
+    autoformat = []
+    jsonAds    = []
+    oldFormat  = []
+    for jobID in range(nJobs):
+        values = [str(1 + jobID % 2), "1400000000", "undefined" if jobID % 2 else "1400000100",
+                  "1399999000", "T1_US_FNAL,T2_CH_CERN", "T1_US_FNAL,T2_CH_CERN,T2_US_UCSD",
+                  "undefined" if jobID % 2 else "T2_CH_CERN", str(jobID)]
+        autoformat.append("\t".join(values) + "\n")
+        ad = {}
+        old = ""
+        for (attribute, name), value in zip(CLASSAD_ATTRIBUTES, values):
+            if value != "undefined":
+                ad[attribute] = value
+                old += "(%s:%s)  " % (name, value)
+        jsonAds.append(json.dumps(ad))
+        oldFormat.append(old[:-2] + ":::")
+
+    return "".join(autoformat), "[\n" + ",\n".join(jsonAds) + "\n]\n", "".join(oldFormat)
+
+def parseOldFormat(output):
+    """
+    _parseOldFormat_
+
+    How the -format output used to be parsed, kept as a reference
+    """
+    jobInfo = {}
+    for ad in output.split(':::'):
+        if not '(' in ad:
+            continue
+        tmpDict = {}
+        for statement in ad.split('('):
+            if not ':' in statement:
+                continue
+            key = str(statement.split(':')[0])
+            value = statement.split(':')[1].split(')')[0]
+            tmpDict[key] = value
+        jobInfo[int(tmpDict['WMAgentID'])] = tmpDict
+    return jobInfo
+
+class CondorUtilsTest(unittest.TestCase):
+    """
+    _CondorUtilsTest_
+
+    """
+
+    def testA_BulkJobAction(self):
+        """
+        _testA_BulkJobAction_
+
+        The action is called once per batch.  Jobs of a failed batch only
+        count as failed if they are still queued, or all of them if the
+        queue could not be checked.
+        """
+        calls = []
+        def action(batch):
+            calls.append(batch)
+            return not set(batch) & set([3, 17])
+
+        queries = []
+        def queuedJobIDs(batch):
+            queries.append(batch)
+            return set(batch) & set([3, 17])
+
+        results = bulkJobAction(action, range(20), batchSize = 8,
+                                queuedJobIDs = queuedJobIDs)
+        self.assertEqual(sorted(results.keys()), range(20))
+        self.assertEqual(sorted([x for x in results if not results[x]]), [3, 17])
+        self.assertEqual(calls, [range(0, 8), range(8, 16), range(16, 20)])
+        self.assertEqual(queries, [range(0, 8), range(16, 20)])
+
+        # Without a way to check the queue the whole failed batch failed
+        calls = []
+        results = bulkJobAction(action, range(20), batchSize = 8)
+        self.assertEqual(sorted([x for x in results if not results[x]]),
+                         range(0, 8) + range(16, 20))
+        self.assertEqual(len(calls), 3)
+
+        # Same if condor_q failed too
+        results = bulkJobAction(action, range(20), batchSize = 8,
+                                queuedJobIDs = lambda batch: None)
+        self.assertEqual(sorted([x for x in results if not results[x]]),
+                         range(0, 8) + range(16, 20))
+
+        self.assertEqual(jobIDConstraint([1, 2]), "WMAgent_JobID =?= 1 || WMAgent_JobID =?= 2")
+        return
+
+    def testB_Parsers(self):
+        """
+        _testB_Parsers_
+
+        Both output formats give the same ads as the old parser, whatever
+        the size of the chunks they are read in.
+        """
+        autoformat, jsonOutput, oldFormat = makeDumps(50)
+        expected = parseOldFormat(oldFormat)
+
+        for parser, output in [(parseAutoformat, autoformat), (parseJSON, jsonOutput),
+                               (parseAutoformat, autoformat.rstrip("\n"))]:
+            for chunkSize in [1, 7, 65536]:
+                ads = list(parser(StringIO.StringIO(output), chunkSize = chunkSize))
+                self.assertEqual(len(ads), 50)
+                for ad in ads:
+                    self.assertEqual(dict([(x, ad[x]) for x in ad.keys()]),
+                                     expected[int(ad['WMAgentID'])])
+
+        ad = ads[1]
+        self.assertEqual(ad.get('runningCMSSite'), None)
+        self.assertEqual(ad.get('runningTime', 0), 0)
+        self.assertFalse('runningCMSSite' in ad)
+        self.assertRaises(KeyError, ad.__getitem__, 'runningCMSSite')
+        self.assertEqual(ad.get('notAnAttribute', 'x'), 'x')
+
+        # Lines that don't have all the attributes are skipped
+        ads = list(parseAutoformat(StringIO.StringIO("1\t2\n" + autoformat)))
+        self.assertEqual(len(ads), 50)
+        self.assertEqual(list(parseJSON(StringIO.StringIO(""))), [])
+        return
+
+    def testD_Snapshot(self):
+        """
+        _testD_Snapshot_
+
+        Check that the snapshot is only refreshed when it expires and that
+        refreshes only load the jobs that changed.
+        """
+        queue = {}
+        for jobID in range(10):
+            queue[jobID] = JobAd(["1", "100", None, "100", "T1_A", "T1_A", None, str(jobID)])
+        queries = []
+
+        def queryAds(constraint):
+            queries.append(constraint)
+            if constraint == None:
+                return dict(queue)
+            # Only the status changes and the job ID lookups are needed here
+            if constraint.startswith("EnteredCurrentStatus"):
+                since = int(constraint.split()[2])
+                return dict([(x, y) for x, y in queue.items() if int(y.stateTime) >= since])
+            jobIDs = [int(x) for x in re.findall("=\?= (\d+)", constraint)]
+            return dict([(x, queue[x]) for x in jobIDs if x in queue])
+
+        snapshot = ClassAdSnapshot(queryAds, lambda: set(queue.keys()),
+                                   ttl = 60, fullRefresh = 1800, margin = 0)
+
+        self.assertEqual(len(snapshot.getClassAds()), 10)
+        self.assertEqual(len(snapshot.getClassAds()), 10)
+        self.assertTrue(snapshot.cached)
+        self.assertEqual(queries, [None])
+
+        # Job 3 starts running, job 5 leaves the queue, job 10 is queued
+        now = int(time.time())
+        queue[3] = JobAd(["2", str(now), str(now), "100", "T1_A", "T1_A", "T1_A", "3"])
+        del queue[5]
+        queue[10] = JobAd(["1", "100", None, "100", "T1_A", "T1_A", None, "10"])
+        snapshot.lastRefresh = now - 100
+
+        jobAds = snapshot.getClassAds()
+        self.assertFalse(snapshot.cached)
+        self.assertEqual(sorted(jobAds.keys()), [0, 1, 2, 3, 4, 6, 7, 8, 9, 10])
+        self.assertEqual(jobAds[3]['JobStatus'], "2")
+        self.assertEqual(len(queries), 3)
+
+        snapshot.updateJobs([1, 2], 'DESIRED_Sites', "T2_B")
+        snapshot.removeJobs([4])
+        jobAds = snapshot.getClassAds()
+        self.assertEqual(jobAds[1]['DESIRED_Sites'], "T2_B")
+        self.assertFalse(4 in jobAds)
+
+        snapshot.expire()
+        snapshot.getClassAds()
+        self.assertFalse(snapshot.cached)
+
+        metrics = snapshot.getMetrics()
+        self.assertEqual(metrics['fullRefreshes'], 1)
+        self.assertEqual(metrics['deltaRefreshes'], 2)
+        self.assertEqual(metrics['cacheHits'], 2)
+        self.assertEqual(metrics['jobs'], 10)
+        self.assertTrue(metrics['staleness'] < 60)
+
+        self.assertEqual(parseJobIDs(StringIO.StringIO("1\n2\n\n3")), set([1, 2, 3]))
+        return
+
+    @attr('performance')
+    def testC_ParserBenchmark(self):
+        """
+        _testC_ParserBenchmark_
+
+        Time the parsers on the output of a schedd with 150k jobs
+        """
+        autoformat, jsonOutput, oldFormat = makeDumps(150000)
+
+        startTime = time.time()
+        parseOldFormat(oldFormat)
+        logging.info("Old -format parser: %.2fs" % (time.time() - startTime))
+
+        for name, parser, output in [("autoformat", parseAutoformat, autoformat),
+                                     ("json", parseJSON, jsonOutput)]:
+            startTime = time.time()
+            jobInfo = {}
+            for ad in parser(StringIO.StringIO(output)):
+                jobInfo[int(ad.WMAgentID)] = ad
+            logging.info("%s parser: %.2fs" % (name, time.time() - startTime))
+            self.assertEqual(len(jobInfo), 150000)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
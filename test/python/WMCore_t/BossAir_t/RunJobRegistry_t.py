@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+_RunJobRegistry_t_
+
+Unit tests for the registry of the jobs tracked by BossAir
+"""
+
+import time
+import logging
+import unittest
+
+from nose.plugins.attrib import attr
+
+from WMCore.BossAir.RunJob         import RunJob
+from WMCore.BossAir.RunJobRegistry import RunJobRegistry
+
+def makeRows(nJobs, statusTime = 0):
+    """
+    _makeRows_
+
+    bl_runjob rows as returned by LoadRunning
+    """
+    return [{'id': x, 'jobid': 100000 + x, 'gridid': None, 'bulkid': None,
+             'status': 'Idle', 'retry_count': 0, 'status_time': statusTime,
+             'userdn': 'dn', 'usergroup': '', 'userrole': '',
+             'cache_dir': '/tmp/%i' % x} for x in range(nJobs)]
+
+def loadByID(rows):
+    """
+    _loadByID_
+
+    Full information for some rows, as loaded by the LoadByID DAO
+    """
+    loadedJobs = []
+    for row in rows:
+        rj = RunJob()
+        rj.update(row)
+        rj['gridid'] = 'grid-%i' % row['id']
+        rj['plugin'] = 'CondorPlugin'
+        loadedJobs.append(rj)
+    return loadedJobs
+
+class RunJobRegistryTest(unittest.TestCase):
+    """
+    _RunJobRegistryTest_
+
+    """
+
+    def cycle(self, registry, rows, runJobIDs = None, wmbsIDs = None):
+        """
+        _cycle_
+
+        What BossAirAPI.track does to get the jobs to track, returns the
+        jobs and the number of them that were loaded by ID
+        """
+        registry.sync(rows)
+        selected = registry.select(runJobIDs = runJobIDs, wmbsIDs = wmbsIDs)
+        toLoad = registry.unloaded(selected)
+        registry.addLoaded(loadByID(toLoad))
+        return registry.getRunJobs(selected), len(toLoad)
+
+    def testA_Registry(self):
+        """
+        _testA_Registry_
+
+        Only new and changed jobs are loaded again, jobs are selected by
+        RunJob and WMBS IDs.
+        """
+        registry = RunJobRegistry()
+        rows = makeRows(10)
+
+        runJobs, nLoaded = self.cycle(registry, rows)
+        self.assertEqual(nLoaded, 10)
+        self.assertEqual(len(runJobs), 10)
+        self.assertEqual(runJobs[0]['plugin'], 'CondorPlugin')
+        self.assertEqual(runJobs[0]['gridid'], 'grid-0')
+        self.assertEqual(runJobs[0]['cache_dir'], '/tmp/0')
+
+        # The plugins change the jobs they track
+        runJobs[0]['status'] = 'Running'
+
+        # Job 3 changes status, job 5 isn't active anymore
+        rows = makeRows(10)
+        rows[3]['status'] = 'Running'
+        del rows[5]
+        runJobs, nLoaded = self.cycle(registry, rows)
+        self.assertEqual(nLoaded, 1)
+        self.assertEqual(len(runJobs), 9)
+        byID = dict([(x['id'], x) for x in runJobs])
+        self.assertFalse(5 in byID)
+        self.assertEqual(byID[3]['status'], 'Running')
+        self.assertEqual(byID[0]['status'], 'Idle')
+
+        runJobs, nLoaded = self.cycle(registry, rows, runJobIDs = [1, 2, 5, 7])
+        self.assertEqual(nLoaded, 0)
+        self.assertEqual(sorted([x['id'] for x in runJobs]), [1, 2, 7])
+        runJobs, nLoaded = self.cycle(registry, rows, wmbsIDs = [100001, 100005, 100008])
+        self.assertEqual(sorted([x['id'] for x in runJobs]), [1, 8])
+        runJobs, nLoaded = self.cycle(registry, rows, runJobIDs = [1, 2], wmbsIDs = [100002, 100003])
+        self.assertEqual([x['id'] for x in runJobs], [2])
+
+        # A new retry of the job 2, the DAO returns new rows every cycle
+        rows = [dict(x) for x in rows]
+        rows[2]['retry_count'] = 1
+        rows.append(makeRows(11)[10])
+        runJobs, nLoaded = self.cycle(registry, rows, wmbsIDs = [100002, 100010])
+        self.assertEqual(nLoaded, 2)
+        self.assertEqual(len(registry), 10)
+        self.assertEqual(sorted(registry.byWMBSID.keys()),
+                         [100000 + x for x in range(11) if x != 5])
+        return
+
+    @attr('performance')
+    def testB_TrackCycleBenchmark(self):
+        """
+        _testB_TrackCycleBenchmark_
+
+        Time a track cycle for up to 200k running jobs, 1% of them changing
+        between cycles, against the list filtering and matching it replaces.
+        """
+        for nJobs in [1000, 10000, 50000, 200000]:
+            registry = RunJobRegistry()
+            self.cycle(registry, makeRows(nJobs))
+            rows = makeRows(nJobs)
+            for row in rows[::100]:
+                row['status'] = 'Running'
+            wmbsIDs = [100000 + x for x in range(0, nJobs, 2)]
+
+            startTime = time.time()
+            runJobs, nLoaded = self.cycle(registry, rows, wmbsIDs = wmbsIDs)
+            logging.info("%i jobs, registry: %.3fs, %i loaded" % (nJobs, time.time() - startTime, nLoaded))
+            self.assertEqual(len(runJobs), nJobs // 2)
+
+            if nJobs > 10000:
+                # The old way is quadratic
+                continue
+            startTime = time.time()
+            runningJobs = []
+            for row in rows:
+                rj = RunJob()
+                rj.update(row)
+                runningJobs.append(rj)
+            for job in runningJobs:
+                if not job['jobid'] in wmbsIDs:
+                    runningJobs.remove(job)
+            for loadJob in loadByID(runningJobs):
+                for rj in runningJobs:
+                    if rj['id'] == loadJob['id']:
+                        break
+            logging.info("%i jobs, old: %.3fs, %i loaded" % (nJobs, time.time() - startTime, len(runningJobs)))
+        return
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+_LRUCache_t_
+
+Unit tests for the bounded LRU dictionary
+"""
+
+import unittest
+
+from WMCore.Cache.LRUCache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+    """
+    _LRUCacheTest_
+
+    """
+    def testA_Eviction(self):
+        """
+        _testA_Eviction_
+
+        The least recently used entries are evicted first
+        """
+        cache = LRUCache(maxSize = 3)
+        for key in ["a", "b", "c"]:
+            cache[key] = key.upper()
+        self.assertEqual(len(cache), 3)
+
+        # Reading "a" makes "b" the least recently used one
+        self.assertEqual(cache.get("a"), "A")
+        cache["d"] = "D"
+        self.assertFalse("b" in cache)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("b", 0), 0)
+        self.assertEqual(sorted(cache.entries.keys()), ["a", "c", "d"])
+
+        # Writing "c" again makes it the most recently used one
+        cache["c"] = "CC"
+        cache["e"] = "E"
+        cache["f"] = "F"
+        self.assertEqual(cache.entries.keys(), ["c", "e", "f"])
+        self.assertEqual(cache["c"], "CC")
+        self.assertRaises(KeyError, cache.__getitem__, "a")
+
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'evictions': 3,
+                                         'entries': 3, 'maxSize': 3})
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        return
+
+    def testB_SizeOf(self):
+        """
+        _testB_SizeOf_
+
+        Entries are evicted by the sizes of their values if asked to
+        """
+        cache = LRUCache(maxSize = 10, sizeOf = len)
+        cache["a"] = "aaaa"
+        cache["b"] = "bbbb"
+        self.assertEqual(cache.currentSize, 8)
+        cache["a"] = "aa"
+        self.assertEqual(cache.currentSize, 6)
+        cache["c"] = "cccccc"
+        self.assertEqual(cache.entries.keys(), ["a", "c"])
+        self.assertEqual(cache.currentSize, 8)
+
+        # The entry just written is kept even if it doesn't fit
+        cache["d"] = "d" * 20
+        self.assertEqual(cache.entries.keys(), ["d"])
+        self.assertEqual(cache.pop("d"), "d" * 20)
+        self.assertEqual(cache.currentSize, 0)
+
+        cache["e"] = "eeee"
+        cache["f"] = "ffff"
+        cache.resize(5)
+        self.assertEqual(cache.entries.keys(), ["f"])
+        self.assertEqual(cache.stats()['evictions'], 4)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
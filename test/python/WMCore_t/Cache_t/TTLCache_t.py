@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+_TTLCache_t_
+
+Unit tests for the expiring, thread safe LRU cache
+"""
+
+import time
+import threading
+import unittest
+
+from WMCore.Cache.TTLCache import TTLCache
+
+
+class TTLCacheTest(unittest.TestCase):
+    """
+    _TTLCacheTest_
+
+    """
+    def testA_Expiry(self):
+        """
+        _testA_Expiry_
+
+        Values are refreshed once expired, errors are not cached
+        """
+        cache = TTLCache(maxSize = 2)
+        calls = []
+        def refresh():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cache.get("a", 60, refresh), 1)
+        self.assertEqual(cache.get("a", 60, refresh), 1)
+        self.assertEqual(cache.get("b", 0, refresh), 2)
+        self.assertEqual(cache.get("b", 0, refresh), 3)
+
+        cache.remove("a")
+        self.assertEqual(cache.get("a", 60, refresh), 4)
+        cache.get("c", 60, refresh)
+        self.assertEqual(cache.statistics()['evictions'], 1)
+
+        def failure():
+            raise RuntimeError("service down")
+        self.assertRaises(RuntimeError, cache.get, "d", 60, failure)
+        self.assertEqual(cache.get("d", 60, refresh), 6)
+
+        stats = cache.statistics()
+        self.assertEqual((stats['hits'], stats['misses'], stats['refreshes'], stats['errors']),
+                         (1, 7, 6, 1))
+        self.assertEqual(stats['entries'], 2)
+        cache.clear()
+        self.assertEqual(cache.statistics()['entries'], 0)
+        return
+
+    def testB_Coalescing(self):
+        """
+        _testB_Coalescing_
+
+        Threads asking for a key being refreshed wait for that refresh
+        """
+        cache = TTLCache()
+        calls = []
+        def refresh():
+            calls.append(1)
+            time.sleep(0.2)
+            return "value"
+
+        results = []
+        def worker():
+            results.append(cache.get("key", 60, refresh))
+        threads = [threading.Thread(target = worker) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+        stats = cache.statistics()
+        self.assertEqual(stats['refreshes'], 1)
+        # The threads that waited find the value once woken up
+        self.assertEqual((stats['misses'], stats['hits']), (1, 4))
+        self.assertTrue(stats['coalesced'] <= 4)
+        self.assertTrue(stats['maxRefreshTime'] >= 0.2)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""
+_WMSpecCache_t_
+
+Unit tests for the process wide WMWorkload spec cache
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from WMCore.Cache.WMSpecCache import WMSpecCache
+from WMCore.WMSpec.WMWorkload import newWorkload
+
+
+class WMSpecCacheTest(unittest.TestCase):
+    """
+    _WMSpecCacheTest_
+
+    """
+    def setUp(self):
+        """
+        _setUp_
+
+        Create a scratch directory for the specs
+        """
+        self.testDir = tempfile.mkdtemp()
+        return
+
+    def tearDown(self):
+        """
+        _tearDown_
+
+        Remove the scratch directory
+        """
+        shutil.rmtree(self.testDir)
+        return
+
+    def writeSpec(self, name, fileName = None):
+        """
+        _writeSpec_
+
+        Save an empty workload to the test directory, return its path
+        """
+        specPath = os.path.join(self.testDir, "%s.pkl" % (fileName or name))
+        workload = newWorkload(name)
+        workload.save(specPath)
+        return specPath
+
+    def testA_HitsAndMisses(self):
+        """
+        _testA_HitsAndMisses_
+
+        Check that a spec is only unpickled once while it does not change
+        """
+        specCache = WMSpecCache()
+        specPath = self.writeSpec("TestWorkload")
+
+        workload = specCache.get(specPath)
+        self.assertEqual(workload.name(), "TestWorkload")
+        for _ in range(5):
+            self.assertTrue(specCache.get(specPath) is workload)
+
+        stats = specCache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 5)
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['size'], os.path.getsize(specPath))
+
+        self.assertEqual(specCache.get(os.path.join(self.testDir, "missing.pkl")), None)
+        return
+
+    def testB_Reload(self):
+        """
+        _testB_Reload_
+
+        Check that a spec is reloaded when the file changes
+        """
+        specCache = WMSpecCache()
+        specPath = self.writeSpec("TestWorkload")
+        workload = specCache.get(specPath)
+
+        self.writeSpec("AnotherTestWorkload", fileName = "TestWorkload")
+        stamp = time.time() + 10
+        os.utime(specPath, (stamp, stamp))
+
+        reloaded = specCache.get(specPath)
+        self.assertFalse(reloaded is workload)
+        self.assertEqual(reloaded.name(), "AnotherTestWorkload")
+        self.assertEqual(specCache.stats()['reloads'], 1)
+        self.assertEqual(specCache.stats()['entries'], 1)
+
+        specCache.invalidate(specPath)
+        self.assertEqual(specCache.stats()['entries'], 0)
+        self.assertEqual(specCache.stats()['size'], 0)
+        return
+
+    def testC_Eviction(self):
+        """
+        _testC_Eviction_
+
+        Check that the least recently used specs are evicted first
+        """
+        specA = self.writeSpec("WorkloadA")
+        specB = self.writeSpec("WorkloadB")
+        specC = self.writeSpec("WorkloadC")
+        specCache = WMSpecCache(maxSize = os.path.getsize(specA) + os.path.getsize(specB))
+
+        specCache.get(specA)
+        specCache.get(specB)
+        specCache.get(specA)
+        specCache.get(specC)
+
+        stats = specCache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['entries'], 2)
+        self.assertTrue(specA in specCache.entries)
+        self.assertFalse(specB in specCache.entries)
+
+        specCache.setMaxSize(0)
+        self.assertEqual(specCache.stats()['entries'], 1)
+        self.assertTrue(specC in specCache.entries)
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
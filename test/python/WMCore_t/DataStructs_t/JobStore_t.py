@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+_JobStore_t_
+
+Unittests for the append only job record store
+"""
+
+import os
+import cPickle
+import unittest
+
+from WMQuality.TestInit import TestInit
+
+from WMCore.DataStructs.File import File
+from WMCore.DataStructs.Job import Job
+from WMCore.DataStructs.JobStore import JobStore, jobStoreDir, loadLegacyJob, \
+                                        HEADER_FILE
+
+class JobStoreTest(unittest.TestCase):
+    def setUp(self):
+        """
+        _setUp_
+
+        Create a work directory for the store
+        """
+        self.testInit = TestInit(__file__)
+        self.testDir = self.testInit.generateWorkDir()
+        return
+
+    def tearDown(self):
+        """
+        _tearDown_
+
+        Remove the work directory
+        """
+        self.testInit.delWorkDir()
+        return
+
+    def makeJob(self, jobID):
+        """
+        _makeJob_
+
+        Create a job with one input file
+        """
+        testFile = File(lfn = "/this/is/file%d" % jobID, locations = set(["se1.cern.ch"]))
+        newJob = Job("Job%d" % jobID, files = [testFile])
+        newJob["id"] = jobID
+        newJob["sandbox"] = "/path/to/sandbox.tar.bz2"
+        newJob["cache_dir"] = os.path.join(self.testDir, "job_%d" % jobID)
+        newJob["siteWhitelist"] = ["T1_US_FNAL"]
+        newJob["ownerDN"] = "/DC=org/CN=someone"
+        return newJob
+
+    def testA_AppendAndRead(self):
+        """
+        _testA_AppendAndRead_
+
+        Verify that headers and bodies written to the store can be read back.
+        """
+        jobStore = JobStore(self.testDir)
+        self.assertFalse(jobStore.exists())
+
+        jobStore.append([self.makeJob(i) for i in range(1, 51)])
+        for i in range(51, 101):
+            jobStore.add(self.makeJob(i))
+        jobStore.flush()
+        self.assertTrue(jobStore.exists())
+
+        headers = JobStore(self.testDir).loadHeaders()
+        self.assertEqual(len(headers), 100)
+        self.assertEqual(headers[7]["name"], "Job7")
+        self.assertEqual(headers[7]["locations"], ["se1.cern.ch"])
+        self.assertEqual(headers[7]["siteWhitelist"], ["T1_US_FNAL"])
+        self.assertEqual(headers[7]["siteBlacklist"], [])
+        self.assertEqual(headers[7]["ownerDN"], "/DC=org/CN=someone")
+        self.assertEqual(headers[7]["numberOfCores"], 1)
+
+        readStore = JobStore(self.testDir)
+        for jobID in [100, 3, 57]:
+            loadedJob = readStore.loadJob(headers[jobID])
+            self.assertEqual(loadedJob["id"], jobID)
+            self.assertEqual(loadedJob["input_files"][0]["lfn"], "/this/is/file%d" % jobID)
+        readStore.close()
+
+        # The latest record wins
+        updatedJob = self.makeJob(7)
+        updatedJob.getBaggage().numberOfCores = 4
+        jobStore.append([updatedJob])
+        headers = jobStore.loadHeaders()
+        self.assertEqual(len(headers), 100)
+        self.assertEqual(headers[7]["numberOfCores"], 4)
+        self.assertEqual(jobStore.loadJob(headers[7]).getBaggage().numberOfCores, 4)
+        jobStore.close()
+        return
+
+    def testB_TruncatedHeader(self):
+        """
+        _testB_TruncatedHeader_
+
+        Verify that a partially written header is ignored.
+        """
+        jobStore = JobStore(self.testDir)
+        jobStore.append([self.makeJob(1), self.makeJob(2)])
+
+        headerPath = os.path.join(self.testDir, HEADER_FILE)
+        headerData = open(headerPath, "rb").read()
+        handle = open(headerPath, "ab")
+        handle.write(headerData[:len(headerData) / 3])
+        handle.close()
+
+        self.assertEqual(sorted(jobStore.loadHeaders().keys()), [1, 2])
+        return
+
+    def testC_LegacyJob(self):
+        """
+        _testC_LegacyJob_
+
+        Verify that jobs pickled in job.pkl files can still be read.
+        """
+        newJob = self.makeJob(1)
+        os.makedirs(newJob["cache_dir"])
+        self.assertEqual(jobStoreDir(newJob["cache_dir"]), self.testDir)
+        self.assertEqual(loadLegacyJob(newJob["cache_dir"]), None)
+
+        handle = open(os.path.join(newJob["cache_dir"], "job.pkl"), "w")
+        cPickle.dump(newJob, handle, cPickle.HIGHEST_PROTOCOL)
+        handle.close()
+
+        loadedJob = loadLegacyJob(newJob["cache_dir"])
+        self.assertEqual(loadedJob["name"], "Job1")
+        return
+
+if __name__ == "__main__":
+    unittest.main()
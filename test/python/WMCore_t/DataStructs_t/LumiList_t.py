@@ -1,9 +1,15 @@
 #! /usr/bin/env python
 
+import time
+import logging
 import unittest
 
+from nose.plugins.attrib import attr
+
 #import FWCore.ParameterSet.Config as cms
 from WMCore.DataStructs.LumiList import LumiList
+from WMCore.DataStructs.Mask import Mask
+from WMCore.DataStructs.Run import Run
 
 class LumiListTest(unittest.TestCase):
     """
@@ -298,5 +304,79 @@ class LumiListTest(unittest.TestCase):
         self.assertEqual(LumiList(compactList=acl).getCMSSWString(), LumiList(compactList=ccl).getCMSSWString())
         self.assertEqual(LumiList(compactList=acl).getCMSSWString(), LumiList(compactList=dcl).getCMSSWString())
 
+    def testContains(self):
+        """
+        Test membership, including ranges open to the end of the run
+        """
+        a = LumiList(compactList = {'1': [[1, 10], [20, 30]], '2': [[5, 0]]})
+
+        self.assertTrue(a.contains(1, 1))
+        self.assertTrue(a.contains(1, 25))
+        self.assertFalse(a.contains(1, 15))
+        self.assertFalse(a.contains(1, 31))
+        self.assertTrue((2, 1000) in a)
+        self.assertFalse((2, 4) in a)
+        self.assertFalse(a.contains(3, 1))
+        self.assertTrue(a.contains(1))
+        self.assertEqual(a.filterLumis([(1, 30), (2, 3), (1, 11), (2, 6), (1, 5)]),
+                         [(1, 30), (1, 5)])
+
+        # a range open to the end of the run followed by other ranges
+        b = LumiList(compactList = {'1': [[1, 0], [5, 7]]})
+        self.assertTrue(b.contains(1, 10))
+        self.assertTrue(b.contains(1, 6))
+        self.assertTrue(b.contains(1, 1))
+        self.assertFalse(b.contains(1, 0))
+
+    @attr('performance')
+    def testBenchmark(self):
+        """
+        Time the set operations on large lists against the same operations
+        on sets of lumis.
+        """
+        nRuns  = 20
+        aLumis = {}
+        bLumis = {}
+        for run in range(1, nRuns + 1):
+            aLumis[run] = [x for x in range(1, 50001) if x % 7 != 0]
+            bLumis[run] = [x for x in range(25000, 75001) if x % 11 != 0]
+
+        startTime = time.time()
+        a = LumiList(runsAndLumis = aLumis)
+        b = LumiList(runsAndLumis = bLumis)
+        results = [a | b, a & b, a - b]
+        filtered = a.filterLumis([(run, x) for run in bLumis for x in bLumis[run]])
+        rangeTime = time.time() - startTime
+
+        startTime = time.time()
+        aSets = dict([(run, set(x)) for run, x in aLumis.items()])
+        bSets = dict([(run, set(x)) for run, x in bLumis.items()])
+        expected = [dict([(run, aSets[run] | bSets[run]) for run in aSets]),
+                    dict([(run, aSets[run] & bSets[run]) for run in aSets]),
+                    dict([(run, aSets[run] - bSets[run]) for run in aSets])]
+        expectedFiltered = [(run, x) for run in bLumis for x in bLumis[run] if x in aSets[run]]
+        setTime = time.time() - startTime
+
+        for result, lumis in zip(results, expected):
+            self.assertEqual(result.getCompactList(),
+                             LumiList(runsAndLumis = lumis).getCompactList())
+        self.assertEqual(filtered, expectedFiltered)
+        logging.info("LumiList: %.2fs with ranges, %.2fs with sets of lumis" % (rangeTime, setTime))
+
+        mask = Mask()
+        for run in range(1, nRuns + 1):
+            mask.addRunWithLumiRanges(run = run, lumiList = [[x, x + 500] for x in range(1, 1000000, 1000)])
+        runs = [Run(run, *aLumis[run]) for run in aLumis]
+        startTime = time.time()
+        newRuns = mask.filterRunLumisByMask(runs = runs)
+        logging.info("Mask: filtered %i lumis in %.2fs" % (sum([len(x) for x in newRuns]),
+                                                            time.time() - startTime))
+
+        startTime = time.time()
+        run = Run(1, *aLumis[1])
+        run + Run(1, *bLumis[1])
+        self.assertEqual(len(run), len(aSets[1] | bSets[1]))
+        logging.info("Run: added %i lumis in %.2fs" % (len(bLumis[1]), time.time() - startTime))
+
 if __name__ == '__main__':
     unittest.main()
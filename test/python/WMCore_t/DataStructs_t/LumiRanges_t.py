@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+_LumiRanges_t_
+
+Unit tests for the lumi range set algebra, checked against sets of lumis.
+"""
+
+import random
+import unittest
+
+from WMCore.DataStructs.LumiRanges import compactLumis, mergeRanges, unionRanges, \
+                                         intersectRanges, subtractRanges, \
+                                         rangesContain, filterLumis
+
+class LumiRangesTest(unittest.TestCase):
+    """
+    _LumiRangesTest_
+
+    """
+
+    def randomLumis(self, maxLumi = 300):
+        """
+        _randomLumis_
+
+        Random set of lumis with runs of consecutive lumis
+        """
+        lumis = set()
+        for i in range(random.randint(0, 20)):
+            first = random.randint(1, maxLumi)
+            lumis.update(range(first, first + random.randint(1, 25)))
+        return lumis
+
+    def expand(self, ranges):
+        """
+        _expand_
+
+        Set of lumis in a list of ranges
+        """
+        lumis = set()
+        for first, last in ranges:
+            lumis.update(range(first, last + 1))
+        return lumis
+
+    def testA_Compact(self):
+        """
+        _testA_Compact_
+
+        Test compacting lumis and merging ranges
+        """
+        ranges, duplicates = compactLumis([5, 1, 2, 3, 9, 2, 10, 5])
+        self.assertEqual(ranges, [[1, 3], [5, 5], [9, 10]])
+        self.assertEqual(duplicates, [2, 5])
+        self.assertEqual(compactLumis([]), ([], []))
+
+        self.assertEqual(mergeRanges([[8, 9], [1, 2], [3, 4], [2, 3], [11, 11]]),
+                         [[1, 4], [8, 9], [11, 11]])
+        self.assertEqual(mergeRanges([[1, 10], [2, 3]]), [[1, 10]])
+        return
+
+    def testB_SetOperations(self):
+        """
+        _testB_SetOperations_
+
+        Compare the range operations with the same operations on sets of
+        lumis for random inputs.
+        """
+        random.seed(12345)
+        for i in range(500):
+            aLumis = self.randomLumis()
+            bLumis = self.randomLumis()
+            aRanges = compactLumis(aLumis)[0]
+            bRanges = compactLumis(bLumis)[0]
+
+            for ranges, lumis in [(unionRanges(aRanges, bRanges), aLumis | bLumis),
+                                  (intersectRanges(aRanges, bRanges), aLumis & bLumis),
+                                  (subtractRanges(aRanges, bRanges), aLumis - bLumis),
+                                  (subtractRanges(bRanges, aRanges), bLumis - aLumis)]:
+                self.assertEqual(ranges, compactLumis(lumis)[0])
+                self.assertEqual(self.expand(ranges), lumis)
+
+            for lumi in range(0, 350):
+                self.assertEqual(rangesContain(aRanges, lumi), lumi in aLumis)
+
+            candidates = range(0, 350, 3)
+            self.assertEqual(filterLumis(aRanges, candidates),
+                             sorted(aLumis.intersection(candidates)))
+        return
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+_CMSCouchAsync_t_
+
+Test the asynchronous bulk commits of CMSCouch against a small HTTP server
+standing in for CouchDB.
+"""
+
+import json
+import time
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+from WMCore.Database.CMSCouch import Database, CouchInternalServerError
+
+class FakeCouchHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    _FakeCouchHandler_
+
+    Answer _bulk_docs posts, documents with an ID starting with "conflict"
+    conflict and a document with the ID "fail" fails the whole post.
+    """
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.posting += 1
+            server.maxPosting = max(server.maxPosting, server.posting)
+
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(server.delay)
+
+        status = 201
+        result = []
+        for doc in body["docs"]:
+            if doc["_id"] == "fail":
+                status = 500
+            elif doc["_id"].startswith("conflict"):
+                result.append({"id": doc["_id"], "error": "conflict",
+                               "reason": "Document update conflict."})
+            else:
+                result.append({"id": doc["_id"], "rev": "1-fake"})
+
+        with server.lock:
+            server.posting -= 1
+            if status == 201:
+                server.posts.append([doc["_id"] for doc in body["docs"]])
+
+        if status != 201:
+            result = {"error": "unknown", "reason": "failed on purpose"}
+        data = json.dumps(result)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        return
+
+    def log_message(self, format, *args):
+        return
+
+class FakeCouchServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    _FakeCouchServer_
+
+    """
+    daemon_threads = True
+
+    def __init__(self, delay = 0.0):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), FakeCouchHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.posting = 0
+        self.maxPosting = 0
+        self.posts = []
+
+class CMSCouchAsyncTest(unittest.TestCase):
+    """
+    _CMSCouchAsyncTest_
+
+    """
+    def setUp(self):
+        self.server = FakeCouchServer(delay = 0.05)
+        self.serverThread = threading.Thread(target = self.server.serve_forever)
+        self.serverThread.setDaemon(True)
+        self.serverThread.start()
+        self.url = "http://127.0.0.1:%i" % self.server.server_address[1]
+        return
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+    def testA_AsyncCommit(self):
+        """
+        _testA_AsyncCommit_
+
+        Full queues are posted in parallel by the writers, flush waits for them
+        """
+        db = Database("async_t", url = self.url, size = 10)
+        db.startAsyncCommit(writers = 3, maxPending = 10)
+
+        startTime = time.time()
+        for i in range(95):
+            db.queue({"_id": "doc%i" % i})
+        db.commit()
+        self.assertTrue(time.time() - startTime < 0.25)
+
+        db.flush()
+        self.assertEqual(len(self.server.posts), 10)
+        self.assertEqual(sorted([len(x) for x in self.server.posts]), [5] + [10] * 9)
+        self.assertEqual(sorted(sum(self.server.posts, [])),
+                         sorted(["doc%i" % i for i in range(95)]))
+        self.assertTrue(self.server.maxPosting > 1)
+
+        stats = db.asyncCommitStats()
+        self.assertEqual(stats["commits"], 10)
+        self.assertEqual(stats["docs"], 95)
+        self.assertEqual(stats["inFlight"], 0)
+        self.assertEqual(stats["queued"], 0)
+
+        db.stopAsyncCommit()
+        self.assertEqual(db.asyncCommitStats(), None)
+
+        # Back to posting in commit
+        db.queue({"_id": "sync"})
+        self.assertEqual(db.commit(), [{"id": "sync", "rev": "1-fake"}])
+        return
+
+    def testB_Conflicts(self):
+        """
+        _testB_Conflicts_
+
+        Conflict callbacks run in the thread flushing the database
+        """
+        callbacks = []
+        def callback(database, data, result):
+            callbacks.append((database, threading.currentThread(),
+                              [x["_id"] for x in data["docs"]], result["id"]))
+            return result
+
+        db = Database("async_t", url = self.url, size = 3)
+        db.startAsyncCommit(writers = 2)
+        for docID in ["a", "conflict1", "b", "c", "conflict2"]:
+            db.queue({"_id": docID}, callback = callback)
+        db.flush(callback = callback)
+        db.stopAsyncCommit()
+
+        self.assertEqual(sorted([x[3] for x in callbacks]), ["conflict1", "conflict2"])
+        for (database, thread, docs, docID) in callbacks:
+            self.assertTrue(database is db)
+            self.assertTrue(thread is threading.currentThread())
+            self.assertTrue(docID in docs)
+        return
+
+    def testC_Backpressure(self):
+        """
+        _testC_Backpressure_
+
+        Callers block once maxPending commits wait for the writers
+        """
+        self.server.delay = 0.1
+        db = Database("async_t", url = self.url, size = 1)
+        db.startAsyncCommit(writers = 1, maxPending = 1)
+
+        for i in range(5):
+            db.queue({"_id": "doc%i" % i})
+        stats = db.asyncCommitStats()
+        self.assertTrue(stats["blocked"] >= 1)
+        self.assertTrue(stats["blockedTime"] > 0)
+        self.assertTrue(stats["inFlight"] <= 2)
+
+        db.stopAsyncCommit()
+        self.assertEqual(db.asyncCommitStats(), None)
+        self.assertEqual(len(self.server.posts), 5)
+        self.assertEqual(self.server.maxPosting, 1)
+        return
+
+    def testD_Errors(self):
+        """
+        _testD_Errors_
+
+        Errors of the writers are raised by flush
+        """
+        db = Database("async_t", url = self.url, size = 2)
+        db.startAsyncCommit(writers = 2)
+        for docID in ["a", "fail", "b", "c"]:
+            db.queue({"_id": docID})
+        self.assertRaises(CouchInternalServerError, db.flush)
+        self.assertEqual(db.asyncCommitStats()["errors"], 1)
+
+        # Only reported once, the writers keep going
+        db.queue({"_id": "d"})
+        db.flush()
+        self.assertEqual(sorted(sum(self.server.posts, [])), ["b", "c", "d"])
+        db.stopAsyncCommit()
+        return
+
+if __name__ == '__main__':
+    unittest.main()
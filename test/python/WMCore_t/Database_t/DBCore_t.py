@@ -11,8 +11,12 @@ Unit tests for the DBInterface class
 import unittest
 import logging
 import threading
+import time
+
+from nose.plugins.attrib import attr
 
 from WMQuality.TestInit import TestInit
+from WMCore.Database.DBFactory import DBFactory
 
 class DBCoreTest(unittest.TestCase):
     def setUp(self):
@@ -315,5 +319,117 @@ class DBCoreTest(unittest.TestCase):
 
         return
 
+class DBCoreSQLiteTest(unittest.TestCase):
+    """
+    _DBCoreSQLiteTest_
+
+    DBInterface tests that run on an in memory SQLite database
+    """
+    def setUp(self):
+        """
+        _setUp_
+
+        Create a table in an in memory database
+        """
+        self.dbi = DBFactory(logging.getLogger(), "sqlite://").connect()
+        self.dbi.engine.execute("""CREATE TABLE test_keys (id INTEGER PRIMARY KEY,
+                                                           name VARCHAR(255))""")
+        return
+
+    def testBindStream(self):
+        """
+        _testBindStream_
+
+        Verify that binds can be given as a generator and that they are
+        executed in batches.
+        """
+        self.dbi.maxBindsPerQuery = 7
+        insertSQL = "INSERT INTO test_keys (id, name) VALUES (:id, :name)"
+
+        result = self.dbi.processData(insertSQL, ({"id": x, "name": "key%d" % x} for x in range(100)))
+        self.assertEqual(len(result), 15)
+        self.assertEqual(self.dbi.processData(insertSQL, (x for x in [])), [])
+
+        resultSets = self.dbi.processData("SELECT id, name FROM test_keys")
+        self.assertEqual(len(resultSets[0].fetchall()), 100)
+        return
+
+    def testInListSelect(self):
+        """
+        _testInListSelect_
+
+        Verify that selects for many values of a single key return the same
+        rows as one select per key.
+        """
+        self.dbi.maxInListSize = 10
+        self.dbi.processData("INSERT INTO test_keys (id, name) VALUES (:id, :name)",
+                             [{"id": x, "name": "key%d" % x} for x in range(100)])
+
+        selectSQL = "SELECT id, name FROM test_keys WHERE name = :name"
+        binds = [{"name": "key%d" % x} for x in range(0, 100, 3)] + [{"name": "missing"}]
+        queries = self.dbi.inListSelects(selectSQL, binds)
+        self.assertEqual(len(queries), 4)
+        self.assertTrue("IN (:name_0, :name_1" in queries[0][0])
+
+        resultSets = self.dbi.processData(selectSQL, binds)
+        self.assertEqual(len(resultSets), 1)
+        self.assertEqual(sorted([x[0] for x in resultSets[0].fetchall()]), range(0, 100, 3))
+
+        # Those have to run once per bind
+        self.assertEqual(self.dbi.inListSelects(selectSQL, binds + [{"name": "key0"}]), None)
+        self.assertEqual(self.dbi.inListSelects("SELECT COUNT(*) FROM test_keys WHERE name = :name",
+                                                binds), None)
+        self.assertEqual(self.dbi.inListSelects("SELECT id FROM test_keys WHERE id >= :name",
+                                                binds), None)
+        self.assertEqual(self.dbi.inListSelects("SELECT id FROM test_keys WHERE id = :id AND name = :name",
+                                                [{"id": 1, "name": "key1"}, {"id": 2, "name": "key2"}]), None)
+        self.assertEqual(self.dbi.inListSelects("SELECT id FROM test_keys WHERE id = 1 OR name = :name",
+                                                binds), None)
+
+        resultSets = self.dbi.processData("SELECT COUNT(*) FROM test_keys WHERE name = :name",
+                                          [{"name": "key1"}, {"name": "key2"}])
+        self.assertEqual(resultSets[0].fetchall(), [(1,), (1,)])
+
+        # The row matching every key comes back once per bind
+        resultSets = self.dbi.processData("SELECT id FROM test_keys WHERE id = 1 OR name = :name",
+                                          [{"name": "key2"}, {"name": "key3"}])
+        self.assertEqual(sorted(resultSets[0].fetchall()), [(1,), (1,), (2,), (3,)])
+
+        # One cursor for each bind
+        cursors = self.dbi.processData(selectSQL, binds[:3], returnCursor = True)
+        self.assertEqual([x.fetchall() for x in cursors], [[(0, "key0")], [(3, "key3")], [(6, "key6")]])
+        return
+
+    @attr("performance")
+    def testBindBatchingBenchmark(self):
+        """
+        _testBindBatchingBenchmark_
+
+        Time inserting 200k rows from a list and from a generator and
+        selecting 20k of them by key.
+        """
+        nRows = 200000
+        insertSQL = "INSERT INTO test_keys (id, name) VALUES (:id, :name)"
+
+        startTime = time.time()
+        self.dbi.processData(insertSQL, [{"id": x, "name": "key%d" % x} for x in range(nRows)])
+        listTime = time.time() - startTime
+        self.dbi.engine.execute("DELETE FROM test_keys")
+
+        startTime = time.time()
+        self.dbi.processData(insertSQL, ({"id": x, "name": "key%d" % x} for x in xrange(nRows)))
+        streamTime = time.time() - startTime
+
+        binds = [{"name": "key%d" % x} for x in range(0, nRows, 10)]
+        startTime = time.time()
+        resultSets = self.dbi.processData("SELECT id FROM test_keys WHERE name = :name", binds)
+        selectTime = time.time() - startTime
+
+        logging.info("Inserted %d rows from a list in %.2f seconds, from a generator in %.2f seconds" % \
+                     (nRows, listTime, streamTime))
+        logging.info("Selected %d keys in %.2f seconds" % (len(binds), selectTime))
+        self.assertEqual(sum([len(x.fetchall()) for x in resultSets]), len(binds))
+        return
+
 if __name__ == "__main__":
     unittest.main()
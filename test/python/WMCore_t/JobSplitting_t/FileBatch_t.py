@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""
+_FileBatch_t_
+
+Test loading files for job splitting in columnar batches
+"""
+
+import unittest
+
+from WMCore.JobSplitting.JobFactory import JobFactory
+
+class FakeProxy(object):
+    """
+    _FakeProxy_
+
+    Result proxy returning rows from a list
+    """
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchmany(self, size):
+        rows = self.rows[:size]
+        self.rows = self.rows[size:]
+        return rows
+
+class FileBatchTest(unittest.TestCase):
+    """
+    _FileBatchTest_
+
+    """
+
+    def makeRows(self, nFiles):
+        """
+        _makeRows_
+
+        Rows of Subscriptions.GetAvailableFilesForSplitting, every third file
+        is at three sites and file 5 has no location.
+        """
+        rows = []
+        for fileID in range(1, nFiles + 1):
+            locations = ['se1']
+            if fileID % 3 == 0:
+                locations = ['se1', 'se2', 'se3']
+            if fileID == 5:
+                locations = [None]
+            for location in locations:
+                rows.append((fileID, '/store/file%i.root' % fileID, 1000 * fileID,
+                             10 * fileID, 0, 1, fileID % 4 or None, location))
+        return rows
+
+    def testA_LoadFileBatch(self):
+        """
+        _testA_LoadFileBatch_
+
+        Files split over several rows are never split between batches
+        """
+        jobFactory = JobFactory()
+        jobFactory.proxies = [FakeProxy(self.makeRows(20))]
+        jobFactory.grabByProxy = True
+
+        loaded = []
+        for size in [2, 1, 4, 3, 100, 5]:
+            fileBatch = jobFactory.loadFileBatch(size = size)
+            self.assertTrue(len(fileBatch) <= size)
+            for i, fileID in enumerate(fileBatch.ids):
+                self.assertEqual(fileBatch.lfns[i], '/store/file%i.root' % fileID)
+                self.assertEqual(fileBatch.sizes[i], 1000 * fileID)
+                self.assertEqual(fileBatch.events[i], 10 * fileID)
+                self.assertEqual(fileBatch.minRuns[i], fileID % 4 or None)
+                if fileID == 5:
+                    self.assertEqual(fileBatch.locations[i], frozenset())
+                elif fileID % 3 == 0:
+                    self.assertEqual(fileBatch.locations[i], frozenset(['se1', 'se2', 'se3']))
+                else:
+                    self.assertEqual(fileBatch.locations[i], frozenset(['se1']))
+            loaded.extend(fileBatch.ids)
+
+        self.assertEqual(loaded, range(1, 21))
+        self.assertEqual(len(jobFactory.proxies), 0)
+
+        # Files at the same sites share their location set
+        jobFactory.proxies = [FakeProxy(self.makeRows(20))]
+        fileBatch = jobFactory.loadFileBatch(size = 20)
+        self.assertEqual(len(set([id(x) for x in fileBatch.locations])), 3)
+        self.assertTrue(fileBatch.locations[2] is fileBatch.locations[5])
+        return
+
+if __name__ == '__main__':
+    unittest.main()
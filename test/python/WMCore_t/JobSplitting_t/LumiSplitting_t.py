@@ -0,0 +1,701 @@
+#!/usr/bin/env python
+"""
+_LumiSplitting_t_
+
+Differential tests of the lumi based splitting algorithms against the lumi
+by lumi implementations they replaced.
+"""
+
+import math
+import time
+import random
+import logging
+import operator
+import unittest
+
+from nose.plugins.attrib import attr
+
+from WMCore.DataStructs.File import File
+from WMCore.DataStructs.Fileset import Fileset
+from WMCore.DataStructs.Subscription import Subscription
+from WMCore.DataStructs.Workflow import Workflow
+from WMCore.DataStructs.Run import Run
+
+from WMCore.JobSplitting.JobFactory import JobFactory
+from WMCore.JobSplitting.LumiBased import isGoodLumi, isGoodRun, LumiChecker, GoodRunList
+from WMCore.JobSplitting.LumiBased import LumiBased
+from WMCore.JobSplitting.EventAwareLumiBased import EventAwareLumiBased
+from WMCore.WMSpec.WMTask import buildLumiMask
+
+class ReferenceLumiBased(JobFactory):
+    """
+    _ReferenceLumiBased_
+
+    LumiBased as it split lumi by lumi
+    """
+
+    def algorithm(self, *args, **kwargs):
+        """
+        _algorithm_
+
+        The lumi by lumi splitting, without the ACDC good run lists
+        """
+
+
+        lumisPerJob = int(kwargs.get('lumis_per_job', 1))
+        totalLumis = int(kwargs.get('total_lumis', 0))
+        splitOnFile = bool(kwargs.get('halt_job_on_file_boundaries', True))
+        splitOnRun = kwargs.get('splitOnRun', True)
+        getParents = kwargs.get('include_parents', False)
+        runWhitelist = kwargs.get('runWhitelist', [])
+        runs = kwargs.get('runs', None)
+        lumis = kwargs.get('lumis', None)
+        deterministicPileup = kwargs.get('deterministicPileup', False)
+        applyLumiCorrection = bool(kwargs.get('applyLumiCorrection', False))
+        eventsPerLumiInDataset = 0
+
+        if deterministicPileup and self.package == 'WMCore.WMBS':
+            getJobNumber = self.daoFactory(classname = "Jobs.GetNumberOfJobsPerWorkflow")
+            jobNumber = getJobNumber.execute(workflow = self.subscription.getWorkflow().id)
+            self.nJobs = jobNumber
+
+        timePerEvent, sizePerEvent, memoryRequirement = \
+                    self.getPerformanceParameters(kwargs.get('performance', {}))
+
+        goodRunList = {}
+        if runs and lumis:
+            goodRunList = buildLumiMask(runs, lumis)
+
+        lDict = self.sortByLocation()
+        locationDict = {}
+
+        # First we need to load the data
+        if self.package == 'WMCore.WMBS':
+            loadRunLumi = self.daoFactory(classname = "Files.GetBulkRunLumi")
+
+        for key in lDict.keys():
+            newlist = []
+            # First we need to load the data
+            if self.package == 'WMCore.WMBS':
+                fileLumis = loadRunLumi.execute(files = lDict[key])
+                for f in lDict[key]:
+                    lumiDict = fileLumis.get(f['id'], {})
+                    for run in lumiDict.keys():
+                        f.addRun(run = Run(run, *lumiDict[run]))
+
+            for f in lDict[key]:
+                # if hasattr(f, 'loadData'):
+                #    f.loadData()
+                if len(f['runs']) == 0:
+                    continue
+                f['lumiCount'] = 0
+                f['runs'] = sorted(f['runs'])
+                for run in f['runs']:
+                    run.lumis.sort()
+                    f['lumiCount'] += len(run.lumis)
+                f['lowestRun'] = f['runs'][0]
+                # Do average event per lumi calculation
+                if f['lumiCount']:
+                    f['avgEvtsPerLumi'] = round(float(f['events']) / f['lumiCount'])
+                    if deterministicPileup:
+                        # We assume that all lumis are equal in the dataset
+                        eventsPerLumiInDataset = f['avgEvtsPerLumi']
+                else:
+                    # No lumis in the file, ignore it
+                    continue
+                newlist.append(f)
+            locationDict[key] = sorted(newlist, key = operator.itemgetter('lowestRun'))
+
+        # Split files into jobs with each job containing
+        # EXACTLY lumisPerJob number of lumis (except for maybe the last one)
+
+        totalJobs = 0
+        lastLumi = None
+        firstLumi = None
+        stopJob = True
+        stopTask = False
+        lastRun = None
+        lumisInJob = 0
+        lumisInTask = 0
+        self.lumiChecker = LumiChecker(applyLumiCorrection)
+        if getParents:
+            # Load the parentage of all the files at once
+            self.findParents([f['lfn'] for files in locationDict.values() for f in files])
+
+        for location in locationDict.keys():
+
+            # For each location, we need a new jobGroup
+            self.newGroup()
+            stopJob = True
+            for f in locationDict[location]:
+                if getParents:
+                    parentLFNs = self.findParent(lfn = f['lfn'])
+                    for lfn in parentLFNs:
+                        parent = File(lfn = lfn)
+                        f['parents'].add(parent)
+
+                if splitOnFile:
+                    # Then we have to split on every boundary
+                    stopJob = True
+
+                for run in f['runs']:
+                    if not isGoodRun(goodRunList = goodRunList, run = run.run):
+                        # Then skip this one
+                        continue
+                    if len(runWhitelist) > 0 and not run.run in runWhitelist:
+                        # Skip due to run whitelist
+                        continue
+                    firstLumi = None
+
+                    if splitOnRun and run.run != lastRun:
+                        # Then we need to kill this job and get a new one
+                        stopJob = True
+
+                    # Now loop over the lumis
+                    for lumi in run:
+                        if (not isGoodLumi(goodRunList, run = run.run, lumi = lumi)
+                                or self.lumiChecker.isSplitLumi(run.run, lumi, f)): # splitLumi checks if the lumi is split across jobs
+                            # Kill the chain of good lumis
+                            # Skip this lumi
+                            if firstLumi != None and firstLumi != lumi:
+                                self.currentJob['mask'].addRunAndLumis(run = run.run,
+                                                                       lumis = [firstLumi, lastLumi])
+                                addedEvents = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
+                                runAddedTime = addedEvents * timePerEvent
+                                runAddedSize = addedEvents * sizePerEvent
+                                self.currentJob.addResourceEstimates(jobTime = runAddedTime,
+                                                                     disk = runAddedSize)
+                                firstLumi = None
+                                lastLumi = None
+                            continue
+
+                        # You have to kill the lumi chain if they're not continuous
+                        if lastLumi and not lumi == lastLumi + 1:
+                            self.currentJob['mask'].addRunAndLumis(run = run.run,
+                                                                   lumis = [firstLumi, lastLumi])
+                            addedEvents = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
+                            runAddedTime = addedEvents * timePerEvent
+                            runAddedSize = addedEvents * sizePerEvent
+                            self.currentJob.addResourceEstimates(jobTime = runAddedTime,
+                                                                 disk = runAddedSize)
+                            firstLumi = None
+                            lastLumi = None
+
+                        if firstLumi == None:
+                            # Set the first lumi in the run
+                            firstLumi = lumi
+
+                        # If we're full, end the job
+                        if lumisInJob == lumisPerJob:
+                            stopJob = True
+                        # Actually do the new job creation
+                        if stopJob:
+                            if firstLumi != None and lastLumi != None and lastRun != None:
+                                self.currentJob['mask'].addRunAndLumis(run = lastRun,
+                                                                       lumis = [firstLumi, lastLumi])
+                                addedEvents = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
+                                runAddedTime = addedEvents * timePerEvent
+                                runAddedSize = addedEvents * sizePerEvent
+                                self.currentJob.addResourceEstimates(jobTime = runAddedTime,
+                                                                     disk = runAddedSize)
+                            self.lumiChecker.closeJob(self.currentJob) # before creating a new job add the lumis of the current one to the checker
+                            self.newJob(name = self.getJobName())
+                            self.currentJob.addResourceEstimates(memory = memoryRequirement)
+                            if deterministicPileup:
+                                self.currentJob.addBaggageParameter("skipPileupEvents", (self.nJobs - 1) * lumisPerJob * eventsPerLumiInDataset)
+                            firstLumi = lumi
+                            lumisInJob = 0
+                            totalJobs += 1
+
+                            # Add the file to new jobs
+                            self.currentJob.addFile(f)
+
+                        lumisInJob += 1
+                        lumisInTask += 1
+                        lastLumi = lumi
+                        stopJob = False
+                        lastRun = run.run
+
+                        if self.currentJob and not f in self.currentJob['input_files']:
+                            self.currentJob.addFile(f)
+
+                        if totalLumis > 0 and lumisInTask >= totalLumis:
+                            stopTask = True
+                            break
+
+                    if firstLumi != None and lastLumi != None:
+                        # Add this run to the mask
+                        self.currentJob['mask'].addRunAndLumis(run = run.run,
+                                                               lumis = [firstLumi, lastLumi])
+                        addedEvents = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
+                        runAddedTime = addedEvents * timePerEvent
+                        runAddedSize = addedEvents * sizePerEvent
+                        self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
+                        firstLumi = None
+                        lastLumi = None
+
+                    if stopTask:
+                        break
+
+                if stopTask:
+                    break
+
+            if stopTask:
+                break
+
+        self.lumiChecker.closeJob(self.currentJob)
+        self.lumiChecker.fixInputFiles()
+        return
+
+class ReferenceEventAwareLumiBased(JobFactory):
+    """
+    _ReferenceEventAwareLumiBased_
+
+    EventAwareLumiBased as it split lumi by lumi
+    """
+
+    def algorithm(self, *args, **kwargs):
+        """
+        _algorithm_
+
+        The lumi by lumi splitting, without the ACDC good run lists
+        """
+
+        avgEventsPerJob = int(kwargs.get('events_per_job', 5000))
+        eventLimit      = int(kwargs.get('max_events_per_lumi', 20000))
+        totalEvents     = int(kwargs.get('total_events', 0))
+        splitOnFile     = bool(kwargs.get('halt_job_on_file_boundaries', True))
+        splitOnRun      = kwargs.get('splitOnRun', True)
+        getParents      = kwargs.get('include_parents', False)
+        runWhitelist    = kwargs.get('runWhitelist', [])
+        runs            = kwargs.get('runs', None)
+        lumis           = kwargs.get('lumis', None)
+        applyLumiCorrection = bool(kwargs.get('applyLumiCorrection', False))
+
+        timePerEvent, sizePerEvent, memoryRequirement = \
+                    self.getPerformanceParameters(kwargs.get('performance', {}))
+        deterministicPileup = kwargs.get('deterministicPileup', False)
+        eventsPerLumiInDataset = 0
+
+        if deterministicPileup and self.package == 'WMCore.WMBS':
+            getJobNumber = self.daoFactory(classname = "Jobs.GetNumberOfJobsPerWorkflow")
+            jobNumber = getJobNumber.execute(workflow = self.subscription.getWorkflow().id)
+            self.nJobs = jobNumber
+
+        goodRunList = {}
+        if runs and lumis:
+            goodRunList = buildLumiMask(runs, lumis)
+
+        lDict = self.sortByLocation()
+        locationDict = {}
+
+        # First we need to load the data
+        if self.package == 'WMCore.WMBS':
+            loadRunLumi = self.daoFactory(classname = "Files.GetBulkRunLumi")
+
+        for key in lDict.keys():
+            newlist = []
+            # First we need to load the data
+            if self.package == 'WMCore.WMBS':
+                fileLumis = loadRunLumi.execute(files = lDict[key])
+                for f in lDict[key]:
+                    lumiDict = fileLumis.get(f['id'], {})
+                    for run in lumiDict.keys():
+                        f.addRun(run = Run(run, *lumiDict[run]))
+
+            for f in lDict[key]:
+                if len(f['runs']) == 0:
+                    continue
+                f['runs'] = sorted(f['runs'])
+                f['lumiCount'] = 0
+                for run in f['runs']:
+                    run.lumis.sort()
+                    f['lumiCount'] += len(run.lumis)
+                f['lowestRun'] = f['runs'][0]
+
+                #Do average event per lumi calculation
+                if f['lumiCount']:
+                    f['avgEvtsPerLumi'] = round(float(f['events'])/f['lumiCount'])
+                    if deterministicPileup:
+                        # We assume that all lumis are equal in the dataset
+                        eventsPerLumiInDataset = f['avgEvtsPerLumi']
+                else:
+                    #No lumis in the file, ignore it
+                    continue
+                newlist.append(f)
+
+
+            locationDict[key] = sorted(newlist, key=operator.itemgetter('lowestRun'))
+
+        totalJobs      = 0
+        lastLumi       = None
+        firstLumi      = None
+        lastRun        = None
+        lumisInJob     = 0
+        totalAvgEventCount = 0
+        currentJobAvgEventCount = 0
+        stopTask = False
+        self.lumiChecker = LumiChecker(applyLumiCorrection)
+        if getParents:
+            # Load the parentage of all the files at once
+            self.findParents([f['lfn'] for files in locationDict.values() for f in files])
+
+        for location in locationDict:
+
+            # For each location, we need a new jobGroup
+            self.newGroup()
+            stopJob = True
+            for f in locationDict[location]:
+
+                if getParents:
+                    parentLFNs = self.findParent(lfn = f['lfn'])
+                    for lfn in parentLFNs:
+                        parent = File(lfn = lfn)
+                        f['parents'].add(parent)
+
+                lumisInJobInFile = 0
+                updateSplitOnJobStop = False
+                failNextJob          = False
+                #If the number of events per lumi is higher than the limit
+                #and it's only one lumi then ditch that lumi
+                if f['avgEvtsPerLumi'] > eventLimit and f['lumiCount'] == 1:
+                    failNextJob = True
+                    stopJob = True
+                    lumisPerJob = 1
+                elif splitOnFile:
+                    # Then we have to split on every boundary
+                    stopJob = True
+                    #Check the average number of events per lumi in this file
+                    #Adapt the lumis per job to match the target conditions
+                    if f['avgEvtsPerLumi']:
+                        #If there are events in the file
+                        ratio = float(avgEventsPerJob) / f['avgEvtsPerLumi']
+                        lumisPerJob = max(int(math.floor(ratio)), 1)
+                    else:
+                        #Zero event file, then the ratio goes to infinity. Computers don't like that
+                        lumisPerJob = f['lumiCount']
+                else:
+                    #Analyze how many events does this job already has
+                    #Check how many we want as target, include as many lumi sections as possible
+                    updateSplitOnJobStop = True
+                    eventsRemaining = max(avgEventsPerJob - currentJobAvgEventCount, 0)
+                    if f['avgEvtsPerLumi']:
+                        lumisAllowed = int(math.floor(float(eventsRemaining) / f['avgEvtsPerLumi']))
+                    else:
+                        lumisAllowed = f['lumiCount']
+                    lumisPerJob = max(lumisInJob + lumisAllowed, 1)
+
+                for run in f['runs']:
+                    if not isGoodRun(goodRunList = goodRunList, run = run.run):
+                        # Then skip this one
+                        continue
+                    if len(runWhitelist) > 0 and not run.run in runWhitelist:
+                        # Skip due to run whitelist
+                        continue
+                    firstLumi = None
+
+                    if splitOnRun and run.run != lastRun:
+                        # Then we need to kill this job and get a new one
+                        stopJob = True
+
+                    # Now loop over the lumis
+                    for lumi in run:
+                        if (not isGoodLumi(goodRunList, run = run.run, lumi = lumi) or
+                            self.lumiChecker.isSplitLumi(run.run, lumi, f)):
+                            # Kill the chain of good lumis
+                            # Skip this lumi
+                            if firstLumi != None and firstLumi != lumi:
+                                self.currentJob['mask'].addRunAndLumis(run = run.run,
+                                                                       lumis = [firstLumi, lastLumi])
+                                eventsAdded = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
+                                runAddedTime = eventsAdded * timePerEvent
+                                runAddedSize = eventsAdded * sizePerEvent
+                                self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
+                                firstLumi = None
+                                lastLumi = None
+                            continue
+
+                        # You have to kill the lumi chain if they're not continuous
+                        if lastLumi and not lumi == lastLumi + 1:
+                            self.currentJob['mask'].addRunAndLumis(run = run.run,
+                                                                   lumis = [firstLumi, lastLumi])
+                            eventsAdded = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
+                            runAddedTime = eventsAdded * timePerEvent
+                            runAddedSize = eventsAdded * sizePerEvent
+                            self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
+                            firstLumi = None
+                            lastLumi = None
+
+                        if firstLumi == None:
+                            # Set the first lumi in the run
+                            firstLumi = lumi
+
+                        # If we're full, end the job
+                        if lumisInJob == lumisPerJob:
+                            stopJob = True
+                        # Actually do the new job creation
+                        if stopJob:
+                            if firstLumi != None and lastLumi != None and lastRun != None:
+                                self.currentJob['mask'].addRunAndLumis(run = lastRun,
+                                                                       lumis = [firstLumi, lastLumi])
+                                eventsAdded = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
+                                runAddedTime = eventsAdded * timePerEvent
+                                runAddedSize = eventsAdded * sizePerEvent
+                                self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
+                            msg = None
+                            if failNextJob:
+                                msg = "File %s has too many events (%d) in %d lumi(s)" % (f['lfn'],
+                                                                                          f['events'],
+                                                                                          f['lumiCount'])
+                            self.lumiChecker.closeJob(self.currentJob)
+                            self.newJob(name = self.getJobName(), failedJob = failNextJob,
+                                        failedReason = msg)
+                            if deterministicPileup:
+                                self.currentJob.addBaggageParameter("skipPileupEvents", (self.nJobs - 1) * lumisPerJob * eventsPerLumiInDataset)
+                            self.currentJob.addResourceEstimates(memory = memoryRequirement)
+                            failNextJob = False
+                            firstLumi = lumi
+                            lumisInJob = 0
+                            lumisInJobInFile = 0
+                            currentJobAvgEventCount = 0
+                            totalJobs += 1
+
+                            # Add the file to new jobs
+                            self.currentJob.addFile(f)
+
+                            if updateSplitOnJobStop:
+                                #Then we were carrying from a previous file
+                                #Reset calculations for this file
+                                updateSplitOnJobStop = False
+                                if f['avgEvtsPerLumi']:
+                                    ratio = float(avgEventsPerJob) / f['avgEvtsPerLumi']
+                                    lumisPerJob = max(int(math.floor(ratio)), 1)
+                                else:
+                                    lumisPerJob = f['lumiCount']
+
+                        lumisInJob += 1
+                        lumisInJobInFile += 1
+                        lastLumi = lumi
+                        stopJob = False
+                        lastRun = run.run
+                        totalAvgEventCount += f['avgEvtsPerLumi']
+
+                        if self.currentJob and not f in self.currentJob['input_files']:
+                            self.currentJob.addFile(f)
+
+                        # We stop here if there are more total events than requested.
+                        if totalEvents > 0 and totalAvgEventCount >= totalEvents:
+                            stopTask = True
+                            break
+
+                    if firstLumi != None and lastLumi != None:
+                        # Add this run to the mask
+                        self.currentJob['mask'].addRunAndLumis(run = run.run,
+                                                               lumis = [firstLumi, lastLumi])
+                        eventsAdded = ((lastLumi - firstLumi + 1) * f['avgEvtsPerLumi'])
+                        runAddedTime = eventsAdded * timePerEvent
+                        runAddedSize = eventsAdded * sizePerEvent
+                        self.currentJob.addResourceEstimates(jobTime = runAddedTime, disk = runAddedSize)
+                        firstLumi = None
+                        lastLumi = None
+
+                    if stopTask:
+                        break
+
+                if not splitOnFile:
+                    currentJobAvgEventCount += f['avgEvtsPerLumi'] * lumisInJobInFile
+
+                if stopTask:
+                    break
+
+            if stopTask:
+                break
+
+        self.lumiChecker.closeJob(self.currentJob)
+        self.lumiChecker.fixInputFiles()
+        return
+
+def makeFiles(nFiles, nRuns, maxLumis, duplicates = False):
+    """
+    _makeFiles_
+
+    Random files as (lfn, events, location, {run: lumis}), the lumis of a
+    run have gaps and are shared between files when duplicates is True
+    """
+    files = []
+    for i in range(nFiles):
+        runLumis = {}
+        for run in random.sample(range(1, 6), random.randint(1, nRuns)):
+            if duplicates:
+                lumis = [random.randint(0, maxLumis) for x in range(random.randint(0, maxLumis))]
+            else:
+                lumis = random.sample(range(1 + i * maxLumis, 1 + (i + 1) * maxLumis),
+                                      random.randint(0, maxLumis))
+            if random.randint(0, 3) == 0:
+                # Mostly consecutive lumis
+                start = random.randint(1, 100) + i * maxLumis * 2
+                lumis = range(start, start + random.randint(1, maxLumis * 2))
+            runLumis[run] = lumis
+        files.append(("/store/file%i.root" % i, random.choice([0, 1, 10, 100, 1000, 20000]),
+                      random.choice(["T1_US_FNAL", "T2_CH_CERN"]), runLumis))
+    return files
+
+def makeLumiMask(maxLumi):
+    """
+    _makeLumiMask_
+
+    Random runs and lumis arguments, with overlapping ranges
+    """
+    runs  = []
+    lumis = []
+    for run in random.sample(range(1, 6), random.randint(1, 5)):
+        ranges = []
+        for i in range(random.randint(0, 4)):
+            first = random.randint(0, maxLumi)
+            ranges.extend([first, first + random.randint(0, maxLumi // 3)])
+        if ranges:
+            runs.append(run)
+            lumis.append(",".join([str(x) for x in ranges]))
+    return runs, lumis
+
+def splitFiles(splitter, files, **kwargs):
+    """
+    _splitFiles_
+
+    Split the files with the given JobFactory class, returns what the jobs
+    are made of
+    """
+    fileset = Fileset(name = "TestFileset")
+    for lfn, events, location, runLumis in files:
+        newFile = File(lfn = lfn, size = 1000, events = events)
+        for run, lumis in runLumis.items():
+            newFile.addRun(Run(run, *lumis))
+        newFile.setLocation(location)
+        fileset.addFile(newFile)
+
+    subscription = Subscription(fileset = fileset, workflow = Workflow(),
+                                split_algo = "LumiBased", type = "Processing")
+    jobFactory = splitter(package = "WMCore.DataStructs", subscription = subscription)
+    jobGroups = jobFactory(performance = {'timePerEvent': 12, 'memoryRequirement': 2300,
+                                          'sizePerEvent': 400}, **kwargs)
+
+    result = []
+    for jobGroup in jobGroups:
+        for job in jobGroup.jobs:
+            result.append(([x['lfn'] for x in job['input_files']], job['mask']['runAndLumis'],
+                           job['estimatedJobTime'], job['estimatedDiskUsage'],
+                           job['estimatedMemoryUsage'], job.get('failedOnCreation'),
+                           job.get('failedReason'),
+                           getattr(job.getBaggage(), 'skipPileupEvents', None)))
+    return result
+
+class LumiSplittingTest(unittest.TestCase):
+    """
+    _LumiSplittingTest_
+
+    The splitting algorithms make the same jobs as the lumi by lumi ones
+    """
+
+    def arguments(self):
+        """
+        _arguments_
+
+        Random arguments common to both algorithms
+        """
+        kwargs = {'halt_job_on_file_boundaries': random.choice([True, False]),
+                  'splitOnRun': random.choice([True, False]),
+                  'applyLumiCorrection': random.choice([True, False]),
+                  'deterministicPileup': random.choice([True, False])}
+        if random.randint(0, 2) == 0:
+            kwargs['runs'], kwargs['lumis'] = makeLumiMask(maxLumi = random.choice([60, 300]))
+        if random.randint(0, 4) == 0:
+            kwargs['runWhitelist'] = random.sample(range(1, 6), 3)
+        return kwargs
+
+    def testA_GoodRunList(self):
+        """
+        _testA_GoodRunList_
+
+        The compiled good run list answers like isGoodRun and isGoodLumi
+        """
+        random.seed(1618)
+        for i in range(200):
+            goodRunList = buildLumiMask(*makeLumiMask(maxLumi = 30))
+            compiled = GoodRunList(goodRunList)
+            for run in range(0, 7):
+                self.assertEqual(compiled.isGoodRun(run), isGoodRun(goodRunList, run))
+                for lumi in range(0, 45):
+                    self.assertEqual(compiled.isGoodLumi(run, lumi), isGoodLumi(goodRunList, run, lumi))
+
+        self.assertTrue(GoodRunList({}).isGoodLumi(12, 34))
+        return
+
+    def testB_LumiBased(self):
+        """
+        _testB_LumiBased_
+
+        LumiBased makes the same jobs as the lumi by lumi splitting
+        """
+        random.seed(2718)
+        for i in range(300):
+            files = makeFiles(nFiles = random.randint(1, 12), nRuns = 3, maxLumis = 25,
+                              duplicates = i % 2)
+            kwargs = self.arguments()
+            kwargs['lumis_per_job'] = random.randint(1, 8)
+            if random.randint(0, 3) == 0:
+                kwargs['total_lumis'] = random.randint(1, 60)
+
+            self.assertEqual(splitFiles(LumiBased, files, **kwargs),
+                             splitFiles(ReferenceLumiBased, files, **kwargs))
+        return
+
+    def testC_EventAwareLumiBased(self):
+        """
+        _testC_EventAwareLumiBased_
+
+        EventAwareLumiBased makes the same jobs as the lumi by lumi splitting
+        """
+        random.seed(3141)
+        for i in range(300):
+            files = makeFiles(nFiles = random.randint(1, 12), nRuns = 3, maxLumis = 25,
+                              duplicates = i % 2)
+            kwargs = self.arguments()
+            kwargs['events_per_job'] = random.choice([1, 10, 100, 500, 5000])
+            kwargs['max_events_per_lumi'] = random.choice([10, 1000, 20000])
+            if random.randint(0, 3) == 0:
+                kwargs['total_events'] = random.randint(1, 5000)
+
+            self.assertEqual(splitFiles(EventAwareLumiBased, files, **kwargs),
+                             splitFiles(ReferenceEventAwareLumiBased, files, **kwargs))
+        return
+
+    @attr('performance')
+    def testD_SplittingBenchmark(self):
+        """
+        _testD_SplittingBenchmark_
+
+        Time both algorithms on 200 files of 5000 lumis with a good run
+        list, against the lumi by lumi splitting.
+        """
+        random.seed(1414)
+        files = []
+        for i in range(200):
+            files.append(("/store/file%i.root" % i, 50000, "T1_US_FNAL",
+                          {1 + i // 20: range(1 + (i % 20) * 5000, 1 + (i % 20 + 1) * 5000)}))
+        runs = range(1, 11)
+        lumis = [",".join(["1,40000", "40100,90000", "90002,200000"])] * 10
+        for splitter, reference, kwargs in \
+                [(LumiBased, ReferenceLumiBased, {'lumis_per_job': 1000}),
+                 (EventAwareLumiBased, ReferenceEventAwareLumiBased, {'events_per_job': 10000})]:
+            startTime = time.time()
+            jobs = splitFiles(splitter, files, runs = runs, lumis = lumis, **kwargs)
+            logging.info("%s: %i jobs in %.3fs" % (splitter.__name__, len(jobs), time.time() - startTime))
+
+            startTime = time.time()
+            referenceJobs = splitFiles(reference, files, runs = runs, lumis = lumis, **kwargs)
+            logging.info("Lumi by lumi: %i jobs in %.3fs" % (len(referenceJobs), time.time() - startTime))
+            self.assertEqual(jobs, referenceJobs)
+        return
+
+if __name__ == '__main__':
+    unittest.main()
@@ -959,5 +959,78 @@ class TestChangeState(unittest.TestCase):
 
         return
 
+    def testBulkTransitions(self):
+        """
+        _testBulkTransitions_
+
+        Verify that the bulk transitions mode records the same job and job
+        summary documents as the per job update handlers.
+        """
+        change = ChangeState(self.config, "changestate_t")
+        self.config.JobStateMachine.bulkTransitions = True
+        bulkChange = ChangeState(self.config, "changestate_t")
+
+        locationAction = self.daoFactory(classname = "Locations.New")
+        locationAction.execute("site1", seName = "somese.cern.ch")
+
+        testWorkflow = Workflow(spec = "spec.xml", owner = "Steve",
+                                name = "wf001", task = self.taskName)
+        testWorkflow.create()
+        testFileset = Fileset(name = "TestFileset")
+        testFileset.create()
+        testSubscription = Subscription(fileset = testFileset,
+                                        workflow = testWorkflow,
+                                        split_algo = "FileBased")
+        testSubscription.create()
+
+        for lfn in ["SomeLFNA", "SomeLFNB"]:
+            testFile = File(lfn = lfn, events = 1024, size = 2048,
+                            locations = set(["somese.cern.ch"]))
+            testFile.create()
+            testFileset.addFile(testFile)
+        testFileset.commit()
+
+        splitter = SplitterFactory()
+        jobFactory = splitter(package = "WMCore.WMBS",
+                              subscription = testSubscription)
+        jobGroup = jobFactory(files_per_job = 1)[0]
+
+        myReport = Report()
+        reportPath = os.path.join(getTestBase(),
+                                  "WMCore_t/JobStateMachine_t/Report.pkl")
+        myReport.unpersist(reportPath)
+
+        for stateChange, testJob in [(change, jobGroup.jobs[0]),
+                                     (bulkChange, jobGroup.jobs[1])]:
+            testJob["user"] = "sfoulkes"
+            testJob["group"] = "DMWM"
+            testJob["taskType"] = "Processing"
+            testJob["site_cms_name"] = "site1"
+
+            stateChange.propagate([testJob], "created", "new")
+            stateChange.propagate([testJob], "executing", "created")
+            testJob["fwjr"] = myReport
+            stateChange.propagate([testJob], "jobfailed", "executing")
+            del testJob["fwjr"]
+            stateChange.propagate([testJob], "jobcooloff", "jobfailed", updatesummary = True)
+            stateChange.propagate([testJob], "created", "jobcooloff", updatesummary = True)
+
+        def stripTimestamps(transitions):
+            return [dict((k, v) for k, v in x.items() if k != "timestamp") for x in transitions]
+
+        jobDocs = [change.jobsdatabase.document(x["couch_record"]) for x in jobGroup.jobs]
+        transitions = [stripTimestamps([x["states"][k] for k in sorted(x["states"], key = int)])
+                       for x in jobDocs]
+        self.assertEqual(len(transitions[0]), 5)
+        self.assertEqual(transitions[0], transitions[1])
+
+        summaryDocs = [change.jsumdatabase.document(x["name"]) for x in jobGroup.jobs]
+        self.assertEqual(summaryDocs[0]["state"], "created")
+        self.assertEqual(summaryDocs[1]["state"], "created")
+        self.assertEqual(stripTimestamps(summaryDocs[0]["state_history"]),
+                         stripTimestamps(summaryDocs[1]["state_history"]))
+        self.assertEqual(len(summaryDocs[1]["state_history"]), 2)
+        return
+
 if __name__ == "__main__":
     unittest.main()
@@ -48,6 +48,7 @@ from WMCore.Agent.Configuration             import Configuration
 # WMCore library imports
 from WMCore.ResourceControl.ResourceControl  import ResourceControl
 from WMCore.FwkJobReport.Report              import Report
+from WMCore.DataStructs.JobStore             import JobStore
 
 # WMSpec stuff
 from WMCore.WMSpec.Makers.TaskMaker import TaskMaker
@@ -442,11 +443,10 @@ class WMAgentTest(unittest.TestCase):
 
         # First job should be in here
         self.assertTrue('job_1' in os.listdir(groupDirectory))
-        jobFile = os.path.join(groupDirectory, 'job_1', 'job.pkl')
-        self.assertTrue(os.path.isfile(jobFile))
-        f = open(jobFile, 'r')
-        job = cPickle.load(f)
-        f.close()
+        jobStore = JobStore(groupDirectory)
+        self.assertTrue(jobStore.exists())
+        job = jobStore.loadJob(jobStore.loadHeaders()[1])
+        jobStore.close()
 
 
         self.assertEqual(job['workflow'], name)
@@ -3,6 +3,9 @@ _ProcessPoolTestWorker_
 
 """
 
+import os
+import time
+
 from WMCore.ProcessPool.ProcessPool import ProcessPoolWorker
 
 class ProcessPoolTestWorker(ProcessPoolWorker):
@@ -11,6 +14,14 @@ class ProcessPoolTestWorker(ProcessPoolWorker):
         """
         __call__
 
+        Return the input.  Dictionaries can ask the worker to sleep first or
+        to die the first time it sees them, a marker file records that.
         """
+        if type(input) == dict:
+            if 'sleep' in input:
+                time.sleep(input['sleep'])
+            if 'dieOnce' in input and not os.path.exists(input['dieOnce']):
+                open(input['dieOnce'], 'w').close()
+                os._exit(1)
 
         return input
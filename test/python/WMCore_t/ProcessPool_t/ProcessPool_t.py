@@ -4,10 +4,12 @@ _ProcessPool_t
 Unit tests for the ProcessPool class.
 """
 
+import os
+import time
 import unittest
 import nose
 
-from WMCore.ProcessPool.ProcessPool import ProcessPool
+from WMCore.ProcessPool.ProcessPool import ProcessPool, ProcessPoolException
 from WMQuality.TestInit import TestInit
 
 class ProcessPoolTest(unittest.TestCase):
@@ -122,8 +124,89 @@ class ProcessPoolTest(unittest.TestCase):
             self.assertEqual(len(result), len(input),
                              "Error: Wrong number of results returned.")
 
+        return
+
+    def testD_SlaveRestart(self):
+        """
+        _testD_SlaveRestart_
+
+        Kill a slave while it has work in flight and verify that it is
+        restarted and that its work is sent again.
+        """
+        config = self.testInit.getConfiguration()
+        config.Agent.useHeartbeat = False
+        self.testInit.generateWorkDir(config)
+
+        processPool = ProcessPool("ProcessPool_t.ProcessPoolTestWorker",
+                                  totalSlaves = 2,
+                                  componentDir = config.General.workDir,
+                                  namespace = "WMCore_t",
+                                  config = config)
+
+        marker = os.path.join(config.General.workDir, "dieOnce")
+        input = [{"id": 1, "dieOnce": marker}]
+        input.extend([{"id": i, "sleep": 0.1} for i in range(2, 10)])
+        processPool.enqueue(input)
+        result = processPool.dequeue(len(input), timeout = 120)
 
+        self.assertEqual(sorted([x["id"] for x in result]), range(1, 10))
+        self.assertTrue(os.path.exists(marker))
+        restarts = [x["restarts"] for x in processPool.getMetrics()["slaves"]]
+        self.assertEqual(sorted(restarts), [0, 1])
 
+        processPool.close()
+        return
+
+    def testE_BackpressureAndMetrics(self):
+        """
+        _testE_BackpressureAndMetrics_
+
+        Verify that enqueue() keeps the master queue bounded, that dequeue()
+        times out and that the metrics add up.
+        """
+        config = self.testInit.getConfiguration()
+        config.Agent.useHeartbeat = False
+        self.testInit.generateWorkDir(config)
+
+        processPool = ProcessPool("ProcessPool_t.ProcessPoolTestWorker",
+                                  totalSlaves = 2,
+                                  componentDir = config.General.workDir,
+                                  namespace = "WMCore_t",
+                                  config = config,
+                                  slaveCredits = 1,
+                                  maxQueueSize = 3)
+
+        input = [{"id": i, "sleep": 0.05} for i in range(20)]
+        processPool.enqueue(input)
+        metrics = processPool.getMetrics()
+        self.assertTrue(metrics["queueDepth"] <= 3)
+        self.assertTrue(metrics["inFlight"] <= 2)
+
+        result = processPool.dequeue(len(input), timeout = 120)
+        self.assertEqual(sorted([x["id"] for x in result]), range(20))
+
+        metrics = processPool.getMetrics()
+        self.assertEqual(metrics["queueDepth"], 0)
+        self.assertEqual(metrics["inFlight"], 0)
+        self.assertEqual(sum([x["completed"] for x in metrics["slaves"]]), 20)
+        self.assertTrue(metrics["itemsPerSecond"] > 0)
+        for slave in metrics["slaves"]:
+            if slave["completed"] > 0:
+                self.assertTrue(slave["latencyP50"] <= slave["latencyP99"])
+
+        processPool.enqueue([{"id": 0, "sleep": 5}])
+        self.assertRaises(ProcessPoolException, processPool.dequeue, 1, timeout = 1)
+
+        # dequeueReady() waits for the whole timeout, not for the first message
+        processPool.dequeue(1, timeout = 120)
+        processPool.enqueue([{"id": 1, "sleep": 0.5}])
+        startTime = time.time()
+        self.assertEqual(processPool.dequeueReady(timeout = 100), [])
+        self.assertTrue(time.time() - startTime >= 0.1)
+        self.assertEqual(processPool.dequeueReady(timeout = 5000), [{"id": 1, "sleep": 0.5}])
+
+        processPool.close()
+        return
 
 
 if __name__ == "__main__":
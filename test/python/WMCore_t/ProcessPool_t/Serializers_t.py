@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+_Serializers_t_
+
+Unit tests for the ProcessPool serializers.
+"""
+
+import os
+import time
+import logging
+import unittest
+
+from nose.plugins.attrib import attr
+
+from WMCore.FwkJobReport.Report import Report
+from WMCore.ProcessPool.Serializers import getSerializer, msgpack, \
+                                           SerializerException, BLOB_THRESHOLD
+from WMCore.WMBase import getTestBase
+
+class SerializersTest(unittest.TestCase):
+    """
+    _SerializersTest_
+
+    """
+    def serializerNames(self):
+        """
+        _serializerNames_
+
+        Serializers available in this environment
+        """
+        names = ["json", "pickle"]
+        if msgpack is not None:
+            names.append("msgpack")
+        return names
+
+    def testA_RoundTrip(self):
+        """
+        _testA_RoundTrip_
+
+        Verify that work items survive a round trip through every
+        serializer and that large strings are sent as separate frames.
+        """
+        blob = "x" * (BLOB_THRESHOLD + 1)
+        work = {"id": 1, "jobSuccess": True, "lfns": ["/store/a", "/store/b"],
+                "log": blob, "nested": {"log": blob, "small": "abc"}}
+
+        for name in self.serializerNames():
+            serializer = getSerializer(name)
+            frames = serializer.dumps(work)
+            self.assertEqual(serializer.loads(frames), work)
+            self.assertEqual(serializer.loads(serializer.dumps("STOP")), "STOP")
+
+            if name == "json":
+                self.assertEqual(len(frames), 1)
+            else:
+                self.assertEqual(len(frames), 3)
+                self.assertTrue(len(frames[0]) < BLOB_THRESHOLD)
+
+        self.assertRaises(SerializerException, getSerializer, "xml")
+        return
+
+    @attr('performance')
+    def testB_ThroughputBenchmark(self):
+        """
+        _testB_ThroughputBenchmark_
+
+        Compare the encode/decode throughput of the serializers on
+        JobAccountant like results carrying a framework job report.
+        """
+        report = Report()
+        report.unpersist(os.path.join(getTestBase(),
+                                      "WMCore_t/JobStateMachine_t/Report.pkl"))
+        work = [{"id": i, "jobSuccess": True, "jobReport": report,
+                 "log": "y" * (256 * 1024)} for i in range(20)]
+
+        nItems = 200
+        for name in self.serializerNames():
+            serializer = getSerializer(name)
+            startTime = time.time()
+            for _ in range(nItems):
+                serializer.loads(serializer.dumps(work))
+            elapsed = time.time() - startTime
+            logging.info("%s: %.1f items/s" % (name, nItems / max(elapsed, 1e-6)))
+        return
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+_ConnectionPool_t_
+
+Test the pool of keep alive connections shared by the HTTP clients
+"""
+
+import time
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+
+from WMCore.Services.ConnectionPool import ConnectionPool, getConnectionPool, closeConnection
+from WMCore.Services.Requests import Requests, JSONRequests
+
+class FakeConnection(object):
+    """
+    _FakeConnection_
+
+    """
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    _KeepAliveHandler_
+
+    Answer every GET with the path, over HTTP/1.1 keep alive connections
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.clients.add(self.client_address)
+        data = '"%s"' % self.path
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        return
+
+    def log_message(self, format, *args):
+        return
+
+class KeepAliveServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    _KeepAliveServer_
+
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), KeepAliveHandler)
+        self.lock = threading.Lock()
+        self.clients = set()
+
+class ConnectionPoolTest(unittest.TestCase):
+    """
+    _ConnectionPoolTest_
+
+    """
+    def testA_Pool(self):
+        """
+        _testA_Pool_
+
+        Connections are reused by key, bounded and closed when idle
+        """
+        pool = ConnectionPool(maxIdle = 2, idleTimeout = 10)
+        conns = [pool.acquire("a", FakeConnection) for i in range(3)]
+        self.assertEqual(len(set(conns)), 3)
+        for conn in conns:
+            pool.release("a", conn)
+        self.assertTrue(conns[2].closed)
+        self.assertFalse(conns[0].closed or conns[1].closed)
+
+        self.assertTrue(pool.acquire("a", FakeConnection) is conns[1])
+        self.assertFalse(pool.acquire("b", FakeConnection) in conns)
+        pool.discard("a", conns[1])
+        self.assertTrue(conns[1].closed)
+
+        # Idle for too long
+        pool.lastEviction = 0
+        pool.idle["a"][0] = (time.time() - 20, conns[0])
+        self.assertFalse(pool.acquire("a", FakeConnection) is conns[0])
+        self.assertTrue(conns[0].closed)
+
+        # A forked process doesn't reuse the connections of its parent
+        conn = FakeConnection()
+        pool.release("a", conn)
+        pool.pid = -1
+        self.assertFalse(pool.acquire("a", FakeConnection) is conn)
+
+        pool.record("host:80", 0.02)
+        pool.record("host:80", 100, error = True)
+        stats = pool.statistics()
+        self.assertEqual(stats['created'], 6)
+        self.assertEqual(stats['reused'], 1)
+        self.assertEqual(stats['evicted'], 1)
+        latency = stats['latency']["host:80"]
+        self.assertEqual((latency['requests'], latency['errors']), (2, 1))
+        self.assertEqual(latency['histogram']["0.05"], 1)
+        self.assertEqual(latency['histogram']["inf"], 1)
+
+        pool.clear()
+        self.assertEqual(pool.statistics()['idle'], {})
+        return
+
+    def testB_Requests(self):
+        """
+        _testB_Requests_
+
+        Requests to the same host share their connections
+        """
+        server = KeepAliveServer()
+        serverThread = threading.Thread(target = server.serve_forever)
+        serverThread.setDaemon(True)
+        serverThread.start()
+        url = "http://127.0.0.1:%i" % server.server_address[1]
+
+        pool = ConnectionPool()
+        clients = [Requests(url, {'cachepath': None}),
+                   JSONRequests(url, {'cachepath': None})]
+        for client in clients:
+            self.assertTrue(client.connectionPool is getConnectionPool())
+            client.connectionPool = pool
+
+        for i in range(10):
+            for client in clients:
+                client.get("/doc%i" % i)
+        self.assertEqual(len(server.clients), 1)
+        self.assertEqual(clients[1].get("/doc")[0], "/doc")
+
+        def makeRequests():
+            client = JSONRequests(url, {'cachepath': None})
+            client.connectionPool = pool
+            for i in range(10):
+                client.get("/doc%i" % i)
+        threads = [threading.Thread(target = makeRequests) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(len(server.clients) <= 4)
+
+        stats = pool.statistics()
+        self.assertEqual(stats['latency']["127.0.0.1:%i" % server.server_address[1]]['requests'], 61)
+        self.assertEqual(stats['created'], len(server.clients))
+
+        # Without the pool every instance has its own connection
+        for client in [Requests(url, {'cachepath': None, 'pool': False}) for i in range(2)]:
+            self.assertEqual(client.connectionPool, None)
+            client.get("/doc")
+            closeConnection(client['conn'])
+        self.assertEqual(len(server.clients), stats['created'] + 2)
+
+        pool.clear()
+        server.shutdown()
+        server.server_close()
+        return
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,7 +13,8 @@ from httplib import BadStatusLine, IncompleteRead
 
 from nose.plugins.attrib import attr
 
-from WMCore.Services.Service import Service
+from WMCore.Services.Service import Service, getResultCache
+from WMCore.Wrappers import JsonWrapper as json
 from WMCore.Services.Requests import Requests
 from WMCore.Algorithms import Permissions
 from WMQuality.TestInitCouchApp import TestInitCouchApp as TestInit
@@ -38,6 +39,13 @@ class CrappyRequest(Requests):
         # METAL \m/
         raise BadStatusLine(666)
 
+class CountingRequest(Requests):
+    calls = 0
+    def makeRequest(self, uri=None, data={}, verb='GET', incoming_headers={},
+                     encoder=True, decoder=True, contentType=None):
+        CountingRequest.calls += 1
+        return json.dumps({'uri': uri, 'call': CountingRequest.calls}), 200, 'OK', False
+
 class RegularServer(object):
     def regular(self):
         return "This is silly."
@@ -182,6 +190,50 @@ class ServiceTest(unittest.TestCase):
         service = Service(dict)
         self.assertEqual( service['cacheduration'] ,  dict['cacheduration'] )
 
+    def testMemoryCache(self):
+        """
+        Results of getCachedResult are kept in memory for the duration of
+        their url
+        """
+        getResultCache().clear()
+        CountingRequest.calls = 0
+        service = Service({'logger': self.logger,
+                           'endpoint': 'http://localhost:8080/',
+                           'cachepath': self.testDir,
+                           'requests': CountingRequest,
+                           'memcacheduration': 1,
+                           'memcachedurations': {'fresh': 0}})
+
+        for i in range(3):
+            result = service.getCachedResult('cached', 'cached', parse = json.loads)
+            self.assertEqual(result, {'uri': 'cached', 'call': 1})
+        self.assertEqual(CountingRequest.calls, 1)
+
+        # Other input data, other result
+        result = service.getCachedResult('cached', 'cached', {'a': 1}, parse = json.loads)
+        self.assertEqual(result['call'], 2)
+
+        # Only the cache file is kept for urls with no duration
+        self.assertEqual(service.getCachedResult('fresh', 'fresh'),
+                         json.dumps({'uri': 'fresh', 'call': 3}))
+        service.clearCache('fresh')
+        self.assertEqual(service.getCachedResult('fresh', 'fresh'),
+                         json.dumps({'uri': 'fresh', 'call': 4}))
+
+        # The memory cache outlives the cache file, unless given the url
+        self.assertTrue(os.path.exists(service.cacheFileName('cached')))
+        service.clearCache('cached')
+        result = service.getCachedResult('cached', 'cached', parse = json.loads)
+        self.assertEqual(result['call'], 1)
+        service.clearCache('cached', url = 'cached')
+        result = service.getCachedResult('cached', 'cached', parse = json.loads)
+        self.assertEqual(result['call'], 5)
+
+        stats = getResultCache().statistics()
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 3)
+        return
+
     def testSocketTimeout(self):
         dict = {'logger': self.logger,
                 'endpoint': 'https://github.com/dmwm',
@@ -3,9 +3,11 @@
 Test case for SiteDB
 """
 
+import time
 import unittest
 
-from WMCore.Services.SiteDB.SiteDB import SiteDBJSON
+from WMCore.Services.SiteDB import SiteDB
+from WMCore.Services.SiteDB.SiteDB import SiteDBJSON, PeopleIndex, SiteIndex, ProcessingIndex
 from WMCore.Services.EmulatorSwitch import EmulatorHelper
 
 from nose.plugins.attrib import attr
@@ -119,5 +121,123 @@ class SiteDBTest(unittest.TestCase):
         self.failUnless(result == ['T2_UK_London_IC'])
         return
 
+    def testIndex(self):
+        """
+        _testIndex_
+
+        Test the lookup tables the mappings are made with
+        """
+        people = [{'dn': '/CN=alice', 'username': 'alice'},
+                  {'dn': '/CN=bob', 'username': 'bob'},
+                  {'dn': '/CN=bob', 'username': 'bob2'}]
+        sitenames = [{'site_name': 'FNAL', 'type': 'cms', 'alias': 'T1_US_FNAL'},
+                     {'site_name': 'FNAL', 'type': 'psn', 'alias': 'T1_US_FNAL'},
+                     {'site_name': 'CERN', 'type': 'cms', 'alias': 'T2_CH_CERN'},
+                     {'site_name': 'CERN', 'type': 'psn', 'alias': 'T2_CH_CERN'},
+                     {'site_name': 'CERN HLT', 'type': 'cms', 'alias': 'T2_CH_CERN_HLT'},
+                     {'site_name': 'CERN HLT', 'type': 'psn', 'alias': 'T2_CH_CERN_HLT'}]
+        siteresources = [{'type': 'SE', 'site_name': 'CERN', 'fqdn': 'srm-eoscms.cern.ch'},
+                         {'type': 'SE', 'site_name': 'FNAL', 'fqdn': 'cmssrm.fnal.gov'},
+                         {'type': 'CE', 'site_name': 'FNAL', 'fqdn': 'cmsosgce.fnal.gov'},
+                         {'type': 'SE', 'site_name': 'CERN HLT', 'fqdn': 'srm-eoscms.cern.ch'},
+                         {'type': 'SE', 'site_name': 'CERN HLT', 'fqdn': 'srm-hlt.cern.ch'}]
+        dataprocessing = [{'phedex_name': 'T1_US_FNAL_Disk', 'psn_name': 'T1_US_FNAL'},
+                          {'phedex_name': 'T2_CH_CERN', 'psn_name': 'T2_CH_CERN'},
+                          {'phedex_name': 'T2_CH_CERN', 'psn_name': 'T2_CH_CERN_HLT'}]
+        peopleIndex = PeopleIndex(people)
+        self.assertEqual(peopleIndex.dnToUser['/CN=bob'], 'bob')
+        self.assertEqual(peopleIndex.userToDn['bob2'], '/CN=bob')
+
+        processingIndex = ProcessingIndex(dataprocessing)
+        self.assertEqual(processingIndex.pnnToPSN['T2_CH_CERN'], ['T2_CH_CERN', 'T2_CH_CERN_HLT'])
+
+        index = SiteIndex(sitenames, siteresources)
+        self.assertEqual(index.fqdnToCMS['srm-eoscms.cern.ch'], ['T2_CH_CERN', 'T2_CH_CERN_HLT'])
+        self.assertEqual(index.fqdnToCMS['cmsosgce.fnal.gov'], ['T1_US_FNAL'])
+
+        # the hosts come in SiteDB order
+        self.assertEqual(index.hostsForPattern('T2_CH_CERN*', 'SE'),
+                         ['srm-eoscms.cern.ch', 'srm-eoscms.cern.ch', 'srm-hlt.cern.ch'])
+        self.assertEqual(index.hostsForPattern('%FNAL', 'CE'), ['cmsosgce.fnal.gov'])
+        self.assertEqual(index.hostsForPattern('T3*', 'SE'), [])
+
+        # the memoized results are not handed out
+        index.hostsForPattern('%FNAL', 'CE').append('other')
+        self.assertEqual(index.hostsForPattern('%FNAL', 'CE'), ['cmsosgce.fnal.gov'])
+        return
+
+    def testLazyIndex(self):
+        """
+        _testLazyIndex_
+
+        Test that every lookup only fetches the lists it needs and that the
+        shared lookup tables are refreshed by another instance
+        """
+        EmulatorHelper.resetEmulators()
+        lists = {'people': [{'dn': '/CN=alice', 'username': 'alice'}],
+                 'sitenames': [{'site_name': 'FNAL', 'type': 'cms', 'alias': 'T1_US_FNAL'},
+                               {'site_name': 'FNAL', 'type': 'psn', 'alias': 'T1_US_FNAL'}],
+                 'siteresources': [{'type': 'SE', 'site_name': 'FNAL', 'fqdn': 'cmssrm.fnal.gov'}],
+                 'dataprocessing': [{'phedex_name': 'T1_US_FNAL_Disk', 'psn_name': 'T1_US_FNAL'}]}
+        fetched = []
+        # the class behind the emulator hook
+        siteDBClass = SiteDBJSON(config = {'memcacheduration': 0}).wrapped.__class__
+        class TestSiteDB(siteDBClass):
+            def _people(self, username = None, clearCache = False):
+                fetched.append('people')
+                return lists['people']
+            def _sitenames(self, sitename = None, clearCache = False):
+                fetched.append('sitenames')
+                return lists['sitenames']
+            def _siteresources(self, clearCache = False):
+                fetched.append('siteresources')
+                return lists['siteresources']
+            def _dataProcessing(self, pnn = None, clearCache = False):
+                fetched.append('dataprocessing')
+                return lists['dataprocessing']
+
+        # nothing is shared, every call builds the tables it needs
+        mySiteDB = TestSiteDB(config = {'memcacheduration': 0})
+        self.assertEqual(mySiteDB.seToCMSName('cmssrm.fnal.gov'), ['T1_US_FNAL'])
+        self.assertEqual(fetched, ['sitenames', 'siteresources'])
+        del fetched[:]
+        self.assertEqual(mySiteDB.PNNtoPSN('T1_US_FNAL_Disk'), ['T1_US_FNAL'])
+        self.assertEqual(fetched, ['dataprocessing'])
+        del fetched[:]
+        self.assertEqual(mySiteDB.dnUserName('/CN=alice'), 'alice')
+        self.assertEqual(fetched, ['people'])
+        self.assertEqual(SiteDB._indexes, {})
+
+        # the tables are shared, an expired one is rebuilt by a new instance
+        del fetched[:]
+        mySiteDB = TestSiteDB(config = {'memcacheduration': 1})
+        try:
+            self.assertEqual(mySiteDB.cmsNametoSE('T1_US_FNAL'), ['cmssrm.fnal.gov'])
+            self.assertEqual(mySiteDB.cmsNametoSE('T1*'), ['cmssrm.fnal.gov'])
+            self.assertEqual(fetched, ['sitenames', 'siteresources'])
+            key = (mySiteDB['endpoint'], 'sites')
+            self.assertEqual(SiteDB._indexes.keys(), [key])
+
+            instances = []
+            buildIndex = TestSiteDB._buildIndex
+            def recordInstance(instance, kind, clearCache = False):
+                instances.append(instance)
+                return buildIndex(instance, kind, clearCache)
+            TestSiteDB._buildIndex = recordInstance
+
+            lists['siteresources'] = [{'type': 'SE', 'site_name': 'FNAL', 'fqdn': 'other.fnal.gov'}]
+            SiteDB._indexes[key].created -= 7200
+            self.assertEqual(mySiteDB.seToCMSName('cmssrm.fnal.gov'), ['T1_US_FNAL'])
+            for i in range(100):
+                if SiteDB._indexes[key].created > time.time() - 60:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(mySiteDB.seToCMSName('other.fnal.gov'), ['T1_US_FNAL'])
+            self.assertEqual(len(instances), 1)
+            self.assertFalse(instances[0] is mySiteDB)
+        finally:
+            SiteDB._indexes.clear()
+        return
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+_pycurl_manager_t_
+
+Test the concurrent requests of pycurl_manager against a small local HTTP
+server.
+"""
+
+import json
+import time
+import socket
+import threading
+import unittest
+import urlparse
+import BaseHTTPServer
+import SocketServer
+from httplib import HTTPException
+
+import pycurl
+
+from WMCore.Services.pycurl_manager import RequestHandler
+from WMCore.Services.Requests import JSONRequests
+
+class SlowHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    _SlowHandler_
+
+    Answer /block?name=X with {"block": X} after the delay of the server,
+    anything else is not found.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.running += 1
+            server.maxRunning = max(server.maxRunning, server.running)
+        time.sleep(server.delay)
+        with server.lock:
+            server.running -= 1
+
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        if url.path == "/block":
+            status = 200
+            data = json.dumps({"block": query["name"][0]})
+        else:
+            status = 404
+            data = json.dumps({"error": "not found"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        return
+
+    def log_message(self, format, *args):
+        return
+
+class SlowServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    _SlowServer_
+
+    """
+    daemon_threads = True
+
+    def __init__(self, delay):
+        BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", 0), SlowHandler)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.maxRunning = 0
+
+class PycurlManagerTest(unittest.TestCase):
+    """
+    _PycurlManagerTest_
+
+    """
+    def setUp(self):
+        self.server = SlowServer(delay = 0.2)
+        self.serverThread = threading.Thread(target = self.server.serve_forever)
+        self.serverThread.setDaemon(True)
+        self.serverThread.start()
+        self.url = "http://127.0.0.1:%i" % self.server.server_address[1]
+        self.mgr = RequestHandler()
+        return
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        return
+
+    def testA_MultiFetch(self):
+        """
+        _testA_MultiFetch_
+
+        Transfers run concurrently, bounded by num_conn, errors are reported
+        per request
+        """
+        # A port nobody listens on
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        closedUrl = "http://127.0.0.1:%i/block" % sock.getsockname()[1]
+        sock.close()
+
+        requests = [(self.url + "/block", {"name": "b%i" % i}) for i in range(20)]
+        requests.append((self.url + "/missing", {}))
+        requests.append((closedUrl, {"name": "x"}))
+
+        startTime = time.time()
+        results = list(self.mgr.multifetch(requests, num_conn = 5, decode = True))
+        self.assertTrue(time.time() - startTime < 0.2 * 21 / 2)
+        self.assertEqual(self.server.maxRunning, 5)
+
+        self.assertEqual(len(results), 22)
+        blocks = []
+        for url, params, header, data, error in results:
+            if url.endswith("/missing"):
+                self.assertTrue(isinstance(error, HTTPException))
+                self.assertEqual(error.status, 404)
+            elif url == closedUrl:
+                self.assertTrue(isinstance(error, pycurl.error))
+            else:
+                self.assertEqual(error, None)
+                self.assertEqual(header.status, 200)
+                self.assertEqual(data, {"block": params["name"]})
+                blocks.append(data["block"])
+        self.assertEqual(sorted(blocks), sorted(["b%i" % i for i in range(20)]))
+        return
+
+    def testB_GetDataMulti(self):
+        """
+        _testB_GetDataMulti_
+
+        The synchronous wrappers return the results in the request order
+        """
+        requests = [(self.url + "/block", {"name": "b%i" % i}) for i in range(8)]
+        requests.insert(3, (self.url + "/missing", {}))
+        results = self.mgr.getdata_multi(requests, num_conn = 4)
+        self.assertEqual(len(results), 9)
+        self.assertEqual(results[3][0], None)
+        self.assertEqual(results[3][1].status, 404)
+        del results[3]
+        self.assertEqual(results, [({"block": "b%i" % i}, None) for i in range(8)])
+
+        client = JSONRequests(self.url, {'cachepath': None})
+        results = client.makeMultiRequest([("/block", {"name": "c%i" % i}) for i in range(4)])
+        self.assertEqual(results, [({"block": "c%i" % i}, None) for i in range(4)])
+
+        # multirequest adds the parameters to the results
+        results = list(self.mgr.multirequest(self.url + "/block",
+                                             [{"name": "d%i" % i} for i in range(3)]))
+        self.assertEqual(sorted([x["name"] for x in results]), ["d0", "d1", "d2"])
+        for result in results:
+            self.assertEqual(result["block"], result["name"])
+        return
+
+if __name__ == '__main__':
+    unittest.main()
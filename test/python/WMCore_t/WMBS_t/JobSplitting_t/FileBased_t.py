@@ -24,7 +24,7 @@ from WMCore.WMFactory import WMFactory
 from WMCore.JobSplitting.SplitterFactory import SplitterFactory
 from WMCore.Services.UUID import makeUUID
 from WMQuality.TestInit import TestInit
-#from nose.plugins.attrib import attr
+from nose.plugins.attrib import attr
 
 class FileBasedTest(unittest.TestCase):
     """
@@ -454,6 +454,88 @@ class FileBasedTest(unittest.TestCase):
         jobFactory.close()
         return
 
+    @attr('performance')
+    def testY_LoadFilesBenchmark(self):
+        """
+        _testY_LoadFilesBenchmark_
+
+        Time loading a large subscription by proxy, with the joined query and
+        the file batches, against the query per file detail it replaces.
+        """
+        myThread = threading.currentThread()
+        daoFactory = DAOFactory(package = "WMCore.WMBS",
+                                logger = myThread.logger,
+                                dbinterface = myThread.dbi)
+
+        testFileset = Fileset(name = "TestFilesetBenchmark")
+        testFileset.create()
+        for i in range(20000):
+            locations = set(["somese.cern.ch"])
+            if i % 4 == 0:
+                locations.add("otherse.cern.ch")
+            newFile = File(makeUUID(), size = 1000, events = 100,
+                           locations = locations)
+            newFile.addRun(Run(i % 10, *[1]))
+            newFile.create()
+            testFileset.addFile(newFile)
+        testFileset.commit()
+
+        testWorkflow = Workflow(spec = "spec.xml", owner = "mnorman",
+                                name = "wf004", task = "Test")
+        testWorkflow.create()
+        subscription = Subscription(fileset = testFileset, workflow = testWorkflow,
+                                    split_algo = "FileBased", type = "Processing")
+        subscription.create()
+
+        splitter = SplitterFactory()
+        jobFactory = splitter(package = "WMCore.WMBS", subscription = subscription)
+        jobFactory.limit = 1000
+
+        startTime = time.time()
+        jobFactory.open()
+        nFiles = 0
+        while True:
+            fileDict = jobFactory.sortByLocation()
+            if not fileDict:
+                break
+            for files in fileDict.values():
+                nFiles += len(files)
+        jobFactory.close()
+        logging.info("Joined query: %i files in %.3fs" % (nFiles, time.time() - startTime))
+        self.assertEqual(nFiles, 20000)
+
+        startTime = time.time()
+        subAction = daoFactory(classname = "Subscriptions.GetAvailableFilesNoLocations")
+        results   = subAction.execute(subscription = subscription['id'],
+                                      returnCursor = True,
+                                      conn = myThread.transaction.conn,
+                                      transaction = True)
+        fileInfoAct  = daoFactory(classname = "Files.GetForJobSplittingByID")
+        getLocAction = daoFactory(classname = "Files.GetLocationBulk")
+        nFiles = 0
+        for proxy in results:
+            keys = list(proxy.keys())
+            while True:
+                rawResults = proxy.fetchmany(size = jobFactory.limit)
+                if not rawResults:
+                    break
+                fileIDs = list(set([x['fileid'] for x in jobFactory.formatDict(rawResults, keys)]))
+                fileInfoDict = fileInfoAct.execute(file = fileIDs,
+                                                   conn = myThread.transaction.conn,
+                                                   transaction = True)
+                getLocDict = getLocAction.execute(files = fileIDs,
+                                                  conn = myThread.transaction.conn,
+                                                  transaction = True)
+                for fID in fileIDs:
+                    fl = File(id = fID)
+                    fl.update(fileInfoDict[fID])
+                    for loc in getLocDict.get(fID, []):
+                        fl.setLocation(loc, immediateSave = False)
+                    nFiles += 1
+        logging.info("Query per detail: %i files in %.3fs" % (nFiles, time.time() - startTime))
+        self.assertEqual(nFiles, 20000)
+        return
+
     def crazyAssFunction(self, jobFactory, file_load_limit = 1):
         groups = ['test']
         while groups != []:
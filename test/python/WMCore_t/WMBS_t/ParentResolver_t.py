@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+_ParentResolver_t_
+
+Unit tests for the bulk resolution of merged ancestors
+"""
+
+import random
+import unittest
+
+from WMCore.WMBS.ParentResolver import ParentResolver
+
+class FakeParentage(object):
+    """
+    _FakeParentage_
+
+    Files with random parentage, answers like the Files.GetParentInfo DAO
+    """
+
+    def __init__(self, nLevels = 4, filesPerLevel = 30):
+        self.merged  = {}
+        self.parents = {}
+        self.calls   = 0
+        levels = []
+        for level in range(nLevels):
+            lfns = ["/store/level%i/file%i.root" % (level, x) for x in range(filesPerLevel)]
+            for lfn in lfns:
+                self.merged[lfn] = random.randint(0, 1)
+                self.parents[lfn] = []
+                if levels:
+                    self.parents[lfn] = random.sample(levels[-1], random.randint(0, 3))
+            levels.append(lfns)
+        self.lfns = levels[-1]
+        return
+
+    def execute(self, childLFNs):
+        self.calls += 1
+        rows = []
+        for childLFN in childLFNs:
+            for parent in self.parents.get(childLFN, []):
+                grandParents = self.parents[parent] or [None]
+                for grandParent in grandParents:
+                    rows.append({'child_lfn': childLFN, 'lfn': parent,
+                                 'merged': self.merged[parent], 'gplfn': grandParent,
+                                 'gpmerged': self.merged.get(grandParent)})
+        return rows
+
+def findParent(getParentInfo, lfn):
+    """
+    _findParent_
+
+    How JobFactory used to find the parents of a file, one query per file
+    and ancestor, kept as a reference
+    """
+    newParents = set()
+    for parentInfo in getParentInfo([lfn]):
+        if int(parentInfo["merged"]) == 1:
+            newParents.add(parentInfo["lfn"])
+        elif parentInfo['gpmerged'] == None:
+            continue
+        elif int(parentInfo["gpmerged"]) == 1:
+            newParents.add(parentInfo["gplfn"])
+        else:
+            newParents.update(findParent(getParentInfo, parentInfo['gplfn']))
+    return newParents
+
+class ParentResolverTest(unittest.TestCase):
+    """
+    _ParentResolverTest_
+
+    """
+
+    def testA_MatchesFindParent(self):
+        """
+        _testA_MatchesFindParent_
+
+        The resolver finds the same parents as the recursive lookup, with a
+        query per level of parentage.
+        """
+        random.seed(2718)
+        for i in range(50):
+            parentage = FakeParentage()
+            expected = dict([(lfn, findParent(parentage.execute, lfn)) for lfn in parentage.lfns])
+            oldCalls = parentage.calls
+
+            parentage.calls = 0
+            resolver = ParentResolver(parentage.execute)
+            self.assertEqual(resolver.findParents(parentage.lfns), expected)
+            self.assertTrue(parentage.calls <= 3)
+            self.assertTrue(parentage.calls <= oldCalls)
+
+            # Everything is cached until it is cleared
+            self.assertEqual(resolver.findParents(parentage.lfns[:5]),
+                             dict([(x, expected[x]) for x in parentage.lfns[:5]]))
+            self.assertTrue(parentage.calls <= 3)
+            resolver.clear()
+            self.assertEqual(resolver.findParents(parentage.lfns[:1]),
+                             {parentage.lfns[0]: expected[parentage.lfns[0]]})
+
+        self.assertEqual(ParentResolver(parentage.execute).findParents([]), {})
+        self.assertEqual(ParentResolver(parentage.execute).findParents(["/store/unknown.root"]),
+                         {"/store/unknown.root": set()})
+        return
+
+if __name__ == '__main__':
+    unittest.main()